@@ -20,6 +20,7 @@ from web.controllers.customer_controller import CustomerController
 from web.controllers.email_controller import EmailController
 from web.controllers.user_controller import UserController
 from web.controllers.auth_controller import AuthController
+from business.services.openai_client import openai_client_pool
 from config.settings import get_cherrypy_config
 
 
@@ -65,6 +66,8 @@ class MyCRMApp:
             config = get_cherrypy_config()
             cherrypy.config.update(config)
             
+            openai_client_pool.warm_up()
+            
             self.logger.info("Starting CherryPy server on http://localhost:8080")
             cherrypy.engine.start()
             cherrypy.engine.block()
@@ -0,0 +1,313 @@
+"""
+Asyncio email service for high-concurrency generation and delivery.
+"""
+
+import asyncio
+import contextvars
+import functools
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import openai
+from data.models.customer import Customer
+from data.models.email_log import (
+    EmailLog, GENERATION_PATH_CIRCUIT_OPEN, GENERATION_PATH_DEADLINE, GENERATION_PATH_ERROR, GENERATION_PATH_OPENAI,
+    GENERATION_PATH_TEMPLATE
+)
+from business.services.circuit_breaker import CircuitOpenError, openai_circuit_breaker
+from business.services.compliance_cache import compliance_verdict_cache
+from business.services.deadlines import DeadlineExceeded
+from business.services.email_service import EmailService
+from business.services.model_router import model_router
+from business.services.openai_client import openai_client_pool
+from business.services.openai_scheduler import PRIORITY_BULK, openai_scheduler, priority_scope
+from business.services.openai_usage import openai_usage_tracker
+from business.services.rate_limiter import openai_rate_limiter, parse_retry_after
+
+
+class AsyncEmailService:
+    """Async counterpart of EmailService.
+
+    OpenAI calls use the async client, so thousands of emails can be in
+    flight on one event loop. Sending queues emails in the outbox, which the
+    outbox dispatcher delivers. Prompts, fallbacks and compliance rules come
+    from the wrapped EmailService, and blocking repository calls run in the
+    default executor. OpenAI calls share the process-wide scheduler and rate
+    limiter with the synchronous service.
+
+    Usage from a CLI or worker::
+
+        logs = asyncio.run(AsyncEmailService().run_campaign(customers, template_text, user_id))
+    """
+
+    def __init__(self, email_service: Optional[EmailService] = None, max_concurrency: Optional[int] = None):
+        self.logger = logging.getLogger(__name__)
+        self.email_service = email_service or EmailService()
+        self.email_log_repository = self.email_service.email_log_repository
+        self.openai_config = self.email_service.openai_config
+        self.email_config = self.email_service.email_config
+        self.security_config = self.email_service.security_config
+        self.max_concurrency = max_concurrency or self.email_service.campaign_config['async_concurrency']
+        self._client = None
+
+    def _get_client(self) -> 'openai.AsyncOpenAI':
+        """Get the async OpenAI client, creating it on first use."""
+        if self._client is None:
+            # Retries are handled by _chat_completion within the shared rate limits
+            self._client = openai_client_pool.create_async_client()
+        return self._client
+
+    async def _run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call (repository access, sync helpers) in the default executor."""
+        loop = asyncio.get_running_loop()
+        # Carry the caller's usage scope into the executor thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(None, functools.partial(context.run, func, *args, **kwargs))
+
+    async def _chat_completion(self, stage: str = 'other', **request) -> Any:
+        """Call the OpenAI chat completions API within the shared rate limits and scheduler, retrying like EmailService.
+
+        The call, waiting and retries included, is abandoned with DeadlineExceeded
+        once its task's timeout passes.
+        """
+        request = self.email_service._fit_request(request)
+        timeout = model_router.get_timeout(stage)
+        started = time.monotonic()
+        try:
+            return await asyncio.wait_for(self._call_with_retries(stage, request), timeout or None)
+        except asyncio.TimeoutError:
+            openai_usage_tracker.record(stage, request.get('model', ''), None, time.monotonic() - started, 0,
+                                        success=False)
+            raise DeadlineExceeded(f"OpenAI {stage} call did not finish within {timeout:.1f}s")
+
+    async def _call_with_retries(self, stage: str, request: Dict[str, Any]) -> Any:
+        """Send a request, retrying transient failures."""
+        estimated_tokens = self.email_service._estimate_request_tokens(request)
+        started = time.monotonic()
+        attempt = 0
+
+        try:
+            while True:
+                openai_circuit_breaker.check()
+                retry_after = None
+                async with openai_scheduler.async_turn(estimated_tokens), \
+                        openai_rate_limiter.async_slot(estimated_tokens):
+                    try:
+                        response = await openai_circuit_breaker.call_async(
+                            lambda: self._get_client().chat.completions.create(**request)
+                        )
+                    except openai.RateLimitError as e:
+                        if getattr(e, 'code', None) == 'insufficient_quota':
+                            raise
+                        retry_after = parse_retry_after(e)
+                        openai_rate_limiter.record_throttle(retry_after)
+                        error = e
+                    except openai.APIStatusError as e:
+                        if e.status_code < 500:
+                            raise
+                        retry_after = parse_retry_after(e)
+                        error = e
+                    except openai.APIConnectionError as e:
+                        error = e
+                    else:
+                        usage = getattr(response, 'usage', None)
+                        openai_rate_limiter.record_usage(estimated_tokens, getattr(usage, 'total_tokens', None))
+                        openai_rate_limiter.record_success()
+                        openai_usage_tracker.record(stage, request['model'], usage, time.monotonic() - started, attempt)
+                        model_router.record_latency(stage, request['model'], time.monotonic() - started)
+                        return response
+
+                if attempt >= self.openai_config['max_retries']:
+                    raise error
+
+                delay = openai_rate_limiter.get_backoff_delay(attempt, retry_after)
+                self.logger.warning(f"OpenAI call failed ({error}), retrying in {delay:.1f}s (attempt {attempt + 1})")
+                await asyncio.sleep(delay)
+                attempt += 1
+        except CircuitOpenError:
+            raise
+        except Exception:
+            openai_usage_tracker.record(stage, request.get('model', ''), None, time.monotonic() - started, attempt,
+                                        success=False)
+            raise
+
+    async def _complete_text(self, stage: str, request: Dict[str, Any]) -> str:
+        """Run a chat completion and return the stripped message text."""
+        response = await self._chat_completion(stage, **request)
+        return response.choices[0].message.content.strip()
+
+    async def generate_personalized_email(self, customer: Customer, template_text: str, user_id: int) -> EmailLog:
+        """Generate a personalized email using AI."""
+        try:
+            email_log = EmailLog(
+                customer_id=customer.customer_id,
+                user_id=user_id,
+                template_text=template_text,
+                recipient_email=customer.email
+            )
+
+            with openai_usage_tracker.scope(user_id=user_id) as usage:
+                if self.openai_config['api_key']:
+                    body, subject = await asyncio.gather(
+                        self._complete_text('body', self.email_service._build_email_request(customer, template_text)),
+                        self._complete_text('subject',
+                                            self.email_service._build_subject_request(customer, template_text)),
+                        return_exceptions=True
+                    )
+                    email_log.generation_path = GENERATION_PATH_OPENAI
+                    if isinstance(body, CircuitOpenError):
+                        body = self.email_service._generate_fallback_email(customer, template_text)
+                        email_log.generation_path = GENERATION_PATH_CIRCUIT_OPEN
+                    elif isinstance(body, DeadlineExceeded):
+                        self.logger.warning(f"Email generation with OpenAI ran out of time, using the template: {body}")
+                        body = self.email_service._generate_fallback_email(customer, template_text)
+                        email_log.generation_path = GENERATION_PATH_DEADLINE
+                    elif isinstance(body, Exception):
+                        self.logger.error(f"Error generating email with OpenAI: {body}")
+                        body = self.email_service._generate_fallback_email(customer, template_text)
+                        email_log.generation_path = GENERATION_PATH_ERROR
+                    if isinstance(subject, Exception):
+                        self.logger.error(f"Error generating subject with OpenAI: {subject}")
+                        subject = f"Message for {customer.company_name}"
+                    email_log.generated_email = body
+                    email_log.subject = subject
+                else:
+                    email_log.generated_email = self.email_service._generate_fallback_email(customer, template_text)
+                    email_log.subject = f"Message from MyCRM - {customer.company_name}"
+                    email_log.generation_path = GENERATION_PATH_TEMPLATE
+
+                await self._perform_compliance_checks(email_log)
+            email_log.openai_usage = usage.get_stage_totals()
+
+            saved_log = await self._run_blocking(self.email_log_repository.create, email_log)
+            self.logger.info(f"Generated personalized email for customer: {customer}")
+            return saved_log
+
+        except Exception as e:
+            self.logger.error(f"Error generating personalized email: {e}")
+            raise
+
+    async def _perform_compliance_checks(self, email_log: EmailLog):
+        """Run the enabled compliance checks concurrently."""
+        async def check(enabled_key: str, build_request: Callable, name: str, review: str) -> Optional[str]:
+            if not self.security_config[enabled_key]:
+                return None
+            if not self.openai_config['api_key']:
+                return f"{name} compliance check skipped - OpenAI not configured"
+            try:
+                content = email_log.generated_email
+                request = build_request(content)
+                cached = await self._run_blocking(compliance_verdict_cache.get, review, request['model'], content)
+                if cached is not None:
+                    return cached
+                result = await self._complete_text(f"{review}_compliance", request)
+                await self._run_blocking(compliance_verdict_cache.put, review, request['model'], content, result)
+                return result
+            except CircuitOpenError:
+                return self.email_service._get_pending_compliance_result(name)
+            except Exception as e:
+                self.logger.error(f"Error checking {name} compliance: {e}")
+                return f"{name} compliance check failed: {str(e)}"
+
+        hipaa_result, ai_result = await asyncio.gather(
+            check('enable_hipaa_compliance', self.email_service._build_hipaa_request, 'HIPAA', 'hipaa'),
+            check('enable_ai_compliance', self.email_service._build_ai_compliance_request, 'AI', 'ai')
+        )
+        self.email_service._apply_compliance_results(email_log, hipaa_result, ai_result)
+
+    async def send_email(self, email_log_id: int) -> bool:
+        """Queue an email that has been generated and approved for delivery by the outbox dispatcher."""
+        return await self._run_blocking(self.email_service.send_email, email_log_id)
+
+    async def _queue_email(self, email_log: EmailLog):
+        """Add an approved email to the outbox without waking the dispatcher."""
+        await self._run_blocking(self.email_service._enqueue_email, email_log)
+
+    async def _send_smtp_email(self, recipient: str, subject: str, body: str,
+                               message_id: Optional[str] = None) -> bool:
+        """Deliver one outbox message using aiosmtplib.
+
+        This is only a transport for dispatching queued messages; emails are
+        sent by queueing them, never by calling this directly.
+        """
+        try:
+            import aiosmtplib
+
+            await aiosmtplib.send(
+                self.email_service._build_mime_message(recipient, subject, body, message_id=message_id),
+                hostname=self.email_config['smtp_server'],
+                port=self.email_config['smtp_port'],
+                username=self.email_config['smtp_username'] or None,
+                password=self.email_config['smtp_password'] or None,
+                start_tls=self.email_config['use_tls'],
+                timeout=self.email_config['smtp_timeout']
+            )
+            return True
+
+        except Exception as e:
+            self.logger.error(f"SMTP send error: {e}")
+            return False
+
+    async def send_bulk_emails(self, email_log_ids: List[int]) -> Dict[int, bool]:
+        """Queue multiple emails for sending and return whether each was queued.
+
+        Email logs are checked and queued a chunk at a time by EmailService, so
+        delivery goes through the outbox with the same idempotency and
+        Message-ID guarantees as the synchronous service.
+        """
+        return await self._run_blocking(self.email_service.send_bulk_emails, email_log_ids)
+
+    async def run_campaign(self, customers: List[Customer], template_text: str, user_id: int,
+                           campaign_mode: bool = False, send: bool = False,
+                           on_result: Optional[Callable[[Customer, Optional[EmailLog], Optional[Exception]],
+                                                        Optional[Awaitable[None]]]] = None,
+                           campaign_id: Optional[str] = None) -> List[EmailLog]:
+        """Generate (and optionally send) emails for many customers with bounded concurrency.
+
+        on_result is called (and awaited if it returns an awaitable) after each
+        customer with the saved email log or the error, so callers such as the
+        job engine can record progress. Failed customers are left out of the
+        returned list. OpenAI usage is reported under campaign_id if given, and
+        calls are scheduled as bulk work.
+        """
+        with openai_usage_tracker.scope(user_id=user_id, campaign_id=campaign_id), priority_scope(PRIORITY_BULK):
+            return await self._run_campaign(customers, template_text, user_id, campaign_mode, send, on_result)
+
+    async def _run_campaign(self, customers: List[Customer], template_text: str, user_id: int,
+                            campaign_mode: bool, send: bool, on_result: Optional[Callable]) -> List[EmailLog]:
+        """Run a campaign inside its usage scope."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        draft = None
+        if campaign_mode:
+            draft = await self._run_blocking(self.email_service.create_campaign_draft, template_text)
+
+        async def process(customer: Customer) -> Optional[EmailLog]:
+            async with semaphore:
+                email_log, error = None, None
+                try:
+                    if draft:
+                        email_log = await self._run_blocking(
+                            self.email_service.generate_campaign_email, draft, customer, user_id
+                        )
+                    else:
+                        email_log = await self.generate_personalized_email(customer, template_text, user_id)
+                    if send and email_log.compliance_approved:
+                        await self._queue_email(email_log)
+                        queued.append(email_log.email_log_id)
+                except Exception as e:
+                    self.logger.error(f"Campaign email failed for customer {customer.customer_id}: {e}")
+                    error = e
+
+            if on_result:
+                outcome = on_result(customer, email_log, error)
+                if asyncio.iscoroutine(outcome):
+                    await outcome
+            return email_log
+
+        queued: List[int] = []
+        results = await asyncio.gather(*(process(customer) for customer in customers))
+        if queued:
+            await self._run_blocking(self.email_service._wake_outbox_dispatcher)
+        email_logs = [email_log for email_log in results if email_log]
+        self.logger.info(f"Campaign generated {len(email_logs)} of {len(customers)} emails")
+        return email_logs
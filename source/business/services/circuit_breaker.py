@@ -0,0 +1,235 @@
+"""
+Circuit breaker that stops calling an AI provider while it is failing.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, Optional, TypeVar
+import openai
+from config.settings import get_openai_config
+
+try:
+    import httpx
+except ImportError:
+    # Newer openai releases are built on httpx2, which keeps the httpx API
+    import httpx2 as httpx
+
+
+T = TypeVar('T')
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Refuses calls to a failing provider, then probes it before letting traffic back.
+
+    Closed: calls go through. The circuit opens after failure_threshold
+    consecutive failures, or once at least error_rate_threshold of the last
+    window_size calls failed.
+    Open: calls are refused for open_seconds.
+    Half-open: up to half_open_probes calls go through; a success closes the
+    circuit and a failure opens it again.
+
+    is_failure decides which errors count against the provider; errors that
+    mean the provider answered (such as a rejected request) count as successes.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, is_failure: Callable[[BaseException], bool], failure_threshold: int = 5,
+                 error_rate_threshold: float = 0.5, window_size: int = 20, open_seconds: float = 30.0,
+                 half_open_probes: int = 1):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.is_failure = is_failure
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.window_size = window_size
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window_size)
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+
+        # Counters exposed to metrics
+        self._times_opened = 0
+        self._rejected = 0
+
+    def check(self):
+        """Raise CircuitOpenError if calls are being refused, without taking a half-open probe."""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() < self._opened_at + self.open_seconds:
+                self._rejected += 1
+                raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def call(self, func: Callable[[], T], abandoned: Optional[Callable[[], bool]] = None) -> T:
+        """Run func if the circuit allows it, recording the outcome.
+
+        abandoned, if given, is asked after a failure whether the caller gave
+        up on the call (e.g. a hedged request the other attempt beat); such a
+        failure says nothing about the provider and is not recorded.
+        """
+        self._before_call()
+        try:
+            result = func()
+        except BaseException as e:
+            self.record_result(e, abandoned=bool(abandoned and abandoned()))
+            raise
+        self.record_result(None)
+        return result
+
+    async def call_async(self, func: Callable[[], Awaitable[T]]) -> T:
+        """Async variant of call()."""
+        self._before_call()
+        try:
+            result = await func()
+        except BaseException as e:
+            self.record_result(e)
+            raise
+        self.record_result(None)
+        return result
+
+    def call_stream(self, func: Callable[[], Iterator[T]],
+                    abandoned: Optional[Callable[[], bool]] = None) -> Iterator[T]:
+        """Open a stream with func if the circuit allows it, recording the outcome when the stream ends.
+
+        A stream that fails midway counts as a failed call, not a successful
+        one; a stream the caller closes early counts as neither. abandoned is
+        as for call().
+        """
+        self._before_call()
+        try:
+            stream = func()
+        except BaseException as e:
+            self.record_result(e, abandoned=bool(abandoned and abandoned()))
+            raise
+        return self._watch_stream(stream, abandoned)
+
+    def _watch_stream(self, stream: Iterator[T], abandoned: Optional[Callable[[], bool]]) -> Iterator[T]:
+        """Yield a stream's items, recording its outcome once it is exhausted, fails or is closed."""
+        try:
+            yield from stream
+        except BaseException as e:
+            self.record_result(e, abandoned=bool(abandoned and abandoned()))
+            raise
+        else:
+            self.record_result(None)
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+
+    def _before_call(self):
+        """Admit a call, moving an open circuit to half-open once it has waited long enough."""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() < self._opened_at + self.open_seconds:
+                    self._rejected += 1
+                    raise CircuitOpenError(f"{self.name} circuit is open")
+                self._state = self.HALF_OPEN
+                self._probes_in_flight = 0
+                self.logger.info(f"{self.name} circuit half-open, probing")
+            if self._state == self.HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self._rejected += 1
+                    raise CircuitOpenError(f"{self.name} circuit is half-open and already probing")
+                self._probes_in_flight += 1
+
+    def record_result(self, error: Optional[BaseException] = None, abandoned: bool = False):
+        """Record a call's outcome; error is None for a success."""
+        if abandoned or (error is not None and not isinstance(error, Exception)):
+            # Cancellation says nothing about the provider, but frees the probe
+            with self._lock:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            return
+
+        failed = error is not None and self.is_failure(error)
+        with self._lock:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            self._outcomes.append(not failed)
+            if not failed:
+                self._consecutive_failures = 0
+                if self._state == self.HALF_OPEN:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                    self.logger.info(f"{self.name} circuit closed")
+                return
+
+            self._consecutive_failures += 1
+            failures = self._outcomes.count(False)
+            if (self._state == self.HALF_OPEN
+                    or (self._state == self.CLOSED and self._consecutive_failures >= self.failure_threshold)
+                    or (self._state == self.CLOSED and len(self._outcomes) >= self.window_size
+                        and failures / len(self._outcomes) >= self.error_rate_threshold)):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._times_opened += 1
+                self._outcomes.clear()
+                self.logger.warning(f"{self.name} circuit opened for {self.open_seconds:.0f}s after "
+                                    f"{self._consecutive_failures} consecutive failure(s): {error}")
+
+    def reset(self):
+        """Close the circuit and forget recorded outcomes and counters."""
+        with self._lock:
+            self._state = self.CLOSED
+            self._outcomes.clear()
+            self._consecutive_failures = 0
+            self._opened_at = 0.0
+            self._probes_in_flight = 0
+            self._times_opened = 0
+            self._rejected = 0
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get the circuit state and counters for metrics and the dashboard."""
+        with self._lock:
+            state = self._state
+            retry_in = 0.0
+            if state == self.OPEN:
+                retry_in = max(self._opened_at + self.open_seconds - time.monotonic(), 0.0)
+                if retry_in == 0:
+                    # The next call will probe
+                    state = self.HALF_OPEN
+            return {
+                'state': state,
+                'retry_in_seconds': round(retry_in, 1),
+                'consecutive_failures': self._consecutive_failures,
+                'recent_error_rate': round(self._outcomes.count(False) / len(self._outcomes), 3) if self._outcomes else 0.0,
+                'times_opened': self._times_opened,
+                'rejected_calls': self._rejected
+            }
+
+
+def is_openai_provider_failure(error: BaseException) -> bool:
+    """Whether an OpenAI error means the provider is unhealthy rather than refusing one request."""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    # A stream that stalls or drops midway raises the HTTP client's own errors
+    return isinstance(error, (openai.APIConnectionError, TimeoutError, httpx.TransportError))
+
+
+def _create_openai_circuit_breaker() -> CircuitBreaker:
+    """Create the OpenAI circuit breaker from OpenAI settings."""
+    config = get_openai_config()
+    return CircuitBreaker(
+        name='OpenAI',
+        is_failure=is_openai_provider_failure,
+        failure_threshold=config['circuit_failure_threshold'],
+        error_rate_threshold=config['circuit_error_rate'],
+        window_size=config['circuit_window'],
+        open_seconds=config['circuit_open_seconds'],
+        half_open_probes=config['circuit_half_open_probes']
+    )
+
+
+# Global breaker shared by every EmailService and AsyncEmailService in the process
+openai_circuit_breaker = _create_openai_circuit_breaker()
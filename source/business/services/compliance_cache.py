@@ -0,0 +1,178 @@
+"""
+Cache of compliance verdicts for email content that has already been reviewed.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from config.settings import get_security_config
+from data.factory import repository_factory
+from data.models.compliance_verdict import ComplianceVerdict
+from data.repositories.base import IComplianceVerdictRepository
+from business.services.prompts import COMPLIANCE_REVIEWS, get_compliance_policy_version
+
+
+class ComplianceVerdictCache:
+    """Reuses HIPAA and AI verdicts for content that was reviewed before.
+
+    A verdict's key hashes the review, the policy version of its prompts, the
+    model and the email content with whitespace collapsed, so editing a
+    compliance prompt or changing model stops old verdicts from matching.
+    Only clear APPROVED or VIOLATION results are stored; pending, skipped and
+    failed reviews run again. Verdicts older than ttl_days are not reused,
+    and every EVICT_EVERY stored verdicts the repository is trimmed to
+    max_entries, least recently used first. Repository errors are logged and
+    treated as misses, so the cache can never block a review.
+    """
+
+    # Verdicts stored between eviction passes
+    EVICT_EVERY = 100
+
+    def __init__(self, repository: IComplianceVerdictRepository, max_entries: int = 10000, ttl_days: float = 30.0):
+        self.logger = logging.getLogger(__name__)
+        self.repository = repository
+        self.max_entries = max_entries
+        self.ttl_days = ttl_days
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0, 'errors': 0}
+        self._stored_since_eviction = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Whether verdicts are cached at all."""
+        return self.max_entries > 0
+
+    @staticmethod
+    def normalize(email_content: str) -> str:
+        """Collapse whitespace so re-wrapped copies of the same email share a key."""
+        return ' '.join((email_content or '').split())
+
+    def make_key(self, review: str, model: str, email_content: str) -> str:
+        """Build the cache key of a review of email_content by model."""
+        parts = (review, get_compliance_policy_version(review), model, self.normalize(email_content))
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def is_cacheable(result: Optional[str]) -> bool:
+        """Whether a review result is a clear verdict worth reusing."""
+        return bool(result) and re.match(r'(APPROVED|VIOLATION)\b', result.strip().upper()) is not None
+
+    def _get_cutoff(self) -> Optional[datetime]:
+        """Creation time before which verdicts are too old to reuse."""
+        return datetime.now() - timedelta(days=self.ttl_days) if self.ttl_days > 0 else None
+
+    def get(self, review: str, model: str, email_content: str) -> Optional[str]:
+        """Get the cached result of a review, or None."""
+        return self.get_many(review, model, [email_content])[0]
+
+    def get_many(self, review: str, model: str, contents: List[str]) -> List[Optional[str]]:
+        """Get the cached result of a review for each of contents, None where there is none."""
+        if not self.enabled or not contents:
+            return [None] * len(contents)
+        keys = [self.make_key(review, model, content) for content in contents]
+        try:
+            verdicts = self.repository.get_many(keys)
+        except Exception as e:
+            self.logger.warning(f"Compliance verdict cache lookup failed: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+            return [None] * len(contents)
+
+        cutoff = self._get_cutoff()
+        results: List[Optional[str]] = []
+        for key in keys:
+            verdict = verdicts.get(key)
+            fresh = verdict is not None and (cutoff is None or verdict.created_date is None
+                                             or verdict.created_date >= cutoff)
+            results.append(verdict.result if fresh else None)
+        with self._lock:
+            hits = sum(1 for result in results if result is not None)
+            self._stats['hits'] += hits
+            self._stats['misses'] += len(results) - hits
+        return results
+
+    def put(self, review: str, model: str, email_content: str, result: Optional[str]):
+        """Store a review's result if it is a clear verdict."""
+        self.put_many(review, model, [email_content], [result])
+
+    def put_many(self, review: str, model: str, contents: List[str], results: List[Optional[str]]):
+        """Store the clear verdicts among results, one per content."""
+        if not self.enabled:
+            return
+        policy_version = get_compliance_policy_version(review)
+        verdicts = {}
+        for content, result in zip(contents, results):
+            if self.is_cacheable(result):
+                key = self.make_key(review, model, content)
+                verdicts[key] = ComplianceVerdict(cache_key=key, review=review, policy_version=policy_version,
+                                                  model=model, result=result.strip())
+        if not verdicts:
+            return
+        try:
+            self.repository.save_many(list(verdicts.values()))
+        except Exception as e:
+            self.logger.warning(f"Compliance verdict cache store failed: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+            return
+
+        with self._lock:
+            self._stats['stored'] += len(verdicts)
+            self._stored_since_eviction += len(verdicts)
+            evict = self._stored_since_eviction >= self.EVICT_EVERY
+            if evict:
+                self._stored_since_eviction = 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop verdicts past their TTL, then the least recently used beyond max_entries."""
+        try:
+            evicted = self.repository.evict(self.max_entries, self._get_cutoff())
+        except Exception as e:
+            self.logger.warning(f"Compliance verdict cache eviction failed: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+            return 0
+        with self._lock:
+            self._stats['evicted'] += evicted
+        return evicted
+
+    def clear(self) -> int:
+        """Forget every cached verdict."""
+        return self.repository.clear()
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get cache size, policy versions and hit counts for metrics."""
+        try:
+            entries = self.repository.count() if self.enabled else 0
+        except Exception:
+            entries = None
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'enabled': self.enabled,
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'ttl_days': self.ttl_days,
+                'policy_versions': {review: get_compliance_policy_version(review) for review in COMPLIANCE_REVIEWS},
+                'hit_ratio': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+                **self._stats
+            }
+
+
+def _create_compliance_verdict_cache() -> ComplianceVerdictCache:
+    """Create the verdict cache from security settings."""
+    config = get_security_config()
+    return ComplianceVerdictCache(
+        repository=repository_factory.get_compliance_verdict_repository(),
+        max_entries=config['compliance_cache_entries'],
+        ttl_days=config['compliance_cache_ttl_days']
+    )
+
+
+# Global verdict cache shared by every EmailService instance in the process
+compliance_verdict_cache = _create_compliance_verdict_cache()
@@ -0,0 +1,199 @@
+"""
+Deadlines and request hedging for OpenAI calls.
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+from config.settings import get_openai_config
+from business.services.openai_usage import openai_usage_tracker
+
+
+T = TypeVar('T')
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when work runs out of time before it can finish."""
+
+
+class Deadline:
+    """A point in time by which work must finish, never later than its parent's."""
+
+    def __init__(self, seconds: float, parent: Optional['Deadline'] = None):
+        self.expires = time.monotonic() + seconds
+        self.parent = parent
+        self._cancelled = False
+
+    def remaining(self) -> float:
+        """Seconds left, zero once expired."""
+        remaining = self.expires - time.monotonic()
+        if self.parent is not None:
+            remaining = min(remaining, self.parent.remaining())
+        return max(remaining, 0.0)
+
+    @property
+    def expired(self) -> bool:
+        """Whether the deadline has passed or was cancelled."""
+        return self.remaining() <= 0
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether this deadline or a parent was cancelled, as opposed to running out."""
+        return self._cancelled or (self.parent is not None and self.parent.cancelled)
+
+    def cancel(self):
+        """Expire now, so work running under this deadline stops at its next check."""
+        self._cancelled = True
+        self.expires = time.monotonic()
+
+    def check(self, what: str):
+        """Raise DeadlineExceeded if the deadline has passed."""
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline exceeded before {what}")
+
+
+# The innermost deadline of the running thread or asyncio task
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    'openai_deadline', default=None
+)
+
+
+def get_current_deadline() -> Optional[Deadline]:
+    """Get the innermost deadline in effect, if any."""
+    return _current_deadline.get()
+
+
+def get_remaining_time() -> Optional[float]:
+    """Get the seconds left before the current deadline, or None if there is no finite one."""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    remaining = deadline.remaining()
+    return None if remaining == float('inf') else remaining
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """Run the block under a deadline of seconds, or the enclosing one if that is sooner.
+
+    A missing or non-positive value adds no deadline of its own.
+    """
+    parent = _current_deadline.get()
+    if not seconds or seconds <= 0:
+        yield parent
+        return
+
+    token = _current_deadline.set(Deadline(seconds, parent))
+    try:
+        yield _current_deadline.get()
+    finally:
+        _current_deadline.reset(token)
+
+
+def _start(func: Callable[[], T], deadline: Deadline) -> Future:
+    """Run func on a new thread under deadline, with the caller's context."""
+    future: Future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        _current_deadline.set(deadline)
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=context.run, args=(run,), name='openai-hedge', daemon=True).start()
+    return future
+
+
+class RequestHedger:
+    """Races a duplicate request against one that is slower than usual for its stage.
+
+    A call that has not finished after the stage's recent latency percentile
+    is sent again; the first success wins and the straggler's deadline is
+    cancelled, so it stops retrying and its in-flight request ends at its
+    timeout. Stages with fewer than MIN_SAMPLES recorded calls are not hedged.
+    """
+
+    # Recorded calls a stage needs before its percentile is trusted
+    MIN_SAMPLES = 20
+
+    def __init__(self, percentile: float, min_delay: float):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'hedged': 0, 'hedge_wins': 0}
+
+    def get_hedge_delay(self, stage: str) -> Optional[float]:
+        """Seconds to wait before hedging a call of stage, or None not to hedge."""
+        if self.percentile <= 0:
+            return None
+        latency_ms = openai_usage_tracker.get_latency_percentile(stage, self.percentile, self.MIN_SAMPLES)
+        if latency_ms is None:
+            return None
+        return max(self.min_delay, latency_ms / 1000.0)
+
+    def call(self, stage: str, func: Callable[[], T]) -> Tuple[T, bool]:
+        """Run func, hedging it if it is slow. Returns the result and whether the hedge won."""
+        with self._lock:
+            self._stats['calls'] += 1
+
+        parent = get_current_deadline()
+        delay = self.get_hedge_delay(stage)
+        if delay is None or (parent is not None and parent.remaining() <= delay):
+            return func(), False
+
+        # Each attempt gets its own deadline so the loser can be cancelled alone
+        primary_deadline = Deadline(parent.remaining() if parent else float('inf'), parent)
+        primary = _start(func, primary_deadline)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result(), False
+
+        with self._lock:
+            self._stats['hedged'] += 1
+        hedge_deadline = Deadline(parent.remaining() if parent else float('inf'), parent)
+        hedge = _start(func, hedge_deadline)
+        attempts = {primary: primary_deadline, hedge: hedge_deadline}
+
+        pending = set(attempts)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, timeout=parent.remaining() if parent else None,
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    for straggler in pending:
+                        attempts[straggler].cancel()
+                    won = future is hedge
+                    if won:
+                        with self._lock:
+                            self._stats['hedge_wins'] += 1
+                    return future.result(), won
+                error = future.exception()
+
+        for straggler in pending:
+            attempts[straggler].cancel()
+        if error is not None and not pending:
+            raise error
+        raise DeadlineExceeded(f"Deadline exceeded waiting for {stage}")
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get hedging counts for metrics."""
+        with self._lock:
+            return {'percentile': self.percentile, 'min_delay': self.min_delay, **self._stats}
+
+
+def _create_request_hedger() -> RequestHedger:
+    """Create the hedger from OpenAI settings."""
+    config = get_openai_config()
+    return RequestHedger(percentile=config['hedge_percentile'], min_delay=config['hedge_min_delay'])
+
+
+# Global hedger shared by every EmailService instance in the process
+request_hedger = _create_request_hedger()
@@ -0,0 +1,346 @@
+"""
+Background job service for bulk email generation.
+"""
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+from config.settings import get_email_job_config
+from data.factory import repository_factory
+from data.models.customer import Customer
+from data.models.email_job import EmailJob, EmailJobItem
+from business.services.email_service import EmailService
+from business.services.openai_scheduler import PRIORITY_BULK, priority_scope
+from business.services.openai_usage import openai_usage_tracker
+from business.services.single_flight import get_payload_fingerprint, idempotency_store
+
+
+class EmailJobService:
+    """Service class for queueing bulk email generation and processing job items.
+
+    Jobs are stored in the job repository and picked up by EmailJobWorker
+    instances that lease items from it. In "inprocess" mode the service runs
+    an embedded worker thread; in "worker" mode jobs wait for worker.py.
+    """
+
+    def __init__(self, email_service: Optional[EmailService] = None):
+        self.logger = logging.getLogger(__name__)
+        self.job_repository = repository_factory.get_email_job_repository()
+        self.email_service = email_service or EmailService()
+        self.job_config = get_email_job_config()
+        self._worker: Optional['EmailJobWorker'] = None
+        self._worker_lock = threading.Lock()
+
+    def submit_generation_job(self, customers: List[Customer], template_text: str, user_id: int,
+                              campaign_mode: bool = False, idempotency_key: Optional[str] = None) -> EmailJob:
+        """Queue a bulk generation job and return it without waiting for it to run.
+        
+        A repeated submission with the same idempotency_key returns the job
+        queued by the first one, as long as the customers, template and mode
+        are unchanged.
+        """
+        if idempotency_key:
+            fingerprint = get_payload_fingerprint(template_text, campaign_mode,
+                                                  *(customer.customer_id for customer in customers))
+            job_id = idempotency_store.run(
+                f"job:{user_id}:{idempotency_key}:{fingerprint}",
+                lambda: self.submit_generation_job(customers, template_text, user_id, campaign_mode).job_id
+            )
+            return self.job_repository.get_by_id(job_id)
+        
+        try:
+            if not customers:
+                raise ValueError("Please select at least one customer")
+
+            job = EmailJob(
+                user_id=user_id,
+                template_text=template_text,
+                campaign_mode=campaign_mode,
+                items=[EmailJobItem(customer_id=customer.customer_id, customer=customer, position=position)
+                       for position, customer in enumerate(customers)]
+            )
+            job = self.job_repository.create(job)
+
+            if self.job_config['mode'] != 'worker':
+                self._get_embedded_worker().wake()
+
+            self.logger.info(f"Queued email job {job.job_id} for {len(customers)} customers")
+            return job
+
+        except Exception as e:
+            self.logger.error(f"Error submitting email job: {e}")
+            raise
+
+    def get_job(self, job_id: int) -> Optional[EmailJob]:
+        """Get a job with its current progress."""
+        try:
+            job = self.job_repository.get_by_id(job_id)
+            if job and job.cancel_requested and not job.is_finished:
+                # Close cancelled jobs whose remaining items were abandoned by a crashed worker
+                job = self.job_repository.finish_job(job_id) or job
+            return job
+        except Exception as e:
+            self.logger.error(f"Error getting email job {job_id}: {e}")
+            raise
+
+    def get_jobs_by_user(self, user_id: int) -> List[EmailJob]:
+        """Get all jobs submitted by a user, newest first."""
+        try:
+            jobs = self.job_repository.get_by_user_id(user_id)
+            return sorted(jobs, key=lambda job: job.job_id, reverse=True)
+        except Exception as e:
+            self.logger.error(f"Error getting email jobs for user {user_id}: {e}")
+            raise
+
+    def cancel_job(self, job_id: int) -> bool:
+        """Request cancellation. Items already running finish; the rest are skipped."""
+        try:
+            job = self.job_repository.get_by_id(job_id)
+            if not job or job.is_finished:
+                return False
+
+            job.cancel_requested = True
+            self.job_repository.update(job)
+            self.job_repository.finish_job(job_id)
+            self.logger.info(f"Cancellation requested for email job {job_id}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Error cancelling email job {job_id}: {e}")
+            raise
+
+    def prepare_job(self, job: EmailJob) -> EmailJob:
+        """Create the shared campaign draft once per job before its items run."""
+        if job.campaign_mode and not job.campaign_draft:
+            with openai_usage_tracker.scope(user_id=job.user_id, campaign_id=job.campaign_id), priority_scope(PRIORITY_BULK):
+                draft = self.email_service.create_campaign_draft(job.template_text)
+            # Another worker may have stored a draft first; everyone uses the stored one
+            job.campaign_draft = self.job_repository.save_campaign_draft(job.job_id, draft)
+        return job
+
+    def process_item(self, job: EmailJob, item: EmailJobItem, worker_id: str) -> EmailJobItem:
+        """Generate the email for one leased job item and record the outcome."""
+        try:
+            if not item.customer:
+                raise ValueError(f"Customer with ID {item.customer_id} not found")
+
+            with openai_usage_tracker.scope(user_id=job.user_id, campaign_id=job.campaign_id), priority_scope(PRIORITY_BULK):
+                if job.campaign_draft:
+                    use_ai = item.position < self.email_service.campaign_config['llm_sample_size']
+                    email_log = self.email_service.generate_campaign_email(
+                        job.campaign_draft, item.customer, job.user_id, use_ai=use_ai
+                    )
+                else:
+                    email_log = self.email_service.generate_personalized_email(
+                        item.customer, job.template_text, job.user_id
+                    )
+
+            item.email_log_id = email_log.email_log_id
+            item.status = 'completed'
+        except Exception as e:
+            self._fail_item(job, item, e)
+
+        return self._complete_item(job, item, worker_id)
+
+    def can_batch(self, job: EmailJob) -> bool:
+        """Whether a job's items may be generated and reviewed together, sharing AI calls."""
+        return not job.campaign_draft and (self.email_service.security_config['compliance_batch_size'] > 1
+                                           or self.email_service.campaign_config['generation_batch_size'] > 1)
+
+    def process_items(self, job: EmailJob, items: List[EmailJobItem], worker_id: str,
+                      executor: ThreadPoolExecutor) -> List[EmailJobItem]:
+        """Generate the emails for several leased items of one job in batches, then review them in batches.
+
+        Emails are generated several recipients per call, concurrently on
+        executor, and checked together once all are ready; then each is saved
+        and its item recorded.
+        """
+        ready = []
+        for item in items:
+            if item.customer:
+                ready.append(item)
+            else:
+                self._fail_item(job, item, ValueError(f"Customer with ID {item.customer_id} not found"))
+
+        try:
+            with openai_usage_tracker.scope(user_id=job.user_id, campaign_id=job.campaign_id), priority_scope(PRIORITY_BULK):
+                email_logs = self.email_service.compose_personalized_emails(
+                    [item.customer for item in ready], job.template_text, job.user_id, executor
+                )
+                self.email_service.perform_batched_compliance_checks(email_logs)
+            composed = list(zip(ready, email_logs))
+        except Exception as e:
+            for item in ready:
+                self._fail_item(job, item, e)
+            composed = []
+
+        for item, email_log in composed:
+            try:
+                item.email_log_id = self.email_service.email_log_repository.create(email_log).email_log_id
+                item.status = 'completed'
+            except Exception as e:
+                self._fail_item(job, item, e)
+
+        return [self._complete_item(job, item, worker_id) for item in items]
+
+    def _fail_item(self, job: EmailJob, item: EmailJobItem, error: Exception):
+        """Mark a job item failed."""
+        self.logger.error(f"Email job {job.job_id} failed for customer {item.customer_id}: {error}")
+        item.status = 'failed'
+        item.error_message = str(error)
+
+    def _complete_item(self, job: EmailJob, item: EmailJobItem, worker_id: str) -> EmailJobItem:
+        """Record a processed item's outcome, discarding its email if the lease was lost."""
+        if not self.job_repository.complete_item(item, worker_id):
+            # The lease expired and another worker owns the item now; drop our duplicate
+            self.logger.warning(f"Lost lease on email job item {item.item_id}")
+            if item.email_log_id:
+                self.email_service.email_log_repository.delete(item.email_log_id)
+            return item
+
+        finished = self.job_repository.finish_job(job.job_id)
+        if finished:
+            self.logger.info(f"Finished {finished}")
+        return item
+
+    def _get_embedded_worker(self) -> 'EmailJobWorker':
+        """Start the in-process worker on first use."""
+        with self._worker_lock:
+            if not self._worker:
+                self._worker = EmailJobWorker(self, worker_id=f"{default_worker_id()}-embedded")
+                self._worker.start()
+            return self._worker
+
+
+def default_worker_id() -> str:
+    """Build a worker ID that is unique across hosts and restarts."""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class EmailJobWorker:
+    """Worker that leases job items from the repository and processes them.
+
+    Leases are renewed by a heartbeat thread while items run, so a crashed
+    worker's items become claimable again once their leases expire.
+    """
+
+    def __init__(self, job_service: EmailJobService, worker_id: Optional[str] = None,
+                 batch_size: Optional[int] = None):
+        self.logger = logging.getLogger(__name__)
+        self.job_service = job_service
+        self.job_repository = job_service.job_repository
+        self.job_config = job_service.job_config
+        self.worker_id = worker_id or default_worker_id()
+        self.batch_size = batch_size or self.job_config['batch_size']
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.job_config['worker_threads'],
+            thread_name_prefix='email-job'
+        )
+        self._active_items: Dict[int, EmailJobItem] = {}
+        self._active_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def start(self) -> threading.Thread:
+        """Run the worker loop on a daemon thread."""
+        thread = threading.Thread(target=self.run, name=f'email-worker-{self.worker_id}', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Ask the worker loop to exit after the current batch."""
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def wake(self):
+        """Poll for new items immediately instead of waiting for the poll interval."""
+        self._wake_event.set()
+
+    def run(self, once: bool = False):
+        """Claim and process items until stopped, or until the queue is empty if once is set."""
+        self.logger.info(f"Email job worker {self.worker_id} started")
+        heartbeat = threading.Thread(target=self._heartbeat, name=f'email-heartbeat-{self.worker_id}', daemon=True)
+        heartbeat.start()
+
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    processed = self.run_batch()
+                except Exception as e:
+                    self.logger.error(f"Email job worker {self.worker_id} batch failed: {e}")
+                    processed = 0
+
+                if processed:
+                    continue
+                if once:
+                    break
+                self._wake_event.wait(self.job_config['poll_interval'])
+                self._wake_event.clear()
+        finally:
+            self._stop_event.set()
+            self.logger.info(f"Email job worker {self.worker_id} stopped")
+
+    def run_batch(self) -> int:
+        """Claim one batch of items and process it. Returns the number of items claimed."""
+        items = self.job_repository.claim_items(
+            self.worker_id, self.batch_size, self.job_config['lease_seconds'], self.job_config['max_attempts']
+        )
+        if not items:
+            return 0
+
+        with self._active_lock:
+            self._active_items.update({item.item_id: item for item in items})
+
+        try:
+            jobs = self._load_jobs({item.job_id for item in items})
+            futures = []
+            batched: Dict[int, List[EmailJobItem]] = {}
+            for item in items:
+                job = jobs.get(item.job_id)
+                if job is None:
+                    item.status = 'failed'
+                    item.error_message = f"Email job {item.job_id} could not be prepared"
+                    self.job_repository.complete_item(item, self.worker_id)
+                    self.job_repository.finish_job(item.job_id)
+                    continue
+                if self.job_service.can_batch(job):
+                    batched.setdefault(job.job_id, []).append(item)
+                    continue
+                futures.append(self._executor.submit(self.job_service.process_item, job, item, self.worker_id))
+            for job_id, job_items in batched.items():
+                self.job_service.process_items(jobs[job_id], job_items, self.worker_id, self._executor)
+            wait(futures)
+        finally:
+            with self._active_lock:
+                for item in items:
+                    self._active_items.pop(item.item_id, None)
+
+        return len(items)
+
+    def _load_jobs(self, job_ids) -> Dict[int, EmailJob]:
+        """Load and prepare the jobs a batch belongs to, without their items; a batch only needs the claimed ones."""
+        jobs = {}
+        for job_id in job_ids:
+            try:
+                job = self.job_repository.get_without_items(job_id)
+                if job:
+                    jobs[job_id] = self.job_service.prepare_job(job)
+            except Exception as e:
+                self.logger.error(f"Error preparing email job {job_id}: {e}")
+        return jobs
+
+    def _heartbeat(self):
+        """Renew leases on running items until the worker stops."""
+        interval = max(self.job_config['lease_seconds'] / 3.0, 1.0)
+        while not self._stop_event.wait(interval):
+            with self._active_lock:
+                item_ids = list(self._active_items)
+            if not item_ids:
+                continue
+            try:
+                self.job_repository.renew_leases(self.worker_id, item_ids, self.job_config['lease_seconds'])
+            except Exception as e:
+                self.logger.error(f"Error renewing leases for worker {self.worker_id}: {e}")
@@ -2,57 +2,142 @@
 Email service for AI-powered email generation and sending.
 """
 
+import contextvars
+import hashlib
+import json
 import logging
-import smtplib
-from datetime import datetime
+import re
+import time
+import uuid
+from concurrent.futures import Executor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Iterator, Generator, Callable
 import openai
-from config.settings import get_openai_config, get_email_config, get_security_config
+from config.settings import (
+    get_openai_config,
+    get_email_config,
+    get_security_config,
+    get_campaign_config,
+    get_email_job_config
+)
 from data.factory import repository_factory
 from data.models.customer import Customer
-from data.models.email_log import EmailLog
+from data.models.email_log import (
+    COMPLIANCE_PENDING, EmailLog, GENERATION_PATH_CAMPAIGN, GENERATION_PATH_CIRCUIT_OPEN, GENERATION_PATH_DEADLINE,
+    GENERATION_PATH_ERROR, GENERATION_PATH_OPENAI, GENERATION_PATH_OPENAI_BATCH, GENERATION_PATH_OPENAI_HEDGED,
+    GENERATION_PATH_REUSED, GENERATION_PATH_TEMPLATE
+)
+from data.models.email_outbox import EmailOutboxMessage
+from business.services.circuit_breaker import CircuitOpenError, openai_circuit_breaker
+from business.services.compliance_cache import compliance_verdict_cache
+from business.services.deadlines import (
+    Deadline, DeadlineExceeded, deadline_scope, get_current_deadline, get_remaining_time, request_hedger
+)
+from business.services.model_router import model_router
+from business.services.openai_client import openai_client_pool
+from business.services.openai_scheduler import PRIORITY_BULK, openai_scheduler, priority_scope
+from business.services.openai_usage import OpenAICall, UsageScope, get_stage_totals, openai_usage_tracker
+from business.services.prompts import (
+    CAMPAIGN_DRAFT_INSTRUCTIONS,
+    CAMPAIGN_SUBJECT_INSTRUCTIONS,
+    COMPLIANCE_REVIEWS,
+    EMAIL_BATCH_INSTRUCTIONS,
+    EMAIL_INSTRUCTIONS,
+    SUBJECT_INSTRUCTIONS,
+    get_compliance_batch_instructions,
+    get_compliance_instructions
+)
+from business.services.rate_limiter import openai_rate_limiter, parse_retry_after
+from business.services.single_flight import generation_flight, get_payload_fingerprint, idempotency_store
+from business.services.template_similarity import get_similarity, patch_text, template_index
+from business.services.smtp_dispatcher import smtp_dispatcher
+from business.services.smtp_pool import smtp_pool
+from business.services.token_budget import (
+    estimate_prompt_tokens,
+    estimate_tokens,
+    fit_request,
+    get_context_window,
+    truncate_to_tokens
+)
+from business.services.template_engine import (
+    CAMPAIGN_PLACEHOLDERS,
+    compile_template,
+    find_placeholders,
+    get_customer_placeholder_values
+)
 
 
 class EmailService:
     """Service class for AI-powered email generation and sending."""
     
+    # Expected body length: tokens per template token, plus greeting and sign-off
+    BODY_TOKENS_PER_TEMPLATE_TOKEN = 1.5
+    BODY_OVERHEAD_TOKENS = 120
+    
+    # Routed task of each compliance review
+    COMPLIANCE_TASKS = {'hipaa': 'hipaa', 'ai': 'ai_check'}
+    
+    # Reply tokens allowed per email in a batched compliance review
+    COMPLIANCE_VERDICT_TOKENS = 60
+    
+    # Reply tokens for a multi-recipient entry's subject and JSON framing, on top of its body
+    BATCH_ENTRY_OVERHEAD_TOKENS = 40
+    
+    # Generation paths of emails that may be patched for a near-identical template
+    REUSABLE_PATHS = (GENERATION_PATH_OPENAI, GENERATION_PATH_OPENAI_HEDGED, GENERATION_PATH_OPENAI_BATCH,
+                      GENERATION_PATH_REUSED)
+    
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.email_log_repository = repository_factory.get_email_log_repository()
+        self.outbox_repository = repository_factory.get_email_outbox_repository()
         self.openai_config = get_openai_config()
         self.email_config = get_email_config()
         self.security_config = get_security_config()
+        self.campaign_config = get_campaign_config()
         
-        # Initialize OpenAI client
-        if self.openai_config['api_key']:
-            openai.api_key = self.openai_config['api_key']
-        else:
+        if not self.openai_config['api_key']:
             self.logger.warning("OpenAI API key not configured")
     
-    def generate_personalized_email(self, customer: Customer, template_text: str, user_id: int) -> EmailLog:
-        """Generate a personalized email using AI."""
-        try:
-            # Create email log entry
-            email_log = EmailLog(
-                customer_id=customer.customer_id,
-                user_id=user_id,
-                template_text=template_text,
-                recipient_email=customer.email
+    def generate_personalized_email(self, customer: Customer, template_text: str, user_id: int,
+                                    idempotency_key: Optional[str] = None) -> EmailLog:
+        """Generate a personalized email using AI.
+        
+        Concurrent requests for the same customer, template and user share one
+        generation. A repeated request with the same idempotency_key returns the
+        email log created by the first one instead of generating again, as long
+        as the customer and template are unchanged.
+        """
+        if idempotency_key:
+            fingerprint = get_payload_fingerprint(customer.customer_id, template_text)
+            email_log_id = idempotency_store.run(
+                f"email:{user_id}:{idempotency_key}:{fingerprint}",
+                lambda: self._generate_single_flight(customer, template_text, user_id).email_log_id
             )
-            
-            # Generate personalized email content using OpenAI
-            if self.openai_config['api_key']:
-                email_log.generated_email = self._generate_with_openai(customer, template_text)
-                email_log.subject = self._generate_subject_with_openai(customer, template_text)
-            else:
-                # Fallback to simple template substitution
-                email_log.generated_email = self._generate_fallback_email(customer, template_text)
-                email_log.subject = f"Message from MyCRM - {customer.company_name}"
+            return self.email_log_repository.get_by_id(email_log_id)
+        return self._generate_single_flight(customer, template_text, user_id)
+    
+    def _generate_single_flight(self, customer: Customer, template_text: str, user_id: int) -> EmailLog:
+        """Generate an email, joining an identical generation that is already in flight."""
+        key = self._get_generation_key(customer, template_text, user_id)
+        return generation_flight.do(key, lambda: self._generate_personalized_email(customer, template_text, user_id))
+    
+    @staticmethod
+    def _get_generation_key(customer: Customer, template_text: str, user_id: int) -> str:
+        """Build the key that identifies identical generation requests."""
+        digest = hashlib.sha256(f"{customer.customer_id}\0{customer.email}\0{template_text}".encode()).hexdigest()
+        return f"{user_id}:{digest}"
+    
+    def _generate_personalized_email(self, customer: Customer, template_text: str, user_id: int) -> EmailLog:
+        """Generate, check and save a personalized email."""
+        try:
+            email_log = self.compose_personalized_email(customer, template_text, user_id)
             
             # Perform compliance checks
-            self._perform_compliance_checks(email_log)
+            with openai_usage_tracker.scope(user_id=user_id) as usage:
+                self._perform_compliance_checks(email_log)
+            email_log.openai_usage = {**email_log.openai_usage, **usage.get_stage_totals()}
             
             # Save email log
             saved_log = self.email_log_repository.create(email_log)
@@ -63,16 +148,352 @@ class EmailService:
         except Exception as e:
             self.logger.error(f"Error generating personalized email: {e}")
             raise
+    
+    def compose_personalized_email(self, customer: Customer, template_text: str, user_id: int) -> EmailLog:
+        """Generate a personalized email's body and subject, without compliance checks or saving."""
+        # Create email log entry
+        email_log = EmailLog(
+            customer_id=customer.customer_id,
+            user_id=user_id,
+            template_text=template_text,
+            recipient_email=customer.email
+        )
+        
+        with openai_usage_tracker.scope(user_id=user_id) as usage:
+            # Generate personalized email content using OpenAI
+            if self.openai_config['api_key']:
+                # Past the deadline the remaining stages fall back to the template at once
+                with deadline_scope(self.openai_config['generation_deadline']):
+                    email_log.generated_email, email_log.generation_path = self._generate_with_openai(
+                        customer, template_text
+                    )
+                    email_log.subject = self._generate_subject_with_openai(customer, template_text)
+            else:
+                # Fallback to simple template substitution
+                email_log.generated_email = self._generate_fallback_email(customer, template_text)
+                email_log.subject = f"Message from MyCRM - {customer.company_name}"
+                email_log.generation_path = GENERATION_PATH_TEMPLATE
+        email_log.openai_usage = usage.get_stage_totals()
+        
+        return email_log
+
+    def compose_personalized_emails(self, customers: List[Customer], template_text: str, user_id: int,
+                                    executor: Optional[Executor] = None) -> List[EmailLog]:
+        """Generate emails for several customers, personalizing a batch of them per AI call.
+        
+        Batches hold up to generation_batch_size customers, as many as the token
+        estimates fit in generation_batch_tokens. Customers whose entry in a
+        batch reply is missing or invalid, and those of a batch whose call
+        fails, are generated one at a time. Calls run on executor if given.
+        Emails patched from a near-identical earlier template are not generated
+        again. Like compose_personalized_email(), nothing is checked or saved.
+        """
+        email_logs: List[Optional[EmailLog]] = self._reuse_similar_run(customers, template_text, user_id)
+        pending = [index for index, email_log in enumerate(email_logs) if email_log is None]
+        
+        batches = []
+        if self.openai_config['api_key'] and self.campaign_config['generation_batch_size'] > 1:
+            batches = [batch for batch in self._plan_generation_batches(customers, template_text, pending)
+                       if len(batch) > 1]
+        batch_logs = self._map(executor, lambda batch: self._compose_email_batch(
+            [customers[index] for index in batch], template_text, user_id
+        ), batches)
+        for batch, generated in zip(batches, batch_logs):
+            for index, email_log in zip(batch, generated):
+                email_logs[index] = email_log
+        
+        missing = [index for index, email_log in enumerate(email_logs) if email_log is None]
+        single_logs = self._map(executor, lambda index: self.compose_personalized_email(
+            customers[index], template_text, user_id
+        ), missing)
+        for index, email_log in zip(missing, single_logs):
+            email_logs[index] = email_log
+        
+        return email_logs
+    
+    def _reuse_similar_run(self, customers: List[Customer], template_text: str, user_id: int) -> List[Optional[EmailLog]]:
+        """Patch the emails of a near-identical earlier template instead of generating them again.
+        
+        With template_reuse_mode "patch" (opt-in), each customer's latest
+        approved AI-written email for the earlier template gets the template's
+        edits applied. Customers without one, or whose email the edits cannot
+        be placed in, get None and are generated as usual. "warn", the default,
+        only logs the match. Earlier templates come from template_index, which
+        is kept per process: a restarted web process or a separate worker.py
+        only matches templates it ran itself.
+        """
+        reused: List[Optional[EmailLog]] = [None] * len(customers)
+        mode = self.campaign_config['template_reuse_mode']
+        if mode not in ('patch', 'warn') or not customers:
+            return reused
+        
+        match = template_index.find_similar(user_id, template_text)
+        template_index.add(user_id, template_text)
+        if match is None:
+            return reused
+        self.logger.warning(f"Template is {match.similarity:.0%} similar to one user {user_id} ran "
+                            f"{(time.time() - match.used_at) / 60:.0f} minute(s) ago")
+        if mode != 'patch':
+            return reused
+        
+        previous: Dict[int, EmailLog] = {}
+        customer_ids = [customer.customer_id for customer in customers if customer.customer_id is not None]
+        for email_log in self.email_log_repository.get_by_template(user_id, match.template_text, customer_ids):
+            if email_log.compliance_approved and email_log.generation_path in self.REUSABLE_PATHS:
+                latest = previous.get(email_log.customer_id)
+                if latest is None or (email_log.email_log_id or 0) > (latest.email_log_id or 0):
+                    previous[email_log.customer_id] = email_log
+        
+        for index, customer in enumerate(customers):
+            prior = previous.get(customer.customer_id)
+            if prior is None or prior.recipient_email != customer.email:
+                continue
+            body = patch_text(match.template_text, template_text, prior.generated_email, customer)
+            # The edits must leave the email recognizably the same one, still addressed to the customer
+            if (body is None or not self._mentions_customer(body, customer)
+                    or get_similarity(prior.generated_email, body) < match.similarity):
+                continue
+            reused[index] = EmailLog(
+                customer_id=customer.customer_id,
+                user_id=user_id,
+                template_text=template_text,
+                recipient_email=customer.email,
+                generated_email=body,
+                subject=patch_text(match.template_text, template_text, prior.subject, customer, strict=False),
+                generation_path=GENERATION_PATH_REUSED
+            )
+        
+        count = len(customers) - reused.count(None)
+        template_index.record_reuse(count, len(customers) - count)
+        self.logger.info(f"Reused {count} of {len(customers)} emails from a {match.similarity:.0%} similar template")
+        return reused
+    
+    @staticmethod
+    def _map(executor: Optional[Executor], func: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+        """Apply func to each item, on executor if given, keeping the caller's usage scope and deadline."""
+        if executor is None:
+            return [func(item) for item in items]
+        contexts = [contextvars.copy_context() for _ in items]
+        return list(executor.map(lambda context, item: context.run(func, item), contexts, items))
+    
+    def _plan_generation_batches(self, customers: List[Customer], template_text: str,
+                                 indexes: List[int]) -> List[List[int]]:
+        """Group the given customer indexes into batches within the batch size and the batch token budget.
+        
+        A customer without an ID, or already in the run, is left out to be generated alone.
+        """
+        batch_size = self.campaign_config['generation_batch_size']
+        budget = min(self.campaign_config['generation_batch_tokens'],
+                     get_context_window(model_router.get_task('body')['model'],
+                                        self.openai_config['context_window']))
+        base_tokens = self._estimate_request_tokens(self._build_email_batch_request([], template_text))
+        reply_tokens = self._get_body_max_tokens(self._truncate_template(template_text)) + self.BATCH_ENTRY_OVERHEAD_TOKENS
+        
+        batchable = []
+        seen = set()
+        for index in indexes:
+            customer = customers[index]
+            if customer.customer_id is not None and customer.customer_id not in seen:
+                seen.add(customer.customer_id)
+                batchable.append(index)
+        item_tokens = [estimate_tokens(self._format_batch_customer(customers[index])) + reply_tokens
+                       for index in batchable]
+        return self._pack_batches(batchable, item_tokens, base_tokens, budget, batch_size)
+    
+    @staticmethod
+    def _format_batch_customer(customer: Customer) -> str:
+        """Describe one customer inside a multi-recipient generation prompt."""
+        return (f"- customer_id {customer.customer_id}: Name: {customer.full_name}; "
+                f"Company: {customer.company_name}; Title: {customer.title}")
+    
+    def _build_email_batch_request(self, customers: List[Customer], template_text: str) -> Dict[str, Any]:
+        """Build the chat completions request that personalizes a template for several customers."""
+        template_text = self._truncate_template(template_text)
+        customer_lines = '\n'.join(self._format_batch_customer(customer) for customer in customers)
+        reply_tokens = self._get_body_max_tokens(template_text) + self.BATCH_ENTRY_OVERHEAD_TOKENS
+        prompt = f"""Email Template:
+{template_text}
+
+Customers ({len(customers)}):
+{customer_lines}"""
+        
+        route = model_router.get_route('body')
+        return {
+            'model': route['model'],
+            'messages': self._build_messages(EMAIL_BATCH_INSTRUCTIONS, prompt),
+            'max_tokens': reply_tokens * max(len(customers), 1),
+            'temperature': route['temperature']
+        }
+    
+    def _compose_email_batch(self, customers: List[Customer], template_text: str,
+                             user_id: int) -> List[Optional[EmailLog]]:
+        """Generate one batch of emails in a single call. Customers without a valid entry get None."""
+        request = self._build_email_batch_request(customers, template_text)
+        with openai_usage_tracker.scope(user_id=user_id) as usage:
+            try:
+                # The batch stands in for each email's body and subject calls
+                with deadline_scope(self.openai_config['generation_deadline']):
+                    response = self._chat_completion('body_batch', **request)
+                entries = self._parse_email_batch(response.choices[0].message.content, customers)
+                invalid = entries.count(None)
+                if invalid:
+                    self.logger.warning(f"Batched generation gave no valid email for {invalid} of {len(customers)} "
+                                        f"customers, generating them one at a time")
+            except Exception as e:
+                self.logger.warning(f"Batched generation for {len(customers)} customers failed, "
+                                    f"generating them one at a time: {e}")
+                entries = [None] * len(customers)
+        
+        shares = [call.share(len(customers)) for call in usage.calls]
+        email_logs: List[Optional[EmailLog]] = []
+        for customer, entry in zip(customers, entries):
+            if entry is None:
+                email_logs.append(None)
+                continue
+            email_logs.append(EmailLog(
+                customer_id=customer.customer_id,
+                user_id=user_id,
+                template_text=template_text,
+                recipient_email=customer.email,
+                generated_email=entry['body'],
+                subject=entry['subject'],
+                generation_path=GENERATION_PATH_OPENAI_BATCH,
+                openai_usage=get_stage_totals(shares)
+            ))
+        return email_logs
+    
+    def _parse_email_batch(self, reply: str, customers: List[Customer]) -> List[Optional[Dict[str, str]]]:
+        """Parse a multi-recipient reply into a subject and body per customer.
+        
+        An entry is invalid if it is repeated, lacks a subject or body, leaves
+        template placeholders unfilled, does not mention its customer, or has
+        the same body as another customer's entry. Invalid entries give None.
+        """
+        match = re.search(r'\[.*\]', reply or '', re.DOTALL)
+        try:
+            entries = json.loads(match.group(0)) if match else []
+        except ValueError:
+            entries = []
+        
+        positions = {customer.customer_id: position for position, customer in enumerate(customers)}
+        results: List[Optional[Dict[str, str]]] = [None] * len(customers)
+        invalid = set()
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                position = positions.get(int(entry.get('customer_id')))
+            except (TypeError, ValueError):
+                continue
+            if position is None:
+                continue
+            if results[position] is not None:
+                invalid.add(position)
+            
+            subject = entry.get('subject')
+            body = entry.get('body')
+            if (not isinstance(subject, str) or not isinstance(body, str)
+                    or not subject.strip() or '\n' in subject.strip() or not body.strip()
+                    or find_placeholders(subject + body)
+                    or not self._mentions_customer(body, customers[position])):
+                invalid.add(position)
+                continue
+            results[position] = {'subject': subject.strip(), 'body': body.strip()}
+        
+        # Identical bodies for different customers were not personalized
+        bodies: Dict[str, List[int]] = {}
+        for position, result in enumerate(results):
+            if result is not None:
+                bodies.setdefault(result['body'], []).append(position)
+        for shared in bodies.values():
+            if len(shared) > 1:
+                invalid.update(shared)
+        
+        for position in invalid:
+            results[position] = None
+        return results
+    
+    @staticmethod
+    def _mentions_customer(body: str, customer: Customer) -> bool:
+        """Whether an email body names its customer or their company, when either is known."""
+        names = [name for name in (customer.first_name, customer.last_name, customer.company_name) if name]
+        lowered = body.lower()
+        return not names or any(name.lower() in lowered for name in names)
+    
+    def stream_personalized_email(self, customer: Customer, template_text: str,
+                                  user_id: int) -> Generator[str, None, EmailLog]:
+        """Generate a personalized email, yielding body text as the AI produces it.
+        
+        When the body is complete the email log is saved, compliance checks run,
+        and the saved log is returned as the generator's return value.
+        """
+        email_log = EmailLog(
+            customer_id=customer.customer_id,
+            user_id=user_id,
+            template_text=template_text,
+            recipient_email=customer.email
+        )
+        
+        # Scopes must not stay open across yields, so each stage gets its own
+        calls = []
+        chunks = []
+        fallback_path = GENERATION_PATH_TEMPLATE
+        if self.openai_config['api_key']:
+            try:
+                with openai_usage_tracker.scope(user_id=user_id) as body_usage:
+                    stream = self._stream_with_openai(customer, template_text)
+                calls = body_usage.calls
+                for chunk in stream:
+                    chunks.append(chunk)
+                    yield chunk
+                email_log.generated_email = ''.join(chunks).strip()
+                email_log.generation_path = GENERATION_PATH_OPENAI
+                with openai_usage_tracker.scope(user_id=user_id) as subject_usage:
+                    email_log.subject = self._generate_subject_with_openai(customer, template_text)
+                calls = calls + subject_usage.calls
+            except CircuitOpenError:
+                fallback_path = GENERATION_PATH_CIRCUIT_OPEN
+            except (TimeoutError, openai.APITimeoutError) as e:
+                self.logger.warning(f"Streaming email with OpenAI ran out of time, using the template: {e}")
+                fallback_path = GENERATION_PATH_DEADLINE
+            except Exception as e:
+                self.logger.error(f"Error streaming email with OpenAI: {e}")
+                fallback_path = GENERATION_PATH_ERROR
+        
+        if not email_log.generated_email:
+            email_log.generated_email = self._generate_fallback_email(customer, template_text)
+            email_log.subject = f"Message from MyCRM - {customer.company_name}"
+            email_log.generation_path = fallback_path
+            if not chunks:
+                yield email_log.generated_email
+        
+        try:
+            saved_log = self.email_log_repository.create(email_log)
+            with openai_usage_tracker.scope(user_id=user_id) as compliance_usage:
+                self._perform_compliance_checks(saved_log)
+            saved_log.openai_usage = get_stage_totals(calls + compliance_usage.calls)
+            saved_log = self.email_log_repository.update(saved_log)
+            self.logger.info(f"Generated streamed email for customer: {customer}")
+            return saved_log
+        except Exception as e:
+            self.logger.error(f"Error saving streamed email: {e}")
+            raise
 
     def generate_bulk_personalized_emails(self, customers: List[Customer], template_text: str, user_id: int) -> List[EmailLog]:
-        """Generate personalized emails for multiple customers using AI."""
+        """Generate personalized emails for multiple customers using AI.
+        
+        Emails are personalized several recipients per AI call, then the
+        compliance checks review them in batches before they are saved.
+        """
         try:
-            email_logs = []
+            with openai_usage_tracker.scope(user_id=user_id), priority_scope(PRIORITY_BULK):
+                composed = self.compose_personalized_emails(customers, template_text, user_id)
+                self.perform_batched_compliance_checks(composed)
             
-            for customer in customers:
+            email_logs = []
+            for customer, email_log in zip(customers, composed):
                 try:
-                    email_log = self.generate_personalized_email(customer, template_text, user_id)
-                    email_logs.append(email_log)
+                    email_logs.append(self.email_log_repository.create(email_log))
                     self.logger.info(f"Generated email for customer: {customer.full_name}")
                 except Exception as e:
                     self.logger.error(f"Failed to generate email for customer {customer.full_name}: {e}")
@@ -94,139 +515,463 @@ class EmailService:
             self.logger.error(f"Error generating bulk personalized emails: {e}")
             raise
 
+    def generate_campaign_emails(self, customers: List[Customer], template_text: str, user_id: int,
+                                 sample_size: Optional[int] = None) -> List[EmailLog]:
+        """Generate campaign emails from a single AI-personalized draft.
+        
+        The template is personalized once into a draft with placeholders, which is
+        then filled locally for each customer. Only the first ``sample_size``
+        customers get a full per-recipient AI generation.
+        """
+        try:
+            if sample_size is None:
+                sample_size = self.campaign_config['llm_sample_size']
+            
+            with openai_usage_tracker.scope(user_id=user_id), priority_scope(PRIORITY_BULK):
+                draft = self.create_campaign_draft(template_text)
+                
+                email_logs = []
+                for index, customer in enumerate(customers):
+                    email_logs.append(self.generate_campaign_email(draft, customer, user_id, use_ai=index < sample_size))
+            
+            self.logger.info(f"Generated {len(email_logs)} campaign emails for {len(customers)} customers (AI sample: {min(sample_size, len(customers))})")
+            return email_logs
+            
+        except Exception as e:
+            self.logger.error(f"Error generating campaign emails: {e}")
+            raise
+    
+    def create_campaign_draft(self, template_text: str) -> EmailLog:
+        """Personalize a template into a compliance-checked campaign draft (not saved)."""
+        with openai_usage_tracker.scope() as usage:
+            draft_body, draft_subject = self._generate_campaign_draft(template_text)
+            
+            # Review the draft once - every rendered email shares its content
+            draft = EmailLog(template_text=template_text, generated_email=draft_body, subject=draft_subject)
+            self._perform_compliance_checks(draft)
+        draft.openai_usage = usage.get_stage_totals()
+        return draft
+    
+    def generate_campaign_email(self, draft: EmailLog, customer: Customer, user_id: int, use_ai: bool = False) -> EmailLog:
+        """Fill a campaign draft for one customer, or generate it with AI for sampled customers.
+        
+        The draft's compliance verdict is copied to the rendered email only
+        while the draft's placeholders are limited to CAMPAIGN_PLACEHOLDERS
+        (name, company and title): filling those cannot change what the
+        review saw. A draft using any other customer field, e.g. the template
+        fallback draft of a template with {linkedin_url}, has each rendered email
+        reviewed on its own instead.
+        """
+        if use_ai and self.openai_config['api_key']:
+            try:
+                return self.generate_personalized_email(customer, draft.template_text, user_id)
+            except Exception as e:
+                self.logger.warning(f"Sample generation failed for customer {customer.full_name}, using campaign draft: {e}")
+        
+        values = get_customer_placeholder_values(customer)
+        email_log = EmailLog(
+            customer_id=customer.customer_id,
+            user_id=user_id,
+            template_text=draft.template_text,
+            recipient_email=customer.email,
+            generated_email=compile_template(draft.generated_email).render(values),
+            subject=compile_template(draft.subject).render(values),
+            hipaa_compliance_check=draft.hipaa_compliance_check,
+            ai_compliance_check=draft.ai_compliance_check,
+            compliance_approved=draft.compliance_approved,
+            generation_path=GENERATION_PATH_CAMPAIGN
+        )
+        if (find_placeholders(draft.generated_email) | find_placeholders(draft.subject)) - set(CAMPAIGN_PLACEHOLDERS):
+            with openai_usage_tracker.scope(user_id=user_id) as usage:
+                self._perform_compliance_checks(email_log)
+            email_log.openai_usage = usage.get_stage_totals()
+        return self.email_log_repository.create(email_log)
+
     def send_bulk_emails(self, email_log_ids: List[int]) -> Dict[int, bool]:
-        """Send multiple emails and return success status for each."""
+        """Queue multiple emails for sending and return whether each was queued.
+        
+        Email logs are loaded, checked and queued a chunk at a time, so the
+        number of repository round trips grows with chunks rather than recipients.
+        """
         try:
             results = {}
+            chunk_size = self.email_config['bulk_send_chunk_size']
             
-            for email_log_id in email_log_ids:
-                try:
-                    success = self.send_email(email_log_id)
-                    results[email_log_id] = success
-                    self.logger.info(f"Email {email_log_id} send result: {success}")
-                except Exception as e:
-                    self.logger.error(f"Failed to send email {email_log_id}: {e}")
-                    results[email_log_id] = False
+            for start in range(0, len(email_log_ids), chunk_size):
+                results.update(self._enqueue_chunk(email_log_ids[start:start + chunk_size]))
             
+            if any(results.values()):
+                self._wake_outbox_dispatcher()
             return results
             
         except Exception as e:
             self.logger.error(f"Error sending bulk emails: {e}")
             raise
     
-    def _generate_with_openai(self, customer: Customer, template_text: str) -> str:
-        """Generate email content using OpenAI."""
+    def _enqueue_chunk(self, email_log_ids: List[int]) -> Dict[int, bool]:
+        """Load, check and queue a chunk of emails with one read and one write."""
+        email_logs = {email_log.email_log_id: email_log
+                      for email_log in self.email_log_repository.get_by_ids(email_log_ids)}
+        results = {}
+        sendable = []
+        
+        for email_log_id in email_log_ids:
+            if email_log_id in results:
+                continue
+            try:
+                self._check_sendable(email_log_id, email_logs.get(email_log_id))
+                sendable.append(email_logs[email_log_id])
+                results[email_log_id] = True
+            except ValueError as e:
+                self.logger.error(f"Failed to queue email {email_log_id}: {e}")
+                results[email_log_id] = False
+        
+        if sendable:
+            try:
+                self.outbox_repository.enqueue_many([self._build_outbox_message(email_log) for email_log in sendable])
+                self.logger.info(f"Queued {len(sendable)} emails")
+            except Exception as e:
+                self.logger.error(f"Failed to queue {len(sendable)} emails: {e}")
+                results.update({email_log.email_log_id: False for email_log in sendable})
+        return results
+    
+    def _chat_completion(self, stage: str = 'other', **request) -> Any:
+        """Call the OpenAI chat completions API within the shared rate limits.
+        
+        Calls wait their turn in the scheduler, interactive ones before bulk
+        ones and users in fair shares, before taking rate limit budget.
+        Throttling (429), server errors (5xx) and connection errors are retried
+        with jittered exponential backoff. Other errors are raised immediately.
+        The call must finish within its stage's deadline and any enclosing
+        deadline_scope(), and slow non-streaming calls are hedged.
+        The call is recorded under ``stage`` for latency, token and cost metrics.
+        """
+        return self._hedged_chat_completion(stage, request)[0]
+    
+    def _hedged_chat_completion(self, stage: str, request: Dict[str, Any]) -> Tuple[Any, bool]:
+        """Make a call under its stage deadline. Returns the response and whether a hedged duplicate produced it."""
+        request = self._fit_request(request)
+        with deadline_scope(model_router.get_timeout(stage)):
+            if request.get('stream'):
+                # A stream is shown as it arrives, so it cannot be raced
+                return self._call_with_retries(stage, request), False
+            return request_hedger.call(stage, lambda: self._call_with_retries(stage, request))
+    
+    def _call_with_retries(self, stage: str, request: Dict[str, Any]) -> Any:
+        """Send a request, retrying transient failures until the current deadline."""
+        estimated_tokens = self._estimate_request_tokens(request)
+        started = time.monotonic()
+        attempt = 0
+        
         try:
-            prompt = f"""
-            Please personalize the following email template for a customer:
-            
-            Customer Information:
-            - Name: {customer.full_name}
-            - Company: {customer.company_name}
-            - Title: {customer.title}
-            
-            Email Template:
-            {template_text}
-            
-            Please create a professional, personalized email that:
-            1. Uses the customer's name and company appropriately
-            2. Maintains a professional tone
-            3. Is appropriate for business communication
-            4. Does not include any inappropriate content
-            
-            Return only the email body content, no subject line.
-            """
-            
-            response = openai.chat.completions.create(
-                model=self.openai_config['model'],
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a professional email assistant that creates personalized business emails."
-                    },
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                max_tokens=self.openai_config['max_tokens'],
-                temperature=self.openai_config['temperature']
-            )
+            while True:
+                deadline = get_current_deadline()
+                if deadline:
+                    deadline.check(f"OpenAI {stage} call")
+                # Refuse before taking rate limit budget while the provider is known to be down
+                openai_circuit_breaker.check()
+                retry_after = None
+                with openai_scheduler.turn(estimated_tokens, get_remaining_time()), \
+                        openai_rate_limiter.slot(estimated_tokens, get_remaining_time()):
+                    try:
+                        # The request is abandoned at the deadline rather than the client's read timeout
+                        remaining = get_remaining_time()
+                        def send():
+                            return self._create_chat_completion(
+                                request if remaining is None else {**request, 'timeout': remaining}
+                            )
+                        
+                        # A hedged attempt cancelled because the other one won does not count against the provider
+                        abandoned = (lambda: deadline.cancelled) if deadline else None
+                        if request.get('stream'):
+                            # A stream's outcome is only known once it has been read to the end
+                            response = openai_circuit_breaker.call_stream(
+                                lambda: self._read_before_deadline(send(), stage, deadline), abandoned
+                            )
+                        else:
+                            response = openai_circuit_breaker.call(send, abandoned)
+                    except openai.RateLimitError as e:
+                        if getattr(e, 'code', None) == 'insufficient_quota':
+                            raise
+                        retry_after = parse_retry_after(e)
+                        openai_rate_limiter.record_throttle(retry_after)
+                        error = e
+                    except openai.APIStatusError as e:
+                        if e.status_code < 500:
+                            raise
+                        retry_after = parse_retry_after(e)
+                        error = e
+                    except openai.APIConnectionError as e:
+                        error = e
+                    else:
+                        usage = getattr(response, 'usage', None)
+                        openai_rate_limiter.record_usage(estimated_tokens, getattr(usage, 'total_tokens', None))
+                        openai_rate_limiter.record_success()
+                        if request.get('stream'):
+                            return self._track_stream(response, stage, request['model'], started, attempt,
+                                                      openai_usage_tracker.get_current_scope())
+                        openai_usage_tracker.record(stage, request['model'], usage, time.monotonic() - started, attempt)
+                        model_router.record_latency(stage, request['model'], time.monotonic() - started)
+                        return response
+                
+                if attempt >= self.openai_config['max_retries']:
+                    raise error
+                
+                delay = openai_rate_limiter.get_backoff_delay(attempt, retry_after)
+                remaining = get_remaining_time()
+                if remaining is not None and delay >= remaining:
+                    raise DeadlineExceeded(f"OpenAI {stage} call cannot be retried before its deadline: {error}")
+                
+                self.logger.warning(f"OpenAI call failed ({error}), retrying in {delay:.1f}s (attempt {attempt + 1})")
+                time.sleep(delay)
+                attempt += 1
+        except CircuitOpenError:
+            # Refused calls never reached the provider, so they are not recorded as calls
+            raise
+        except Exception:
+            openai_usage_tracker.record(stage, request.get('model', ''), None, time.monotonic() - started, attempt,
+                                        success=False)
+            raise
+    
+    @staticmethod
+    def _read_before_deadline(stream: Iterator[Any], stage: str, deadline: Optional[Deadline]) -> Iterator[Any]:
+        """Yield a stream's chunks under the deadline it was opened with.
+        
+        Each read is bounded by the request timeout, and a stream still
+        arriving at the deadline is closed with DeadlineExceeded.
+        """
+        try:
+            for chunk in stream:
+                if deadline:
+                    deadline.check(f"the OpenAI {stage} stream finished")
+                yield chunk
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+    
+    def _track_stream(self, stream: Iterator[Any], stage: str, model: str, started: float,
+                      retries: int, scope: Optional[UsageScope]) -> Iterator[Any]:
+        """Yield a streamed response's chunks, recording the call in scope when the stream ends."""
+        usage = None
+        success = False
+        try:
+            for chunk in stream:
+                usage = getattr(chunk, 'usage', None) or usage
+                yield chunk
+            success = True
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+            openai_usage_tracker.record(stage, model, usage, time.monotonic() - started, retries,
+                                        success=success, scope=scope)
+    
+    def _create_chat_completion(self, request: Dict[str, Any]) -> Any:
+        """Send a single chat completions request."""
+        return openai_client_pool.get_client().chat.completions.create(**request)
+    
+    @staticmethod
+    def _estimate_request_tokens(request: Dict[str, Any]) -> int:
+        """Estimate the tokens a request uses: its prompt plus the most it may generate."""
+        return estimate_prompt_tokens(request.get('messages', [])) + request.get('max_tokens', 0)
+    
+    def _fit_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Shrink max_tokens to fit the model's context window, or raise TokenBudgetExceeded."""
+        context_window = get_context_window(request['model'], self.openai_config['context_window'])
+        return fit_request(request, context_window, self.openai_config['min_output_tokens'])
+    
+    def _truncate_template(self, template_text: str) -> str:
+        """Cut an oversized template down to the prompt budget for templates."""
+        truncated = truncate_to_tokens(template_text, self.openai_config['max_template_tokens'])
+        if truncated != template_text:
+            self.logger.warning(f"Template of about {estimate_tokens(template_text)} tokens truncated for the prompt")
+        return truncated
+    
+    def _get_body_max_tokens(self, template_text: str) -> int:
+        """Size the reply budget for an email body from its template, within the configured bounds."""
+        expected = int(estimate_tokens(template_text) * self.BODY_TOKENS_PER_TEMPLATE_TOKEN) + self.BODY_OVERHEAD_TOKENS
+        return max(self.openai_config['min_output_tokens'], min(expected, model_router.get_task('body')['max_tokens']))
+    
+    def _build_email_request(self, customer: Customer, template_text: str) -> Dict[str, Any]:
+        """Build the chat completions request that personalizes an email body."""
+        template_text = self._truncate_template(template_text)
+        prompt = f"""Email Template:
+{template_text}
+
+Customer Information:
+{self._format_customer(customer)}"""
+        
+        route = model_router.get_route('body')
+        return {
+            'model': route['model'],
+            'messages': self._build_messages(EMAIL_INSTRUCTIONS, prompt),
+            'max_tokens': self._get_body_max_tokens(template_text),
+            'temperature': route['temperature']
+        }
+    
+    @staticmethod
+    def _build_messages(instructions: str, prompt: str) -> List[Dict[str, str]]:
+        """Put a prompt's fixed instructions first, so requests share a cacheable prefix, and its data last."""
+        return [
+            {
+                "role": "system",
+                "content": instructions
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    
+    @staticmethod
+    def _format_customer(customer: Customer) -> str:
+        """Describe the customer an email is personalized for."""
+        return f"- Name: {customer.full_name}\n- Company: {customer.company_name}\n- Title: {customer.title}"
+    
+    def _generate_with_openai(self, customer: Customer, template_text: str) -> Tuple[str, str]:
+        """Generate email content using OpenAI. Returns the body and the generation path that produced it."""
+        try:
+            response, hedged = self._hedged_chat_completion('body', self._build_email_request(customer, template_text))
             
-            return response.choices[0].message.content.strip()
+            return (response.choices[0].message.content.strip(),
+                    GENERATION_PATH_OPENAI_HEDGED if hedged else GENERATION_PATH_OPENAI)
             
+        except CircuitOpenError:
+            return self._generate_fallback_email(customer, template_text), GENERATION_PATH_CIRCUIT_OPEN
+        except (TimeoutError, openai.APITimeoutError) as e:
+            self.logger.warning(f"Email generation with OpenAI ran out of time, using the template: {e}")
+            return self._generate_fallback_email(customer, template_text), GENERATION_PATH_DEADLINE
         except Exception as e:
             self.logger.error(f"Error generating email with OpenAI: {e}")
             # Fallback to simple substitution
-            return self._generate_fallback_email(customer, template_text)
+            return self._generate_fallback_email(customer, template_text), GENERATION_PATH_ERROR
+    
+    def _stream_with_openai(self, customer: Customer, template_text: str) -> Iterator[str]:
+        """Start generating email content using OpenAI and return its text as it arrives."""
+        stream = self._chat_completion(
+            'body', stream=True, stream_options={'include_usage': True},
+            **self._build_email_request(customer, template_text)
+        )
+        return (chunk.choices[0].delta.content for chunk in stream
+                if chunk.choices and chunk.choices[0].delta.content)
+    
+    def _build_subject_request(self, customer: Customer, template_text: str) -> Dict[str, Any]:
+        """Build the chat completions request that writes a subject line."""
+        prompt = f"""Email Template:
+{template_text[:200]}...
+
+Customer Information:
+{self._format_customer(customer)}"""
+        
+        route = model_router.get_route('subject')
+        return {
+            'model': route['model'],
+            'messages': self._build_messages(SUBJECT_INSTRUCTIONS, prompt),
+            'max_tokens': route['max_tokens'],
+            'temperature': route['temperature']
+        }
     
     def _generate_subject_with_openai(self, customer: Customer, template_text: str) -> str:
         """Generate email subject using OpenAI."""
         try:
-            prompt = f"""
-            Based on this email template for {customer.full_name} at {customer.company_name}:
-            {template_text[:200]}...
-            
-            Generate a professional email subject line that is:
-            1. Clear and concise
-            2. Relevant to the content
-            3. Professional
-            4. Under 50 characters
-            
-            Return only the subject line, no quotes or extra text.
-            """
-            
-            response = openai.chat.completions.create(
-                model=self.openai_config['model'],
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a professional email assistant that creates email subject lines."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=50,
-                temperature=0.3
-            )
+            response = self._chat_completion('subject', **self._build_subject_request(customer, template_text))
             
             return response.choices[0].message.content.strip()
             
+        except CircuitOpenError:
+            return f"Message for {customer.company_name}"
         except Exception as e:
             self.logger.error(f"Error generating subject with OpenAI: {e}")
             return f"Message for {customer.company_name}"
     
+    def _generate_campaign_draft(self, template_text: str) -> Tuple[str, str]:
+        """Personalize a template once into a body and subject draft with placeholders."""
+        fallback_body = f"Dear {{name}},\n\n{template_text}\n\nBest regards,\nMyCRM Team"
+        fallback_subject = "Message from MyCRM - {company}"
+        
+        if not self.openai_config['api_key']:
+            return fallback_body, fallback_subject
+        
+        placeholders = ', '.join(f"{{{name}}}" for name in CAMPAIGN_PLACEHOLDERS)
+        template_text = self._truncate_template(template_text)
+        
+        try:
+            route = model_router.get_route('body')
+            response = self._chat_completion(
+                'campaign_draft',
+                model=route['model'],
+                messages=self._build_messages(CAMPAIGN_DRAFT_INSTRUCTIONS.format(placeholders=placeholders),
+                                              f"Email Template:\n{template_text}"),
+                max_tokens=self._get_body_max_tokens(template_text),
+                temperature=route['temperature']
+            )
+            draft_body = response.choices[0].message.content.strip()
+            
+            route = model_router.get_route('subject')
+            response = self._chat_completion(
+                'campaign_subject',
+                model=route['model'],
+                messages=self._build_messages(CAMPAIGN_SUBJECT_INSTRUCTIONS,
+                                              f"Campaign Email Draft:\n{draft_body[:200]}..."),
+                max_tokens=route['max_tokens'],
+                temperature=route['temperature']
+            )
+            draft_subject = response.choices[0].message.content.strip()
+            
+        except Exception as e:
+            self.logger.error(f"Error generating campaign draft with OpenAI: {e}")
+            return fallback_body, fallback_subject
+        
+        # A draft without recipient placeholders would send identical text to everyone
+        unknown = find_placeholders(draft_body) - set(CAMPAIGN_PLACEHOLDERS)
+        if unknown or not find_placeholders(draft_body):
+            self.logger.warning(f"Campaign draft has invalid placeholders {sorted(unknown)}, using template draft")
+            return fallback_body, fallback_subject
+        
+        if find_placeholders(draft_subject) - set(CAMPAIGN_PLACEHOLDERS):
+            draft_subject = fallback_subject
+        
+        return draft_body, draft_subject
+    
     def _generate_fallback_email(self, customer: Customer, template_text: str) -> str:
         """Generate email using simple template substitution."""
-        personalized_text = template_text
-        
-        # Simple substitutions
-        personalized_text = personalized_text.replace("{name}", customer.full_name)
-        personalized_text = personalized_text.replace("{first_name}", customer.first_name)
-        personalized_text = personalized_text.replace("{last_name}", customer.last_name)
-        personalized_text = personalized_text.replace("{company}", customer.company_name)
-        personalized_text = personalized_text.replace("{title}", customer.title)
+        personalized_text = compile_template(template_text).render_customer(customer)
         
         return f"Dear {customer.full_name},\n\n{personalized_text}\n\nBest regards,\nMyCRM Team"
     
     def _perform_compliance_checks(self, email_log: EmailLog):
         """Perform HIPAA and AI compliance checks."""
-        compliance_approved = True
+        hipaa_result = None
+        ai_result = None
         
         # HIPAA compliance check
         if self.security_config['enable_hipaa_compliance']:
-            email_log.hipaa_compliance_check = self._check_hipaa_compliance(email_log.generated_email)
-            if "VIOLATION" in email_log.hipaa_compliance_check.upper():
+            hipaa_result = self._check_hipaa_compliance(email_log.generated_email)
+        
+        # AI compliance check
+        if self.security_config['enable_ai_compliance']:
+            ai_result = self._check_ai_compliance(email_log.generated_email)
+        
+        self._apply_compliance_results(email_log, hipaa_result, ai_result)
+    
+    def _apply_compliance_results(self, email_log: EmailLog, hipaa_result: Optional[str], ai_result: Optional[str]):
+        """Record compliance check results on an email log. None means the check is disabled.
+        
+        Pending reviews leave the email unapproved until recheck_compliance() completes them.
+        """
+        compliance_approved = True
+        
+        if hipaa_result is not None:
+            email_log.hipaa_compliance_check = hipaa_result
+            if "VIOLATION" in hipaa_result.upper() or hipaa_result.startswith(COMPLIANCE_PENDING):
                 compliance_approved = False
         else:
             email_log.hipaa_compliance_check = "HIPAA compliance checking disabled"
         
-        # AI compliance check
-        if self.security_config['enable_ai_compliance']:
-            email_log.ai_compliance_check = self._check_ai_compliance(email_log.generated_email)
-            if "VIOLATION" in email_log.ai_compliance_check.upper():
+        if ai_result is not None:
+            email_log.ai_compliance_check = ai_result
+            if "VIOLATION" in ai_result.upper() or ai_result.startswith(COMPLIANCE_PENDING):
                 compliance_approved = False
         else:
             email_log.ai_compliance_check = "AI compliance checking disabled"
@@ -235,160 +980,318 @@ class EmailService:
         
         self.logger.info(f"Compliance check completed - Approved: {compliance_approved}")
     
+    @staticmethod
+    def _get_pending_compliance_result(name: str) -> str:
+        """Result recorded for a review skipped while the AI provider's circuit is open."""
+        return f"{COMPLIANCE_PENDING}: {name} compliance review will run when the AI provider is available again"
+    
+    def recheck_compliance(self, email_log_id: int) -> EmailLog:
+        """Run the compliance checks of an unsent email again, e.g. once pending reviews can complete."""
+        try:
+            email_log = self.email_log_repository.get_by_id(email_log_id)
+            if not email_log:
+                raise ValueError(f"Email log with ID {email_log_id} not found")
+            if email_log.email_sent:
+                raise ValueError("Email has already been sent")
+            
+            with openai_usage_tracker.scope(user_id=email_log.user_id) as usage:
+                self._perform_compliance_checks(email_log)
+            email_log.openai_usage = {**email_log.openai_usage, **usage.get_stage_totals()}
+            return self.email_log_repository.update(email_log)
+            
+        except Exception as e:
+            self.logger.error(f"Error rechecking compliance: {e}")
+            raise
+    
+    def perform_batched_compliance_checks(self, email_logs: List[EmailLog]):
+        """Perform HIPAA and AI compliance checks for many emails, reviewing several per AI call.
+        
+        Emails with a cached verdict are not reviewed again. The rest are
+        packed into batches of up to compliance_batch_size that fit
+        compliance_batch_tokens, and each batch gets one classification call per
+        check that returns a verdict for every email. Emails whose verdict is
+        missing or unclear, and batches whose call fails, are reviewed one at a time.
+        """
+        hipaa_results: List[Optional[str]] = [None] * len(email_logs)
+        ai_results: List[Optional[str]] = [None] * len(email_logs)
+        calls: List[List[OpenAICall]] = [[] for _ in email_logs]
+        contents = [email_log.generated_email for email_log in email_logs]
+        
+        if self.security_config['enable_hipaa_compliance']:
+            hipaa_results = self._check_compliance_batched('hipaa', contents, calls)
+        if self.security_config['enable_ai_compliance']:
+            ai_results = self._check_compliance_batched('ai', contents, calls)
+        
+        for email_log, hipaa_result, ai_result, email_calls in zip(email_logs, hipaa_results, ai_results, calls):
+            self._apply_compliance_results(email_log, hipaa_result, ai_result)
+            email_log.openai_usage = {**email_log.openai_usage, **get_stage_totals(email_calls)}
+    
+    def _check_compliance_batched(self, review: str, contents: List[str], calls: List[List[OpenAICall]]) -> List[str]:
+        """Review many emails for one check, adding each email's share of the calls to calls."""
+        check = self._check_hipaa_compliance if review == 'hipaa' else self._check_ai_compliance
+        name = COMPLIANCE_REVIEWS[review]['name']
+        model = self._get_compliance_model(review)
+        results: List[Optional[str]] = [None] * len(contents)
+        
+        batches = []
+        if self.openai_config['api_key']:
+            results = compliance_verdict_cache.get_many(review, model, contents)
+            uncached = [index for index, result in enumerate(results) if result is None]
+            batches = self._plan_compliance_batches(review, contents, uncached)
+        for batch in batches:
+            if len(batch) < 2:
+                continue
+            request = self._build_compliance_batch_request(review, [contents[index] for index in batch])
+            with openai_usage_tracker.scope() as usage:
+                try:
+                    response = self._chat_completion(f"{review}_compliance_batch", **request)
+                    verdicts = self._parse_compliance_verdicts(response.choices[0].message.content, len(batch))
+                    unclear = verdicts.count(None)
+                    if unclear:
+                        self.logger.warning(f"Batched {name} compliance check gave no clear verdict for {unclear} "
+                                            f"of {len(batch)} emails, reviewing them one at a time")
+                except CircuitOpenError:
+                    verdicts = [self._get_pending_compliance_result(name)] * len(batch)
+                except Exception as e:
+                    self.logger.warning(f"Batched {name} compliance check failed, reviewing emails one at a time: {e}")
+                    verdicts = [None] * len(batch)
+            compliance_verdict_cache.put_many(review, request['model'], [contents[index] for index in batch], verdicts)
+            for index, verdict in zip(batch, verdicts):
+                results[index] = verdict
+                calls[index].extend(call.share(len(batch)) for call in usage.calls)
+        
+        for index, content in enumerate(contents):
+            if results[index] is None:
+                with openai_usage_tracker.scope() as usage:
+                    results[index] = check(content)
+                calls[index].extend(usage.calls)
+        
+        return results
+    
+    def _plan_compliance_batches(self, review: str, contents: List[str], indexes: List[int]) -> List[List[int]]:
+        """Group the given email indexes into batches within the batch size and the batch token budget."""
+        batch_size = self.security_config['compliance_batch_size']
+        budget = min(self.security_config['compliance_batch_tokens'],
+                     get_context_window(model_router.get_task(self.COMPLIANCE_TASKS[review])['model'],
+                                        self.openai_config['context_window']))
+        base_tokens = self._estimate_request_tokens(self._build_compliance_batch_request(review, []))
+        
+        item_tokens = [estimate_tokens(self._format_batch_email(batch_size, contents[index]))
+                       + self.COMPLIANCE_VERDICT_TOKENS for index in indexes]
+        return self._pack_batches(indexes, item_tokens, base_tokens, budget, batch_size)
+    
+    @staticmethod
+    def _pack_batches(indexes: List[int], item_tokens: List[int], base_tokens: int, budget: int,
+                      batch_size: int) -> List[List[int]]:
+        """Pack items into consecutive batches of at most batch_size whose tokens fit the budget.
+        
+        item_tokens holds each item's prompt and reply tokens and base_tokens what
+        every request needs; an item too large for the budget gets a batch of its own.
+        """
+        batches: List[List[int]] = []
+        batch: List[int] = []
+        used = base_tokens
+        for index, tokens in zip(indexes, item_tokens):
+            if batch and (len(batch) >= batch_size or used + tokens > budget):
+                batches.append(batch)
+                batch = []
+                used = base_tokens
+            batch.append(index)
+            used += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    @staticmethod
+    def _format_batch_email(number: int, email_content: str) -> str:
+        """Mark one email's content inside a batched compliance prompt."""
+        return f'<email id="{number}">\n{email_content}\n</email>'
+    
+    def _build_compliance_batch_request(self, review: str, contents: List[str]) -> Dict[str, Any]:
+        """Build the chat completions request that classifies several emails for one compliance check."""
+        emails = '\n\n'.join(self._format_batch_email(number, content) for number, content in enumerate(contents, 1))
+        
+        route = model_router.get_route(self.COMPLIANCE_TASKS[review])
+        return {
+            'model': route['model'],
+            'messages': self._build_messages(get_compliance_batch_instructions(review), emails),
+            'max_tokens': self.COMPLIANCE_VERDICT_TOKENS * max(len(contents), 1) + 20,
+            'temperature': route['temperature']
+        }
+    
+    @staticmethod
+    def _parse_compliance_verdicts(reply: str, count: int) -> List[Optional[str]]:
+        """Parse a batched review into an "APPROVED: ..." or "VIOLATION: ..." result per email.
+        
+        An email whose entry is missing, repeated or has an unknown verdict gets None.
+        """
+        results: List[Optional[str]] = [None] * count
+        match = re.search(r'\{.*\}', reply or '', re.DOTALL)
+        try:
+            entries = json.loads(match.group(0))['results'] if match else []
+        except (ValueError, KeyError, TypeError):
+            entries = []
+        
+        seen = set()
+        repeated = set()
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                index = int(entry.get('id')) - 1
+            except (TypeError, ValueError):
+                continue
+            verdict = str(entry.get('verdict', '')).strip().upper()
+            if not 0 <= index < count or verdict not in ('APPROVED', 'VIOLATION'):
+                continue
+            if index in seen:
+                repeated.add(index)
+            seen.add(index)
+            reason = str(entry.get('reason') or '').strip() or "No reason given"
+            results[index] = f"{verdict}: {reason}"
+        
+        for index in repeated:
+            results[index] = None
+        return results
+    
+    def _get_compliance_model(self, review: str) -> str:
+        """Get the model that runs a compliance review now; cached verdicts are only reused for the same model."""
+        return model_router.get_route(self.COMPLIANCE_TASKS[review])['model']
+    
+    def _build_compliance_request(self, review: str, email_content: str) -> Dict[str, Any]:
+        """Build the chat completions request for one email's compliance review."""
+        route = model_router.get_route(self.COMPLIANCE_TASKS[review])
+        return {
+            'model': route['model'],
+            'messages': self._build_messages(get_compliance_instructions(review), email_content),
+            'max_tokens': route['max_tokens'],
+            'temperature': route['temperature']
+        }
+    
+    def _build_hipaa_request(self, email_content: str) -> Dict[str, Any]:
+        """Build the chat completions request for a HIPAA compliance review."""
+        return self._build_compliance_request('hipaa', email_content)
+    
     def _check_hipaa_compliance(self, email_content: str) -> str:
         """Check email content for HIPAA compliance."""
         try:
             if not self.openai_config['api_key']:
                 return "HIPAA compliance check skipped - OpenAI not configured"
             
-            prompt = f"""
-            Please review the following email content for HIPAA compliance:
-            
-            {email_content}
-            
-            Check for:
-            1. No personal health information (PHI)
-            2. No medical condition details
-            3. No protected health information
-            4. Professional business communication only
-            
-            Respond with either:
-            "APPROVED: [brief reason]" or "VIOLATION: [specific issue]"
-            """
+            request = self._build_hipaa_request(email_content)
+            cached = compliance_verdict_cache.get('hipaa', request['model'], email_content)
+            if cached is not None:
+                return cached
             
-            response = openai.chat.completions.create(
-                model=self.openai_config['model'],
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a HIPAA compliance officer reviewing business emails."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=200,
-                temperature=0.1
-            )
+            response = self._chat_completion('hipaa_compliance', **request)
             
-            return response.choices[0].message.content.strip()
+            result = response.choices[0].message.content.strip()
+            compliance_verdict_cache.put('hipaa', request['model'], email_content, result)
+            return result
             
+        except CircuitOpenError:
+            return self._get_pending_compliance_result('HIPAA')
         except Exception as e:
             self.logger.error(f"Error checking HIPAA compliance: {e}")
             return f"HIPAA compliance check failed: {str(e)}"
     
+    def _build_ai_compliance_request(self, email_content: str) -> Dict[str, Any]:
+        """Build the chat completions request for a Responsible AI review."""
+        return self._build_compliance_request('ai', email_content)
+    
     def _check_ai_compliance(self, email_content: str) -> str:
         """Check email content for Microsoft Responsible AI principles."""
         try:
             if not self.openai_config['api_key']:
                 return "AI compliance check skipped - OpenAI not configured"
             
-            prompt = f"""
-            Please review the following email content against Microsoft's Responsible AI principles:
-            
-            {email_content}
+            request = self._build_ai_compliance_request(email_content)
+            cached = compliance_verdict_cache.get('ai', request['model'], email_content)
+            if cached is not None:
+                return cached
             
-            Check for:
-            1. Fairness and inclusivity
-            2. Reliability and safety
-            3. Privacy and security
-            4. Transparency
-            5. Accountability
-            6. No harmful or inappropriate content
+            response = self._chat_completion('ai_compliance', **request)
             
-            Respond with either:
-            "APPROVED: [brief reason]" or "VIOLATION: [specific issue]"
-            """
-            
-            response = openai.chat.completions.create(
-                model=self.openai_config['model'],
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an AI ethics reviewer checking content for responsible AI principles."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=200,
-                temperature=0.1
-            )
-            
-            return response.choices[0].message.content.strip()
+            result = response.choices[0].message.content.strip()
+            compliance_verdict_cache.put('ai', request['model'], email_content, result)
+            return result
             
+        except CircuitOpenError:
+            return self._get_pending_compliance_result('AI')
         except Exception as e:
             self.logger.error(f"Error checking AI compliance: {e}")
             return f"AI compliance check failed: {str(e)}"
     
     def send_email(self, email_log_id: int) -> bool:
-        """Send an email that has been generated and approved."""
+        """Queue an email that has been generated and approved for delivery by the outbox dispatcher."""
         try:
-            # Get email log
-            email_log = self.email_log_repository.get_by_id(email_log_id)
-            if not email_log:
-                raise ValueError(f"Email log with ID {email_log_id} not found")
-            
-            # Check compliance approval
-            if not email_log.compliance_approved:
-                raise ValueError("Email has not been approved for sending due to compliance issues")
-            
-            # Check if already sent
-            if email_log.email_sent:
-                raise ValueError("Email has already been sent")
-            
-            # Send email
-            success = self._send_smtp_email(
-                email_log.recipient_email,
-                email_log.subject,
-                email_log.generated_email
-            )
-            
-            if success:
-                # Update email log
-                email_log.email_sent = True
-                email_log.sent_date = datetime.now()
-                self.email_log_repository.update(email_log)
-                
-                self.logger.info(f"Email sent successfully to: {email_log.recipient_email}")
-                return True
-            else:
-                self.logger.error(f"Failed to send email to: {email_log.recipient_email}")
-                return False
+            email_log = self._get_sendable_email_log(email_log_id)
+            self._enqueue_email(email_log)
+            self._wake_outbox_dispatcher()
+            return True
                 
         except Exception as e:
             self.logger.error(f"Error sending email: {e}")
             raise
     
-    def _send_smtp_email(self, recipient: str, subject: str, body: str) -> bool:
-        """Send email using SMTP."""
-        try:
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = f"{self.email_config['sender_name']} <{self.email_config['sender_email']}>"
-            msg['To'] = recipient
-            msg['Subject'] = subject
-            
-            # Attach body
-            msg.attach(MIMEText(body, 'plain'))
-            
-            # Connect to SMTP server and send
-            with smtplib.SMTP(self.email_config['smtp_server'], self.email_config['smtp_port']) as server:
-                if self.email_config['use_tls']:
-                    server.starttls()
-                
-                if self.email_config['smtp_username'] and self.email_config['smtp_password']:
-                    server.login(self.email_config['smtp_username'], self.email_config['smtp_password'])
-                
-                server.send_message(msg)
-            
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"SMTP send error: {e}")
-            return False
+    def _get_sendable_email_log(self, email_log_id: int) -> EmailLog:
+        """Get an email log and check that it may be sent."""
+        email_log = self.email_log_repository.get_by_id(email_log_id)
+        self._check_sendable(email_log_id, email_log)
+        return email_log
+    
+    def _check_sendable(self, email_log_id: int, email_log: Optional[EmailLog]):
+        """Raise ValueError if an email log is missing, not approved or already sent."""
+        if not email_log:
+            raise ValueError(f"Email log with ID {email_log_id} not found")
+        
+        # Check compliance approval
+        if not email_log.compliance_approved:
+            raise ValueError("Email has not been approved for sending due to compliance issues")
+        
+        # Check if already sent
+        if email_log.email_sent:
+            raise ValueError("Email has already been sent")
+    
+    def _build_outbox_message(self, email_log: EmailLog) -> EmailOutboxMessage:
+        """Build the outbox message for an email log."""
+        return EmailOutboxMessage(
+            email_log_id=email_log.email_log_id,
+            idempotency_key=f"email-log-{email_log.email_log_id}",
+            message_id=f"email-log-{email_log.email_log_id}.{uuid.uuid4().hex}",
+            recipient_email=email_log.recipient_email,
+            subject=email_log.subject,
+            body=email_log.generated_email
+        )
+    
+    def _enqueue_email(self, email_log: EmailLog) -> EmailOutboxMessage:
+        """Add an email to the outbox. Queueing the same email log again is a no-op."""
+        message = self.outbox_repository.enqueue(self._build_outbox_message(email_log))
+        self.logger.info(f"Queued email to: {email_log.recipient_email}")
+        return message
+    
+    def _wake_outbox_dispatcher(self):
+        """Start delivering queued emails now when the dispatcher runs in this process."""
+        if get_email_job_config()['mode'] == 'worker':
+            # worker.py drains the outbox
+            return
+        # Import here to avoid circular dependencies
+        from business.services.outbox_dispatcher import get_embedded_dispatcher
+        get_embedded_dispatcher().wake()
+    
+    def _build_mime_message(self, recipient: str, subject: str, body: str,
+                            message_id: Optional[str] = None) -> MIMEMultipart:
+        """Build the MIME message for an email."""
+        msg = MIMEMultipart()
+        msg['From'] = f"{self.email_config['sender_name']} <{self.email_config['sender_email']}>"
+        msg['To'] = recipient
+        msg['Subject'] = subject
+        if message_id:
+            msg['Message-ID'] = message_id
+        
+        # Attach body
+        msg.attach(MIMEText(body, 'plain'))
+        return msg
     
     def get_email_logs_by_customer(self, customer_id: int) -> List[EmailLog]:
         """Get all email logs for a specific customer."""
@@ -419,3 +1322,21 @@ class EmailService:
         except Exception as e:
             self.logger.error(f"Error getting sent emails: {e}")
             raise
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get operational metrics for the email pipeline."""
+        return {
+            'rate_limiter': openai_rate_limiter.get_state(),
+            'scheduler': openai_scheduler.get_state(),
+            'smtp_pool': smtp_pool.get_state(),
+            'smtp_dispatch': smtp_dispatcher.get_state(),
+            'outbox': self.outbox_repository.get_status_counts(),
+            'openai_client': openai_client_pool.get_state(),
+            'openai_usage': openai_usage_tracker.get_state(),
+            'openai_hedging': request_hedger.get_state(),
+            'openai_circuit': openai_circuit_breaker.get_state(),
+            'compliance_cache': compliance_verdict_cache.get_state(),
+            'model_routing': model_router.get_state(),
+            'template_reuse': template_index.get_state(),
+            'generation_single_flight': generation_flight.get_state()
+        }
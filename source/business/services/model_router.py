@@ -0,0 +1,146 @@
+"""
+Per-task model routing, downgrading to a faster model when a task runs over its latency budget.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from config.settings import get_model_routing_config
+from business.services.deadlines import get_remaining_time
+
+
+# Task whose timeout each stage's calls run under; other stages only have enclosing deadlines
+STAGE_TASKS = {
+    'body': 'body',
+    'campaign_draft': 'body',
+    'subject': 'subject',
+    'campaign_subject': 'subject',
+    'hipaa_compliance': 'hipaa',
+    'hipaa_compliance_batch': 'hipaa',
+    'ai_compliance': 'ai_check',
+    'ai_compliance_batch': 'ai_check'
+}
+
+# The one stage of each task whose latencies are compared with the task's budget;
+# batched and streamed calls take longer for reasons unrelated to the model
+BUDGET_STAGES = {
+    'body': 'body',
+    'subject': 'subject',
+    'hipaa_compliance': 'hipaa',
+    'ai_compliance': 'ai_check'
+}
+
+
+class ModelRouter:
+    """Chooses the model, token limit, temperature and timeout of each task's calls.
+
+    A task with a fallback model and a latency budget is downgraded when the
+    latency percentile of its own model's recent calls exceeds the budget:
+    its calls use the fallback model for downgrade_seconds, then its own model
+    again, judged on fresh calls only. A single call is also sent to the
+    fallback model when the time left before its deadline is shorter than the
+    task's own model usually takes.
+    """
+
+    # Recent calls kept per task and model
+    WINDOW_SIZE = 100
+    # Calls a model needs before its latency is trusted
+    MIN_SAMPLES = 10
+
+    def __init__(self, tasks: Dict[str, Dict[str, Any]], latency_percentile: float = 90.0,
+                 downgrade_seconds: float = 60.0):
+        self.logger = logging.getLogger(__name__)
+        self.tasks = tasks
+        self.latency_percentile = latency_percentile
+        self.downgrade_seconds = downgrade_seconds
+        self._lock = threading.Lock()
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = defaultdict(lambda: deque(maxlen=self.WINDOW_SIZE))
+        self._downgraded_until: Dict[str, float] = {}
+        self._downgrades: Dict[str, int] = {task: 0 for task in tasks}
+
+    def get_task(self, task: str) -> Dict[str, Any]:
+        """Get a task's configured settings, without choosing between its models."""
+        return self.tasks[task]
+
+    def get_route(self, task: str) -> Dict[str, Any]:
+        """Get the settings for a call of task, with the model it should use right now."""
+        route = self.tasks[task]
+        if route['fallback_model'] and self._should_downgrade(task, route):
+            return {**route, 'model': route['fallback_model']}
+        return dict(route)
+
+    def get_timeout(self, stage: str) -> Optional[float]:
+        """Get the timeout of a stage's task, or None for stages without one."""
+        task = STAGE_TASKS.get(stage)
+        return self.tasks[task]['timeout'] if task else None
+
+    def _should_downgrade(self, task: str, route: Dict[str, Any]) -> bool:
+        """Whether a call of task should go to its fallback model."""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._downgraded_until.get(task, 0.0):
+                return True
+        latency = self._get_latency(task, route['model'])
+        if latency is None:
+            return False
+
+        if route['latency_budget'] > 0 and latency > route['latency_budget']:
+            with self._lock:
+                # Fresh calls decide whether the model has recovered once the downgrade ends
+                self._latencies.pop((task, route['model']), None)
+                self._downgraded_until[task] = now + self.downgrade_seconds
+                self._downgrades[task] += 1
+            self.logger.warning(f"{task} calls on {route['model']} take {latency:.1f}s, over their "
+                                f"{route['latency_budget']:.1f}s budget; using {route['fallback_model']} "
+                                f"for {self.downgrade_seconds:.0f}s")
+            return True
+
+        remaining = get_remaining_time()
+        return remaining is not None and remaining < latency
+
+    def _get_latency(self, task: str, model: str) -> Optional[float]:
+        """Get a model's recent latency percentile for task in seconds, or None with too few calls."""
+        with self._lock:
+            latencies = sorted(self._latencies.get((task, model), ()))
+        if len(latencies) < self.MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(self.latency_percentile / 100.0 * len(latencies)))]
+
+    def record_latency(self, stage: str, model: str, latency: float):
+        """Record how long a successful call of stage on model took, in seconds."""
+        task = BUDGET_STAGES.get(stage)
+        if task is None:
+            return
+        with self._lock:
+            self._latencies[(task, model)].append(latency)
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get each task's models, downgrade status and counts for metrics."""
+        now = time.monotonic()
+        state = {}
+        for task, route in self.tasks.items():
+            latency = self._get_latency(task, route['model'])
+            with self._lock:
+                downgraded_for = max(self._downgraded_until.get(task, 0.0) - now, 0.0)
+                state[task] = {
+                    'model': route['model'],
+                    'fallback_model': route['fallback_model'],
+                    'latency_budget': route['latency_budget'],
+                    'recent_latency': round(latency, 3) if latency is not None else None,
+                    'downgraded_seconds_left': round(downgraded_for, 1),
+                    'downgrades': self._downgrades[task]
+                }
+        return state
+
+
+def _create_model_router() -> ModelRouter:
+    """Create the router from model routing settings."""
+    config = get_model_routing_config()
+    return ModelRouter(tasks=config['tasks'], latency_percentile=config['latency_percentile'],
+                       downgrade_seconds=config['downgrade_seconds'])
+
+
+# Global router shared by every EmailService instance in the process
+model_router = _create_model_router()
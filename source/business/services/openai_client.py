@@ -0,0 +1,143 @@
+"""
+Shared OpenAI client with a sized keep-alive connection pool and explicit timeouts.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+import openai
+from config.settings import get_openai_config
+
+try:
+    import httpx
+except ImportError:
+    # Newer openai releases are built on httpx2, which keeps the httpx API
+    import httpx2 as httpx
+
+
+class OpenAIClientPool:
+    """Owns the process's OpenAI client and the HTTP connection pool behind it.
+
+    The synchronous client is created on first use and shared by every thread;
+    its HTTP client is thread-safe. Async clients are bound to one event loop,
+    so create_async_client() builds a new one with the same limits and timeouts
+    for each owner of a loop. Retries are left to the callers, which retry
+    within the shared rate limits.
+    """
+
+    def __init__(self, api_key: str, base_url: str = '', max_connections: int = 16,
+                 max_keepalive_connections: int = 16, keepalive_expiry: float = 60.0,
+                 connect_timeout: float = 5.0, read_timeout: float = 60.0, warmup_connections: int = 2):
+        self.logger = logging.getLogger(__name__)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.warmup_connections = warmup_connections
+        self._client: Optional[openai.OpenAI] = None
+        self._lock = threading.Lock()
+        self._warmed_connections = 0
+
+    def _get_limits(self) -> 'httpx.Limits':
+        """Build the connection pool limits."""
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def _get_timeout(self) -> 'httpx.Timeout':
+        """Build the timeouts; waiting for a pooled connection counts as reading."""
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def get_client(self) -> openai.OpenAI:
+        """Get the shared client, creating it on first use."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = openai.OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url or None,
+                        max_retries=0,
+                        http_client=openai.DefaultHttpxClient(limits=self._get_limits(), timeout=self._get_timeout())
+                    )
+        return self._client
+
+    def create_async_client(self) -> openai.AsyncOpenAI:
+        """Create an async client with the same limits and timeouts for the calling event loop."""
+        return openai.AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url or None,
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(limits=self._get_limits(), timeout=self._get_timeout())
+        )
+
+    def warm_up(self) -> int:
+        """Open warmup_connections keep-alive connections ahead of the first real call.
+
+        Each connection is opened by listing models, which is not billed.
+        Failures are logged and otherwise ignored. Returns the connections opened.
+        """
+        if not self.api_key or self.warmup_connections <= 0:
+            return 0
+
+        client = self.get_client()
+
+        def open_connection(_) -> bool:
+            try:
+                client.models.list()
+                return True
+            except Exception as e:
+                self.logger.warning(f"OpenAI connection warm-up failed: {e}")
+                return False
+
+        # Concurrent requests each take their own connection from the pool
+        with ThreadPoolExecutor(max_workers=self.warmup_connections) as executor:
+            opened = sum(executor.map(open_connection, range(self.warmup_connections)))
+
+        with self._lock:
+            self._warmed_connections += opened
+        self.logger.info(f"Warmed up {opened} OpenAI connection(s)")
+        return opened
+
+    def close(self):
+        """Close the shared client and its connections."""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get pool settings and warm-up counts for metrics."""
+        return {
+            'client_created': self._client is not None,
+            'max_connections': self.max_connections,
+            'max_keepalive_connections': self.max_keepalive_connections,
+            'keepalive_expiry': self.keepalive_expiry,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'warmed_connections': self._warmed_connections
+        }
+
+
+def _create_openai_client_pool() -> OpenAIClientPool:
+    """Create the client pool from OpenAI settings."""
+    config = get_openai_config()
+    return OpenAIClientPool(
+        api_key=config['api_key'],
+        base_url=config['base_url'],
+        max_connections=config['max_connections'],
+        max_keepalive_connections=config['max_keepalive_connections'],
+        keepalive_expiry=config['keepalive_expiry'],
+        connect_timeout=config['connect_timeout'],
+        read_timeout=config['read_timeout'],
+        warmup_connections=config['warmup_connections']
+    )
+
+
+# Global client pool shared by every EmailService instance in the process
+openai_client_pool = _create_openai_client_pool()
@@ -0,0 +1,270 @@
+"""
+Priority classes and fair queuing between users for OpenAI calls waiting on shared capacity.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from config.settings import get_openai_config
+from business.services.openai_usage import openai_usage_tracker
+from business.services.rate_limiter import OpenAIRateLimiter, openai_rate_limiter
+
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BULK = 'bulk'
+
+# Priority classes, highest first
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+
+# Priority of the running thread or asyncio task's calls; unscoped calls are interactive
+_current_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    'openai_priority', default=PRIORITY_INTERACTIVE
+)
+
+
+def get_current_priority() -> str:
+    """Get the priority class of calls made here."""
+    return _current_priority.get()
+
+
+@contextmanager
+def priority_scope(priority: str) -> Iterator[str]:
+    """Make the calls inside the block, including those on executors that copy the context, in priority."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    token = _current_priority.set(priority)
+    try:
+        yield priority
+    finally:
+        _current_priority.reset(token)
+
+
+class _Waiter:
+    """A call waiting for its turn."""
+
+    __slots__ = ('priority', 'user_id', 'start', 'enqueued', 'granted', 'cancelled')
+
+    def __init__(self, priority: str, user_id: Optional[int], start: float):
+        self.priority = priority
+        self.user_id = user_id
+        self.start = start
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+
+
+class OpenAIScheduler:
+    """Decides which waiting OpenAI call goes next when capacity frees up.
+
+    Calls take a turn before asking the rate limiter for budget, and at most
+    the limiter's current concurrency limit hold turns at once. A freed turn
+    goes to a waiting interactive call first; bulk calls only get one when
+    no interactive call waits, and never take the last interactive_reserve
+    turns, so a preview finds a turn free while a campaign keeps the rest
+    busy instead of queuing behind it. Within a class, users are served by weighted
+    fair queuing on estimated tokens: each call is stamped with the virtual
+    time its user's share would finish it, and the earliest stamp goes next,
+    so a user with a 5k-email job and one with a 10-email job take turns
+    instead of queuing in arrival order.
+    """
+
+    # How often async callers re-check whether their turn was granted
+    ASYNC_POLL_SECONDS = 0.05
+
+    def __init__(self, rate_limiter: OpenAIRateLimiter, interactive_reserve: int = 1,
+                 user_weights: Optional[Dict[int, float]] = None):
+        self.rate_limiter = rate_limiter
+        self.interactive_reserve = interactive_reserve
+        self.user_weights = user_weights or {}
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._queues: Dict[str, List[Tuple[float, int, _Waiter]]] = {priority: [] for priority in PRIORITIES}
+        self._queued: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._active: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        # Per class virtual clock, and the finish stamp of each user's latest call
+        self._virtual_time: Dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._last_finish: Dict[Tuple[str, Optional[int]], float] = {}
+
+        # Counters exposed to metrics
+        self._stats = {priority: {'granted': 0, 'abandoned': 0, 'wait_seconds': 0.0, 'peak_queued': 0}
+                       for priority in PRIORITIES}
+
+    def get_weight(self, user_id: Optional[int]) -> float:
+        """Get a user's share of each class relative to other users."""
+        weight = self.user_weights.get(user_id, 1.0) if user_id is not None else 1.0
+        return max(weight, 0.01)
+
+    def _get_capacity(self, priority: str) -> int:
+        """Turns a class may hold at once."""
+        limit = max(self.rate_limiter.concurrency_limit, 1)
+        if priority == PRIORITY_INTERACTIVE:
+            return limit
+        # Bulk work always keeps at least one turn
+        return max(limit - self.interactive_reserve, 1)
+
+    @contextmanager
+    def turn(self, estimated_tokens: int, timeout: Optional[float] = None):
+        """Wait for a turn in the current priority class, holding it for the duration of a call."""
+        waiter = self.acquire(estimated_tokens, timeout)
+        try:
+            yield
+        finally:
+            self.release(waiter)
+
+    @asynccontextmanager
+    async def async_turn(self, estimated_tokens: int):
+        """Async variant of turn() that waits without blocking the event loop."""
+        waiter = self._enqueue(estimated_tokens)
+        try:
+            while True:
+                with self._condition:
+                    if waiter.granted:
+                        break
+                await asyncio.sleep(self.ASYNC_POLL_SECONDS)
+        except BaseException:
+            if not self._cancel(waiter):
+                self.release(waiter)
+            raise
+
+        try:
+            yield
+        finally:
+            self.release(waiter)
+
+    def acquire(self, estimated_tokens: int, timeout: Optional[float] = None) -> _Waiter:
+        """Block until the call's turn comes, returning the turn to release().
+
+        Raises TimeoutError if it does not come within timeout seconds.
+        """
+        waiter = self._enqueue(estimated_tokens)
+        give_up = waiter.enqueued + timeout if timeout is not None else None
+        with self._condition:
+            while not waiter.granted:
+                if give_up is None:
+                    self._condition.wait()
+                elif not self._condition.wait(give_up - time.monotonic()) and time.monotonic() >= give_up:
+                    break
+        if not waiter.granted and self._cancel(waiter):
+            raise TimeoutError(f"Timed out waiting for an OpenAI turn ({waiter.priority})")
+        return waiter
+
+    def _enqueue(self, estimated_tokens: int) -> _Waiter:
+        """Stamp a call of the current priority and user, queue it and hand out free turns."""
+        priority = get_current_priority()
+        scope = openai_usage_tracker.get_current_scope()
+        user_id = getattr(scope, 'user_id', None)
+        with self._condition:
+            key = (priority, user_id)
+            start = max(self._virtual_time[priority], self._last_finish.get(key, 0.0))
+            finish = start + max(estimated_tokens, 1) / self.get_weight(user_id)
+            self._last_finish[key] = finish
+            waiter = _Waiter(priority, user_id, start)
+            heapq.heappush(self._queues[priority], (finish, next(self._sequence), waiter))
+            self._queued[priority] += 1
+            stats = self._stats[priority]
+            stats['peak_queued'] = max(stats['peak_queued'], self._queued[priority])
+            self._dispatch()
+        return waiter
+
+    def _cancel(self, waiter: _Waiter) -> bool:
+        """Withdraw a waiting call. Returns False if its turn was granted meanwhile."""
+        with self._condition:
+            if waiter.granted:
+                return False
+            waiter.cancelled = True
+            self._queued[waiter.priority] -= 1
+            self._stats[waiter.priority]['abandoned'] += 1
+            if not self._queued[waiter.priority]:
+                self._forget_backlog(waiter.priority)
+            return True
+
+    def _dispatch(self):
+        """Grant free turns to waiting calls, highest class first. Called with the lock held."""
+        granted = False
+        while True:
+            priority = next((priority for priority in PRIORITIES
+                             if self._queued[priority] and self._free_turns(priority) > 0), None)
+            if priority is None:
+                break
+            _, _, waiter = heapq.heappop(self._queues[priority])
+            if waiter.cancelled:
+                continue
+            waiter.granted = True
+            granted = True
+            self._queued[priority] -= 1
+            self._active[priority] += 1
+            # The virtual clock follows the start stamp of the call being served
+            self._virtual_time[priority] = max(self._virtual_time[priority], waiter.start)
+            stats = self._stats[priority]
+            stats['granted'] += 1
+            stats['wait_seconds'] += time.monotonic() - waiter.enqueued
+            if not self._queued[priority]:
+                self._forget_backlog(priority)
+        if granted:
+            self._condition.notify_all()
+
+    def _forget_backlog(self, priority: str):
+        """Reset a class whose queue has emptied; with no backlog, no user is behind another."""
+        self._queues[priority].clear()
+        self._last_finish = {key: finish for key, finish in self._last_finish.items() if key[0] != priority}
+        self._virtual_time[priority] = 0.0
+
+    def _free_turns(self, priority: str) -> int:
+        """Turns a class could be granted now."""
+        in_use = sum(self._active.values())
+        limit = self._get_capacity(PRIORITY_INTERACTIVE)
+        if priority == PRIORITY_INTERACTIVE:
+            return limit - in_use
+        # A waiting interactive call is served first
+        if self._queued[PRIORITY_INTERACTIVE]:
+            return 0
+        return min(limit - in_use, self._get_capacity(priority) - self._active[priority])
+
+    def release(self, waiter: _Waiter):
+        """Give back a turn and hand it to the next waiting call."""
+        with self._condition:
+            self._active[waiter.priority] -= 1
+            self._dispatch()
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get queue depths, turns in use and waiting times per class for metrics."""
+        with self._condition:
+            classes = {}
+            for priority in PRIORITIES:
+                stats = self._stats[priority]
+                queued_users = {waiter.user_id for _, _, waiter in self._queues[priority] if not waiter.cancelled}
+                classes[priority] = {
+                    'queued': self._queued[priority],
+                    'queued_users': len(queued_users),
+                    'active': self._active[priority],
+                    'capacity': self._get_capacity(priority),
+                    'peak_queued': stats['peak_queued'],
+                    'granted': stats['granted'],
+                    'abandoned': stats['abandoned'],
+                    'avg_wait_ms': round(stats['wait_seconds'] / stats['granted'] * 1000, 1) if stats['granted'] else 0.0
+                }
+            return {
+                'interactive_reserve': self.interactive_reserve,
+                'queued': sum(self._queued.values()),
+                'classes': classes
+            }
+
+
+def _create_scheduler() -> OpenAIScheduler:
+    """Create the scheduler from OpenAI settings."""
+    config = get_openai_config()
+    return OpenAIScheduler(
+        rate_limiter=openai_rate_limiter,
+        interactive_reserve=config['interactive_reserve'],
+        user_weights=config['user_weights']
+    )
+
+
+# Global scheduler shared by every EmailService instance in the process
+openai_scheduler = _create_scheduler()
@@ -0,0 +1,223 @@
+"""
+Per-call OpenAI latency, token and cost tracking.
+"""
+
+import contextvars
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from config.settings import get_openai_config
+
+
+@dataclass
+class OpenAICall:
+    """One chat completion as seen by the caller, including its retries."""
+
+    stage: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Prompt tokens served from the provider's prompt cache, billed at the cached rate
+    cached_tokens: int = 0
+    latency_ms: float = 0.0
+    retries: int = 0
+    cost: float = 0.0
+    success: bool = True
+
+    def share(self, parts: int) -> 'OpenAICall':
+        """One of parts equal shares of this call's tokens and cost, for a call made on behalf of several emails."""
+        return replace(self, prompt_tokens=self.prompt_tokens // parts, completion_tokens=self.completion_tokens // parts,
+                       cached_tokens=self.cached_tokens // parts, cost=self.cost / parts)
+
+
+@dataclass
+class UsageScope:
+    """Attribution for the calls made inside OpenAIUsageTracker.scope()."""
+
+    user_id: Optional[int] = None
+    campaign_id: Optional[str] = None
+    calls: List[OpenAICall] = field(default_factory=list)
+
+    def get_stage_totals(self) -> Dict[str, Dict[str, Any]]:
+        """Aggregate this scope's calls per stage, e.g. for EmailLog.openai_usage."""
+        return get_stage_totals(self.calls)
+
+
+def get_stage_totals(calls: List[OpenAICall]) -> Dict[str, Dict[str, Any]]:
+    """Aggregate calls per stage: calls, tokens, latency, retries and cost."""
+    totals: Dict[str, Dict[str, Any]] = {}
+    for call in calls:
+        stage = totals.setdefault(call.stage, {
+            'calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0,
+            'latency_ms': 0.0, 'retries': 0, 'cost': 0.0
+        })
+        stage['calls'] += 1
+        stage['prompt_tokens'] += call.prompt_tokens
+        stage['cached_tokens'] += call.cached_tokens
+        stage['completion_tokens'] += call.completion_tokens
+        stage['latency_ms'] = round(stage['latency_ms'] + call.latency_ms, 1)
+        stage['retries'] += call.retries
+        stage['cost'] = round(stage['cost'] + call.cost, 6)
+    return totals
+
+
+# The innermost scope of the running thread or asyncio task
+_current_scope: contextvars.ContextVar[Optional[UsageScope]] = contextvars.ContextVar(
+    'openai_usage_scope', default=None
+)
+
+
+class OpenAIUsageTracker:
+    """Records OpenAI calls for rolling per-stage latency percentiles and cost totals.
+
+    Callers open a scope() around a unit of work (one email, one campaign) to
+    attribute its calls to a user and campaign and to collect them for the
+    email log. Scopes follow contextvars, so they work across threads and
+    asyncio tasks alike.
+    """
+
+    # Calls kept per stage for percentiles
+    WINDOW_SIZE = 1000
+
+    def __init__(self, prompt_cost_per_1k: float, completion_cost_per_1k: float,
+                 cached_prompt_cost_per_1k: Optional[float] = None):
+        self.prompt_cost_per_1k = prompt_cost_per_1k
+        self.completion_cost_per_1k = completion_cost_per_1k
+        self.cached_prompt_cost_per_1k = (prompt_cost_per_1k if cached_prompt_cost_per_1k is None
+                                          else cached_prompt_cost_per_1k)
+        self._lock = threading.Lock()
+        self._windows: Dict[str, Deque[OpenAICall]] = defaultdict(lambda: deque(maxlen=self.WINDOW_SIZE))
+        self._by_user: Dict[int, Dict[str, float]] = {}
+        self._by_campaign: Dict[str, Dict[str, float]] = {}
+        self._totals = self._new_totals()
+
+    @contextmanager
+    def scope(self, user_id: Optional[int] = None, campaign_id: Optional[str] = None) -> Iterator[UsageScope]:
+        """Collect the calls made inside the block, inheriting attribution from an enclosing scope."""
+        parent = _current_scope.get()
+        current = UsageScope(
+            user_id=user_id if user_id is not None else getattr(parent, 'user_id', None),
+            campaign_id=campaign_id if campaign_id is not None else getattr(parent, 'campaign_id', None)
+        )
+        token = _current_scope.set(current)
+        try:
+            yield current
+        finally:
+            _current_scope.reset(token)
+
+    def get_cost(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        """Get the cost of a call in the configured currency; cached_tokens are part of prompt_tokens."""
+        return ((prompt_tokens - cached_tokens) * self.prompt_cost_per_1k
+                + cached_tokens * self.cached_prompt_cost_per_1k
+                + completion_tokens * self.completion_cost_per_1k) / 1000.0
+
+    def get_current_scope(self) -> Optional[UsageScope]:
+        """Get the innermost open scope, e.g. to record a streamed call after the scope has closed."""
+        return _current_scope.get()
+
+    def record(self, stage: str, model: str, usage: Any, latency: float, retries: int,
+               success: bool = True, scope: Optional[UsageScope] = None) -> OpenAICall:
+        """Record a finished call. usage is the response's usage object, if any.
+
+        The call is attributed to scope, or to the current scope if none is given.
+        """
+        prompt_tokens = getattr(usage, 'prompt_tokens', None) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', None) or 0
+        cached_tokens = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None) or 0
+        call = OpenAICall(
+            stage=stage,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            latency_ms=round(latency * 1000.0, 1),
+            retries=retries,
+            cost=self.get_cost(prompt_tokens, completion_tokens, cached_tokens),
+            success=success
+        )
+
+        scope = scope or _current_scope.get()
+        with self._lock:
+            self._windows[stage].append(call)
+            self._add(self._totals, call)
+            if scope:
+                scope.calls.append(call)
+                if scope.user_id is not None:
+                    self._add(self._by_user.setdefault(scope.user_id, self._new_totals()), call)
+                if scope.campaign_id is not None:
+                    self._add(self._by_campaign.setdefault(scope.campaign_id, self._new_totals()), call)
+        return call
+
+    @staticmethod
+    def _new_totals() -> Dict[str, float]:
+        """Create an empty running total."""
+        return {'calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0, 'cost': 0.0}
+
+    @staticmethod
+    def _add(totals: Dict[str, float], call: OpenAICall):
+        """Add a call to a running total."""
+        totals['calls'] += 1
+        totals['prompt_tokens'] += call.prompt_tokens
+        totals['cached_tokens'] += call.cached_tokens
+        totals['completion_tokens'] += call.completion_tokens
+        totals['cost'] = round(totals['cost'] + call.cost, 6)
+
+    def get_latency_percentile(self, stage: str, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """Get a stage's recent successful-call latency percentile in ms, or None with too few calls."""
+        with self._lock:
+            latencies = sorted(call.latency_ms for call in self._windows.get(stage, ()) if call.success)
+        if len(latencies) < max(min_samples, 1):
+            return None
+        return latencies[min(len(latencies) - 1, int(percentile / 100.0 * len(latencies)))]
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get rolling per-stage statistics and cost totals for metrics."""
+        with self._lock:
+            stages = {stage: self._summarize(list(calls)) for stage, calls in self._windows.items() if calls}
+            return {
+                'stages': stages,
+                'totals': dict(self._totals),
+                'by_user': {user_id: dict(totals) for user_id, totals in self._by_user.items()},
+                'by_campaign': {campaign_id: dict(totals) for campaign_id, totals in self._by_campaign.items()}
+            }
+
+    @staticmethod
+    def _summarize(calls: List[OpenAICall]) -> Dict[str, Any]:
+        """Summarize a stage's recent calls."""
+        latencies = sorted(call.latency_ms for call in calls)
+        prompt_tokens = sum(call.prompt_tokens for call in calls)
+
+        def percentile(p: float) -> float:
+            # Nearest-rank percentile
+            return latencies[min(len(latencies) - 1, int(p / 100.0 * len(latencies)))]
+
+        return {
+            'calls': len(calls),
+            'errors': sum(1 for call in calls if not call.success),
+            'retries': sum(call.retries for call in calls),
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'avg_prompt_tokens': round(prompt_tokens / len(calls), 1),
+            # Share of prompt tokens served from the provider's prompt cache
+            'cached_prompt_ratio': (round(sum(call.cached_tokens for call in calls) / prompt_tokens, 3)
+                                    if prompt_tokens else 0.0),
+            'avg_completion_tokens': round(sum(call.completion_tokens for call in calls) / len(calls), 1),
+            'cost': round(sum(call.cost for call in calls), 6)
+        }
+
+
+def _create_usage_tracker() -> OpenAIUsageTracker:
+    """Create the tracker from OpenAI settings."""
+    config = get_openai_config()
+    return OpenAIUsageTracker(
+        prompt_cost_per_1k=config['prompt_cost_per_1k'],
+        completion_cost_per_1k=config['completion_cost_per_1k'],
+        cached_prompt_cost_per_1k=config['cached_prompt_cost_per_1k']
+    )
+
+
+# Global tracker shared by every EmailService instance in the process
+openai_usage_tracker = _create_usage_tracker()
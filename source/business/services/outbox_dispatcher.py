@@ -0,0 +1,139 @@
+"""
+Outbox dispatcher that delivers queued emails in batches.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from config.settings import get_email_config
+from data.factory import repository_factory
+from data.models.email_outbox import EmailOutboxMessage
+from business.services.email_service import EmailService
+from business.services.email_job_service import default_worker_id
+from business.services.smtp_dispatcher import smtp_dispatcher
+from business.services.smtp_pool import smtp_pool
+
+
+class EmailOutboxDispatcher:
+    """Drains the email outbox: claims due messages, sends them and records the outcome.
+
+    Delivery is at-least-once. A message whose dispatcher dies after the SMTP
+    handoff but before it is marked sent is sent again once its lease expires;
+    every attempt carries the same Message-ID so receiving servers can
+    discard the duplicate.
+    """
+
+    def __init__(self, email_service: Optional[EmailService] = None, worker_id: Optional[str] = None):
+        self.logger = logging.getLogger(__name__)
+        self.email_service = email_service or EmailService()
+        self.outbox_repository = repository_factory.get_email_outbox_repository()
+        self.email_config = get_email_config()
+        self.worker_id = worker_id or default_worker_id()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def start(self) -> threading.Thread:
+        """Run the dispatch loop on a daemon thread."""
+        thread = threading.Thread(target=self.run, name=f'email-outbox-{self.worker_id}', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Ask the dispatch loop to exit after the current batch."""
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def wake(self):
+        """Poll for queued messages immediately instead of waiting for the poll interval."""
+        self._wake_event.set()
+
+    def run(self, once: bool = False):
+        """Dispatch batches until stopped, or until nothing is due if once is set."""
+        self.logger.info(f"Email outbox dispatcher {self.worker_id} started")
+        while not self._stop_event.is_set():
+            try:
+                processed = self.run_batch()
+            except Exception as e:
+                self.logger.error(f"Email outbox dispatcher {self.worker_id} batch failed: {e}")
+                processed = 0
+
+            if processed:
+                continue
+            if once:
+                break
+            self._wake_event.wait(self.email_config['outbox_poll_interval'])
+            self._wake_event.clear()
+        self.logger.info(f"Email outbox dispatcher {self.worker_id} stopped")
+
+    def run_batch(self) -> int:
+        """Claim and send one batch of messages. Returns the number of messages claimed."""
+        messages = self.outbox_repository.claim_batch(
+            self.worker_id, self.email_config['outbox_batch_size'], self.email_config['outbox_lease_seconds']
+        )
+        if not messages:
+            return 0
+
+        errors: Dict[int, str] = {}
+
+        def send(message: EmailOutboxMessage) -> bool:
+            try:
+                smtp_pool.send_message(self.email_service._build_mime_message(
+                    message.recipient_email, message.subject, message.body,
+                    message_id=self._get_message_id(message)
+                ))
+                return True
+            except Exception as e:
+                errors[message.outbox_id] = str(e)
+                raise
+
+        results = smtp_dispatcher.dispatch(
+            {message.outbox_id: message for message in messages},
+            get_recipient=lambda message: message.recipient_email,
+            send=send
+        )
+        self._record_results(messages, results, errors)
+        return len(messages)
+
+    def _record_results(self, messages: List[EmailOutboxMessage], results: Dict[int, bool], errors: Dict[int, str]):
+        """Mark sent messages in one write and schedule retries for failed ones."""
+        sent = [message for message in messages if results.get(message.outbox_id)]
+        if sent:
+            marked = set(self.outbox_repository.mark_sent_many(sent, self.worker_id))
+            for message in sent:
+                if message.outbox_id not in marked:
+                    self.logger.warning(f"Lost lease on {message} after sending it")
+
+        for message in messages:
+            if results.get(message.outbox_id):
+                continue
+
+            error = errors.get(message.outbox_id, "SMTP send failed")
+            retry_at = None
+            if message.attempts < self.email_config['outbox_max_attempts']:
+                delay = self.email_config['outbox_retry_seconds'] * (2 ** (message.attempts - 1))
+                retry_at = datetime.now() + timedelta(seconds=delay)
+                self.logger.warning(f"Sending {message} failed ({error}), retrying at {retry_at:%H:%M:%S}")
+            else:
+                self.logger.error(f"Giving up on {message} after {message.attempts} attempts: {error}")
+            self.outbox_repository.mark_failed(message, self.worker_id, error, retry_at)
+
+    def _get_message_id(self, message: EmailOutboxMessage) -> str:
+        """Build a Message-ID that stays the same across retries of a message."""
+        domain = self.email_config['sender_email'].rsplit('@', 1)[-1] or 'mycrm.local'
+        # Messages queued before message_id existed fall back to the idempotency key
+        return f"<{message.message_id or message.idempotency_key}@{domain}>"
+
+
+_embedded_dispatcher: Optional[EmailOutboxDispatcher] = None
+_embedded_lock = threading.Lock()
+
+
+def get_embedded_dispatcher() -> EmailOutboxDispatcher:
+    """Get the dispatcher that runs inside the web process, starting it on first use."""
+    global _embedded_dispatcher
+    with _embedded_lock:
+        if _embedded_dispatcher is None:
+            _embedded_dispatcher = EmailOutboxDispatcher(worker_id=f"{default_worker_id()}-embedded")
+            _embedded_dispatcher.start()
+        return _embedded_dispatcher
@@ -0,0 +1,135 @@
+"""
+Instructions for the OpenAI prompts sent by EmailService.
+
+Every request puts these fixed instructions first, as its system message, and
+the data that varies last: the template before the customer, the customer
+before the email under review. Requests of one run then share their longest
+possible prefix, which the provider's prompt cache can reuse.
+"""
+
+import hashlib
+from typing import Any, Dict
+
+
+EMAIL_INSTRUCTIONS = """You are a professional email assistant that creates personalized business emails.
+
+Personalize the email template you are given for the customer described after it.
+Create a professional, personalized email that:
+1. Uses the customer's name and company appropriately
+2. Maintains a professional tone
+3. Is appropriate for business communication
+4. Does not include any inappropriate content
+
+Return only the email body content, no subject line."""
+
+EMAIL_BATCH_INSTRUCTIONS = """You are a professional email assistant that creates personalized business emails.
+
+Personalize the email template you are given for each of the customers listed after it.
+For each customer, create a professional, personalized email that:
+1. Uses that customer's name and company appropriately
+2. Maintains a professional tone
+3. Is appropriate for business communication
+4. Does not include any inappropriate content
+Give each email a clear, professional subject line under 50 characters.
+
+Respond with only a JSON array with one object per customer, in the form:
+[{"customer_id": 1, "subject": "subject line", "body": "email body"}]"""
+
+SUBJECT_INSTRUCTIONS = """You are a professional email assistant that creates email subject lines.
+
+Based on the email template you are given and the customer it is for, generate a professional
+email subject line that is:
+1. Clear and concise
+2. Relevant to the content
+3. Professional
+4. Under 50 characters
+
+Return only the subject line, no quotes or extra text."""
+
+CAMPAIGN_DRAFT_INSTRUCTIONS = """You are a professional email assistant that creates reusable business email drafts.
+
+Turn the email template you are given into a reusable campaign email draft.
+Create a professional email draft that:
+1. Uses only these placeholders for recipient details: {placeholders}
+2. Leaves the placeholders unfilled, exactly as written above
+3. Maintains a professional tone
+4. Does not include any inappropriate content
+
+Return only the email body content, no subject line."""
+
+CAMPAIGN_SUBJECT_INSTRUCTIONS = """You are a professional email assistant that creates email subject lines.
+
+Based on the campaign email draft you are given, generate a professional email subject line that is:
+1. Clear and concise
+2. Relevant to the content
+3. Professional
+4. Under 50 characters
+
+You may use the {company} placeholder. Return only the subject line, no quotes or extra text."""
+
+# Compliance reviews: the reviewer's role, what the email is reviewed against and what is checked
+COMPLIANCE_REVIEWS: Dict[str, Dict[str, Any]] = {
+    'hipaa': {
+        'name': 'HIPAA',
+        'reviewer': "You are a HIPAA compliance officer reviewing business emails.",
+        'standard': "for HIPAA compliance",
+        'checks': [
+            "No personal health information (PHI)",
+            "No medical condition details",
+            "No protected health information",
+            "Professional business communication only"
+        ]
+    },
+    'ai': {
+        'name': 'AI',
+        'reviewer': "You are an AI ethics reviewer checking content for responsible AI principles.",
+        'standard': "against Microsoft's Responsible AI principles",
+        'checks': [
+            "Fairness and inclusivity",
+            "Reliability and safety",
+            "Privacy and security",
+            "Transparency",
+            "Accountability",
+            "No harmful or inappropriate content"
+        ]
+    }
+}
+
+
+def _format_checks(review: str) -> str:
+    """Number a compliance review's checks, one per line."""
+    return '\n'.join(f"{number}. {check}" for number, check in enumerate(COMPLIANCE_REVIEWS[review]['checks'], 1))
+
+
+def get_compliance_instructions(review: str) -> str:
+    """Get the instructions for reviewing one email."""
+    config = COMPLIANCE_REVIEWS[review]
+    return f"""{config['reviewer']}
+
+Review the email content you are given {config['standard']}.
+Check for:
+{_format_checks(review)}
+
+Respond with either:
+"APPROVED: [brief reason]" or "VIOLATION: [specific issue]\""""
+
+
+def get_compliance_batch_instructions(review: str) -> str:
+    """Get the instructions for reviewing several emails in one request."""
+    config = COMPLIANCE_REVIEWS[review]
+    return f"""{config['reviewer']}
+
+Review each of the emails you are given {config['standard']}.
+Each email is enclosed in <email id="..."> tags.
+Check each email for:
+{_format_checks(review)}
+
+Respond with only a JSON object with one result per email id, in the form:
+{{"results": [{{"id": 1, "verdict": "APPROVED", "reason": "brief reason"}}]}}
+The verdict is either "APPROVED" or "VIOLATION"; for a violation the reason names the specific issue."""
+
+
+def get_compliance_policy_version(review: str) -> str:
+    """Get a short hash of a review's instructions, which changes whenever they are edited."""
+    instructions = get_compliance_instructions(review) + get_compliance_batch_instructions(review)
+    return hashlib.sha256(instructions.encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,286 @@
+"""
+Token-bucket rate limiting and throttling backoff for OpenAI calls.
+"""
+
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+from config.settings import get_openai_config
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously up to its capacity."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Add the tokens accumulated since the last update."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def try_consume(self, amount: float) -> float:
+        """Consume tokens if available. Returns 0 on success, otherwise the seconds to wait."""
+        with self._lock:
+            self._refill()
+            # Requests larger than the bucket are let through once it is full
+            amount = min(amount, self.capacity)
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.refill_per_second
+
+    def adjust(self, amount: float):
+        """Return (positive) or charge (negative) tokens after the real cost is known."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    @property
+    def available(self) -> float:
+        """Get the number of tokens currently available."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class OpenAIRateLimiter:
+    """Shared limiter for requests-per-minute, tokens-per-minute and concurrency budgets.
+
+    Concurrency adapts to throttling: it is halved when 429 responses keep
+    arriving and grows back by one slot after a run of successful calls.
+    """
+
+    # Consecutive successes needed before a concurrency slot is restored
+    RECOVERY_SUCCESSES = 20
+
+    # How often async callers re-check for a free concurrency slot
+    ASYNC_POLL_SECONDS = 0.05
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_concurrency: int,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.logger = logging.getLogger(__name__)
+        self.request_bucket = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.max_concurrency = max_concurrency
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._condition = threading.Condition()
+        self._concurrency_limit = max_concurrency
+        self._in_flight = 0
+        self._blocked_until = 0.0
+        self._consecutive_successes = 0
+        self._consecutive_throttles = 0
+
+        # Counters exposed to metrics
+        self._total_requests = 0
+        self._total_throttled = 0
+        self._total_retries = 0
+        self._total_wait_seconds = 0.0
+
+    @contextmanager
+    def slot(self, estimated_tokens: int, timeout: Optional[float] = None):
+        """Wait for budget and a concurrency slot, holding the slot for the duration of a call."""
+        self.acquire(estimated_tokens, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def async_slot(self, estimated_tokens: int):
+        """Async variant of slot() that waits without blocking the event loop."""
+        started = time.monotonic()
+        while True:
+            with self._condition:
+                if self._in_flight < self._concurrency_limit:
+                    self._in_flight += 1
+                    break
+            await asyncio.sleep(self.ASYNC_POLL_SECONDS)
+
+        try:
+            while True:
+                wait = self._take_budget(estimated_tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(min(wait, self.backoff_max))
+            self._record_acquired(started)
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, estimated_tokens: int, timeout: Optional[float] = None):
+        """Block until the request and token budgets and a concurrency slot are available.
+
+        Raises TimeoutError if they will not be available within timeout seconds.
+        """
+        started = time.monotonic()
+        give_up = started + timeout if timeout is not None else None
+
+        with self._condition:
+            while self._in_flight >= self._concurrency_limit:
+                if give_up is None:
+                    self._condition.wait()
+                elif not self._condition.wait(give_up - time.monotonic()) and time.monotonic() >= give_up:
+                    raise TimeoutError("Timed out waiting for an OpenAI concurrency slot")
+            self._in_flight += 1
+
+        try:
+            while True:
+                wait = self._take_budget(estimated_tokens)
+                if wait <= 0:
+                    break
+                if give_up is not None and time.monotonic() + wait > give_up:
+                    raise TimeoutError("Timed out waiting for OpenAI rate limit budget")
+                time.sleep(min(wait, self.backoff_max))
+        except BaseException:
+            self.release()
+            raise
+
+        self._record_acquired(started)
+
+    def _take_budget(self, estimated_tokens: int) -> float:
+        """Take one request and the estimated tokens. Returns 0 on success, otherwise the seconds to wait."""
+        wait = self._blocked_until - time.monotonic()
+        if wait > 0:
+            return wait
+        wait = self.request_bucket.try_consume(1)
+        if wait > 0:
+            return wait
+        wait = self.token_bucket.try_consume(estimated_tokens)
+        if wait > 0:
+            # Give the request back until the token budget allows the call
+            self.request_bucket.adjust(1)
+            return wait
+        return 0.0
+
+    def _record_acquired(self, started: float):
+        """Count a granted request and the time spent waiting for it."""
+        with self._condition:
+            self._total_requests += 1
+            self._total_wait_seconds += time.monotonic() - started
+
+    @property
+    def concurrency_limit(self) -> int:
+        """Get the number of calls currently allowed in flight, after throttling reductions."""
+        with self._condition:
+            return self._concurrency_limit
+
+    def release(self):
+        """Release a concurrency slot."""
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Reconcile the token budget with the usage reported by the API."""
+        if actual_tokens is not None:
+            self.token_bucket.adjust(estimated_tokens - actual_tokens)
+
+    def record_success(self):
+        """Record a successful call and slowly restore concurrency."""
+        with self._condition:
+            self._consecutive_throttles = 0
+            self._consecutive_successes += 1
+            if (self._consecutive_successes >= self.RECOVERY_SUCCESSES
+                    and self._concurrency_limit < self.max_concurrency):
+                self._concurrency_limit += 1
+                self._consecutive_successes = 0
+                self._condition.notify()
+
+    def record_throttle(self, retry_after: Optional[float] = None):
+        """Record a 429 response, pausing all callers and reducing concurrency."""
+        with self._condition:
+            self._total_throttled += 1
+            self._consecutive_successes = 0
+            self._consecutive_throttles += 1
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            if self._consecutive_throttles >= 2 and self._concurrency_limit > 1:
+                self._concurrency_limit = max(1, self._concurrency_limit // 2)
+                self.logger.warning(f"Sustained OpenAI throttling - concurrency reduced to {self._concurrency_limit}")
+
+    def get_backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Get a jittered exponential backoff delay, never shorter than the server's hint."""
+        with self._condition:
+            self._total_retries += 1
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = random.uniform(delay / 2, delay)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get the current limiter state for metrics."""
+        with self._condition:
+            return {
+                'requests_available': round(self.request_bucket.available, 2),
+                'requests_per_minute': self.request_bucket.capacity,
+                'tokens_available': round(self.token_bucket.available, 2),
+                'tokens_per_minute': self.token_bucket.capacity,
+                'concurrency_limit': self._concurrency_limit,
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self._in_flight,
+                'blocked_seconds': round(max(0.0, self._blocked_until - time.monotonic()), 2),
+                'total_requests': self._total_requests,
+                'total_throttled': self._total_throttled,
+                'total_retries': self._total_retries,
+                'total_wait_seconds': round(self._total_wait_seconds, 2)
+            }
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """Get the retry delay in seconds suggested by an OpenAI error, if any."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    # e.g. "Rate limit reached ... Please try again in 1.5s" or "in 250ms"
+    match = re.search(r'try again in (\d+(?:\.\d+)?)(ms|s)', str(error))
+    if match:
+        value = float(match.group(1))
+        return value / 1000.0 if match.group(2) == 'ms' else value
+
+    return None
+
+
+def _create_rate_limiter() -> OpenAIRateLimiter:
+    """Create the limiter from OpenAI settings."""
+    config = get_openai_config()
+    return OpenAIRateLimiter(
+        requests_per_minute=config['requests_per_minute'],
+        tokens_per_minute=config['tokens_per_minute'],
+        max_concurrency=config['max_concurrency']
+    )
+
+
+# Global limiter shared by every EmailService instance in the process
+openai_rate_limiter = _create_rate_limiter()
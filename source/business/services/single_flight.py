@@ -0,0 +1,139 @@
+"""
+Single-flight de-duplication and idempotency keys for generation requests.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, TypeVar
+from config.settings import get_campaign_config
+
+
+T = TypeVar('T')
+
+
+class _Call:
+    """An in-flight call that followers wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution.
+
+    The first caller runs the function; callers arriving while it runs wait
+    and receive the same result or exception. Nothing is cached once the
+    call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._executed = 0
+        self._shared = 0
+
+    def do(self, key: str, func: Callable[[], T]) -> T:
+        """Run func for key, or wait for the run already in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+            else:
+                self._shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def get_state(self) -> Dict[str, int]:
+        """Get call counts for metrics."""
+        with self._lock:
+            return {'in_flight': len(self._calls), 'executed': self._executed, 'shared': self._shared}
+
+
+class IdempotencyStore:
+    """Remembers the outcome of completed requests by idempotency key.
+
+    A repeated request with the same key gets the stored value instead of
+    running again; one arriving while the first is still running waits for
+    it. Entries expire after ttl_seconds, and the oldest are dropped beyond
+    max_entries.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._values: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._flight = SingleFlight()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get the stored value for a key, if it has not expired."""
+        with self._lock:
+            entry = self._values.get(key)
+            if not entry:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._values[key]
+                return None
+            return value
+
+    def put(self, key: str, value: Any):
+        """Store the value for a key."""
+        with self._lock:
+            self._values[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+
+    def run(self, key: str, func: Callable[[], T]) -> T:
+        """Return the stored value for key, or run func once and store its result."""
+        def run_once() -> T:
+            value = self.get(key)
+            if value is None:
+                value = func()
+                self.put(key, value)
+            return value
+
+        value = self.get(key)
+        return value if value is not None else self._flight.do(key, run_once)
+
+
+def get_payload_fingerprint(*parts: Any) -> str:
+    """Hash the request payload stored with an idempotency key.
+
+    Keys are stored together with this fingerprint, so reusing a key for a
+    different payload runs the new request instead of returning the result
+    of the old one.
+    """
+    return hashlib.sha256('\0'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _create_idempotency_store() -> IdempotencyStore:
+    """Create the idempotency store from campaign settings."""
+    return IdempotencyStore(ttl_seconds=get_campaign_config()['idempotency_ttl_seconds'])
+
+
+# Process-wide de-duplication shared by every EmailService instance
+generation_flight = SingleFlight()
+idempotency_store = _create_idempotency_store()
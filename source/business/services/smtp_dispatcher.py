@@ -0,0 +1,156 @@
+"""
+Parallel SMTP dispatch with per-recipient-domain throttling.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, TypeVar
+from config.settings import get_email_config
+from business.services.rate_limiter import TokenBucket
+
+T = TypeVar('T')
+
+
+def get_recipient_domain(recipient: str) -> str:
+    """Get the lower-cased domain of an email address."""
+    return recipient.rsplit('@', 1)[-1].strip().lower() if recipient else ''
+
+
+class DomainThrottle:
+    """Limits concurrent sessions and message rate per recipient domain."""
+
+    def __init__(self, max_concurrent_per_domain: int, messages_per_second_per_domain: float):
+        self.max_concurrent_per_domain = max_concurrent_per_domain
+        self.messages_per_second_per_domain = messages_per_second_per_domain
+        self._semaphores: Dict[str, threading.Semaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _get_limits(self, domain: str):
+        """Get (creating on first use) the semaphore and bucket for a domain."""
+        with self._lock:
+            if domain not in self._semaphores:
+                self._semaphores[domain] = threading.Semaphore(self.max_concurrent_per_domain)
+                self._buckets[domain] = TokenBucket(
+                    capacity=max(1.0, self.messages_per_second_per_domain),
+                    refill_per_second=self.messages_per_second_per_domain
+                )
+            return self._semaphores[domain], self._buckets[domain]
+
+    @contextmanager
+    def slot(self, domain: str):
+        """Hold a sending slot for a domain, waiting for its rate budget."""
+        semaphore, bucket = self._get_limits(domain)
+        with semaphore:
+            while True:
+                wait = bucket.try_consume(1)
+                if wait <= 0:
+                    break
+                time.sleep(wait)
+            yield
+
+
+class ParallelSMTPDispatcher:
+    """Sends messages on several SMTP sessions at once and reports throughput.
+
+    Messages are interleaved across recipient domains so that workers waiting
+    on a throttled domain do not hold up messages for other domains.
+    """
+
+    def __init__(self, max_workers: int, throttle: DomainThrottle):
+        self.logger = logging.getLogger(__name__)
+        self.max_workers = max_workers
+        self.throttle = throttle
+        self._lock = threading.Lock()
+        self._stats = {'dispatches': 0, 'messages': 0, 'sent': 0, 'failed': 0, 'seconds': 0.0}
+        self._last_dispatch: Dict[str, Any] = {}
+
+    def dispatch(self, messages: Dict[int, T], get_recipient: Callable[[T], str],
+                 send: Callable[[T], bool]) -> Dict[int, bool]:
+        """Send each message by ID and return success status for each."""
+        if not messages:
+            return {}
+
+        by_domain: Dict[str, List[int]] = OrderedDict()
+        for message_id, message in messages.items():
+            by_domain.setdefault(get_recipient_domain(get_recipient(message)), []).append(message_id)
+
+        # Round-robin across domains: a, b, c, a, b, a, ...
+        queues = list(by_domain.items())
+        order = []
+        while queues:
+            for domain, ids in queues:
+                order.append((domain, ids.pop(0)))
+            queues = [(domain, ids) for domain, ids in queues if ids]
+
+        def send_one(domain: str, message_id: int) -> bool:
+            try:
+                with self.throttle.slot(domain):
+                    return send(messages[message_id])
+            except Exception as e:
+                self.logger.error(f"Failed to send email {message_id}: {e}")
+                return False
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(order)),
+                                thread_name_prefix='smtp-dispatch') as executor:
+            futures = {message_id: executor.submit(send_one, domain, message_id) for domain, message_id in order}
+            results = {message_id: futures[message_id].result() for message_id in messages}
+        elapsed = time.monotonic() - started
+
+        self._record(results, elapsed, len(by_domain))
+        return results
+
+    def _record(self, results: Dict[int, bool], elapsed: float, domain_count: int):
+        """Record throughput for a finished dispatch."""
+        sent = sum(1 for success in results.values() if success)
+        rate = round(len(results) / elapsed, 2) if elapsed > 0 else None
+        with self._lock:
+            self._stats['dispatches'] += 1
+            self._stats['messages'] += len(results)
+            self._stats['sent'] += sent
+            self._stats['failed'] += len(results) - sent
+            self._stats['seconds'] += elapsed
+            self._last_dispatch = {
+                'messages': len(results),
+                'sent': sent,
+                'domains': domain_count,
+                'seconds': round(elapsed, 3),
+                'messages_per_second': rate
+            }
+        self.logger.info(f"Dispatched {len(results)} emails to {domain_count} domains "
+                         f"in {elapsed:.2f}s ({rate} messages/sec)")
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get throughput totals and the most recent dispatch for monitoring."""
+        with self._lock:
+            seconds = self._stats['seconds']
+            return {
+                'max_workers': self.max_workers,
+                'max_concurrent_per_domain': self.throttle.max_concurrent_per_domain,
+                'messages_per_second_per_domain': self.throttle.messages_per_second_per_domain,
+                **self._stats,
+                'seconds': round(seconds, 3),
+                'messages_per_second': round(self._stats['messages'] / seconds, 2) if seconds > 0 else None,
+                'last_dispatch': dict(self._last_dispatch)
+            }
+
+
+def _create_smtp_dispatcher() -> ParallelSMTPDispatcher:
+    """Create the dispatcher from email settings."""
+    config = get_email_config()
+    return ParallelSMTPDispatcher(
+        max_workers=config['smtp_dispatch_workers'],
+        throttle=DomainThrottle(
+            max_concurrent_per_domain=config['smtp_domain_concurrency'],
+            messages_per_second_per_domain=config['smtp_domain_rate']
+        )
+    )
+
+
+# Global dispatcher shared by every EmailService instance in the process
+smtp_dispatcher = _create_smtp_dispatcher()
@@ -0,0 +1,172 @@
+"""
+Pool of authenticated SMTP connections reused across sends.
+"""
+
+import logging
+import smtplib
+import threading
+import time
+from email.message import Message
+from typing import Dict, Any, List
+from config.settings import get_email_config
+
+
+class PooledSMTPConnection:
+    """An authenticated SMTP session with usage bookkeeping."""
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        """Close the session, ignoring errors from an already broken connection."""
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """Thread-safe pool that keeps SMTP sessions logged in between messages.
+
+    Idle sessions are reset with RSET before reuse; sessions that fail the
+    reset, sit idle too long or reach the per-connection message cap are
+    closed and replaced. A send that fails on a reused session because the
+    server dropped it is retried once on a fresh session.
+    """
+
+    def __init__(self, host: str, port: int, username: str = '', password: str = '', use_tls: bool = True,
+                 max_connections: int = 4, max_messages_per_connection: int = 100,
+                 idle_timeout: float = 60.0, timeout: float = 30.0):
+        self.logger = logging.getLogger(__name__)
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_connections = max_connections
+        self.max_messages_per_connection = max_messages_per_connection
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle: List[PooledSMTPConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._stats = {'connections_opened': 0, 'connections_reused': 0, 'messages_sent': 0, 'reconnects': 0}
+
+    def _create_connection(self) -> smtplib.SMTP:
+        """Open, secure and authenticate a new SMTP session."""
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        return server
+
+    def _open(self) -> PooledSMTPConnection:
+        """Open a new pooled connection."""
+        connection = PooledSMTPConnection(self._create_connection())
+        with self._lock:
+            self._stats['connections_opened'] += 1
+        return connection
+
+    def _acquire(self) -> PooledSMTPConnection:
+        """Take a healthy idle connection, or open a new one. The caller holds a slot."""
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                return self._open()
+
+            if time.monotonic() - connection.last_used > self.idle_timeout:
+                connection.close()
+                continue
+            try:
+                # Clears any half-finished transaction and checks the session is still alive
+                connection.server.rset()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+                continue
+
+            with self._lock:
+                self._stats['connections_reused'] += 1
+            return connection
+
+    def _release(self, connection: PooledSMTPConnection):
+        """Return a connection to the pool unless it has reached its message cap."""
+        connection.last_used = time.monotonic()
+        if connection.messages_sent >= self.max_messages_per_connection:
+            connection.close()
+            return
+        with self._lock:
+            self._idle.append(connection)
+
+    def send_message(self, msg: Message):
+        """Send a message on a pooled connection."""
+        with self._slots:
+            connection = self._acquire()
+            reused = connection.messages_sent > 0
+            try:
+                connection.server.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                connection.close()
+                if not reused:
+                    raise
+                # The server dropped an idle session between RSET and send; retry on a new one
+                self.logger.warning(f"SMTP connection dropped, reconnecting: {e}")
+                with self._lock:
+                    self._stats['reconnects'] += 1
+                connection = self._open()
+                try:
+                    connection.server.send_message(msg)
+                except Exception:
+                    connection.close()
+                    raise
+            except Exception:
+                # The session state is unknown after a failed send; do not reuse it
+                connection.close()
+                raise
+
+            connection.messages_sent += 1
+            with self._lock:
+                self._stats['messages_sent'] += 1
+            self._release(connection)
+
+    def close_all(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get a snapshot of pool usage for monitoring."""
+        with self._lock:
+            return {
+                'idle_connections': len(self._idle),
+                'max_connections': self.max_connections,
+                **self._stats
+            }
+
+
+def _create_smtp_pool() -> SMTPConnectionPool:
+    """Create the pool from email settings."""
+    config = get_email_config()
+    return SMTPConnectionPool(
+        host=config['smtp_server'],
+        port=config['smtp_port'],
+        username=config['smtp_username'],
+        password=config['smtp_password'],
+        use_tls=config['use_tls'],
+        max_connections=config['smtp_pool_size'],
+        max_messages_per_connection=config['smtp_max_messages_per_connection'],
+        idle_timeout=config['smtp_idle_timeout'],
+        timeout=config['smtp_timeout']
+    )
+
+
+# Global pool shared by every EmailService instance in the process
+smtp_pool = _create_smtp_pool()
@@ -0,0 +1,133 @@
+"""
+Placeholder template engine for email personalization.
+
+Templates use ``{field}`` placeholders for any Customer field (plus the
+aliases ``name``/``full_name`` and ``company``), ``{field|default}`` to fall
+back when the value is empty, and ``{{``/``}}`` for literal braces, so
+``{{first_name}}`` renders as the text ``{first_name}``.
+Templates are parsed once into a cached CompiledTemplate and rendered in a
+single pass.
+"""
+
+import dataclasses
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from data.models.customer import Customer
+
+
+# Placeholder syntax, e.g. "Hello {first_name}" or "Hi {title|there}"
+TOKEN_PATTERN = re.compile(r'\{\{|\}\}|\{(\w+)(?:\|([^{}]*))?\}')
+
+# Placeholders the AI is allowed to leave in a campaign draft
+CAMPAIGN_PLACEHOLDERS = ('name', 'first_name', 'last_name', 'company', 'title')
+
+# Short names for Customer properties and fields
+CUSTOMER_ALIASES = {
+    'name': lambda customer: customer.full_name,
+    'full_name': lambda customer: customer.full_name,
+    'company': lambda customer: customer.company_name
+}
+
+CUSTOMER_FIELDS = tuple(field.name for field in dataclasses.fields(Customer))
+
+
+class CompiledTemplate:
+    """A template compiled to a positional format string.
+
+    Each distinct (placeholder, default) pair becomes one positional field,
+    so rendering resolves every pair once and str.format assembles the text
+    in a single pass.
+    """
+
+    def __init__(self, source: str, format_string: str, fields: List[Tuple[str, Optional[str]]]):
+        self.source = source
+        self.format_string = format_string
+        self.fields = fields
+        self.placeholders = {name for name, _ in fields}
+        self._customer_getters = [
+            (name, _get_customer_getter(name)) for name in self.placeholders if _get_customer_getter(name)
+        ]
+
+    def render(self, values: Dict[str, str], escape: Optional[Callable[[str], str]] = None) -> str:
+        """Fill placeholders from values. Unknown placeholders are left untouched.
+
+        escape, if given, is applied to substituted values (e.g. html.escape).
+        """
+        arguments = []
+        for name, default in self.fields:
+            value = values.get(name)
+            if value is None:
+                value = f"{{{name}|{default}}}" if default is not None else f"{{{name}}}"
+            elif not value and default is not None:
+                value = escape(default) if escape else default
+            elif escape:
+                value = escape(value)
+            arguments.append(value)
+        return self.format_string.format(*arguments)
+
+    def render_customer(self, customer: Customer, escape: Optional[Callable[[str], str]] = None) -> str:
+        """Render the template for a customer, reading only the fields it uses."""
+        values = {}
+        for name, get_value in self._customer_getters:
+            values[name] = get_value(customer)
+        return self.render(values, escape)
+
+    def render_many(self, customers: Iterable[Customer],
+                    escape: Optional[Callable[[str], str]] = None) -> List[str]:
+        """Render the template for many customers, e.g. a bulk campaign."""
+        return [self.render_customer(customer, escape) for customer in customers]
+
+
+def _get_customer_getter(name: str) -> Optional[Callable[[Customer], str]]:
+    """Get the function that reads a placeholder's value from a customer, if it is a customer field."""
+    if name in CUSTOMER_ALIASES:
+        return CUSTOMER_ALIASES[name]
+    if name in CUSTOMER_FIELDS:
+        return lambda customer: _to_text(getattr(customer, name))
+    return None
+
+
+def _to_text(value) -> str:
+    """Convert a field value to placeholder text."""
+    return '' if value is None else str(value)
+
+
+@lru_cache(maxsize=256)
+def compile_template(text: str) -> CompiledTemplate:
+    """Parse a template once. Results are cached by template text."""
+    parts = []
+    fields: List[Tuple[str, Optional[str]]] = []
+    position = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        # Literal braces are escaped again for str.format
+        parts.append(text[position:match.start()].replace('{', '{{').replace('}', '}}'))
+        token = match.group(0)
+        if token in ('{{', '}}'):
+            parts.append(token)
+        else:
+            field = (match.group(1), match.group(2))
+            if field not in fields:
+                fields.append(field)
+            parts.append(f"{{{fields.index(field)}}}")
+        position = match.end()
+    parts.append(text[position:].replace('{', '{{').replace('}', '}}'))
+    return CompiledTemplate(text, ''.join(parts), fields)
+
+
+def get_customer_placeholder_values(customer: Customer) -> Dict[str, str]:
+    """Get every placeholder value available for a customer."""
+    values = {name: _to_text(getattr(customer, name)) for name in CUSTOMER_FIELDS}
+    for name, get_value in CUSTOMER_ALIASES.items():
+        values[name] = get_value(customer)
+    return values
+
+
+def find_placeholders(text: str) -> Set[str]:
+    """Get the set of placeholder names used in a text."""
+    return set(compile_template(text).placeholders)
+
+
+def render_placeholders(text: str, values: Dict[str, str]) -> str:
+    """Fill placeholders in a single pass. Unknown placeholders are left untouched."""
+    return compile_template(text).render(values)
@@ -0,0 +1,184 @@
+"""
+Near-duplicate detection for templates, used to patch earlier emails instead of generating them again.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+from config.settings import get_campaign_config
+from data.models.customer import Customer
+from business.services.template_engine import compile_template
+
+
+# Words per shingle hashed into a SimHash fingerprint
+SHINGLE_SIZE = 3
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into whitespace-separated tokens."""
+    return (text or '').split()
+
+
+def simhash(text: str) -> int:
+    """Get the 64-bit SimHash of text's lowercased word shingles; near-identical texts differ in few bits."""
+    tokens = [token.lower() for token in tokenize(text)]
+    shingles = [' '.join(tokens[start:start + SHINGLE_SIZE])
+                for start in range(max(len(tokens) - SHINGLE_SIZE + 1, 1))]
+    weights = [0] * 64
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(first: int, second: int) -> int:
+    """Count the bits in which two fingerprints differ."""
+    return bin(first ^ second).count('1')
+
+
+def get_similarity(first: str, second: str) -> float:
+    """Share of tokens two texts have in common, in order, from 0 to 1."""
+    return SequenceMatcher(None, tokenize(first), tokenize(second), autojunk=False).ratio()
+
+
+@dataclass
+class TemplateMatch:
+    """An earlier template that is nearly identical to a new one."""
+
+    template_text: str
+    similarity: float
+    used_at: float  # time.time() of the earlier run
+
+
+class TemplateIndex:
+    """Remembers each user's recent templates to find near-duplicates of a new one.
+
+    SimHash fingerprints pick the candidates cheaply; each candidate within
+    MAX_DISTANCE bits is then compared token by token, and the most similar
+    one at or above the similarity threshold is the match. An identical
+    template is never a match: running it again asks for fresh emails.
+    Entries are held in memory, so each process (web or worker) only knows
+    the templates it ran since it started.
+    """
+
+    # Fingerprint bits a template may differ by and still be compared in full
+    MAX_DISTANCE = 24
+
+    def __init__(self, similarity: float = 0.9, max_entries: int = 500):
+        self.similarity = similarity
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (user_id, template digest) -> (fingerprint, template_text, used_at), least recently used first
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[int, str, float]]" = OrderedDict()
+        self._stats = {'lookups': 0, 'near_duplicates': 0, 'reused_emails': 0, 'regenerated_emails': 0}
+
+    @staticmethod
+    def _digest(template_text: str) -> str:
+        """Identify a template exactly."""
+        return hashlib.sha256(template_text.encode('utf-8')).hexdigest()
+
+    def add(self, user_id: int, template_text: str):
+        """Remember that user_id ran template_text."""
+        key = (user_id, self._digest(template_text))
+        with self._lock:
+            self._entries[key] = (simhash(template_text), template_text, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > max(self.max_entries, 0):
+                self._entries.popitem(last=False)
+
+    def find_similar(self, user_id: int, template_text: str) -> Optional[TemplateMatch]:
+        """Find user_id's most similar earlier template, if one reaches the similarity threshold."""
+        fingerprint = simhash(template_text)
+        digest = self._digest(template_text)
+        with self._lock:
+            self._stats['lookups'] += 1
+            candidates = [(text, used_at) for (owner, key), (other, text, used_at) in self._entries.items()
+                          if owner == user_id and key != digest
+                          and hamming_distance(fingerprint, other) <= self.MAX_DISTANCE]
+
+        best: Optional[TemplateMatch] = None
+        for text, used_at in candidates:
+            similarity = get_similarity(text, template_text)
+            if similarity >= self.similarity and (best is None or similarity > best.similarity):
+                best = TemplateMatch(template_text=text, similarity=round(similarity, 3), used_at=used_at)
+        if best is not None:
+            with self._lock:
+                self._stats['near_duplicates'] += 1
+        return best
+
+    def record_reuse(self, reused: int, regenerated: int):
+        """Count emails patched from an earlier run and those that had to be generated again."""
+        with self._lock:
+            self._stats['reused_emails'] += reused
+            self._stats['regenerated_emails'] += regenerated
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get index size and reuse counts for metrics."""
+        with self._lock:
+            return {'templates': len(self._entries), 'similarity': self.similarity, **self._stats}
+
+
+def _get_edits(old_tokens: List[str], new_tokens: List[str]) -> Optional[List[Tuple[List[str], List[str]]]]:
+    """List the (old, new) token runs that turn old_tokens into new_tokens.
+
+    An insertion or deletion takes a neighbouring unchanged token on both
+    sides, so every edit has text to find and text to put in its place.
+    Gives None if old_tokens is empty and there is nothing to anchor on.
+    """
+    edits = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_tokens, new_tokens, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            continue
+        if i1 == i2 or j1 == j2:
+            if i1 > 0:
+                i1, j1 = i1 - 1, j1 - 1
+            elif i2 < len(old_tokens):
+                i2, j2 = i2 + 1, j2 + 1
+            else:
+                return None
+        edits.append((old_tokens[i1:i2], new_tokens[j1:j2]))
+    return edits
+
+
+def patch_text(old_template: str, new_template: str, text: str, customer: Customer,
+               strict: bool = True) -> Optional[str]:
+    """Apply the edits between two templates to text generated from the old one.
+
+    Each edit's old tokens, rendered for customer, must appear exactly once in
+    text and are replaced with the rendered new tokens. With strict, an edit
+    that cannot be placed gives None; otherwise it is skipped.
+    """
+    edits = _get_edits(tokenize(old_template), tokenize(new_template))
+    if edits is None:
+        return None if strict else text
+
+    patched = text
+    for old, new in edits:
+        old_rendered = tokenize(compile_template(' '.join(old)).render_customer(customer))
+        new_rendered = compile_template(' '.join(new)).render_customer(customer)
+        pattern = r'(?<!\S)' + r'\s+'.join(re.escape(token) for token in old_rendered) + r'(?!\S)'
+        matches = list(re.finditer(pattern, patched)) if old_rendered else []
+        if len(matches) != 1:
+            if strict:
+                return None
+            continue
+        match = matches[0]
+        patched = patched[:match.start()] + new_rendered + patched[match.end():]
+    return patched
+
+
+def _create_template_index() -> TemplateIndex:
+    """Create the template index from campaign settings."""
+    config = get_campaign_config()
+    return TemplateIndex(similarity=config['template_reuse_similarity'],
+                         max_entries=config['template_reuse_templates'])
+
+
+# Global template index shared by every EmailService instance in the process
+template_index = _create_template_index()
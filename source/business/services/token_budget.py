@@ -0,0 +1,86 @@
+"""
+Local token estimation and prompt budgeting for OpenAI requests.
+"""
+
+import re
+from typing import Any, Dict, List
+
+
+# Word pieces, roughly as a BPE tokenizer splits text
+WORD_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Characters per token inside long words
+CHARS_PER_TOKEN = 4
+
+# Tokens the chat format adds per message and to prime the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+# Context window sizes by model prefix; the longest matching prefix wins
+CONTEXT_WINDOWS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4': 8192,
+    'gpt-4-turbo': 128000,
+    'gpt-4o': 128000,
+    'gpt-4.1': 1047576,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+
+class TokenBudgetExceeded(ValueError):
+    """Raised when a request cannot fit in the model's context window."""
+
+
+def _piece_tokens(piece: str) -> int:
+    """Estimate the tokens in one word piece."""
+    return -(-len(piece) // CHARS_PER_TOKEN)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the tokens in a text without calling the API.
+
+    Errs slightly high for English prose, which is the safe side for budgeting.
+    """
+    return sum(_piece_tokens(piece) for piece in WORD_PIECE_PATTERN.findall(text or ''))
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Estimate the prompt tokens of a chat completions request."""
+    return sum(estimate_tokens(message.get('content', '')) + MESSAGE_OVERHEAD_TOKENS
+               for message in messages) + REPLY_OVERHEAD_TOKENS
+
+
+def get_context_window(model: str, configured: int = 0) -> int:
+    """Get a model's context window, preferring an explicitly configured size."""
+    if configured:
+        return configured
+    matches = [prefix for prefix in CONTEXT_WINDOWS if model.startswith(prefix)]
+    return CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = " [...]") -> str:
+    """Cut a text to about max_tokens, at a word boundary, marking the cut."""
+    used = 0
+    for match in WORD_PIECE_PATTERN.finditer(text):
+        used += _piece_tokens(match.group(0))
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + marker
+    return text
+
+
+def fit_request(request: Dict[str, Any], context_window: int, min_output_tokens: int) -> Dict[str, Any]:
+    """Lower a request's max_tokens to what is left of the context window after its prompt.
+
+    Raises TokenBudgetExceeded if fewer than min_output_tokens would remain.
+    """
+    prompt_tokens = estimate_prompt_tokens(request.get('messages', []))
+    available = context_window - prompt_tokens
+    requested = request.get('max_tokens') or available
+    if available < min(requested, min_output_tokens):
+        raise TokenBudgetExceeded(
+            f"Prompt of about {prompt_tokens} tokens leaves {max(available, 0)} of the "
+            f"{context_window}-token context for the reply"
+        )
+    if requested > available:
+        return {**request, 'max_tokens': available}
+    return request
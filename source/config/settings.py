@@ -2,6 +2,7 @@
 Application settings and configuration management.
 """
 
+import logging
 import os
 from typing import Dict, Any
 
@@ -29,13 +30,104 @@ def get_database_config() -> Dict[str, Any]:
     }
 
 
+def _parse_user_weights(value: str) -> Dict[int, float]:
+    """Parse "user_id:weight,..." pairs, skipping malformed entries so those users keep the default weight of 1."""
+    weights = {}
+    for entry in value.split(','):
+        if not entry.strip():
+            continue
+        try:
+            user_id, weight = entry.split(':')
+            user_id, weight = int(user_id), float(weight)
+            if weight <= 0:
+                raise ValueError("the weight must be positive")
+        except ValueError as e:
+            logging.getLogger(__name__).warning(f"Ignoring OPENAI_USER_WEIGHTS entry {entry.strip()!r}: {e}")
+            continue
+        weights[user_id] = weight
+    return weights
+
+
 def get_openai_config() -> Dict[str, Any]:
     """Get OpenAI configuration settings."""
     return {
         'api_key': os.getenv('OPENAI_API_KEY', ''),
+        # Empty means the public API; point at another server such as tests/fake_openai_server.py
+        'base_url': os.getenv('OPENAI_BASE_URL', ''),
         'model': os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo'),
         'max_tokens': int(os.getenv('OPENAI_MAX_TOKENS', '500')),
-        'temperature': float(os.getenv('OPENAI_TEMPERATURE', '0.7'))
+        'temperature': float(os.getenv('OPENAI_TEMPERATURE', '0.7')),
+        'requests_per_minute': int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', '500')),
+        'tokens_per_minute': int(os.getenv('OPENAI_TOKENS_PER_MINUTE', '90000')),
+        'max_concurrency': int(os.getenv('OPENAI_MAX_CONCURRENCY', '8')),
+        'max_retries': int(os.getenv('OPENAI_MAX_RETRIES', '4')),
+        # Scheduling of calls waiting for a concurrency slot: slots bulk work may never take,
+        # and each user's share of bulk and interactive capacity as "user_id:weight,..." (default 1)
+        'interactive_reserve': int(os.getenv('OPENAI_INTERACTIVE_RESERVE', '1')),
+        'user_weights': _parse_user_weights(os.getenv('OPENAI_USER_WEIGHTS', '')),
+        # Shared HTTP connection pool; timeouts are in seconds
+        'max_connections': int(os.getenv('OPENAI_MAX_CONNECTIONS', '16')),
+        'max_keepalive_connections': int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '16')),
+        'keepalive_expiry': float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '60')),
+        'connect_timeout': float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5')),
+        'read_timeout': float(os.getenv('OPENAI_READ_TIMEOUT', '60')),
+        'warmup_connections': int(os.getenv('OPENAI_WARMUP_CONNECTIONS', '2')),
+        # Deadline in seconds covering the body and subject together; each task has its own timeout
+        'generation_deadline': float(os.getenv('OPENAI_GENERATION_DEADLINE', '20')),
+        # Resend a call still running after this percentile of its stage's latency; 0 disables
+        'hedge_percentile': float(os.getenv('OPENAI_HEDGE_PERCENTILE', '95')),
+        'hedge_min_delay': float(os.getenv('OPENAI_HEDGE_MIN_DELAY', '0.5')),
+        # Circuit breaker: stop calling OpenAI after repeated or frequent provider failures
+        'circuit_failure_threshold': int(os.getenv('OPENAI_CIRCUIT_FAILURE_THRESHOLD', '5')),
+        'circuit_error_rate': float(os.getenv('OPENAI_CIRCUIT_ERROR_RATE', '0.5')),
+        'circuit_window': int(os.getenv('OPENAI_CIRCUIT_WINDOW', '20')),
+        'circuit_open_seconds': float(os.getenv('OPENAI_CIRCUIT_OPEN_SECONDS', '30')),
+        'circuit_half_open_probes': int(os.getenv('OPENAI_CIRCUIT_HALF_OPEN_PROBES', '1')),
+        # Token budgeting; a context window of 0 means the model's known size
+        'context_window': int(os.getenv('OPENAI_CONTEXT_WINDOW', '0')),
+        'max_template_tokens': int(os.getenv('OPENAI_MAX_TEMPLATE_TOKENS', '400')),
+        'min_output_tokens': int(os.getenv('OPENAI_MIN_OUTPUT_TOKENS', '64')),
+        # Prices per 1,000 tokens, used for cost reporting
+        'prompt_cost_per_1k': float(os.getenv('OPENAI_PROMPT_COST_PER_1K', '0.0005')),
+        # Prompt tokens read from the provider's prompt cache are billed at a discount
+        'cached_prompt_cost_per_1k': float(os.getenv('OPENAI_CACHED_PROMPT_COST_PER_1K', '0.00025')),
+        'completion_cost_per_1k': float(os.getenv('OPENAI_COMPLETION_COST_PER_1K', '0.0015'))
+    }
+
+
+def _get_model_route(task: str, max_tokens: str, temperature: str, timeout: str) -> Dict[str, Any]:
+    """Read one task's model settings from OPENAI_<TASK>_* variables."""
+    prefix = f"OPENAI_{task.upper()}"
+    return {
+        'model': os.getenv(f'{prefix}_MODEL', os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')),
+        # Faster model used while the task is over its latency budget; empty never downgrades
+        'fallback_model': os.getenv(f'{prefix}_FALLBACK_MODEL', ''),
+        'max_tokens': int(os.getenv(f'{prefix}_MAX_TOKENS', max_tokens)),
+        'temperature': float(os.getenv(f'{prefix}_TEMPERATURE', temperature)),
+        # Seconds a call may take, retries included
+        'timeout': float(os.getenv(f'{prefix}_TIMEOUT', timeout)),
+        # Seconds the model's recent latency percentile may reach before calls downgrade; 0 never downgrades
+        'latency_budget': float(os.getenv(f'{prefix}_LATENCY_BUDGET', '0'))
+    }
+
+
+def get_model_routing_config() -> Dict[str, Any]:
+    """Get the model, token limit, timeout and temperature of each kind of OpenAI call.
+
+    Timeouts default to the OPENAI_*_DEADLINE settings they replaced.
+    """
+    return {
+        'tasks': {
+            'body': _get_model_route('body', os.getenv('OPENAI_MAX_TOKENS', '500'),
+                                     os.getenv('OPENAI_TEMPERATURE', '0.7'), os.getenv('OPENAI_BODY_DEADLINE', '15')),
+            'subject': _get_model_route('subject', '50', '0.3', os.getenv('OPENAI_SUBJECT_DEADLINE', '5')),
+            'hipaa': _get_model_route('hipaa', '200', '0.1', os.getenv('OPENAI_COMPLIANCE_DEADLINE', '10')),
+            'ai_check': _get_model_route('ai_check', '200', '0.1', os.getenv('OPENAI_COMPLIANCE_DEADLINE', '10'))
+        },
+        # Latency percentile compared with each task's budget
+        'latency_percentile': float(os.getenv('OPENAI_ROUTING_PERCENTILE', '90')),
+        # Seconds a downgraded task stays on its fallback model before its own model is tried again
+        'downgrade_seconds': float(os.getenv('OPENAI_ROUTING_DOWNGRADE_SECONDS', '60'))
     }
 
 
@@ -48,7 +140,53 @@ def get_email_config() -> Dict[str, Any]:
         'smtp_password': os.getenv('SMTP_PASSWORD', ''),
         'use_tls': os.getenv('SMTP_USE_TLS', 'true').lower() == 'true',
         'sender_email': os.getenv('SENDER_EMAIL', 'noreply@mycrm.com'),
-        'sender_name': os.getenv('SENDER_NAME', 'MyCRM System')
+        'sender_name': os.getenv('SENDER_NAME', 'MyCRM System'),
+        'smtp_pool_size': int(os.getenv('SMTP_POOL_SIZE', '4')),
+        'smtp_max_messages_per_connection': int(os.getenv('SMTP_MAX_MESSAGES_PER_CONNECTION', '100')),
+        'smtp_idle_timeout': float(os.getenv('SMTP_IDLE_TIMEOUT', '60')),
+        'smtp_timeout': float(os.getenv('SMTP_TIMEOUT', '30')),
+        'smtp_dispatch_workers': int(os.getenv('SMTP_DISPATCH_WORKERS', os.getenv('SMTP_POOL_SIZE', '4'))),
+        'smtp_domain_concurrency': int(os.getenv('SMTP_DOMAIN_CONCURRENCY', '2')),
+        'smtp_domain_rate': float(os.getenv('SMTP_DOMAIN_RATE', '5')),  # messages per second per domain
+        'outbox_batch_size': int(os.getenv('OUTBOX_BATCH_SIZE', '50')),
+        'outbox_lease_seconds': int(os.getenv('OUTBOX_LEASE_SECONDS', '300')),
+        'outbox_max_attempts': int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5')),
+        'outbox_retry_seconds': float(os.getenv('OUTBOX_RETRY_SECONDS', '30')),
+        'outbox_poll_interval': float(os.getenv('OUTBOX_POLL_INTERVAL', '1.0')),
+        'bulk_send_chunk_size': int(os.getenv('BULK_SEND_CHUNK_SIZE', '200'))
+    }
+
+
+def get_campaign_config() -> Dict[str, Any]:
+    """Get bulk campaign generation settings."""
+    return {
+        'llm_sample_size': int(os.getenv('CAMPAIGN_LLM_SAMPLE_SIZE', '0')),
+        'async_concurrency': int(os.getenv('ASYNC_EMAIL_CONCURRENCY', '50')),
+        # Bulk runs personalize up to this many recipients per AI call; 1 generates each email alone
+        'generation_batch_size': int(os.getenv('GENERATION_BATCH_SIZE', '5')),
+        # Most prompt and reply tokens one multi-recipient generation call may use
+        'generation_batch_tokens': int(os.getenv('GENERATION_BATCH_TOKENS', '4000')),
+        # How long a generate form submission is remembered to ignore repeats
+        'idempotency_ttl_seconds': float(os.getenv('GENERATION_IDEMPOTENCY_TTL', '3600')),
+        # A bulk run whose template nearly matches an earlier one: warn, off or patch (reuse its emails)
+        'template_reuse_mode': os.getenv('TEMPLATE_REUSE_MODE', 'warn'),
+        # Share of template tokens that must match an earlier template, from 0 to 1
+        'template_reuse_similarity': float(os.getenv('TEMPLATE_REUSE_SIMILARITY', '0.9')),
+        # Recent templates remembered across all users
+        'template_reuse_templates': int(os.getenv('TEMPLATE_REUSE_TEMPLATES', '500'))
+    }
+
+
+def get_email_job_config() -> Dict[str, Any]:
+    """Get background email job settings."""
+    return {
+        'worker_threads': int(os.getenv('EMAIL_JOB_WORKERS', '4')),
+        'mode': os.getenv('EMAIL_JOB_MODE', 'inprocess'),  # inprocess or worker
+        'sqlite_path': os.getenv('EMAIL_JOB_SQLITE_PATH', 'database/email_jobs.db'),
+        'lease_seconds': int(os.getenv('EMAIL_JOB_LEASE_SECONDS', '120')),
+        'batch_size': int(os.getenv('EMAIL_JOB_BATCH_SIZE', '8')),
+        'max_attempts': int(os.getenv('EMAIL_JOB_MAX_ATTEMPTS', '3')),
+        'poll_interval': float(os.getenv('EMAIL_JOB_POLL_INTERVAL', '1.0'))
     }
 
 
@@ -59,7 +197,19 @@ def get_security_config() -> Dict[str, Any]:
         'bcrypt_rounds': int(os.getenv('BCRYPT_ROUNDS', '12')),
         'secret_key': os.getenv('SECRET_KEY', 'your-secret-key-change-in-production'),
         'enable_hipaa_compliance': os.getenv('ENABLE_HIPAA_COMPLIANCE', 'true').lower() == 'true',
-        'enable_ai_compliance': os.getenv('ENABLE_AI_COMPLIANCE', 'true').lower() == 'true'
+        'enable_ai_compliance': os.getenv('ENABLE_AI_COMPLIANCE', 'true').lower() == 'true',
+        # Bulk runs review up to this many emails per compliance call; 1 reviews each email alone
+        'compliance_batch_size': int(os.getenv('COMPLIANCE_BATCH_SIZE', '10')),
+        # Most prompt and reply tokens one batched compliance call may use
+        'compliance_batch_tokens': int(os.getenv('COMPLIANCE_BATCH_TOKENS', '6000')),
+        # Compliance verdicts kept for reuse on identical content; 0 turns the cache off
+        'compliance_cache_entries': int(os.getenv('COMPLIANCE_CACHE_ENTRIES', '10000')),
+        # Verdicts older than this many days are reviewed again
+        'compliance_cache_ttl_days': float(os.getenv('COMPLIANCE_CACHE_TTL_DAYS', '30')),
+        # Where verdicts are kept: 'auto' (SQL Server when available, else memory), 'memory' or 'sqlite'
+        'compliance_cache_store': os.getenv('COMPLIANCE_CACHE_STORE', 'auto').lower(),
+        # SQLite file for verdicts with the 'sqlite' store; empty uses EMAIL_JOB_SQLITE_PATH
+        'compliance_cache_path': os.getenv('COMPLIANCE_CACHE_PATH', '')
     }
 
 
@@ -98,6 +248,8 @@ def get_app_config() -> Dict[str, Any]:
         'database': get_database_config(),
         'openai': get_openai_config(),
         'email': get_email_config(),
+        'campaign': get_campaign_config(),
+        'email_jobs': get_email_job_config(),
         'security': get_security_config(),
         'cherrypy': get_cherrypy_config()
     }
@@ -6,12 +6,24 @@ Implements automatic fallback from SQL Server to mock repositories.
 import logging
 from typing import Dict, Any
 from config.database import db_config
-from data.repositories.base import ICustomerRepository, IUserRepository, IEmailLogRepository, IRoleRepository
+from config.settings import get_email_job_config, get_security_config
+from data.repositories.base import (
+    ICustomerRepository,
+    IUserRepository,
+    IEmailLogRepository,
+    IRoleRepository,
+    IEmailJobRepository,
+    IEmailOutboxRepository,
+    IComplianceVerdictRepository
+)
 from data.repositories.mock_repositories import (
     MockCustomerRepository, 
     MockUserRepository, 
     MockEmailLogRepository, 
-    MockRoleRepository
+    MockRoleRepository,
+    MockEmailJobRepository,
+    MockEmailOutboxRepository,
+    MockComplianceVerdictRepository
 )
 
 
@@ -83,13 +95,18 @@ class RepositoryFactory:
         if 'email_log' not in self._repositories:
             if self._use_sql:
                 try:
-                    from data.repositories.sql_repositories import SqlEmailLogRepository
+                    from data.repositories.sql_email_repositories import SqlEmailLogRepository
                     self._repositories['email_log'] = SqlEmailLogRepository()
                     self.logger.info("Created SQL email log repository")
                 except Exception as e:
                     self.logger.error(f"Failed to create SQL email log repository: {e}")
                     self.logger.info("Falling back to mock email log repository")
                     self._repositories['email_log'] = MockEmailLogRepository()
+            elif get_email_job_config()['mode'] == 'worker':
+                # Standalone workers write logs the web process must be able to read
+                from data.repositories.sqlite_repositories import SqliteEmailLogRepository
+                self._repositories['email_log'] = SqliteEmailLogRepository()
+                self.logger.info("Created SQLite email log repository")
             else:
                 self._repositories['email_log'] = MockEmailLogRepository()
                 self.logger.info("Created mock email log repository")
@@ -114,6 +131,74 @@ class RepositoryFactory:
         
         return self._repositories['role']
     
+    def get_email_job_repository(self) -> IEmailJobRepository:
+        """Get email generation job repository instance."""
+        if 'email_job' not in self._repositories:
+            if get_email_job_config()['mode'] != 'worker':
+                # Jobs run inside the web process and are only kept in memory
+                self._repositories['email_job'] = MockEmailJobRepository()
+                self.logger.info("Created in-memory email job repository")
+            elif self._use_sql:
+                try:
+                    from data.repositories.sql_job_repository import SqlEmailJobRepository
+                    self._repositories['email_job'] = SqlEmailJobRepository()
+                    self.logger.info("Created SQL email job repository")
+                except Exception as e:
+                    self.logger.error(f"Failed to create SQL email job repository: {e}")
+                    self.logger.info("Falling back to SQLite email job repository")
+                    from data.repositories.sqlite_repositories import SqliteEmailJobRepository
+                    self._repositories['email_job'] = SqliteEmailJobRepository()
+            else:
+                from data.repositories.sqlite_repositories import SqliteEmailJobRepository
+                self._repositories['email_job'] = SqliteEmailJobRepository()
+                self.logger.info("Created SQLite email job repository")
+        
+        return self._repositories['email_job']
+    
+    def get_email_outbox_repository(self) -> IEmailOutboxRepository:
+        """Get email outbox repository instance."""
+        if 'email_outbox' not in self._repositories:
+            # The outbox must live next to the email logs so both are marked sent in one write
+            email_log_repository = self.get_email_log_repository()
+            from data.repositories.sqlite_repositories import SqliteEmailLogRepository, SqliteEmailOutboxRepository
+            from data.repositories.sql_email_repositories import SqlEmailLogRepository, SqlEmailOutboxRepository
+            if isinstance(email_log_repository, SqlEmailLogRepository):
+                self._repositories['email_outbox'] = SqlEmailOutboxRepository()
+                self.logger.info("Created SQL email outbox repository")
+            elif isinstance(email_log_repository, SqliteEmailLogRepository):
+                self._repositories['email_outbox'] = SqliteEmailOutboxRepository(email_log_repository.database)
+                self.logger.info("Created SQLite email outbox repository")
+            else:
+                self._repositories['email_outbox'] = MockEmailOutboxRepository(email_log_repository)
+                self.logger.info("Created in-memory email outbox repository")
+        
+        return self._repositories['email_outbox']
+    
+    def get_compliance_verdict_repository(self) -> IComplianceVerdictRepository:
+        """Get compliance verdict cache repository instance."""
+        if 'compliance_verdict' not in self._repositories:
+            config = get_security_config()
+            store = config['compliance_cache_store']
+            if store == 'sqlite':
+                # Only on request: verdicts outlive the process and are shared with workers on this host
+                from data.repositories.sqlite_repositories import SqliteComplianceVerdictRepository, SqliteDatabase
+                self._repositories['compliance_verdict'] = SqliteComplianceVerdictRepository(
+                    SqliteDatabase(config['compliance_cache_path'] or None))
+                self.logger.info("Created SQLite compliance verdict repository")
+            elif store != 'memory' and self._use_sql:
+                try:
+                    from data.repositories.sql_compliance_repository import SqlComplianceVerdictRepository
+                    self._repositories['compliance_verdict'] = SqlComplianceVerdictRepository()
+                    self.logger.info("Created SQL compliance verdict repository")
+                except Exception as e:
+                    self.logger.error(f"Failed to create SQL compliance verdict repository: {e}")
+                    self.logger.info("Falling back to in-memory compliance verdict repository")
+            if 'compliance_verdict' not in self._repositories:
+                self._repositories['compliance_verdict'] = MockComplianceVerdictRepository()
+                self.logger.info("Created in-memory compliance verdict repository")
+        
+        return self._repositories['compliance_verdict']
+    
     def reset(self):
         """Reset factory - clears cached repositories and retests database."""
         self._repositories.clear()
@@ -0,0 +1,43 @@
+"""
+Compliance verdict cache data model.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+
+@dataclass
+class ComplianceVerdict:
+    """A compliance review's result, stored so identical content is not reviewed again.
+
+    The cache key is a hash of the review, its policy version, the model and
+    the normalized email content, so a changed prompt or model never matches
+    an old verdict.
+    """
+
+    cache_key: str = ""
+    review: str = ""  # hipaa or ai
+    policy_version: str = ""
+    model: str = ""
+    result: str = ""
+    hits: int = 0
+    created_date: Optional[datetime] = None
+    last_used_date: Optional[datetime] = None
+
+    def __str__(self) -> str:
+        """String representation of the verdict."""
+        return f"{self.review} verdict {self.cache_key[:12]}: {self.result[:40]}"
+
+    def to_dict(self) -> dict:
+        """Convert verdict to dictionary."""
+        return {
+            'cache_key': self.cache_key,
+            'review': self.review,
+            'policy_version': self.policy_version,
+            'model': self.model,
+            'result': self.result,
+            'hits': self.hits,
+            'created_date': self.created_date.isoformat() if self.created_date else None,
+            'last_used_date': self.last_used_date.isoformat() if self.last_used_date else None
+        }
@@ -0,0 +1,134 @@
+"""
+Email generation job data model.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+from data.models.customer import Customer
+from data.models.email_log import EmailLog
+
+
+@dataclass
+class EmailJobItem:
+    """A single recipient within an email generation job.
+    
+    The customer is snapshotted when the job is submitted so that workers in
+    other processes can generate the email without the web tier's data.
+    """
+
+    item_id: Optional[int] = None
+    job_id: Optional[int] = None
+    customer_id: int = 0
+    customer: Optional[Customer] = None
+    position: int = 0  # index of the recipient in the submitted list
+    status: str = "pending"  # pending, running, completed, failed, cancelled
+    email_log_id: Optional[int] = None
+    error_message: str = ""
+    lease_owner: Optional[str] = None
+    lease_expires: Optional[datetime] = None
+    attempts: int = 0
+
+    @property
+    def is_finished(self) -> bool:
+        """Check if the item no longer needs processing."""
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def to_dict(self) -> dict:
+        """Convert job item to dictionary."""
+        return {
+            'item_id': self.item_id,
+            'job_id': self.job_id,
+            'customer_id': self.customer_id,
+            'position': self.position,
+            'status': self.status,
+            'email_log_id': self.email_log_id,
+            'error_message': self.error_message,
+            'lease_owner': self.lease_owner,
+            'attempts': self.attempts
+        }
+
+
+@dataclass
+class EmailJob:
+    """Bulk email generation job data model."""
+
+    job_id: Optional[int] = None
+    user_id: int = 0
+    template_text: str = ""
+    campaign_mode: bool = False
+    status: str = "queued"  # queued, running, completed, cancelled, failed
+    cancel_requested: bool = False
+    error_message: str = ""
+    campaign_draft: Optional[EmailLog] = None
+    items: List[EmailJobItem] = field(default_factory=list)
+    created_date: Optional[datetime] = None
+    started_date: Optional[datetime] = None
+    completed_date: Optional[datetime] = None
+
+    def __str__(self) -> str:
+        """String representation of the job."""
+        return f"Email job {self.job_id} ({self.status}, {self.processed_count}/{self.total_count})"
+
+    @property
+    def campaign_id(self) -> str:
+        """Get the label that attributes the job's OpenAI usage in metrics."""
+        return f"job-{self.job_id}"
+
+    @property
+    def total_count(self) -> int:
+        """Get the number of recipients in the job."""
+        return len(self.items)
+
+    @property
+    def processed_count(self) -> int:
+        """Get the number of recipients that have been processed."""
+        return sum(1 for item in self.items if item.is_finished)
+
+    @property
+    def is_finished(self) -> bool:
+        """Check if the job has stopped running."""
+        return self.status in ('completed', 'cancelled', 'failed')
+
+    @property
+    def progress_percent(self) -> float:
+        """Get job progress as a percentage."""
+        if not self.items:
+            return 100.0
+        return round(self.processed_count * 100.0 / self.total_count, 1)
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        """Estimate the remaining run time from the average time per processed item."""
+        if self.is_finished or not self.started_date:
+            return None
+        processed = self.processed_count
+        if processed == 0:
+            return None
+        elapsed = (datetime.now() - self.started_date).total_seconds()
+        return round(elapsed / processed * (self.total_count - processed), 1)
+
+    @property
+    def email_log_ids(self) -> List[int]:
+        """Get the email logs generated so far."""
+        return [item.email_log_id for item in self.items if item.email_log_id]
+
+    def to_dict(self) -> dict:
+        """Convert job to dictionary."""
+        return {
+            'job_id': self.job_id,
+            'user_id': self.user_id,
+            'campaign_mode': self.campaign_mode,
+            'status': self.status,
+            'cancel_requested': self.cancel_requested,
+            'error_message': self.error_message,
+            'total_count': self.total_count,
+            'processed_count': self.processed_count,
+            'progress_percent': self.progress_percent,
+            'eta_seconds': self.eta_seconds,
+            'email_log_ids': self.email_log_ids,
+            'items': [item.to_dict() for item in self.items],
+            'created_date': self.created_date.isoformat() if self.created_date else None,
+            'started_date': self.started_date.isoformat() if self.started_date else None,
+            'completed_date': self.completed_date.isoformat() if self.completed_date else None
+        }
@@ -2,11 +2,25 @@
 Email log data model.
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional
 
 
+# How an email body was produced
+GENERATION_PATH_OPENAI = 'openai'
+GENERATION_PATH_OPENAI_HEDGED = 'openai_hedged'  # a hedged duplicate request answered first
+GENERATION_PATH_OPENAI_BATCH = 'openai_batch'  # personalized together with other recipients in one request
+GENERATION_PATH_TEMPLATE = 'template'  # OpenAI is not configured
+GENERATION_PATH_DEADLINE = 'template_deadline'  # OpenAI missed its deadline
+GENERATION_PATH_ERROR = 'template_error'  # OpenAI failed
+GENERATION_PATH_CIRCUIT_OPEN = 'template_circuit_open'  # OpenAI was skipped while its circuit was open
+GENERATION_PATH_CAMPAIGN = 'campaign_draft'  # rendered from a shared campaign draft
+GENERATION_PATH_REUSED = 'reused'  # patched from the email of a near-identical earlier template
+
+# Prefix of a compliance result whose review is waiting for the AI provider
+COMPLIANCE_PENDING = 'PENDING'
+
 @dataclass
 class EmailLog:
     """Email log data model."""
@@ -24,6 +38,20 @@ class EmailLog:
     email_sent: bool = False
     sent_date: Optional[datetime] = None
     created_date: Optional[datetime] = None
+    # Per-stage OpenAI totals: stage -> calls, tokens, latency_ms, retries, cost
+    openai_usage: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    generation_path: str = ""
+    
+    @property
+    def compliance_pending(self) -> bool:
+        """Whether a compliance review still has to be run."""
+        return (self.hipaa_compliance_check.startswith(COMPLIANCE_PENDING)
+                or self.ai_compliance_check.startswith(COMPLIANCE_PENDING))
+    
+    @property
+    def openai_cost(self) -> float:
+        """Total OpenAI cost of generating and checking this email."""
+        return round(sum(stage.get('cost', 0.0) for stage in self.openai_usage.values()), 6)
     
     def __str__(self) -> str:
         """String representation of the email log."""
@@ -45,7 +73,9 @@ class EmailLog:
             'compliance_approved': self.compliance_approved,
             'email_sent': self.email_sent,
             'sent_date': self.sent_date.isoformat() if self.sent_date else None,
-            'created_date': self.created_date.isoformat() if self.created_date else None
+            'created_date': self.created_date.isoformat() if self.created_date else None,
+            'openai_usage': self.openai_usage,
+            'generation_path': self.generation_path
         }
     
     @classmethod
@@ -64,7 +94,9 @@ class EmailLog:
             compliance_approved=data.get('compliance_approved', False),
             email_sent=data.get('email_sent', False),
             sent_date=datetime.fromisoformat(data['sent_date']) if data.get('sent_date') else None,
-            created_date=datetime.fromisoformat(data['created_date']) if data.get('created_date') else None
+            created_date=datetime.fromisoformat(data['created_date']) if data.get('created_date') else None,
+            openai_usage=data.get('openai_usage') or {},
+            generation_path=data.get('generation_path', '')
         )
     
     def validate(self) -> list[str]:
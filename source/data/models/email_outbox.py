@@ -0,0 +1,55 @@
+"""
+Email outbox data model.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+
+@dataclass
+class EmailOutboxMessage:
+    """An email queued for delivery by the outbox dispatcher.
+
+    The idempotency key is unique per email log, so queueing the same email
+    twice returns the existing message instead of sending it again. The
+    message_id adds a random part, because email log IDs repeat across
+    databases and would otherwise give unrelated emails the same Message-ID.
+    """
+
+    outbox_id: Optional[int] = None
+    email_log_id: int = 0
+    idempotency_key: str = ""
+    # Unique part of the Message-ID, fixed when the message is first queued
+    message_id: str = ""
+    recipient_email: str = ""
+    subject: str = ""
+    body: str = ""
+    status: str = "pending"  # pending, sending, sent, failed
+    attempts: int = 0
+    next_attempt_date: Optional[datetime] = None
+    lease_owner: Optional[str] = None
+    lease_expires: Optional[datetime] = None
+    last_error: str = ""
+    created_date: Optional[datetime] = None
+    sent_date: Optional[datetime] = None
+
+    def __str__(self) -> str:
+        """String representation of the outbox message."""
+        return f"Outbox message {self.outbox_id} to {self.recipient_email} ({self.status})"
+
+    def to_dict(self) -> dict:
+        """Convert outbox message to dictionary."""
+        return {
+            'outbox_id': self.outbox_id,
+            'email_log_id': self.email_log_id,
+            'idempotency_key': self.idempotency_key,
+            'recipient_email': self.recipient_email,
+            'subject': self.subject,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_date': self.next_attempt_date.isoformat() if self.next_attempt_date else None,
+            'last_error': self.last_error,
+            'created_date': self.created_date.isoformat() if self.created_date else None,
+            'sent_date': self.sent_date.isoformat() if self.sent_date else None
+        }
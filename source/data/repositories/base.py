@@ -3,13 +3,17 @@ Base repository interface and abstract classes.
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Optional, TypeVar, Generic, TYPE_CHECKING
+from datetime import datetime
+from typing import Dict, List, Optional, TypeVar, Generic, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from data.models.customer import Customer
     from data.models.user import User
     from data.models.email_log import EmailLog
     from data.models.user import Role
+    from data.models.email_job import EmailJob, EmailJobItem
+    from data.models.email_outbox import EmailOutboxMessage
+    from data.models.compliance_verdict import ComplianceVerdict
 
 T = TypeVar('T')
 
@@ -98,6 +102,21 @@ class IEmailLogRepository(IRepository):
     def get_sent_emails(self) -> List['EmailLog']:
         """Get all sent emails."""
         pass
+    
+    @abstractmethod
+    def get_by_ids(self, entity_ids: List[int]) -> List['EmailLog']:
+        """Get the email logs with the given IDs in one query. Unknown IDs are skipped."""
+        pass
+    
+    @abstractmethod
+    def get_by_template(self, user_id: int, template_text: str, customer_ids: List[int]) -> List['EmailLog']:
+        """Get the email logs user_id generated from template_text for the given customers, newest first."""
+        pass
+    
+    @abstractmethod
+    def mark_sent(self, email_log_ids: List[int], sent_date: datetime) -> int:
+        """Mark email logs sent in one write. Returns the number of logs updated."""
+        pass
 
 
 class IRoleRepository(IRepository):
@@ -107,3 +126,146 @@ class IRoleRepository(IRepository):
     def get_by_name(self, role_name: str) -> Optional['Role']:
         """Get role by name."""
         pass
+
+
+class IEmailJobRepository(IRepository):
+    """Email generation job repository interface.
+    
+    Job items are processed by workers that claim them with a time-limited
+    lease. A worker must renew its leases while it works; items whose lease
+    expires are handed to another worker.
+    """
+    
+    @abstractmethod
+    def get_by_user_id(self, user_id: int) -> List['EmailJob']:
+        """Get jobs submitted by a specific user."""
+        pass
+    
+    @abstractmethod
+    def get_without_items(self, job_id: int) -> Optional['EmailJob']:
+        """Get a job's own fields, leaving its items empty, for workers that only need the job settings."""
+        pass
+    
+    @abstractmethod
+    def claim_items(self, worker_id: str, limit: int, lease_seconds: int, max_attempts: int) -> List['EmailJobItem']:
+        """Lease up to ``limit`` pending (or lease-expired) items of jobs that are not cancelled.
+        
+        Items that have already been attempted ``max_attempts`` times are failed instead.
+        """
+        pass
+    
+    @abstractmethod
+    def renew_leases(self, worker_id: str, item_ids: List[int], lease_seconds: int) -> int:
+        """Extend the leases a worker holds. Returns the number of leases renewed."""
+        pass
+    
+    @abstractmethod
+    def complete_item(self, item: 'EmailJobItem', worker_id: str) -> bool:
+        """Record an item's outcome if the worker still holds its lease."""
+        pass
+    
+    @abstractmethod
+    def save_campaign_draft(self, job_id: int, draft: 'EmailLog') -> 'EmailLog':
+        """Store a job's campaign draft unless one exists. Returns the stored draft."""
+        pass
+    
+    @abstractmethod
+    def finish_job(self, job_id: int) -> Optional['EmailJob']:
+        """Close a job once no items are left to run, cancelling pending items if requested.
+        
+        Returns the job if it was finished by this call.
+        """
+        pass
+
+
+class IEmailOutboxRepository(IRepository):
+    """Email outbox repository interface.
+    
+    Messages are delivered by dispatchers that claim them with a time-limited
+    lease. Marking a message sent also marks its email log sent in the same
+    write, so the two never disagree.
+    """
+    
+    @abstractmethod
+    def get_by_email_log_id(self, email_log_id: int) -> Optional['EmailOutboxMessage']:
+        """Get the outbox message for an email log."""
+        pass
+    
+    @abstractmethod
+    def enqueue(self, message: 'EmailOutboxMessage') -> 'EmailOutboxMessage':
+        """Queue a message unless one with the same idempotency key exists.
+        
+        A previously failed message is queued again. Returns the stored message.
+        """
+        pass
+    
+    @abstractmethod
+    def enqueue_many(self, messages: List['EmailOutboxMessage']) -> List['EmailOutboxMessage']:
+        """Queue several messages in one write, with the same rules as enqueue."""
+        pass
+    
+    @abstractmethod
+    def claim_batch(self, worker_id: str, limit: int, lease_seconds: int) -> List['EmailOutboxMessage']:
+        """Lease up to ``limit`` due pending (or lease-expired) messages, counting an attempt on each."""
+        pass
+    
+    @abstractmethod
+    def mark_sent(self, message: 'EmailOutboxMessage', worker_id: str) -> bool:
+        """Mark a message and its email log sent if the worker still holds the lease."""
+        pass
+    
+    @abstractmethod
+    def mark_sent_many(self, messages: List['EmailOutboxMessage'], worker_id: str) -> List[int]:
+        """Mark several messages and their email logs sent in one write.
+        
+        Messages whose lease the worker no longer holds are skipped. Returns the
+        outbox IDs that were marked.
+        """
+        pass
+    
+    @abstractmethod
+    def mark_failed(self, message: 'EmailOutboxMessage', worker_id: str, error: str,
+                    retry_at: Optional[datetime]) -> bool:
+        """Record a failed attempt, scheduling a retry at ``retry_at`` or giving up when it is None."""
+        pass
+    
+    @abstractmethod
+    def get_status_counts(self) -> Dict[str, int]:
+        """Get the number of messages in each status."""
+        pass
+
+
+class IComplianceVerdictRepository(ABC):
+    """Compliance verdict cache repository interface.
+    
+    Verdicts are keyed by their cache key rather than an ID. Reading a verdict
+    counts a hit and refreshes its last use, which eviction goes by.
+    """
+    
+    @abstractmethod
+    def get_many(self, cache_keys: List[str]) -> Dict[str, 'ComplianceVerdict']:
+        """Get the stored verdicts among cache_keys, recording a hit on each."""
+        pass
+    
+    @abstractmethod
+    def save_many(self, verdicts: List['ComplianceVerdict']) -> int:
+        """Store verdicts in one write, replacing any with the same cache key. Returns the number stored."""
+        pass
+    
+    @abstractmethod
+    def evict(self, max_entries: int, created_before: Optional[datetime]) -> int:
+        """Delete verdicts created before created_before, then the least recently used beyond max_entries.
+        
+        Returns the number of verdicts deleted.
+        """
+        pass
+    
+    @abstractmethod
+    def count(self) -> int:
+        """Get the number of stored verdicts."""
+        pass
+    
+    @abstractmethod
+    def clear(self) -> int:
+        """Delete every verdict. Returns the number deleted."""
+        pass
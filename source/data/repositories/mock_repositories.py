@@ -2,13 +2,28 @@
 Mock repository implementations for development and testing.
 """
 
+import copy
 import logging
-from datetime import datetime
+import threading
+from dataclasses import replace
+from datetime import datetime, timedelta
+from collections import OrderedDict
 from typing import List, Optional, Dict, Any
-from data.repositories.base import ICustomerRepository, IUserRepository, IEmailLogRepository, IRoleRepository
+from data.repositories.base import (
+    ICustomerRepository,
+    IUserRepository,
+    IEmailLogRepository,
+    IRoleRepository,
+    IEmailJobRepository,
+    IEmailOutboxRepository,
+    IComplianceVerdictRepository
+)
 from data.models.customer import Customer
 from data.models.user import User, Role
 from data.models.email_log import EmailLog
+from data.models.email_job import EmailJob, EmailJobItem
+from data.models.email_outbox import EmailOutboxMessage
+from data.models.compliance_verdict import ComplianceVerdict
 
 
 class MockCustomerRepository(ICustomerRepository):
@@ -234,6 +249,7 @@ class MockEmailLogRepository(IEmailLogRepository):
         self.logger = logging.getLogger(__name__)
         self._email_logs: Dict[int, EmailLog] = {}
         self._next_id = 1
+        self._lock = threading.Lock()
     
     def get_all(self) -> List[EmailLog]:
         """Get all email logs."""
@@ -255,12 +271,37 @@ class MockEmailLogRepository(IEmailLogRepository):
         """Get all sent emails."""
         return [log for log in self._email_logs.values() if log.email_sent]
     
+    def get_by_ids(self, entity_ids: List[int]) -> List[EmailLog]:
+        """Get the email logs with the given IDs."""
+        return [self._email_logs[entity_id] for entity_id in entity_ids if entity_id in self._email_logs]
+    
+    def get_by_template(self, user_id: int, template_text: str, customer_ids: List[int]) -> List[EmailLog]:
+        """Get the email logs user_id generated from template_text for the given customers, newest first."""
+        wanted = set(customer_ids)
+        logs = [log for log in self._email_logs.values()
+                if log.user_id == user_id and log.template_text == template_text and log.customer_id in wanted]
+        return sorted(logs, key=lambda log: log.email_log_id, reverse=True)
+    
+    def mark_sent(self, email_log_ids: List[int], sent_date: datetime) -> int:
+        """Mark email logs sent."""
+        updated = 0
+        with self._lock:
+            for email_log_id in email_log_ids:
+                email_log = self._email_logs.get(email_log_id)
+                if email_log:
+                    email_log.email_sent = True
+                    email_log.sent_date = sent_date
+                    updated += 1
+        return updated
+    
     def create(self, entity: EmailLog) -> EmailLog:
         """Create a new email log."""
-        entity.email_log_id = self._next_id
-        entity.created_date = datetime.now()
-        self._email_logs[self._next_id] = entity
-        self._next_id += 1
+        # Background generation jobs create logs from several threads
+        with self._lock:
+            entity.email_log_id = self._next_id
+            entity.created_date = datetime.now()
+            self._email_logs[self._next_id] = entity
+            self._next_id += 1
         self.logger.info(f"Created email log: {entity}")
         return entity
     
@@ -329,3 +370,371 @@ class MockRoleRepository(IRoleRepository):
             self.logger.info(f"Deleted role with ID: {entity_id}")
             return True
         return False
+
+
+class MockEmailJobRepository(IEmailJobRepository):
+    """Mock implementation of email job repository.
+    
+    Jobs are updated concurrently by worker threads, so copies are stored and
+    returned rather than shared instances.
+    """
+    
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._jobs: Dict[int, EmailJob] = {}
+        self._next_id = 1
+        self._next_item_id = 1
+        self._lock = threading.Lock()
+    
+    def get_all(self) -> List[EmailJob]:
+        """Get all jobs."""
+        with self._lock:
+            return [copy.deepcopy(job) for job in self._jobs.values()]
+    
+    def get_by_id(self, entity_id: int) -> Optional[EmailJob]:
+        """Get job by ID."""
+        with self._lock:
+            job = self._jobs.get(entity_id)
+            return copy.deepcopy(job) if job else None
+    
+    def get_by_user_id(self, user_id: int) -> List[EmailJob]:
+        """Get jobs submitted by a specific user."""
+        with self._lock:
+            return [copy.deepcopy(job) for job in self._jobs.values() if job.user_id == user_id]
+    
+    def get_without_items(self, job_id: int) -> Optional[EmailJob]:
+        """Get a job's own fields, leaving its items empty."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(replace(job, items=[])) if job else None
+    
+    def create(self, entity: EmailJob) -> EmailJob:
+        """Create a new job with its items."""
+        with self._lock:
+            entity.job_id = self._next_id
+            entity.created_date = datetime.now()
+            for item in entity.items:
+                item.item_id = self._next_item_id
+                item.job_id = entity.job_id
+                self._next_item_id += 1
+            self._jobs[self._next_id] = copy.deepcopy(entity)
+            self._next_id += 1
+        self.logger.info(f"Created email job: {entity}")
+        return entity
+    
+    def update(self, entity: EmailJob) -> EmailJob:
+        """Update job fields. Items are updated through the lease methods."""
+        with self._lock:
+            job = self._jobs.get(entity.job_id)
+            if not job:
+                raise ValueError(f"Email job with ID {entity.job_id} not found")
+            
+            job.status = entity.status
+            job.cancel_requested = entity.cancel_requested
+            job.error_message = entity.error_message
+            job.started_date = entity.started_date
+            job.completed_date = entity.completed_date
+        return entity
+    
+    def claim_items(self, worker_id: str, limit: int, lease_seconds: int, max_attempts: int) -> List[EmailJobItem]:
+        """Lease up to limit pending (or lease-expired) items of jobs that are not cancelled."""
+        now = datetime.now()
+        claimed = []
+        with self._lock:
+            for job in self._jobs.values():
+                if job.cancel_requested or job.is_finished:
+                    continue
+                for item in job.items:
+                    if len(claimed) >= limit:
+                        break
+                    expired = item.status == 'running' and item.lease_expires and item.lease_expires < now
+                    if item.status != 'pending' and not expired:
+                        continue
+                    if item.attempts >= max_attempts:
+                        item.status = 'failed'
+                        item.error_message = f"Gave up after {item.attempts} attempts"
+                        item.lease_owner = None
+                        continue
+                    
+                    item.status = 'running'
+                    item.lease_owner = worker_id
+                    item.lease_expires = now + timedelta(seconds=lease_seconds)
+                    item.attempts += 1
+                    if job.status == 'queued':
+                        job.status = 'running'
+                        job.started_date = now
+                    claimed.append(copy.deepcopy(item))
+        return claimed
+    
+    def renew_leases(self, worker_id: str, item_ids: List[int], lease_seconds: int) -> int:
+        """Extend the leases a worker holds."""
+        expires = datetime.now() + timedelta(seconds=lease_seconds)
+        renewed = 0
+        with self._lock:
+            for job in self._jobs.values():
+                for item in job.items:
+                    if item.item_id in item_ids and item.lease_owner == worker_id and item.status == 'running':
+                        item.lease_expires = expires
+                        renewed += 1
+        return renewed
+    
+    def complete_item(self, item: EmailJobItem, worker_id: str) -> bool:
+        """Record an item's outcome if the worker still holds its lease."""
+        with self._lock:
+            job = self._jobs.get(item.job_id)
+            if not job:
+                return False
+            for stored in job.items:
+                if stored.item_id == item.item_id:
+                    if stored.lease_owner != worker_id or stored.status != 'running':
+                        return False
+                    stored.status = item.status
+                    stored.email_log_id = item.email_log_id
+                    stored.error_message = item.error_message
+                    stored.lease_owner = None
+                    stored.lease_expires = None
+                    return True
+        return False
+    
+    def save_campaign_draft(self, job_id: int, draft: EmailLog) -> EmailLog:
+        """Store a job's campaign draft unless one exists."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                raise ValueError(f"Email job with ID {job_id} not found")
+            if job.campaign_draft is None:
+                job.campaign_draft = copy.deepcopy(draft)
+            return copy.deepcopy(job.campaign_draft)
+    
+    def finish_job(self, job_id: int) -> Optional[EmailJob]:
+        """Close a job once no items are left to run."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job.is_finished:
+                return None
+            
+            if job.cancel_requested:
+                now = datetime.now()
+                for item in job.items:
+                    if item.status == 'pending' or (item.status == 'running' and item.lease_expires < now):
+                        item.status = 'cancelled'
+                        item.lease_owner = None
+            
+            if not all(item.is_finished for item in job.items):
+                return None
+            
+            job.status = 'cancelled' if job.cancel_requested else 'completed'
+            job.completed_date = datetime.now()
+            return copy.deepcopy(job)
+    
+    def delete(self, entity_id: int) -> bool:
+        """Delete a job."""
+        with self._lock:
+            if entity_id in self._jobs:
+                del self._jobs[entity_id]
+                self.logger.info(f"Deleted email job with ID: {entity_id}")
+                return True
+        return False
+
+
+class MockEmailOutboxRepository(IEmailOutboxRepository):
+    """Mock implementation of email outbox repository.
+    
+    Messages are copied in and out because dispatcher threads update them
+    concurrently. Sent status is written to the shared email log repository
+    while holding the outbox lock.
+    """
+    
+    def __init__(self, email_log_repository: IEmailLogRepository):
+        self.logger = logging.getLogger(__name__)
+        self.email_log_repository = email_log_repository
+        self._messages: Dict[int, EmailOutboxMessage] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+    
+    def get_all(self) -> List[EmailOutboxMessage]:
+        """Get all outbox messages."""
+        with self._lock:
+            return [copy.deepcopy(message) for message in self._messages.values()]
+    
+    def get_by_id(self, entity_id: int) -> Optional[EmailOutboxMessage]:
+        """Get outbox message by ID."""
+        with self._lock:
+            message = self._messages.get(entity_id)
+            return copy.deepcopy(message) if message else None
+    
+    def get_by_email_log_id(self, email_log_id: int) -> Optional[EmailOutboxMessage]:
+        """Get the outbox message for an email log."""
+        with self._lock:
+            for message in self._messages.values():
+                if message.email_log_id == email_log_id:
+                    return copy.deepcopy(message)
+        return None
+    
+    def create(self, entity: EmailOutboxMessage) -> EmailOutboxMessage:
+        """Create a new outbox message."""
+        return self.enqueue(entity)
+    
+    def enqueue(self, message: EmailOutboxMessage) -> EmailOutboxMessage:
+        """Queue a message unless one with the same idempotency key exists."""
+        with self._lock:
+            for existing in self._messages.values():
+                if existing.idempotency_key == message.idempotency_key:
+                    if existing.status == 'failed':
+                        existing.status = 'pending'
+                        existing.attempts = 0
+                        existing.next_attempt_date = None
+                    return copy.deepcopy(existing)
+            
+            message.outbox_id = self._next_id
+            message.created_date = datetime.now()
+            self._messages[self._next_id] = copy.deepcopy(message)
+            self._next_id += 1
+        self.logger.info(f"Queued {message}")
+        return message
+    
+    def enqueue_many(self, messages: List[EmailOutboxMessage]) -> List[EmailOutboxMessage]:
+        """Queue several messages."""
+        return [self.enqueue(message) for message in messages]
+    
+    def update(self, entity: EmailOutboxMessage) -> EmailOutboxMessage:
+        """Update an existing outbox message."""
+        with self._lock:
+            if entity.outbox_id not in self._messages:
+                raise ValueError(f"Outbox message with ID {entity.outbox_id} not found")
+            self._messages[entity.outbox_id] = copy.deepcopy(entity)
+        return entity
+    
+    def claim_batch(self, worker_id: str, limit: int, lease_seconds: int) -> List[EmailOutboxMessage]:
+        """Lease up to limit due pending (or lease-expired) messages."""
+        now = datetime.now()
+        claimed = []
+        with self._lock:
+            for message in sorted(self._messages.values(), key=lambda message: message.outbox_id):
+                if len(claimed) >= limit:
+                    break
+                due = message.status == 'pending' and (not message.next_attempt_date or message.next_attempt_date <= now)
+                expired = message.status == 'sending' and message.lease_expires < now
+                if not due and not expired:
+                    continue
+                message.status = 'sending'
+                message.lease_owner = worker_id
+                message.lease_expires = now + timedelta(seconds=lease_seconds)
+                message.attempts += 1
+                claimed.append(copy.deepcopy(message))
+        return claimed
+    
+    def mark_sent(self, message: EmailOutboxMessage, worker_id: str) -> bool:
+        """Mark a message and its email log sent if the worker still holds the lease."""
+        return bool(self.mark_sent_many([message], worker_id))
+    
+    def mark_sent_many(self, messages: List[EmailOutboxMessage], worker_id: str) -> List[int]:
+        """Mark messages and their email logs sent if the worker still holds their leases."""
+        sent_date = datetime.now()
+        marked = []
+        with self._lock:
+            for message in messages:
+                stored = self._messages.get(message.outbox_id)
+                if not stored or stored.status != 'sending' or stored.lease_owner != worker_id:
+                    continue
+                stored.status = 'sent'
+                stored.sent_date = sent_date
+                stored.lease_owner = None
+                stored.last_error = ""
+                marked.append(stored)
+            self.email_log_repository.mark_sent([stored.email_log_id for stored in marked], sent_date)
+        return [stored.outbox_id for stored in marked]
+    
+    def mark_failed(self, message: EmailOutboxMessage, worker_id: str, error: str,
+                    retry_at: Optional[datetime]) -> bool:
+        """Record a failed attempt and schedule a retry or give up."""
+        with self._lock:
+            stored = self._messages.get(message.outbox_id)
+            if not stored or stored.status != 'sending' or stored.lease_owner != worker_id:
+                return False
+            
+            stored.status = 'pending' if retry_at else 'failed'
+            stored.next_attempt_date = retry_at
+            stored.lease_owner = None
+            stored.last_error = error
+        return True
+    
+    def get_status_counts(self) -> Dict[str, int]:
+        """Get the number of messages in each status."""
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for message in self._messages.values():
+                counts[message.status] = counts.get(message.status, 0) + 1
+        return counts
+    
+    def delete(self, entity_id: int) -> bool:
+        """Delete an outbox message."""
+        with self._lock:
+            if entity_id in self._messages:
+                del self._messages[entity_id]
+                return True
+        return False
+
+
+class MockComplianceVerdictRepository(IComplianceVerdictRepository):
+    """In-memory implementation of compliance verdict repository.
+    
+    Verdicts are kept in least recently used order, so eviction drops from the front.
+    """
+    
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._verdicts: "OrderedDict[str, ComplianceVerdict]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get_many(self, cache_keys: List[str]) -> Dict[str, ComplianceVerdict]:
+        """Get the stored verdicts among cache_keys, recording a hit on each."""
+        now = datetime.now()
+        found = {}
+        with self._lock:
+            for cache_key in cache_keys:
+                verdict = self._verdicts.get(cache_key)
+                if verdict is None or cache_key in found:
+                    continue
+                verdict.hits += 1
+                verdict.last_used_date = now
+                self._verdicts.move_to_end(cache_key)
+                found[cache_key] = copy.copy(verdict)
+        return found
+    
+    def save_many(self, verdicts: List[ComplianceVerdict]) -> int:
+        """Store verdicts, replacing any with the same cache key."""
+        now = datetime.now()
+        with self._lock:
+            for verdict in verdicts:
+                stored = copy.copy(verdict)
+                stored.created_date = stored.created_date or now
+                stored.last_used_date = stored.last_used_date or now
+                self._verdicts[stored.cache_key] = stored
+                self._verdicts.move_to_end(stored.cache_key)
+        return len(verdicts)
+    
+    def evict(self, max_entries: int, created_before: Optional[datetime]) -> int:
+        """Delete expired verdicts, then the least recently used beyond max_entries."""
+        with self._lock:
+            expired = [key for key, verdict in self._verdicts.items()
+                       if created_before is not None and verdict.created_date < created_before]
+            for key in expired:
+                del self._verdicts[key]
+            evicted = len(expired)
+            while len(self._verdicts) > max(max_entries, 0):
+                self._verdicts.popitem(last=False)
+                evicted += 1
+        return evicted
+    
+    def count(self) -> int:
+        """Get the number of stored verdicts."""
+        with self._lock:
+            return len(self._verdicts)
+    
+    def clear(self) -> int:
+        """Delete every verdict."""
+        with self._lock:
+            cleared = len(self._verdicts)
+            self._verdicts.clear()
+        return cleared
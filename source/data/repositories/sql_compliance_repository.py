@@ -0,0 +1,141 @@
+"""
+SQL Server implementation of the compliance verdict cache.
+
+Verdicts are shared by every web process and worker using the database, so
+identical content is reviewed once across hosts and restarts.
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+from config.database import DatabaseConfig
+from data.models.compliance_verdict import ComplianceVerdict
+from data.repositories.base import IComplianceVerdictRepository
+
+
+VERDICT_COLUMNS = "cache_key, review, policy_version, model, result, hits, created_date, last_used_date"
+
+
+class SqlComplianceVerdictRepository(IComplianceVerdictRepository):
+    """SQL Server implementation of compliance verdict repository."""
+
+    # Cache keys looked up per statement, within SQL Server's 2100 parameter limit
+    LOOKUP_CHUNK = 1000
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.db_config = DatabaseConfig()
+
+    def _get_connection(self):
+        """Get database connection."""
+        return self.db_config.get_connection()
+
+    def _row_to_verdict(self, row) -> ComplianceVerdict:
+        """Convert a database row to a verdict."""
+        return ComplianceVerdict(
+            cache_key=row.cache_key,
+            review=row.review,
+            policy_version=row.policy_version,
+            model=row.model,
+            result=row.result,
+            hits=row.hits,
+            created_date=row.created_date,
+            last_used_date=row.last_used_date
+        )
+
+    def get_many(self, cache_keys: List[str]) -> Dict[str, ComplianceVerdict]:
+        """Get the stored verdicts among cache_keys, recording a hit on each."""
+        keys = list(dict.fromkeys(cache_keys))
+        found: Dict[str, ComplianceVerdict] = {}
+        now = datetime.now()
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                for start in range(0, len(keys), self.LOOKUP_CHUNK):
+                    chunk = keys[start:start + self.LOOKUP_CHUNK]
+                    cursor.execute(f"""
+                        UPDATE compliance_verdicts SET hits = hits + 1, last_used_date = ?
+                        OUTPUT {', '.join(f'INSERTED.{column.strip()}' for column in VERDICT_COLUMNS.split(','))}
+                        WHERE cache_key IN ({','.join('?' for _ in chunk)})
+                    """, (now, *chunk))
+                    for row in cursor.fetchall():
+                        verdict = self._row_to_verdict(row)
+                        found[verdict.cache_key] = verdict
+                conn.commit()
+            return found
+        except Exception as e:
+            self.logger.error(f"Error getting compliance verdicts: {e}")
+            raise
+
+    def save_many(self, verdicts: List[ComplianceVerdict]) -> int:
+        """Store verdicts in one transaction, replacing any with the same cache key."""
+        if not verdicts:
+            return 0
+        latest = {verdict.cache_key: verdict for verdict in verdicts}
+        keys = list(latest)
+        now = datetime.now()
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                for start in range(0, len(keys), self.LOOKUP_CHUNK):
+                    chunk = keys[start:start + self.LOOKUP_CHUNK]
+                    cursor.execute(f"DELETE FROM compliance_verdicts WHERE cache_key IN ({','.join('?' for _ in chunk)})",
+                                   chunk)
+                cursor.executemany(f"""
+                    INSERT INTO compliance_verdicts ({VERDICT_COLUMNS})
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [(verdict.cache_key, verdict.review, verdict.policy_version, verdict.model, verdict.result,
+                       verdict.hits, verdict.created_date or now, verdict.last_used_date or now)
+                      for verdict in latest.values()])
+                conn.commit()
+            return len(verdicts)
+        except Exception as e:
+            self.logger.error(f"Error saving compliance verdicts: {e}")
+            raise
+
+    def evict(self, max_entries: int, created_before: Optional[datetime]) -> int:
+        """Delete expired verdicts, then the least recently used beyond max_entries."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                evicted = 0
+                if created_before is not None:
+                    cursor.execute("DELETE FROM compliance_verdicts WHERE created_date < ?", created_before)
+                    evicted += cursor.rowcount
+                cursor.execute("""
+                    WITH ranked AS (
+                        SELECT cache_key, ROW_NUMBER() OVER (ORDER BY last_used_date DESC) AS recency
+                        FROM compliance_verdicts
+                    )
+                    DELETE FROM ranked WHERE recency > ?
+                """, max(max_entries, 0))
+                evicted += cursor.rowcount
+                conn.commit()
+                return evicted
+        except Exception as e:
+            self.logger.error(f"Error evicting compliance verdicts: {e}")
+            raise
+
+    def count(self) -> int:
+        """Get the number of stored verdicts."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COUNT(*) FROM compliance_verdicts")
+                return cursor.fetchone()[0]
+        except Exception as e:
+            self.logger.error(f"Error counting compliance verdicts: {e}")
+            raise
+
+    def clear(self) -> int:
+        """Delete every verdict."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM compliance_verdicts")
+                cleared = cursor.rowcount
+                conn.commit()
+                return cleared
+        except Exception as e:
+            self.logger.error(f"Error clearing compliance verdicts: {e}")
+            raise
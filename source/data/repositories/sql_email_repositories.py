@@ -0,0 +1,489 @@
+"""
+SQL Server implementations of the email log and email outbox repositories.
+
+Lookups and updates of many email logs are set-based: one statement per
+chunk of IDs instead of one round trip per email. The outbox lives in the
+same database so that a message and its email log are marked sent in one
+transaction.
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+from config.database import DatabaseConfig
+from data.models.email_log import EmailLog
+from data.models.email_outbox import EmailOutboxMessage
+from data.repositories.base import IEmailLogRepository, IEmailOutboxRepository
+
+
+EMAIL_LOG_COLUMNS = """email_log_id, customer_id, user_id, template_text, generated_email, recipient_email,
+                       subject, hipaa_compliance_check, ai_compliance_check, compliance_approved, email_sent,
+                       sent_date, created_date, openai_usage, generation_path"""
+
+OUTBOX_COLUMNS = """outbox_id, email_log_id, idempotency_key, message_id, recipient_email, subject, body, status,
+                    attempts, next_attempt_date, lease_owner, lease_expires, last_error, created_date, sent_date"""
+
+# SQL Server accepts at most 2100 parameters per statement
+MAX_IDS_PER_STATEMENT = 1000
+
+
+def _chunks(values: List[int]) -> List[List[int]]:
+    """Split IDs into lists small enough for one IN (...) clause."""
+    return [values[start:start + MAX_IDS_PER_STATEMENT] for start in range(0, len(values), MAX_IDS_PER_STATEMENT)]
+
+
+def _placeholders(values: List[int]) -> str:
+    """Get the parameter markers for an IN (...) clause."""
+    return ','.join('?' for _ in values)
+
+
+class SqlEmailLogRepository(IEmailLogRepository):
+    """SQL Server implementation of email log repository."""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.db_config = DatabaseConfig()
+
+    def _get_connection(self):
+        """Get database connection."""
+        return self.db_config.get_connection()
+
+    def _row_to_email_log(self, row) -> EmailLog:
+        """Convert a database row to an email log."""
+        return EmailLog(
+            email_log_id=row.email_log_id,
+            customer_id=row.customer_id,
+            user_id=row.user_id,
+            template_text=row.template_text,
+            generated_email=row.generated_email,
+            recipient_email=row.recipient_email,
+            subject=row.subject,
+            hipaa_compliance_check=row.hipaa_compliance_check,
+            ai_compliance_check=row.ai_compliance_check,
+            compliance_approved=bool(row.compliance_approved),
+            email_sent=bool(row.email_sent),
+            sent_date=row.sent_date,
+            created_date=row.created_date,
+            openai_usage=json.loads(row.openai_usage or '{}'),
+            generation_path=row.generation_path
+        )
+
+    def _query(self, where: str = "", params: tuple = ()) -> List[EmailLog]:
+        """Get email logs matching a WHERE clause."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"SELECT {EMAIL_LOG_COLUMNS} FROM email_logs {where} ORDER BY email_log_id DESC",
+                               params)
+                return [self._row_to_email_log(row) for row in cursor.fetchall()]
+        except Exception as e:
+            self.logger.error(f"Error getting email logs: {e}")
+            raise
+
+    def get_all(self) -> List[EmailLog]:
+        """Get all email logs."""
+        return self._query()
+
+    def get_by_id(self, entity_id: int) -> Optional[EmailLog]:
+        """Get email log by ID."""
+        logs = self._query("WHERE email_log_id = ?", (entity_id,))
+        return logs[0] if logs else None
+
+    def get_by_customer_id(self, customer_id: int) -> List[EmailLog]:
+        """Get email logs for a specific customer."""
+        return self._query("WHERE customer_id = ?", (customer_id,))
+
+    def get_by_user_id(self, user_id: int) -> List[EmailLog]:
+        """Get email logs created by a specific user."""
+        return self._query("WHERE user_id = ?", (user_id,))
+
+    def get_sent_emails(self) -> List[EmailLog]:
+        """Get all sent emails."""
+        return self._query("WHERE email_sent = 1")
+
+    def get_by_ids(self, entity_ids: List[int]) -> List[EmailLog]:
+        """Get the email logs with the given IDs, one query per chunk of IDs."""
+        if not entity_ids:
+            return []
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                logs = []
+                for chunk in _chunks(list(entity_ids)):
+                    cursor.execute(f"""
+                        SELECT {EMAIL_LOG_COLUMNS} FROM email_logs
+                        WHERE email_log_id IN ({_placeholders(chunk)})
+                    """, chunk)
+                    logs.extend(self._row_to_email_log(row) for row in cursor.fetchall())
+            logs.sort(key=lambda log: log.email_log_id, reverse=True)
+            return logs
+        except Exception as e:
+            self.logger.error(f"Error getting email logs by ID: {e}")
+            raise
+
+    def get_by_template(self, user_id: int, template_text: str, customer_ids: List[int]) -> List[EmailLog]:
+        """Get the email logs user_id generated from template_text for the given customers, one query per chunk."""
+        if not customer_ids:
+            return []
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                logs = []
+                for chunk in _chunks(list(dict.fromkeys(customer_ids))):
+                    cursor.execute(f"""
+                        SELECT {EMAIL_LOG_COLUMNS} FROM email_logs
+                        WHERE user_id = ? AND customer_id IN ({_placeholders(chunk)}) AND template_text = ?
+                    """, (user_id, *chunk, template_text))
+                    logs.extend(self._row_to_email_log(row) for row in cursor.fetchall())
+            logs.sort(key=lambda log: log.email_log_id, reverse=True)
+            return logs
+        except Exception as e:
+            self.logger.error(f"Error getting email logs by template: {e}")
+            raise
+
+    def mark_sent(self, email_log_ids: List[int], sent_date: datetime) -> int:
+        """Mark email logs sent with one UPDATE per chunk of IDs, in one transaction."""
+        if not email_log_ids:
+            return 0
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                updated = 0
+                for chunk in _chunks(list(email_log_ids)):
+                    cursor.execute(
+                        f"UPDATE email_logs SET email_sent = 1, sent_date = ? WHERE email_log_id IN ({_placeholders(chunk)})",
+                        (sent_date, *chunk)
+                    )
+                    updated += cursor.rowcount
+                conn.commit()
+                return updated
+        except Exception as e:
+            self.logger.error(f"Error marking email logs sent: {e}")
+            raise
+
+    def create(self, entity: EmailLog) -> EmailLog:
+        """Create a new email log."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO email_logs (
+                        customer_id, user_id, template_text, generated_email, recipient_email,
+                        subject, hipaa_compliance_check, ai_compliance_check, compliance_approved,
+                        email_sent, sent_date, openai_usage, generation_path
+                    )
+                    OUTPUT INSERTED.email_log_id, INSERTED.created_date
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    entity.customer_id,
+                    entity.user_id,
+                    entity.template_text,
+                    entity.generated_email,
+                    entity.recipient_email,
+                    entity.subject,
+                    entity.hipaa_compliance_check,
+                    entity.ai_compliance_check,
+                    int(entity.compliance_approved),
+                    int(entity.email_sent),
+                    entity.sent_date,
+                    json.dumps(entity.openai_usage),
+                    entity.generation_path
+                ))
+                row = cursor.fetchone()
+                entity.email_log_id = row.email_log_id
+                entity.created_date = row.created_date
+                conn.commit()
+            self.logger.info(f"Created email log: {entity}")
+            return entity
+        except Exception as e:
+            self.logger.error(f"Error creating email log: {e}")
+            raise
+
+    def update(self, entity: EmailLog) -> EmailLog:
+        """Update an existing email log."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    UPDATE email_logs SET
+                        generated_email = ?, subject = ?, hipaa_compliance_check = ?,
+                        ai_compliance_check = ?, compliance_approved = ?, email_sent = ?, sent_date = ?,
+                        openai_usage = ?, generation_path = ?
+                    WHERE email_log_id = ?
+                """, (
+                    entity.generated_email,
+                    entity.subject,
+                    entity.hipaa_compliance_check,
+                    entity.ai_compliance_check,
+                    int(entity.compliance_approved),
+                    int(entity.email_sent),
+                    entity.sent_date,
+                    json.dumps(entity.openai_usage),
+                    entity.generation_path,
+                    entity.email_log_id
+                ))
+                if cursor.rowcount == 0:
+                    raise ValueError(f"Email log with ID {entity.email_log_id} not found")
+                conn.commit()
+            self.logger.info(f"Updated email log: {entity}")
+            return entity
+        except Exception as e:
+            self.logger.error(f"Error updating email log: {e}")
+            raise
+
+    def delete(self, entity_id: int) -> bool:
+        """Delete an email log."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM email_logs WHERE email_log_id = ?", entity_id)
+                deleted = cursor.rowcount > 0
+                conn.commit()
+                return deleted
+        except Exception as e:
+            self.logger.error(f"Error deleting email log: {e}")
+            raise
+
+
+class SqlEmailOutboxRepository(IEmailOutboxRepository):
+    """SQL Server implementation of email outbox repository.
+
+    Dispatchers on any number of hosts claim messages with UPDLOCK/READPAST,
+    and leases use the database clock, as in SqlEmailJobRepository. Every
+    outbox timestamp (creation, retry, lease and sent) is database UTC so
+    retries and leases are compared on the same clock.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.db_config = DatabaseConfig()
+
+    def _get_connection(self):
+        """Get database connection."""
+        return self.db_config.get_connection()
+
+    def _row_to_message(self, row) -> EmailOutboxMessage:
+        """Convert a database row to an outbox message."""
+        return EmailOutboxMessage(
+            outbox_id=row.outbox_id,
+            email_log_id=row.email_log_id,
+            idempotency_key=row.idempotency_key,
+            message_id=row.message_id,
+            recipient_email=row.recipient_email,
+            subject=row.subject,
+            body=row.body,
+            status=row.status,
+            attempts=row.attempts,
+            next_attempt_date=row.next_attempt_date,
+            lease_owner=row.lease_owner,
+            lease_expires=row.lease_expires,
+            last_error=row.last_error or "",
+            created_date=row.created_date,
+            sent_date=row.sent_date
+        )
+
+    def _query(self, where: str = "", params: tuple = ()) -> List[EmailOutboxMessage]:
+        """Get outbox messages matching a WHERE clause."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"SELECT {OUTBOX_COLUMNS} FROM email_outbox {where} ORDER BY outbox_id", params)
+                return [self._row_to_message(row) for row in cursor.fetchall()]
+        except Exception as e:
+            self.logger.error(f"Error getting outbox messages: {e}")
+            raise
+
+    def get_all(self) -> List[EmailOutboxMessage]:
+        """Get all outbox messages."""
+        return self._query()
+
+    def get_by_id(self, entity_id: int) -> Optional[EmailOutboxMessage]:
+        """Get outbox message by ID."""
+        messages = self._query("WHERE outbox_id = ?", (entity_id,))
+        return messages[0] if messages else None
+
+    def get_by_email_log_id(self, email_log_id: int) -> Optional[EmailOutboxMessage]:
+        """Get the outbox message for an email log."""
+        messages = self._query("WHERE email_log_id = ?", (email_log_id,))
+        return messages[0] if messages else None
+
+    def create(self, entity: EmailOutboxMessage) -> EmailOutboxMessage:
+        """Create a new outbox message."""
+        return self.enqueue(entity)
+
+    def _insert_or_requeue(self, cursor, message: EmailOutboxMessage):
+        """Insert a message unless its idempotency key exists, requeueing a failed one."""
+        cursor.execute("""
+            UPDATE email_outbox WITH (UPDLOCK, HOLDLOCK)
+            SET status = 'pending', attempts = 0, next_attempt_date = NULL
+            WHERE idempotency_key = ? AND status = 'failed'
+        """, message.idempotency_key)
+        cursor.execute("""
+            INSERT INTO email_outbox (email_log_id, idempotency_key, message_id, recipient_email, subject, body,
+                                      created_date)
+            SELECT ?, ?, ?, ?, ?, ?, SYSUTCDATETIME()
+            WHERE NOT EXISTS (SELECT 1 FROM email_outbox WITH (UPDLOCK, HOLDLOCK) WHERE idempotency_key = ?)
+        """, (message.email_log_id, message.idempotency_key, message.message_id, message.recipient_email,
+              message.subject, message.body, message.idempotency_key))
+
+    def enqueue(self, message: EmailOutboxMessage) -> EmailOutboxMessage:
+        """Queue a message unless one with the same idempotency key exists."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                self._insert_or_requeue(cursor, message)
+                cursor.execute(f"SELECT {OUTBOX_COLUMNS} FROM email_outbox WHERE idempotency_key = ?",
+                               message.idempotency_key)
+                stored = self._row_to_message(cursor.fetchone())
+                conn.commit()
+            self.logger.info(f"Queued {stored}")
+            return stored
+        except Exception as e:
+            self.logger.error(f"Error queueing outbox message: {e}")
+            raise
+
+    def enqueue_many(self, messages: List[EmailOutboxMessage]) -> List[EmailOutboxMessage]:
+        """Queue several messages in one transaction."""
+        if not messages:
+            return []
+        keys = [message.idempotency_key for message in messages]
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                for message in messages:
+                    self._insert_or_requeue(cursor, message)
+                stored = {}
+                for start in range(0, len(keys), MAX_IDS_PER_STATEMENT):
+                    chunk = keys[start:start + MAX_IDS_PER_STATEMENT]
+                    cursor.execute(f"""
+                        SELECT {OUTBOX_COLUMNS} FROM email_outbox WHERE idempotency_key IN ({_placeholders(chunk)})
+                    """, chunk)
+                    stored.update((row.idempotency_key, self._row_to_message(row)) for row in cursor.fetchall())
+                conn.commit()
+            self.logger.info(f"Queued {len(stored)} outbox messages")
+            return [stored[key] for key in keys]
+        except Exception as e:
+            self.logger.error(f"Error queueing outbox messages: {e}")
+            raise
+
+    def update(self, entity: EmailOutboxMessage) -> EmailOutboxMessage:
+        """Update an existing outbox message."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    UPDATE email_outbox SET status = ?, attempts = ?, next_attempt_date = ?,
+                        lease_owner = ?, lease_expires = ?, last_error = ?, sent_date = ?
+                    WHERE outbox_id = ?
+                """, (entity.status, entity.attempts, entity.next_attempt_date, entity.lease_owner,
+                      entity.lease_expires, entity.last_error, entity.sent_date, entity.outbox_id))
+                if cursor.rowcount == 0:
+                    raise ValueError(f"Outbox message with ID {entity.outbox_id} not found")
+                conn.commit()
+            return entity
+        except Exception as e:
+            self.logger.error(f"Error updating outbox message: {e}")
+            raise
+
+    def claim_batch(self, worker_id: str, limit: int, lease_seconds: int) -> List[EmailOutboxMessage]:
+        """Lease up to limit due pending (or lease-expired) messages."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    WITH due AS (
+                        SELECT TOP (?) *
+                        FROM email_outbox WITH (UPDLOCK, READPAST, ROWLOCK)
+                        WHERE (status = 'pending' AND (next_attempt_date IS NULL OR next_attempt_date <= SYSUTCDATETIME()))
+                           OR (status = 'sending' AND lease_expires < SYSUTCDATETIME())
+                        ORDER BY outbox_id
+                    )
+                    UPDATE due
+                    SET status = 'sending', lease_owner = ?,
+                        lease_expires = DATEADD(second, ?, SYSUTCDATETIME()), attempts = attempts + 1
+                    OUTPUT {', '.join(f'INSERTED.{column.strip()}' for column in OUTBOX_COLUMNS.split(','))}
+                """, (limit, worker_id, lease_seconds))
+                messages = [self._row_to_message(row) for row in cursor.fetchall()]
+                conn.commit()
+                return sorted(messages, key=lambda message: message.outbox_id)
+        except Exception as e:
+            self.logger.error(f"Error claiming outbox messages: {e}")
+            raise
+
+    def mark_sent(self, message: EmailOutboxMessage, worker_id: str) -> bool:
+        """Mark a message and its email log sent in one transaction."""
+        return bool(self.mark_sent_many([message], worker_id))
+
+    def mark_sent_many(self, messages: List[EmailOutboxMessage], worker_id: str) -> List[int]:
+        """Mark messages and their email logs sent in one transaction."""
+        if not messages:
+            return []
+        outbox_ids = [message.outbox_id for message in messages]
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                marked = []
+                for chunk in _chunks(outbox_ids):
+                    cursor.execute(f"""
+                        UPDATE email_outbox
+                        SET status = 'sent', sent_date = SYSUTCDATETIME(), lease_owner = NULL, last_error = ''
+                        OUTPUT INSERTED.outbox_id, INSERTED.email_log_id
+                        WHERE outbox_id IN ({_placeholders(chunk)}) AND status = 'sending' AND lease_owner = ?
+                    """, (*chunk, worker_id))
+                    marked.extend(cursor.fetchall())
+                email_log_ids = [row.email_log_id for row in marked]
+                for chunk in _chunks(email_log_ids):
+                    cursor.execute(f"""
+                        UPDATE email_logs SET email_sent = 1, sent_date = GETDATE()
+                        WHERE email_log_id IN ({_placeholders(chunk)})
+                    """, chunk)
+                conn.commit()
+                return sorted(row.outbox_id for row in marked)
+        except Exception as e:
+            self.logger.error(f"Error marking outbox messages sent: {e}")
+            raise
+
+    def mark_failed(self, message: EmailOutboxMessage, worker_id: str, error: str,
+                    retry_at: Optional[datetime]) -> bool:
+        """Record a failed attempt and schedule a retry or give up."""
+        # Only the delay is taken from retry_at; DATEADD of a NULL delay leaves no retry scheduled
+        delay_ms = max(int((retry_at - datetime.now()).total_seconds() * 1000), 0) if retry_at else None
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    UPDATE email_outbox SET status = ?, lease_owner = NULL, last_error = ?,
+                        next_attempt_date = DATEADD(millisecond, ?, SYSUTCDATETIME())
+                    WHERE outbox_id = ? AND status = 'sending' AND lease_owner = ?
+                """, ('pending' if retry_at else 'failed', error, delay_ms, message.outbox_id, worker_id))
+                updated = cursor.rowcount > 0
+                conn.commit()
+                return updated
+        except Exception as e:
+            self.logger.error(f"Error marking outbox message {message.outbox_id} failed: {e}")
+            raise
+
+    def get_status_counts(self) -> Dict[str, int]:
+        """Get the number of messages in each status."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT status, COUNT(*) AS count FROM email_outbox GROUP BY status")
+                return {row.status: row.count for row in cursor.fetchall()}
+        except Exception as e:
+            self.logger.error(f"Error counting outbox messages: {e}")
+            raise
+
+    def delete(self, entity_id: int) -> bool:
+        """Delete an outbox message."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM email_outbox WHERE outbox_id = ?", entity_id)
+                deleted = cursor.rowcount > 0
+                conn.commit()
+                return deleted
+        except Exception as e:
+            self.logger.error(f"Error deleting outbox message: {e}")
+            raise
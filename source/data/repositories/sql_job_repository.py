@@ -0,0 +1,319 @@
+"""
+SQL Server implementation of the durable email job queue.
+
+Workers on any number of hosts claim items with UPDLOCK/READPAST so that
+concurrent claims skip rows another worker is taking instead of blocking.
+Lease times use the database clock to avoid skew between hosts.
+"""
+
+import json
+import logging
+from typing import List, Optional
+from config.database import DatabaseConfig
+from data.models.customer import Customer
+from data.models.email_log import EmailLog
+from data.models.email_job import EmailJob, EmailJobItem
+from data.repositories.base import IEmailJobRepository
+
+
+ITEM_COLUMNS = """item_id, job_id, customer_id, customer_data, position, status, email_log_id,
+                  error_message, lease_owner, lease_expires, attempts"""
+
+
+class SqlEmailJobRepository(IEmailJobRepository):
+    """SQL Server implementation of email job repository."""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.db_config = DatabaseConfig()
+
+    def _get_connection(self):
+        """Get database connection."""
+        return self.db_config.get_connection()
+
+    def _row_to_item(self, row) -> EmailJobItem:
+        """Convert a database row to a job item."""
+        return EmailJobItem(
+            item_id=row.item_id,
+            job_id=row.job_id,
+            customer_id=row.customer_id,
+            customer=Customer.from_dict(json.loads(row.customer_data)) if row.customer_data else None,
+            position=row.position,
+            status=row.status,
+            email_log_id=row.email_log_id,
+            error_message=row.error_message or "",
+            lease_owner=row.lease_owner,
+            lease_expires=row.lease_expires,
+            attempts=row.attempts
+        )
+
+    def _load_jobs(self, cursor, where: str = "", params: tuple = (), with_items: bool = True) -> List[EmailJob]:
+        """Load jobs matching a WHERE clause, together with their items unless with_items is False."""
+        cursor.execute(f"""
+            SELECT job_id, user_id, template_text, campaign_mode, status, cancel_requested,
+                   error_message, campaign_draft, created_date, started_date, completed_date
+            FROM email_jobs {where}
+            ORDER BY job_id
+        """, params)
+        jobs = []
+        for row in cursor.fetchall():
+            jobs.append(EmailJob(
+                job_id=row.job_id,
+                user_id=row.user_id,
+                template_text=row.template_text,
+                campaign_mode=bool(row.campaign_mode),
+                status=row.status,
+                cancel_requested=bool(row.cancel_requested),
+                error_message=row.error_message or "",
+                campaign_draft=EmailLog.from_dict(json.loads(row.campaign_draft)) if row.campaign_draft else None,
+                created_date=row.created_date,
+                started_date=row.started_date,
+                completed_date=row.completed_date
+            ))
+
+        if with_items:
+            for job in jobs:
+                cursor.execute(f"SELECT {ITEM_COLUMNS} FROM email_job_items WHERE job_id = ? ORDER BY item_id",
+                               job.job_id)
+                job.items = [self._row_to_item(row) for row in cursor.fetchall()]
+        return jobs
+
+    def get_all(self) -> List[EmailJob]:
+        """Get all jobs."""
+        try:
+            with self._get_connection() as conn:
+                return self._load_jobs(conn.cursor())
+        except Exception as e:
+            self.logger.error(f"Error getting email jobs: {e}")
+            raise
+
+    def get_by_id(self, entity_id: int) -> Optional[EmailJob]:
+        """Get job by ID."""
+        try:
+            with self._get_connection() as conn:
+                jobs = self._load_jobs(conn.cursor(), "WHERE job_id = ?", (entity_id,))
+                return jobs[0] if jobs else None
+        except Exception as e:
+            self.logger.error(f"Error getting email job {entity_id}: {e}")
+            raise
+
+    def get_by_user_id(self, user_id: int) -> List[EmailJob]:
+        """Get jobs submitted by a specific user."""
+        try:
+            with self._get_connection() as conn:
+                return self._load_jobs(conn.cursor(), "WHERE user_id = ?", (user_id,))
+        except Exception as e:
+            self.logger.error(f"Error getting email jobs for user {user_id}: {e}")
+            raise
+
+    def get_without_items(self, job_id: int) -> Optional[EmailJob]:
+        """Get a job's own fields, leaving its items empty."""
+        try:
+            with self._get_connection() as conn:
+                jobs = self._load_jobs(conn.cursor(), "WHERE job_id = ?", (job_id,), with_items=False)
+                return jobs[0] if jobs else None
+        except Exception as e:
+            self.logger.error(f"Error getting email job {job_id}: {e}")
+            raise
+
+    def create(self, entity: EmailJob) -> EmailJob:
+        """Create a new job with its items in one transaction."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO email_jobs (user_id, template_text, campaign_mode, status)
+                    OUTPUT INSERTED.job_id, INSERTED.created_date
+                    VALUES (?, ?, ?, ?)
+                """, (entity.user_id, entity.template_text, int(entity.campaign_mode), entity.status))
+                row = cursor.fetchone()
+                entity.job_id = row.job_id
+                entity.created_date = row.created_date
+
+                for item in entity.items:
+                    cursor.execute("""
+                        INSERT INTO email_job_items (job_id, customer_id, customer_data, position, status)
+                        OUTPUT INSERTED.item_id
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (entity.job_id, item.customer_id,
+                          json.dumps(item.customer.to_dict()) if item.customer else None, item.position, item.status))
+                    item.item_id = cursor.fetchone().item_id
+                    item.job_id = entity.job_id
+
+                conn.commit()
+            self.logger.info(f"Created email job: {entity}")
+            return entity
+        except Exception as e:
+            self.logger.error(f"Error creating email job: {e}")
+            raise
+
+    def update(self, entity: EmailJob) -> EmailJob:
+        """Update job fields. Items are updated through the lease methods."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    UPDATE email_jobs SET status = ?, cancel_requested = ?, error_message = ?,
+                        started_date = ?, completed_date = ?
+                    WHERE job_id = ?
+                """, (entity.status, int(entity.cancel_requested), entity.error_message,
+                      entity.started_date, entity.completed_date, entity.job_id))
+                if cursor.rowcount == 0:
+                    raise ValueError(f"Email job with ID {entity.job_id} not found")
+                conn.commit()
+            return entity
+        except Exception as e:
+            self.logger.error(f"Error updating email job: {e}")
+            raise
+
+    def claim_items(self, worker_id: str, limit: int, lease_seconds: int, max_attempts: int) -> List[EmailJobItem]:
+        """Lease up to limit pending (or lease-expired) items of jobs that are not cancelled."""
+        claimable = """
+            (i.status = 'pending' OR (i.status = 'running' AND i.lease_expires < SYSUTCDATETIME()))
+            AND j.cancel_requested = 0 AND j.status IN ('queued', 'running')
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    UPDATE i SET status = 'failed', lease_owner = NULL,
+                        error_message = CONCAT('Gave up after ', i.attempts, ' attempts')
+                    FROM email_job_items i WITH (UPDLOCK, READPAST, ROWLOCK)
+                    JOIN email_jobs j ON j.job_id = i.job_id
+                    WHERE {claimable} AND i.attempts >= ?
+                """, max_attempts)
+
+                cursor.execute(f"""
+                    WITH next_items AS (
+                        SELECT TOP (?) i.*
+                        FROM email_job_items i WITH (UPDLOCK, READPAST, ROWLOCK)
+                        JOIN email_jobs j ON j.job_id = i.job_id
+                        WHERE {claimable}
+                        ORDER BY i.job_id, i.item_id
+                    )
+                    UPDATE next_items
+                    SET status = 'running', lease_owner = ?,
+                        lease_expires = DATEADD(second, ?, SYSUTCDATETIME()), attempts = attempts + 1
+                    OUTPUT {', '.join(f'INSERTED.{column.strip()}' for column in ITEM_COLUMNS.split(','))}
+                """, (limit, worker_id, lease_seconds))
+                items = [self._row_to_item(row) for row in cursor.fetchall()]
+
+                job_ids = sorted({item.job_id for item in items})
+                if job_ids:
+                    cursor.execute(f"""
+                        UPDATE email_jobs SET status = 'running', started_date = GETDATE()
+                        WHERE status = 'queued' AND job_id IN ({','.join('?' for _ in job_ids)})
+                    """, job_ids)
+
+                conn.commit()
+                return sorted(items, key=lambda item: item.item_id)
+        except Exception as e:
+            self.logger.error(f"Error claiming email job items: {e}")
+            raise
+
+    def renew_leases(self, worker_id: str, item_ids: List[int], lease_seconds: int) -> int:
+        """Extend the leases a worker holds."""
+        if not item_ids:
+            return 0
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    UPDATE email_job_items SET lease_expires = DATEADD(second, ?, SYSUTCDATETIME())
+                    WHERE lease_owner = ? AND status = 'running'
+                      AND item_id IN ({','.join('?' for _ in item_ids)})
+                """, (lease_seconds, worker_id, *item_ids))
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            self.logger.error(f"Error renewing email job leases: {e}")
+            raise
+
+    def complete_item(self, item: EmailJobItem, worker_id: str) -> bool:
+        """Record an item's outcome if the worker still holds its lease."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    UPDATE email_job_items
+                    SET status = ?, email_log_id = ?, error_message = ?, lease_owner = NULL, lease_expires = NULL
+                    WHERE item_id = ? AND lease_owner = ? AND status = 'running'
+                """, (item.status, item.email_log_id, item.error_message, item.item_id, worker_id))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            self.logger.error(f"Error completing email job item {item.item_id}: {e}")
+            raise
+
+    def save_campaign_draft(self, job_id: int, draft: EmailLog) -> EmailLog:
+        """Store a job's campaign draft unless one exists."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "UPDATE email_jobs SET campaign_draft = ? WHERE job_id = ? AND campaign_draft IS NULL",
+                    (json.dumps(draft.to_dict()), job_id)
+                )
+                cursor.execute("SELECT campaign_draft FROM email_jobs WHERE job_id = ?", job_id)
+                row = cursor.fetchone()
+                conn.commit()
+                if not row:
+                    raise ValueError(f"Email job with ID {job_id} not found")
+                return EmailLog.from_dict(json.loads(row.campaign_draft))
+        except Exception as e:
+            self.logger.error(f"Error saving campaign draft for job {job_id}: {e}")
+            raise
+
+    def finish_job(self, job_id: int) -> Optional[EmailJob]:
+        """Close a job once no items are left to run."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT status, cancel_requested FROM email_jobs WITH (UPDLOCK) WHERE job_id = ?", job_id
+                )
+                job = cursor.fetchone()
+                if not job or job.status not in ('queued', 'running'):
+                    conn.rollback()
+                    return None
+
+                if job.cancel_requested:
+                    # Items abandoned by a crashed worker are cancelled along with pending ones
+                    cursor.execute("""
+                        UPDATE email_job_items SET status = 'cancelled', lease_owner = NULL
+                        WHERE job_id = ? AND (status = 'pending'
+                                              OR (status = 'running' AND lease_expires < SYSUTCDATETIME()))
+                    """, job_id)
+
+                cursor.execute(
+                    "SELECT COUNT(*) FROM email_job_items WHERE job_id = ? AND status IN ('pending', 'running')",
+                    job_id
+                )
+                if cursor.fetchone()[0]:
+                    conn.commit()
+                    return None
+
+                cursor.execute(
+                    "UPDATE email_jobs SET status = ?, completed_date = GETDATE() WHERE job_id = ?",
+                    ('cancelled' if job.cancel_requested else 'completed', job_id)
+                )
+                finished = self._load_jobs(cursor, "WHERE job_id = ?", (job_id,))[0]
+                conn.commit()
+                return finished
+        except Exception as e:
+            self.logger.error(f"Error finishing email job {job_id}: {e}")
+            raise
+
+    def delete(self, entity_id: int) -> bool:
+        """Delete a job and its items."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM email_job_items WHERE job_id = ?", entity_id)
+                cursor.execute("DELETE FROM email_jobs WHERE job_id = ?", entity_id)
+                deleted = cursor.rowcount > 0
+                conn.commit()
+                return deleted
+        except Exception as e:
+            self.logger.error(f"Error deleting email job {entity_id}: {e}")
+            raise
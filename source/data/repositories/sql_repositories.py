@@ -8,7 +8,6 @@ from typing import List, Optional
 from datetime import datetime
 from data.models.customer import Customer
 from data.models.user import User, Role
-from data.models.email_log import EmailLog
 from data.repositories.base import BaseRepository
 from config.database import DatabaseConfig
 
@@ -525,168 +524,3 @@ class SqlRoleRepository(BaseRepository):
             raise
             
         return None
-
-
-class SqlEmailLogRepository(BaseRepository):
-    """SQL Server implementation of email log repository."""
-    
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
-        self.db_config = DatabaseConfig()
-    
-    def _get_connection(self):
-        """Get database connection."""
-        return pyodbc.connect(self.db_config.get_connection_string())
-    
-    def get_all(self) -> List[EmailLog]:
-        """Get all email logs."""
-        logs = []
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT log_id, customer_id, user_id, email_type, subject,
-                           content, recipient_email, sent_date, status, error_message
-                    FROM email_logs
-                    ORDER BY sent_date DESC
-                """)
-                
-                for row in cursor.fetchall():
-                    log = EmailLog(
-                        log_id=row.log_id,
-                        customer_id=row.customer_id,
-                        user_id=row.user_id,
-                        email_type=row.email_type,
-                        subject=row.subject,
-                        content=row.content,
-                        recipient_email=row.recipient_email,
-                        sent_date=row.sent_date,
-                        status=row.status,
-                        error_message=row.error_message
-                    )
-                    logs.append(log)
-                    
-        except Exception as e:
-            self.logger.error(f"Error getting all email logs: {e}")
-            raise
-            
-        return logs
-    
-    def get_by_id(self, log_id: int) -> Optional[EmailLog]:
-        """Get email log by ID."""
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT log_id, customer_id, user_id, email_type, subject,
-                           content, recipient_email, sent_date, status, error_message
-                    FROM email_logs
-                    WHERE log_id = ?
-                """, log_id)
-                
-                row = cursor.fetchone()
-                if row:
-                    return EmailLog(
-                        log_id=row.log_id,
-                        customer_id=row.customer_id,
-                        user_id=row.user_id,
-                        email_type=row.email_type,
-                        subject=row.subject,
-                        content=row.content,
-                        recipient_email=row.recipient_email,
-                        sent_date=row.sent_date,
-                        status=row.status,
-                        error_message=row.error_message
-                    )
-                    
-        except Exception as e:
-            self.logger.error(f"Error getting email log by ID {log_id}: {e}")
-            raise
-            
-        return None
-    
-    def get_by_customer(self, customer_id: int) -> List[EmailLog]:
-        """Get email logs by customer."""
-        logs = []
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT log_id, customer_id, user_id, email_type, subject,
-                           content, recipient_email, sent_date, status, error_message
-                    FROM email_logs
-                    WHERE customer_id = ?
-                    ORDER BY sent_date DESC
-                """, customer_id)
-                
-                for row in cursor.fetchall():
-                    log = EmailLog(
-                        log_id=row.log_id,
-                        customer_id=row.customer_id,
-                        user_id=row.user_id,
-                        email_type=row.email_type,
-                        subject=row.subject,
-                        content=row.content,
-                        recipient_email=row.recipient_email,
-                        sent_date=row.sent_date,
-                        status=row.status,
-                        error_message=row.error_message
-                    )
-                    logs.append(log)
-                    
-        except Exception as e:
-            self.logger.error(f"Error getting email logs by customer {customer_id}: {e}")
-            raise
-            
-        return logs
-    
-    def create(self, log: EmailLog) -> EmailLog:
-        """Create new email log."""
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO email_logs (
-                        customer_id, user_id, email_type, subject, content,
-                        recipient_email, sent_date, status, error_message
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    log.customer_id,
-                    log.user_id,
-                    log.email_type,
-                    log.subject,
-                    log.content,
-                    log.recipient_email,
-                    datetime.now(),
-                    log.status,
-                    log.error_message
-                ))
-                
-                # Get the inserted ID
-                cursor.execute("SELECT @@IDENTITY")
-                log_id = cursor.fetchone()[0]
-                conn.commit()
-                
-                # Return the created log
-                return self.get_by_id(log_id)
-                
-        except Exception as e:
-            self.logger.error(f"Error creating email log: {e}")
-            raise
-    
-    def update_status(self, log_id: int, status: str, error_message: str = None) -> bool:
-        """Update email log status."""
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE email_logs SET status = ?, error_message = ?
-                    WHERE log_id = ?
-                """, (status, error_message, log_id))
-                
-                conn.commit()
-                return cursor.rowcount > 0
-                
-        except Exception as e:
-            self.logger.error(f"Error updating email log status: {e}")
-            raise
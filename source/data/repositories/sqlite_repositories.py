@@ -0,0 +1,957 @@
+"""
+SQLite repository implementations.
+
+A local SQLite database stands in for SQL Server so that the web process and
+standalone email job workers on the same host can share jobs and email logs.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from config.settings import get_email_job_config
+from data.models.customer import Customer
+from data.models.email_log import EmailLog
+from data.models.email_job import EmailJob, EmailJobItem
+from data.models.email_outbox import EmailOutboxMessage
+from data.models.compliance_verdict import ComplianceVerdict
+from data.repositories.base import (
+    IComplianceVerdictRepository, IEmailLogRepository, IEmailJobRepository, IEmailOutboxRepository
+)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_logs (
+    email_log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    template_text TEXT NOT NULL DEFAULT '',
+    generated_email TEXT NOT NULL DEFAULT '',
+    recipient_email TEXT NOT NULL DEFAULT '',
+    subject TEXT NOT NULL DEFAULT '',
+    hipaa_compliance_check TEXT NOT NULL DEFAULT '',
+    ai_compliance_check TEXT NOT NULL DEFAULT '',
+    compliance_approved INTEGER NOT NULL DEFAULT 0,
+    email_sent INTEGER NOT NULL DEFAULT 0,
+    sent_date TEXT,
+    created_date TEXT,
+    openai_usage TEXT NOT NULL DEFAULT '{}',
+    generation_path TEXT NOT NULL DEFAULT ''
+);
+
+CREATE TABLE IF NOT EXISTS email_jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    template_text TEXT NOT NULL,
+    campaign_mode INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    error_message TEXT NOT NULL DEFAULT '',
+    campaign_draft TEXT,
+    created_date TEXT,
+    started_date TEXT,
+    completed_date TEXT
+);
+
+CREATE TABLE IF NOT EXISTS email_job_items (
+    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL REFERENCES email_jobs(job_id),
+    customer_id INTEGER NOT NULL,
+    customer_data TEXT,
+    position INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    email_log_id INTEGER,
+    error_message TEXT NOT NULL DEFAULT '',
+    lease_owner TEXT,
+    lease_expires TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+    outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email_log_id INTEGER NOT NULL REFERENCES email_logs(email_log_id),
+    idempotency_key TEXT NOT NULL UNIQUE,
+    message_id TEXT NOT NULL DEFAULT '',
+    recipient_email TEXT NOT NULL,
+    subject TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_date TEXT,
+    lease_owner TEXT,
+    lease_expires TEXT,
+    last_error TEXT NOT NULL DEFAULT '',
+    created_date TEXT,
+    sent_date TEXT
+);
+
+CREATE TABLE IF NOT EXISTS compliance_verdicts (
+    cache_key TEXT PRIMARY KEY,
+    review TEXT NOT NULL,
+    policy_version TEXT NOT NULL,
+    model TEXT NOT NULL,
+    result TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_date TEXT,
+    last_used_date TEXT
+);
+
+CREATE INDEX IF NOT EXISTS IX_ComplianceVerdicts_LastUsed ON compliance_verdicts(last_used_date);
+CREATE INDEX IF NOT EXISTS IX_EmailOutbox_Status ON email_outbox(status, next_attempt_date);
+CREATE INDEX IF NOT EXISTS IX_EmailJobItems_Status ON email_job_items(status, lease_expires);
+CREATE INDEX IF NOT EXISTS IX_EmailJobItems_JobID ON email_job_items(job_id);
+CREATE INDEX IF NOT EXISTS IX_EmailJobs_UserID ON email_jobs(user_id);
+"""
+
+# Columns added after a table was first released: (table, column, definition)
+COLUMN_MIGRATIONS = [
+    ('email_logs', 'openai_usage', "TEXT NOT NULL DEFAULT '{}'"),
+    ('email_logs', 'generation_path', "TEXT NOT NULL DEFAULT ''"),
+    ('email_job_items', 'position', "INTEGER NOT NULL DEFAULT 0"),
+    ('email_outbox', 'message_id', "TEXT NOT NULL DEFAULT ''"),
+]
+
+
+def _to_text(value: Optional[datetime]) -> Optional[str]:
+    """Convert a datetime to the ISO text stored in SQLite."""
+    return value.isoformat() if value else None
+
+
+def _to_datetime(value: Optional[str]) -> Optional[datetime]:
+    """Convert stored ISO text back to a datetime."""
+    return datetime.fromisoformat(value) if value else None
+
+
+class SqliteDatabase:
+    """Connection manager for the local SQLite database."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.logger = logging.getLogger(__name__)
+        self.path = path or get_email_job_config()['sqlite_path']
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._initialize_schema()
+
+    def _initialize_schema(self):
+        """Create tables on first use."""
+        with self.get_connection() as conn:
+            # WAL lets readers in the web process run while a worker writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            for table, column, definition in COLUMN_MIGRATIONS:
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    @contextmanager
+    def get_connection(self):
+        """Get an autocommit connection that is closed afterwards."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Get a connection holding the database write lock until commit."""
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+
+class SqliteEmailLogRepository(IEmailLogRepository):
+    """SQLite implementation of email log repository."""
+
+    def __init__(self, database: Optional[SqliteDatabase] = None):
+        self.logger = logging.getLogger(__name__)
+        self.database = database or SqliteDatabase()
+
+    def _row_to_email_log(self, row: sqlite3.Row) -> EmailLog:
+        """Convert a database row to an email log."""
+        return EmailLog(
+            email_log_id=row['email_log_id'],
+            customer_id=row['customer_id'],
+            user_id=row['user_id'],
+            template_text=row['template_text'],
+            generated_email=row['generated_email'],
+            recipient_email=row['recipient_email'],
+            subject=row['subject'],
+            hipaa_compliance_check=row['hipaa_compliance_check'],
+            ai_compliance_check=row['ai_compliance_check'],
+            compliance_approved=bool(row['compliance_approved']),
+            email_sent=bool(row['email_sent']),
+            sent_date=_to_datetime(row['sent_date']),
+            created_date=_to_datetime(row['created_date']),
+            openai_usage=json.loads(row['openai_usage'] or '{}'),
+            generation_path=row['generation_path']
+        )
+
+    def _query(self, where: str = "", params: tuple = ()) -> List[EmailLog]:
+        """Get email logs matching a WHERE clause."""
+        try:
+            with self.database.get_connection() as conn:
+                rows = conn.execute(
+                    f"SELECT * FROM email_logs {where} ORDER BY email_log_id DESC", params
+                ).fetchall()
+                return [self._row_to_email_log(row) for row in rows]
+        except Exception as e:
+            self.logger.error(f"Error getting email logs: {e}")
+            raise
+
+    def get_all(self) -> List[EmailLog]:
+        """Get all email logs."""
+        return self._query()
+
+    def get_by_id(self, entity_id: int) -> Optional[EmailLog]:
+        """Get email log by ID."""
+        logs = self._query("WHERE email_log_id = ?", (entity_id,))
+        return logs[0] if logs else None
+
+    def get_by_customer_id(self, customer_id: int) -> List[EmailLog]:
+        """Get email logs for a specific customer."""
+        return self._query("WHERE customer_id = ?", (customer_id,))
+
+    def get_by_user_id(self, user_id: int) -> List[EmailLog]:
+        """Get email logs created by a specific user."""
+        return self._query("WHERE user_id = ?", (user_id,))
+
+    def get_sent_emails(self) -> List[EmailLog]:
+        """Get all sent emails."""
+        return self._query("WHERE email_sent = 1")
+
+    def get_by_ids(self, entity_ids: List[int]) -> List[EmailLog]:
+        """Get the email logs with the given IDs in one query."""
+        if not entity_ids:
+            return []
+        placeholders = ','.join('?' for _ in entity_ids)
+        return self._query(f"WHERE email_log_id IN ({placeholders})", tuple(entity_ids))
+
+    def get_by_template(self, user_id: int, template_text: str, customer_ids: List[int]) -> List[EmailLog]:
+        """Get the email logs user_id generated from template_text for the given customers, newest first."""
+        if not customer_ids:
+            return []
+        placeholders = ','.join('?' for _ in customer_ids)
+        return self._query(f"WHERE user_id = ? AND template_text = ? AND customer_id IN ({placeholders})",
+                           (user_id, template_text, *customer_ids))
+
+    def mark_sent(self, email_log_ids: List[int], sent_date: datetime) -> int:
+        """Mark email logs sent in one UPDATE."""
+        if not email_log_ids:
+            return 0
+        try:
+            placeholders = ','.join('?' for _ in email_log_ids)
+            with self.database.get_connection() as conn:
+                cursor = conn.execute(
+                    f"UPDATE email_logs SET email_sent = 1, sent_date = ? WHERE email_log_id IN ({placeholders})",
+                    (_to_text(sent_date), *email_log_ids)
+                )
+                return cursor.rowcount
+        except Exception as e:
+            self.logger.error(f"Error marking email logs sent: {e}")
+            raise
+
+    def create(self, entity: EmailLog) -> EmailLog:
+        """Create a new email log."""
+        try:
+            entity.created_date = datetime.now()
+            with self.database.get_connection() as conn:
+                cursor = conn.execute("""
+                    INSERT INTO email_logs (
+                        customer_id, user_id, template_text, generated_email, recipient_email,
+                        subject, hipaa_compliance_check, ai_compliance_check, compliance_approved,
+                        email_sent, sent_date, created_date, openai_usage, generation_path
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    entity.customer_id,
+                    entity.user_id,
+                    entity.template_text,
+                    entity.generated_email,
+                    entity.recipient_email,
+                    entity.subject,
+                    entity.hipaa_compliance_check,
+                    entity.ai_compliance_check,
+                    int(entity.compliance_approved),
+                    int(entity.email_sent),
+                    _to_text(entity.sent_date),
+                    _to_text(entity.created_date),
+                    json.dumps(entity.openai_usage),
+                    entity.generation_path
+                ))
+                entity.email_log_id = cursor.lastrowid
+            self.logger.info(f"Created email log: {entity}")
+            return entity
+        except Exception as e:
+            self.logger.error(f"Error creating email log: {e}")
+            raise
+
+    def update(self, entity: EmailLog) -> EmailLog:
+        """Update an existing email log."""
+        try:
+            with self.database.get_connection() as conn:
+                cursor = conn.execute("""
+                    UPDATE email_logs SET
+                        generated_email = ?, subject = ?, hipaa_compliance_check = ?,
+                        ai_compliance_check = ?, compliance_approved = ?, email_sent = ?, sent_date = ?,
+                        openai_usage = ?, generation_path = ?
+                    WHERE email_log_id = ?
+                """, (
+                    entity.generated_email,
+                    entity.subject,
+                    entity.hipaa_compliance_check,
+                    entity.ai_compliance_check,
+                    int(entity.compliance_approved),
+                    int(entity.email_sent),
+                    _to_text(entity.sent_date),
+                    json.dumps(entity.openai_usage),
+                    entity.generation_path,
+                    entity.email_log_id
+                ))
+                if cursor.rowcount == 0:
+                    raise ValueError(f"Email log with ID {entity.email_log_id} not found")
+            self.logger.info(f"Updated email log: {entity}")
+            return entity
+        except Exception as e:
+            self.logger.error(f"Error updating email log: {e}")
+            raise
+
+    def delete(self, entity_id: int) -> bool:
+        """Delete an email log."""
+        try:
+            with self.database.get_connection() as conn:
+                cursor = conn.execute("DELETE FROM email_logs WHERE email_log_id = ?", (entity_id,))
+                return cursor.rowcount > 0
+        except Exception as e:
+            self.logger.error(f"Error deleting email log: {e}")
+            raise
+
+
+class SqliteEmailJobRepository(IEmailJobRepository):
+    """SQLite implementation of email job repository."""
+
+    def __init__(self, database: Optional[SqliteDatabase] = None):
+        self.logger = logging.getLogger(__name__)
+        self.database = database or SqliteDatabase()
+
+    def _row_to_item(self, row: sqlite3.Row) -> EmailJobItem:
+        """Convert a database row to a job item."""
+        return EmailJobItem(
+            item_id=row['item_id'],
+            job_id=row['job_id'],
+            customer_id=row['customer_id'],
+            customer=Customer.from_dict(json.loads(row['customer_data'])) if row['customer_data'] else None,
+            position=row['position'],
+            status=row['status'],
+            email_log_id=row['email_log_id'],
+            error_message=row['error_message'],
+            lease_owner=row['lease_owner'],
+            lease_expires=_to_datetime(row['lease_expires']),
+            attempts=row['attempts']
+        )
+
+    def _load_jobs(self, conn: sqlite3.Connection, where: str = "", params: tuple = (),
+                   with_items: bool = True) -> List[EmailJob]:
+        """Load jobs matching a WHERE clause, together with their items unless with_items is False."""
+        jobs = []
+        for row in conn.execute(f"SELECT * FROM email_jobs {where} ORDER BY job_id", params).fetchall():
+            items = conn.execute(
+                "SELECT * FROM email_job_items WHERE job_id = ? ORDER BY item_id", (row['job_id'],)
+            ).fetchall() if with_items else []
+            jobs.append(EmailJob(
+                job_id=row['job_id'],
+                user_id=row['user_id'],
+                template_text=row['template_text'],
+                campaign_mode=bool(row['campaign_mode']),
+                status=row['status'],
+                cancel_requested=bool(row['cancel_requested']),
+                error_message=row['error_message'],
+                campaign_draft=EmailLog.from_dict(json.loads(row['campaign_draft'])) if row['campaign_draft'] else None,
+                items=[self._row_to_item(item) for item in items],
+                created_date=_to_datetime(row['created_date']),
+                started_date=_to_datetime(row['started_date']),
+                completed_date=_to_datetime(row['completed_date'])
+            ))
+        return jobs
+
+    def get_all(self) -> List[EmailJob]:
+        """Get all jobs."""
+        try:
+            with self.database.get_connection() as conn:
+                return self._load_jobs(conn)
+        except Exception as e:
+            self.logger.error(f"Error getting email jobs: {e}")
+            raise
+
+    def get_by_id(self, entity_id: int) -> Optional[EmailJob]:
+        """Get job by ID."""
+        try:
+            with self.database.get_connection() as conn:
+                jobs = self._load_jobs(conn, "WHERE job_id = ?", (entity_id,))
+                return jobs[0] if jobs else None
+        except Exception as e:
+            self.logger.error(f"Error getting email job {entity_id}: {e}")
+            raise
+
+    def get_by_user_id(self, user_id: int) -> List[EmailJob]:
+        """Get jobs submitted by a specific user."""
+        try:
+            with self.database.get_connection() as conn:
+                return self._load_jobs(conn, "WHERE user_id = ?", (user_id,))
+        except Exception as e:
+            self.logger.error(f"Error getting email jobs for user {user_id}: {e}")
+            raise
+
+    def get_without_items(self, job_id: int) -> Optional[EmailJob]:
+        """Get a job's own fields, leaving its items empty."""
+        try:
+            with self.database.get_connection() as conn:
+                jobs = self._load_jobs(conn, "WHERE job_id = ?", (job_id,), with_items=False)
+                return jobs[0] if jobs else None
+        except Exception as e:
+            self.logger.error(f"Error getting email job {job_id}: {e}")
+            raise
+
+    def create(self, entity: EmailJob) -> EmailJob:
+        """Create a new job with its items."""
+        try:
+            entity.created_date = datetime.now()
+            with self.database.transaction() as conn:
+                cursor = conn.execute("""
+                    INSERT INTO email_jobs (user_id, template_text, campaign_mode, status, created_date)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (entity.user_id, entity.template_text, int(entity.campaign_mode), entity.status,
+                      _to_text(entity.created_date)))
+                entity.job_id = cursor.lastrowid
+
+                for item in entity.items:
+                    cursor = conn.execute("""
+                        INSERT INTO email_job_items (job_id, customer_id, customer_data, position, status)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (entity.job_id, item.customer_id,
+                          json.dumps(item.customer.to_dict()) if item.customer else None, item.position, item.status))
+                    item.item_id = cursor.lastrowid
+                    item.job_id = entity.job_id
+            self.logger.info(f"Created email job: {entity}")
+            return entity
+        except Exception as e:
+            self.logger.error(f"Error creating email job: {e}")
+            raise
+
+    def update(self, entity: EmailJob) -> EmailJob:
+        """Update job fields. Items are updated through the lease methods."""
+        try:
+            with self.database.get_connection() as conn:
+                cursor = conn.execute("""
+                    UPDATE email_jobs SET status = ?, cancel_requested = ?, error_message = ?,
+                        started_date = ?, completed_date = ?
+                    WHERE job_id = ?
+                """, (entity.status, int(entity.cancel_requested), entity.error_message,
+                      _to_text(entity.started_date), _to_text(entity.completed_date), entity.job_id))
+                if cursor.rowcount == 0:
+                    raise ValueError(f"Email job with ID {entity.job_id} not found")
+            return entity
+        except Exception as e:
+            self.logger.error(f"Error updating email job: {e}")
+            raise
+
+    def claim_items(self, worker_id: str, limit: int, lease_seconds: int, max_attempts: int) -> List[EmailJobItem]:
+        """Lease up to limit pending (or lease-expired) items of jobs that are not cancelled."""
+        now = datetime.now()
+        try:
+            with self.database.transaction() as conn:
+                claimable = """
+                    FROM email_job_items
+                    WHERE (status = 'pending' OR (status = 'running' AND lease_expires < ?))
+                      AND job_id IN (SELECT job_id FROM email_jobs
+                                     WHERE cancel_requested = 0 AND status IN ('queued', 'running'))
+                """
+                conn.execute(f"""
+                    UPDATE email_job_items
+                    SET status = 'failed', lease_owner = NULL,
+                        error_message = 'Gave up after ' || attempts || ' attempts'
+                    WHERE item_id IN (SELECT item_id {claimable} AND attempts >= ?)
+                """, (_to_text(now), max_attempts))
+
+                rows = conn.execute(
+                    f"SELECT item_id, job_id {claimable} ORDER BY job_id, item_id LIMIT ?",
+                    (_to_text(now), limit)
+                ).fetchall()
+                if not rows:
+                    return []
+
+                item_ids = [row['item_id'] for row in rows]
+                placeholders = ','.join('?' for _ in item_ids)
+                conn.execute(f"""
+                    UPDATE email_job_items
+                    SET status = 'running', lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+                    WHERE item_id IN ({placeholders})
+                """, (worker_id, _to_text(now + timedelta(seconds=lease_seconds)), *item_ids))
+
+                job_ids = sorted({row['job_id'] for row in rows})
+                conn.execute(f"""
+                    UPDATE email_jobs SET status = 'running', started_date = ?
+                    WHERE status = 'queued' AND job_id IN ({','.join('?' for _ in job_ids)})
+                """, (_to_text(now), *job_ids))
+
+                items = conn.execute(
+                    f"SELECT * FROM email_job_items WHERE item_id IN ({placeholders}) ORDER BY item_id", item_ids
+                ).fetchall()
+                return [self._row_to_item(item) for item in items]
+        except Exception as e:
+            self.logger.error(f"Error claiming email job items: {e}")
+            raise
+
+    def renew_leases(self, worker_id: str, item_ids: List[int], lease_seconds: int) -> int:
+        """Extend the leases a worker holds."""
+        if not item_ids:
+            return 0
+        try:
+            expires = datetime.now() + timedelta(seconds=lease_seconds)
+            with self.database.get_connection() as conn:
+                cursor = conn.execute(f"""
+                    UPDATE email_job_items SET lease_expires = ?
+                    WHERE lease_owner = ? AND status = 'running'
+                      AND item_id IN ({','.join('?' for _ in item_ids)})
+                """, (_to_text(expires), worker_id, *item_ids))
+                return cursor.rowcount
+        except Exception as e:
+            self.logger.error(f"Error renewing email job leases: {e}")
+            raise
+
+    def complete_item(self, item: EmailJobItem, worker_id: str) -> bool:
+        """Record an item's outcome if the worker still holds its lease."""
+        try:
+            with self.database.get_connection() as conn:
+                cursor = conn.execute("""
+                    UPDATE email_job_items
+                    SET status = ?, email_log_id = ?, error_message = ?, lease_owner = NULL, lease_expires = NULL
+                    WHERE item_id = ? AND lease_owner = ? AND status = 'running'
+                """, (item.status, item.email_log_id, item.error_message, item.item_id, worker_id))
+                return cursor.rowcount > 0
+        except Exception as e:
+            self.logger.error(f"Error completing email job item {item.item_id}: {e}")
+            raise
+
+    def save_campaign_draft(self, job_id: int, draft: EmailLog) -> EmailLog:
+        """Store a job's campaign draft unless one exists."""
+        try:
+            with self.database.transaction() as conn:
+                conn.execute(
+                    "UPDATE email_jobs SET campaign_draft = ? WHERE job_id = ? AND campaign_draft IS NULL",
+                    (json.dumps(draft.to_dict()), job_id)
+                )
+                row = conn.execute("SELECT campaign_draft FROM email_jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if not row:
+                    raise ValueError(f"Email job with ID {job_id} not found")
+                return EmailLog.from_dict(json.loads(row['campaign_draft']))
+        except Exception as e:
+            self.logger.error(f"Error saving campaign draft for job {job_id}: {e}")
+            raise
+
+    def finish_job(self, job_id: int) -> Optional[EmailJob]:
+        """Close a job once no items are left to run."""
+        try:
+            with self.database.transaction() as conn:
+                job = conn.execute("SELECT status, cancel_requested FROM email_jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if not job or job['status'] not in ('queued', 'running'):
+                    return None
+
+                if job['cancel_requested']:
+                    # Items abandoned by a crashed worker are cancelled along with pending ones
+                    conn.execute("""
+                        UPDATE email_job_items SET status = 'cancelled', lease_owner = NULL
+                        WHERE job_id = ? AND (status = 'pending' OR (status = 'running' AND lease_expires < ?))
+                    """, (job_id, _to_text(datetime.now())))
+
+                open_items = conn.execute(
+                    "SELECT COUNT(*) FROM email_job_items WHERE job_id = ? AND status IN ('pending', 'running')",
+                    (job_id,)
+                ).fetchone()[0]
+                if open_items:
+                    return None
+
+                conn.execute(
+                    "UPDATE email_jobs SET status = ?, completed_date = ? WHERE job_id = ?",
+                    ('cancelled' if job['cancel_requested'] else 'completed', _to_text(datetime.now()), job_id)
+                )
+                return self._load_jobs(conn, "WHERE job_id = ?", (job_id,))[0]
+        except Exception as e:
+            self.logger.error(f"Error finishing email job {job_id}: {e}")
+            raise
+
+    def delete(self, entity_id: int) -> bool:
+        """Delete a job and its items."""
+        try:
+            with self.database.transaction() as conn:
+                conn.execute("DELETE FROM email_job_items WHERE job_id = ?", (entity_id,))
+                cursor = conn.execute("DELETE FROM email_jobs WHERE job_id = ?", (entity_id,))
+                return cursor.rowcount > 0
+        except Exception as e:
+            self.logger.error(f"Error deleting email job {entity_id}: {e}")
+            raise
+
+
+class SqliteEmailOutboxRepository(IEmailOutboxRepository):
+    """SQLite implementation of email outbox repository.
+    
+    Uses the same database as SqliteEmailLogRepository so that a message and
+    its email log are marked sent in one transaction.
+    """
+
+    def __init__(self, database: Optional[SqliteDatabase] = None):
+        self.logger = logging.getLogger(__name__)
+        self.database = database or SqliteDatabase()
+
+    def _row_to_message(self, row: sqlite3.Row) -> EmailOutboxMessage:
+        """Convert a database row to an outbox message."""
+        return EmailOutboxMessage(
+            outbox_id=row['outbox_id'],
+            email_log_id=row['email_log_id'],
+            idempotency_key=row['idempotency_key'],
+            message_id=row['message_id'],
+            recipient_email=row['recipient_email'],
+            subject=row['subject'],
+            body=row['body'],
+            status=row['status'],
+            attempts=row['attempts'],
+            next_attempt_date=_to_datetime(row['next_attempt_date']),
+            lease_owner=row['lease_owner'],
+            lease_expires=_to_datetime(row['lease_expires']),
+            last_error=row['last_error'],
+            created_date=_to_datetime(row['created_date']),
+            sent_date=_to_datetime(row['sent_date'])
+        )
+
+    def _query(self, where: str = "", params: tuple = ()) -> List[EmailOutboxMessage]:
+        """Get outbox messages matching a WHERE clause."""
+        try:
+            with self.database.get_connection() as conn:
+                rows = conn.execute(f"SELECT * FROM email_outbox {where} ORDER BY outbox_id", params).fetchall()
+                return [self._row_to_message(row) for row in rows]
+        except Exception as e:
+            self.logger.error(f"Error getting outbox messages: {e}")
+            raise
+
+    def get_all(self) -> List[EmailOutboxMessage]:
+        """Get all outbox messages."""
+        return self._query()
+
+    def get_by_id(self, entity_id: int) -> Optional[EmailOutboxMessage]:
+        """Get outbox message by ID."""
+        messages = self._query("WHERE outbox_id = ?", (entity_id,))
+        return messages[0] if messages else None
+
+    def get_by_email_log_id(self, email_log_id: int) -> Optional[EmailOutboxMessage]:
+        """Get the outbox message for an email log."""
+        messages = self._query("WHERE email_log_id = ?", (email_log_id,))
+        return messages[0] if messages else None
+
+    def create(self, entity: EmailOutboxMessage) -> EmailOutboxMessage:
+        """Create a new outbox message."""
+        return self.enqueue(entity)
+
+    def enqueue(self, message: EmailOutboxMessage) -> EmailOutboxMessage:
+        """Queue a message unless one with the same idempotency key exists."""
+        try:
+            with self.database.transaction() as conn:
+                conn.execute("""
+                    INSERT INTO email_outbox (email_log_id, idempotency_key, message_id, recipient_email, subject, body,
+                                              created_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(idempotency_key) DO UPDATE SET
+                        status = 'pending', attempts = 0, next_attempt_date = NULL
+                    WHERE email_outbox.status = 'failed'
+                """, (message.email_log_id, message.idempotency_key, message.message_id, message.recipient_email,
+                      message.subject, message.body, _to_text(datetime.now())))
+                row = conn.execute(
+                    "SELECT * FROM email_outbox WHERE idempotency_key = ?", (message.idempotency_key,)
+                ).fetchone()
+            stored = self._row_to_message(row)
+            self.logger.info(f"Queued {stored}")
+            return stored
+        except Exception as e:
+            self.logger.error(f"Error queueing outbox message: {e}")
+            raise
+
+    def enqueue_many(self, messages: List[EmailOutboxMessage]) -> List[EmailOutboxMessage]:
+        """Queue several messages in one transaction."""
+        if not messages:
+            return []
+        created_date = _to_text(datetime.now())
+        keys = [message.idempotency_key for message in messages]
+        try:
+            with self.database.transaction() as conn:
+                conn.executemany("""
+                    INSERT INTO email_outbox (email_log_id, idempotency_key, message_id, recipient_email, subject, body,
+                                              created_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(idempotency_key) DO UPDATE SET
+                        status = 'pending', attempts = 0, next_attempt_date = NULL
+                    WHERE email_outbox.status = 'failed'
+                """, [(message.email_log_id, message.idempotency_key, message.message_id, message.recipient_email,
+                       message.subject, message.body, created_date) for message in messages])
+                placeholders = ','.join('?' for _ in keys)
+                rows = conn.execute(
+                    f"SELECT * FROM email_outbox WHERE idempotency_key IN ({placeholders})", keys
+                ).fetchall()
+            stored = {row['idempotency_key']: self._row_to_message(row) for row in rows}
+            self.logger.info(f"Queued {len(stored)} outbox messages")
+            return [stored[key] for key in keys]
+        except Exception as e:
+            self.logger.error(f"Error queueing outbox messages: {e}")
+            raise
+
+    def update(self, entity: EmailOutboxMessage) -> EmailOutboxMessage:
+        """Update an existing outbox message."""
+        try:
+            with self.database.get_connection() as conn:
+                cursor = conn.execute("""
+                    UPDATE email_outbox SET status = ?, attempts = ?, next_attempt_date = ?,
+                        lease_owner = ?, lease_expires = ?, last_error = ?, sent_date = ?
+                    WHERE outbox_id = ?
+                """, (entity.status, entity.attempts, _to_text(entity.next_attempt_date), entity.lease_owner,
+                      _to_text(entity.lease_expires), entity.last_error, _to_text(entity.sent_date),
+                      entity.outbox_id))
+                if cursor.rowcount == 0:
+                    raise ValueError(f"Outbox message with ID {entity.outbox_id} not found")
+            return entity
+        except Exception as e:
+            self.logger.error(f"Error updating outbox message: {e}")
+            raise
+
+    def claim_batch(self, worker_id: str, limit: int, lease_seconds: int) -> List[EmailOutboxMessage]:
+        """Lease up to limit due pending (or lease-expired) messages."""
+        now = datetime.now()
+        try:
+            with self.database.transaction() as conn:
+                rows = conn.execute("""
+                    SELECT outbox_id FROM email_outbox
+                    WHERE (status = 'pending' AND (next_attempt_date IS NULL OR next_attempt_date <= ?))
+                       OR (status = 'sending' AND lease_expires < ?)
+                    ORDER BY outbox_id LIMIT ?
+                """, (_to_text(now), _to_text(now), limit)).fetchall()
+                outbox_ids = [row['outbox_id'] for row in rows]
+                if not outbox_ids:
+                    return []
+
+                placeholders = ','.join('?' for _ in outbox_ids)
+                conn.execute(f"""
+                    UPDATE email_outbox SET status = 'sending', lease_owner = ?, lease_expires = ?,
+                        attempts = attempts + 1
+                    WHERE outbox_id IN ({placeholders})
+                """, (worker_id, _to_text(now + timedelta(seconds=lease_seconds)), *outbox_ids))
+                rows = conn.execute(
+                    f"SELECT * FROM email_outbox WHERE outbox_id IN ({placeholders}) ORDER BY outbox_id", outbox_ids
+                ).fetchall()
+                return [self._row_to_message(row) for row in rows]
+        except Exception as e:
+            self.logger.error(f"Error claiming outbox messages: {e}")
+            raise
+
+    def mark_sent(self, message: EmailOutboxMessage, worker_id: str) -> bool:
+        """Mark a message and its email log sent in one transaction."""
+        sent_date = _to_text(datetime.now())
+        try:
+            with self.database.transaction() as conn:
+                cursor = conn.execute("""
+                    UPDATE email_outbox SET status = 'sent', sent_date = ?, lease_owner = NULL, last_error = ''
+                    WHERE outbox_id = ? AND status = 'sending' AND lease_owner = ?
+                """, (sent_date, message.outbox_id, worker_id))
+                if cursor.rowcount == 0:
+                    return False
+                conn.execute(
+                    "UPDATE email_logs SET email_sent = 1, sent_date = ? WHERE email_log_id = ?",
+                    (sent_date, message.email_log_id)
+                )
+                return True
+        except Exception as e:
+            self.logger.error(f"Error marking outbox message {message.outbox_id} sent: {e}")
+            raise
+
+    def mark_sent_many(self, messages: List[EmailOutboxMessage], worker_id: str) -> List[int]:
+        """Mark messages and their email logs sent in one transaction."""
+        if not messages:
+            return []
+        sent_date = _to_text(datetime.now())
+        placeholders = ','.join('?' for _ in messages)
+        try:
+            with self.database.transaction() as conn:
+                rows = conn.execute(f"""
+                    SELECT outbox_id, email_log_id FROM email_outbox
+                    WHERE outbox_id IN ({placeholders}) AND status = 'sending' AND lease_owner = ?
+                """, (*[message.outbox_id for message in messages], worker_id)).fetchall()
+                if not rows:
+                    return []
+
+                outbox_ids = [row['outbox_id'] for row in rows]
+                email_log_ids = [row['email_log_id'] for row in rows]
+                conn.execute(f"""
+                    UPDATE email_outbox SET status = 'sent', sent_date = ?, lease_owner = NULL, last_error = ''
+                    WHERE outbox_id IN ({','.join('?' for _ in outbox_ids)})
+                """, (sent_date, *outbox_ids))
+                conn.execute(
+                    f"UPDATE email_logs SET email_sent = 1, sent_date = ? "
+                    f"WHERE email_log_id IN ({','.join('?' for _ in email_log_ids)})",
+                    (sent_date, *email_log_ids)
+                )
+                return outbox_ids
+        except Exception as e:
+            self.logger.error(f"Error marking outbox messages sent: {e}")
+            raise
+
+    def mark_failed(self, message: EmailOutboxMessage, worker_id: str, error: str,
+                    retry_at: Optional[datetime]) -> bool:
+        """Record a failed attempt and schedule a retry or give up."""
+        try:
+            with self.database.get_connection() as conn:
+                cursor = conn.execute("""
+                    UPDATE email_outbox SET status = ?, next_attempt_date = ?, lease_owner = NULL, last_error = ?
+                    WHERE outbox_id = ? AND status = 'sending' AND lease_owner = ?
+                """, ('pending' if retry_at else 'failed', _to_text(retry_at), error, message.outbox_id, worker_id))
+                return cursor.rowcount > 0
+        except Exception as e:
+            self.logger.error(f"Error marking outbox message {message.outbox_id} failed: {e}")
+            raise
+
+    def get_status_counts(self) -> Dict[str, int]:
+        """Get the number of messages in each status."""
+        try:
+            with self.database.get_connection() as conn:
+                rows = conn.execute("SELECT status, COUNT(*) AS count FROM email_outbox GROUP BY status").fetchall()
+                return {row['status']: row['count'] for row in rows}
+        except Exception as e:
+            self.logger.error(f"Error counting outbox messages: {e}")
+            raise
+
+    def delete(self, entity_id: int) -> bool:
+        """Delete an outbox message."""
+        try:
+            with self.database.get_connection() as conn:
+                cursor = conn.execute("DELETE FROM email_outbox WHERE outbox_id = ?", (entity_id,))
+                return cursor.rowcount > 0
+        except Exception as e:
+            self.logger.error(f"Error deleting outbox message: {e}")
+            raise
+
+
+class SqliteComplianceVerdictRepository(IComplianceVerdictRepository):
+    """SQLite implementation of compliance verdict repository.
+    
+    Lets verdicts outlive the process and be shared by the web process and
+    standalone workers on the same host.
+    """
+
+    # Cache keys looked up per query, within SQLite's limit on bound parameters
+    LOOKUP_CHUNK = 500
+
+    def __init__(self, database: Optional[SqliteDatabase] = None):
+        self.logger = logging.getLogger(__name__)
+        self.database = database or SqliteDatabase()
+
+    def _row_to_verdict(self, row: sqlite3.Row) -> ComplianceVerdict:
+        """Convert a database row to a verdict."""
+        return ComplianceVerdict(
+            cache_key=row['cache_key'],
+            review=row['review'],
+            policy_version=row['policy_version'],
+            model=row['model'],
+            result=row['result'],
+            hits=row['hits'],
+            created_date=_to_datetime(row['created_date']),
+            last_used_date=_to_datetime(row['last_used_date'])
+        )
+
+    def get_many(self, cache_keys: List[str]) -> Dict[str, ComplianceVerdict]:
+        """Get the stored verdicts among cache_keys, recording a hit on each."""
+        keys = list(dict.fromkeys(cache_keys))
+        found: Dict[str, ComplianceVerdict] = {}
+        now = _to_text(datetime.now())
+        try:
+            with self.database.get_connection() as conn:
+                for start in range(0, len(keys), self.LOOKUP_CHUNK):
+                    chunk = keys[start:start + self.LOOKUP_CHUNK]
+                    placeholders = ','.join('?' for _ in chunk)
+                    rows = conn.execute(f"SELECT * FROM compliance_verdicts WHERE cache_key IN ({placeholders})",
+                                        chunk).fetchall()
+                    if not rows:
+                        continue
+                    hit_keys = [row['cache_key'] for row in rows]
+                    conn.execute(f"""
+                        UPDATE compliance_verdicts SET hits = hits + 1, last_used_date = ?
+                        WHERE cache_key IN ({','.join('?' for _ in hit_keys)})
+                    """, (now, *hit_keys))
+                    for row in rows:
+                        verdict = self._row_to_verdict(row)
+                        verdict.hits += 1
+                        verdict.last_used_date = _to_datetime(now)
+                        found[verdict.cache_key] = verdict
+            return found
+        except Exception as e:
+            self.logger.error(f"Error getting compliance verdicts: {e}")
+            raise
+
+    def save_many(self, verdicts: List[ComplianceVerdict]) -> int:
+        """Store verdicts in one transaction, replacing any with the same cache key."""
+        if not verdicts:
+            return 0
+        now = _to_text(datetime.now())
+        try:
+            with self.database.transaction() as conn:
+                conn.executemany("""
+                    INSERT OR REPLACE INTO compliance_verdicts
+                        (cache_key, review, policy_version, model, result, hits, created_date, last_used_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [(verdict.cache_key, verdict.review, verdict.policy_version, verdict.model, verdict.result,
+                       verdict.hits, _to_text(verdict.created_date) or now, _to_text(verdict.last_used_date) or now)
+                      for verdict in verdicts])
+            return len(verdicts)
+        except Exception as e:
+            self.logger.error(f"Error saving compliance verdicts: {e}")
+            raise
+
+    def evict(self, max_entries: int, created_before: Optional[datetime]) -> int:
+        """Delete expired verdicts, then the least recently used beyond max_entries."""
+        try:
+            with self.database.transaction() as conn:
+                evicted = 0
+                if created_before is not None:
+                    evicted += conn.execute("DELETE FROM compliance_verdicts WHERE created_date < ?",
+                                            (_to_text(created_before),)).rowcount
+                evicted += conn.execute("""
+                    DELETE FROM compliance_verdicts WHERE cache_key IN (
+                        SELECT cache_key FROM compliance_verdicts
+                        ORDER BY last_used_date DESC LIMIT -1 OFFSET ?
+                    )
+                """, (max(max_entries, 0),)).rowcount
+                return evicted
+        except Exception as e:
+            self.logger.error(f"Error evicting compliance verdicts: {e}")
+            raise
+
+    def count(self) -> int:
+        """Get the number of stored verdicts."""
+        try:
+            with self.database.get_connection() as conn:
+                return conn.execute("SELECT COUNT(*) FROM compliance_verdicts").fetchone()[0]
+        except Exception as e:
+            self.logger.error(f"Error counting compliance verdicts: {e}")
+            raise
+
+    def clear(self) -> int:
+        """Delete every verdict."""
+        try:
+            with self.database.get_connection() as conn:
+                return conn.execute("DELETE FROM compliance_verdicts").rowcount
+        except Exception as e:
+            self.logger.error(f"Error clearing compliance verdicts: {e}")
+            raise
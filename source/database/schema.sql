@@ -52,21 +52,95 @@ GO
 
 -- Create email_logs table
 CREATE TABLE email_logs (
-    log_id INT IDENTITY(1,1) PRIMARY KEY,
-    customer_id INT,
+    email_log_id INT IDENTITY(1,1) PRIMARY KEY,
+    customer_id INT NOT NULL,
     user_id INT NOT NULL,
-    email_type NVARCHAR(50) NOT NULL,
-    subject NVARCHAR(255) NOT NULL,
-    content NTEXT NOT NULL,
-    recipient_email NVARCHAR(255) NOT NULL,
-    sent_date DATETIME2 DEFAULT GETDATE(),
-    status NVARCHAR(50) DEFAULT 'Pending',
-    error_message NTEXT NULL,
+    template_text NVARCHAR(MAX) NOT NULL DEFAULT '',
+    generated_email NVARCHAR(MAX) NOT NULL DEFAULT '',
+    recipient_email NVARCHAR(255) NOT NULL DEFAULT '',
+    subject NVARCHAR(255) NOT NULL DEFAULT '',
+    hipaa_compliance_check NVARCHAR(MAX) NOT NULL DEFAULT '',
+    ai_compliance_check NVARCHAR(MAX) NOT NULL DEFAULT '',
+    compliance_approved BIT NOT NULL DEFAULT 0,
+    email_sent BIT NOT NULL DEFAULT 0,
+    sent_date DATETIME2 NULL,
+    created_date DATETIME2 DEFAULT GETDATE(),
+    openai_usage NVARCHAR(MAX) NOT NULL DEFAULT '{}',
+    generation_path NVARCHAR(50) NOT NULL DEFAULT '',
     CONSTRAINT FK_EmailLogs_Customers FOREIGN KEY (customer_id) REFERENCES customers(customer_id),
     CONSTRAINT FK_EmailLogs_Users FOREIGN KEY (user_id) REFERENCES users(user_id)
 );
 GO
 
+-- Create email_jobs table (durable bulk generation queue)
+CREATE TABLE email_jobs (
+    job_id INT IDENTITY(1,1) PRIMARY KEY,
+    user_id INT NOT NULL,
+    template_text NVARCHAR(MAX) NOT NULL,
+    campaign_mode BIT NOT NULL DEFAULT 0,
+    status NVARCHAR(20) NOT NULL DEFAULT 'queued',
+    cancel_requested BIT NOT NULL DEFAULT 0,
+    error_message NVARCHAR(MAX) NULL,
+    campaign_draft NVARCHAR(MAX) NULL,
+    created_date DATETIME2 DEFAULT GETDATE(),
+    started_date DATETIME2 NULL,
+    completed_date DATETIME2 NULL,
+    CONSTRAINT FK_EmailJobs_Users FOREIGN KEY (user_id) REFERENCES users(user_id)
+);
+GO
+
+-- Create email_job_items table (one leased work item per recipient)
+CREATE TABLE email_job_items (
+    item_id INT IDENTITY(1,1) PRIMARY KEY,
+    job_id INT NOT NULL,
+    customer_id INT NOT NULL,
+    customer_data NVARCHAR(MAX) NULL,
+    position INT NOT NULL DEFAULT 0,
+    status NVARCHAR(20) NOT NULL DEFAULT 'pending',
+    email_log_id INT NULL,
+    error_message NVARCHAR(MAX) NULL,
+    lease_owner NVARCHAR(100) NULL,
+    lease_expires DATETIME2 NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    CONSTRAINT FK_EmailJobItems_EmailJobs FOREIGN KEY (job_id) REFERENCES email_jobs(job_id)
+);
+GO
+
+-- Create email_outbox table (emails waiting for delivery, marked sent together with their email log)
+CREATE TABLE email_outbox (
+    outbox_id INT IDENTITY(1,1) PRIMARY KEY,
+    email_log_id INT NOT NULL,
+    idempotency_key NVARCHAR(100) NOT NULL,
+    message_id NVARCHAR(100) NOT NULL DEFAULT '',
+    recipient_email NVARCHAR(255) NOT NULL,
+    subject NVARCHAR(255) NOT NULL DEFAULT '',
+    body NVARCHAR(MAX) NOT NULL DEFAULT '',
+    status NVARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_date DATETIME2 NULL,
+    lease_owner NVARCHAR(100) NULL,
+    lease_expires DATETIME2 NULL,
+    last_error NVARCHAR(MAX) NOT NULL DEFAULT '',
+    created_date DATETIME2 DEFAULT SYSUTCDATETIME(),
+    sent_date DATETIME2 NULL,
+    CONSTRAINT UQ_EmailOutbox_IdempotencyKey UNIQUE (idempotency_key),
+    CONSTRAINT FK_EmailOutbox_EmailLogs FOREIGN KEY (email_log_id) REFERENCES email_logs(email_log_id)
+);
+GO
+
+-- Create compliance_verdicts table (reused compliance review results)
+CREATE TABLE compliance_verdicts (
+    cache_key NVARCHAR(64) NOT NULL PRIMARY KEY,
+    review NVARCHAR(20) NOT NULL,
+    policy_version NVARCHAR(64) NOT NULL,
+    model NVARCHAR(100) NOT NULL,
+    result NVARCHAR(MAX) NOT NULL,
+    hits INT NOT NULL DEFAULT 0,
+    created_date DATETIME2 DEFAULT GETDATE(),
+    last_used_date DATETIME2 DEFAULT GETDATE()
+);
+GO
+
 -- Create indexes for better performance
 CREATE INDEX IX_Users_Username ON users(username);
 CREATE INDEX IX_Users_Email ON users(email);
@@ -75,6 +149,11 @@ CREATE INDEX IX_Customers_ContactEmail ON customers(contact_email);
 CREATE INDEX IX_EmailLogs_CustomerID ON email_logs(customer_id);
 CREATE INDEX IX_EmailLogs_UserID ON email_logs(user_id);
 CREATE INDEX IX_EmailLogs_SentDate ON email_logs(sent_date);
+CREATE INDEX IX_EmailJobs_UserID ON email_jobs(user_id);
+CREATE INDEX IX_EmailJobItems_Status ON email_job_items(status, lease_expires);
+CREATE INDEX IX_EmailJobItems_JobID ON email_job_items(job_id);
+CREATE INDEX IX_EmailOutbox_Status ON email_outbox(status, next_attempt_date);
+CREATE INDEX IX_ComplianceVerdicts_LastUsed ON compliance_verdicts(last_used_date);
 GO
 
 -- Insert default roles
@@ -0,0 +1,66 @@
+"""
+Benchmark for AI email generation against the local fake OpenAI server.
+
+Generates emails for synthetic customers through EmailService with a pool of
+threads, the way bulk jobs do, and reports throughput, per-stage latency and
+how the server saw the load. No requests leave the machine.
+
+Usage: python tests/benchmark_openai_generation.py [emails] [threads] [latency_ms] [rate_limit_rate]
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_openai_server import FakeOpenAIServer
+
+
+def main():
+    """Run the benchmark and print throughput and latency figures."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 200.0
+    rate_limit_rate = float(sys.argv[4]) if len(sys.argv) > 4 else 0.0
+    # Retries are counted in the results; keep their warnings out of the report
+    logging.basicConfig(level=logging.ERROR)
+
+    with FakeOpenAIServer(latency='lognormal', latency_ms=latency_ms, latency_spread=0.5,
+                          rate_limit_rate=rate_limit_rate, retry_after=0.2) as server:
+        # Settings are read when the services are imported and created
+        os.environ['OPENAI_API_KEY'] = 'fake-key'
+        os.environ['OPENAI_BASE_URL'] = server.base_url
+
+        from data.models.customer import Customer
+        from business.services.email_service import EmailService
+
+        email_service = EmailService()
+        customers = [
+            Customer(customer_id=i, first_name=f"First{i}", last_name=f"Last{i}",
+                     company_name=f"Company {i}", title="Director", email=f"user{i}@example.com")
+            for i in range(count)
+        ]
+        template = "Invite {first_name} at {company} to a 20 minute product walkthrough next week."
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda customer: email_service.generate_personalized_email(customer, template, user_id=1),
+                          customers))
+        elapsed = time.monotonic() - started
+
+        print(f"Generated {count} emails with {threads} threads in {elapsed:.2f}s "
+              f"({count / elapsed:.1f} emails/s)")
+        for stage, stats in email_service.get_metrics()['openai_usage']['stages'].items():
+            print(f"  {stage:<18} calls={stats['calls']:<5} retries={stats['retries']:<4} "
+                  f"p50={stats['p50_ms']:.0f}ms p95={stats['p95_ms']:.0f}ms p99={stats['p99_ms']:.0f}ms "
+                  f"cached={stats['cached_prompt_ratio']:.0%}")
+        print(f"Server: {json.dumps(server.get_stats())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load and resilience testing.
+
+Replies are deterministic for a given request, token usage is estimated
+locally, and latency, 429 and 5xx responses are injected from a seeded
+random source, so generation throughput can be measured offline.
+
+Start it from a test:
+
+    with FakeOpenAIServer(latency='lognormal', latency_ms=300, rate_limit_rate=0.05) as server:
+        ...  # point OPENAI_BASE_URL at server.base_url
+
+or from the command line, then run the app with OPENAI_BASE_URL and any
+OPENAI_API_KEY:
+
+    python tests/fake_openai_server.py --port 8090 --latency lognormal --latency-ms 300
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Set
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from business.services.token_budget import (
+    MESSAGE_OVERHEAD_TOKENS, WORD_PIECE_PATTERN, estimate_prompt_tokens, estimate_tokens, truncate_to_tokens
+)
+
+
+LATENCY_DISTRIBUTIONS = ('constant', 'uniform', 'normal', 'lognormal', 'exponential')
+
+BODY_SENTENCES = [
+    "I hope this note finds you well.",
+    "I wanted to follow up on the ideas we discussed for the coming quarter.",
+    "Teams like yours have been using MyCRM to keep every customer conversation in one place.",
+    "Our onboarding specialists can have your workspace ready within a week.",
+    "I would be glad to walk you through a short demonstration at a time that suits you.",
+    "Please let me know if there is anything I can prepare ahead of our conversation.",
+    "Thank you for your time and for considering MyCRM.",
+]
+
+SUBJECT_LINES = [
+    "Following up on your plans",
+    "A quick idea for your team",
+    "Next steps with MyCRM",
+    "Time for a short demo?",
+]
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """Threaded HTTP server that does not report clients hanging up mid-reply."""
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients abandon requests at their deadline or when a hedged duplicate wins
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def build_reply(messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> str:
+    """Build a deterministic reply that suits the kind of prompt the app sends."""
+    prompt = '\n'.join(str(message.get('content', '')) for message in messages)
+    choice = random.Random(hashlib.sha256(prompt.encode('utf-8')).hexdigest())
+    lowered = prompt.lower()
+
+    batch_ids = re.findall(r'<email id="(\d+)">', prompt)
+    batch_customers = re.findall(r'- customer_id (\d+): Name: ([^;]*); Company: ([^;]*);', prompt)
+    if batch_customers and '"customer_id"' in prompt:
+        reply = json.dumps([
+            {
+                'customer_id': int(customer_id),
+                'subject': choice.choice(SUBJECT_LINES),
+                'body': f"Dear {name},\n\n{' '.join(choice.sample(BODY_SENTENCES, k=3))} "
+                        f"I look forward to hearing how things are going at {company}.\n\nBest regards,\nMyCRM Team"
+            }
+            for customer_id, name, company in batch_customers
+        ])
+    elif batch_ids and '"results"' in prompt:
+        reply = json.dumps({'results': [
+            {'id': int(email_id), 'verdict': 'APPROVED', 'reason': "Professional business communication."}
+            for email_id in batch_ids
+        ]})
+    elif 'approved:' in lowered and 'violation:' in lowered:
+        reply = "APPROVED: Professional business communication with no sensitive content."
+    elif 'subject line' in lowered and 'no subject line' not in lowered:
+        reply = choice.choice(SUBJECT_LINES)
+    else:
+        greeting = "Dear {name}," if 'placeholder' in lowered else "Hello,"
+        sentences = choice.sample(BODY_SENTENCES, k=4)
+        reply = f"{greeting}\n\n{' '.join(sentences)}\n\nBest regards,\nMyCRM Team"
+
+    return truncate_to_tokens(reply, max_tokens, marker="") if max_tokens else reply
+
+
+class FakeOpenAIServer:
+    """A threaded HTTP server speaking enough of the chat completions API for EmailService.
+
+    latency_ms is the mean (the median for lognormal) time before a reply or
+    the first streamed chunk; latency_spread is the distribution's width in
+    milliseconds (sigma for lognormal). error_rate and rate_limit_rate are the
+    fractions of requests answered with 500 and 429.
+
+    Like the provider's prompt cache, prompt prefixes of at least
+    cache_min_tokens are remembered in steps of cache_block_tokens, and the
+    longest one a later prompt starts with is reported as its cached tokens.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: str = 'constant',
+                 latency_ms: float = 0.0, latency_spread: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after: float = 1.0, stream_chunk_ms: float = 0.0,
+                 cache_min_tokens: int = 1024, cache_block_tokens: int = 128, seed: int = 0):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{latency}', expected one of {LATENCY_DISTRIBUTIONS}")
+
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.latency_spread = latency_spread
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stream_chunk_ms = stream_chunk_ms
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_block_tokens = cache_block_tokens
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {'connections': 0, 'requests': 0, 'completions': 0, 'streams': 0, 'rate_limited': 0,
+                       'server_errors': 0, 'in_flight': 0, 'max_in_flight': 0, 'prompt_tokens': 0,
+                       'cached_tokens': 0}
+        self._prompt_cache: Set[str] = set()
+        self._httpd = _QuietHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """The URL to configure as OPENAI_BASE_URL."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'FakeOpenAIServer':
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-openai', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> 'FakeOpenAIServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get connection and request counts, including the highest number served at once."""
+        with self._lock:
+            return dict(self._stats)
+
+    def sample_latency(self) -> float:
+        """Draw one response latency in seconds."""
+        with self._lock:
+            if self.latency == 'uniform':
+                value = self._random.uniform(self.latency_ms - self.latency_spread, self.latency_ms + self.latency_spread)
+            elif self.latency == 'normal':
+                value = self._random.gauss(self.latency_ms, self.latency_spread)
+            elif self.latency == 'lognormal':
+                value = self._random.lognormvariate(math.log(max(self.latency_ms, 1e-3)), self.latency_spread)
+            elif self.latency == 'exponential':
+                value = self._random.expovariate(1.0 / self.latency_ms) if self.latency_ms > 0 else 0.0
+            else:
+                value = self.latency_ms
+        return max(value, 0.0) / 1000.0
+
+    def choose_fault(self) -> Optional[int]:
+        """Pick the status code to inject for a request, or None to answer normally."""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def lookup_prompt_cache(self, messages: List[Dict[str, Any]]) -> int:
+        """Get the prompt tokens found in the cache, then cache the prompt's own prefixes."""
+        digest = hashlib.sha256()
+        tokens = 0
+        boundary = self.cache_min_tokens
+        prefixes = []
+        for message in messages:
+            digest.update(str(message.get('role', '')).encode('utf-8'))
+            tokens += MESSAGE_OVERHEAD_TOKENS
+            for piece in WORD_PIECE_PATTERN.findall(str(message.get('content') or '')):
+                digest.update(piece.encode('utf-8'))
+                tokens += estimate_tokens(piece)
+                while tokens >= boundary:
+                    prefixes.append((boundary, digest.copy().hexdigest()))
+                    boundary += self.cache_block_tokens
+
+        with self._lock:
+            cached = max((length for length, key in prefixes if key in self._prompt_cache), default=0)
+            if len(self._prompt_cache) > 100000:
+                self._prompt_cache.clear()
+            self._prompt_cache.update(key for _, key in prefixes)
+        return cached
+
+    def _count(self, name: str, delta: int = 1):
+        """Update a request counter."""
+        with self._lock:
+            self._stats[name] += delta
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._stats['in_flight'])
+
+    def _make_handler(self):
+        """Build the request handler class bound to this server."""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; Nagle would hold the body for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                server._count('connections')
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if not self.path.rstrip('/').endswith('/models'):
+                    self._send_json(404, {'error': {'message': f"Unknown path {self.path}", 'type': 'invalid_request_error'}})
+                    return
+                self._send_json(200, {'object': 'list', 'data': [
+                    {'id': 'fake-model', 'object': 'model', 'created': 0, 'owned_by': 'fake-openai'}
+                ]})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self._send_json(404, {'error': {'message': f"Unknown path {self.path}", 'type': 'invalid_request_error'}})
+                    return
+
+                server._count('requests')
+                server._count('in_flight')
+                try:
+                    self._handle_completion(json.loads(body or b'{}'))
+                finally:
+                    server._count('in_flight', -1)
+
+            def _handle_completion(self, request: Dict[str, Any]):
+                time.sleep(server.sample_latency())
+
+                fault = server.choose_fault()
+                if fault == 429:
+                    server._count('rate_limited')
+                    self._send_json(429, {'error': {'message': "Rate limit reached (injected)",
+                                                    'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                                    {'Retry-After': str(server.retry_after)})
+                    return
+                if fault == 500:
+                    server._count('server_errors')
+                    self._send_json(500, {'error': {'message': "Internal server error (injected)",
+                                                    'type': 'server_error'}})
+                    return
+
+                messages = request.get('messages', [])
+                reply = build_reply(messages, request.get('max_tokens'))
+                usage = {
+                    'prompt_tokens': estimate_prompt_tokens(messages),
+                    'completion_tokens': estimate_tokens(reply),
+                    'prompt_tokens_details': {'cached_tokens': server.lookup_prompt_cache(messages)}
+                }
+                usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+                server._count('prompt_tokens', usage['prompt_tokens'])
+                server._count('cached_tokens', usage['prompt_tokens_details']['cached_tokens'])
+                completion_id = f"chatcmpl-fake-{hashlib.sha1(reply.encode('utf-8')).hexdigest()[:12]}"
+                model = request.get('model', 'fake-model')
+
+                if request.get('stream'):
+                    server._count('streams')
+                    include_usage = (request.get('stream_options') or {}).get('include_usage', False)
+                    self._send_stream(completion_id, model, reply, usage if include_usage else None)
+                    return
+
+                server._count('completions')
+                self._send_json(200, {
+                    'id': completion_id,
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply},
+                                 'finish_reason': 'stop'}],
+                    'usage': usage
+                })
+
+            def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, completion_id: str, model: str, reply: str, usage: Optional[Dict[str, int]]):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+
+                def chunk(choices: List[Dict[str, Any]], **extra) -> bytes:
+                    payload = {'id': completion_id, 'object': 'chat.completion.chunk',
+                               'created': int(time.time()), 'model': model, 'choices': choices, **extra}
+                    return f"data: {json.dumps(payload)}\n\n".encode('utf-8')
+
+                pieces = reply.split(' ')
+                for index, piece in enumerate(pieces):
+                    content = piece if index == len(pieces) - 1 else piece + ' '
+                    self.wfile.write(chunk([{'index': 0, 'delta': {'role': 'assistant', 'content': content},
+                                             'finish_reason': None}]))
+                    self.wfile.flush()
+                    if server.stream_chunk_ms:
+                        time.sleep(server.stream_chunk_ms / 1000.0)
+                self.wfile.write(chunk([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]))
+                if usage:
+                    self.wfile.write(chunk([], usage=usage))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    """Run the fake server until interrupted."""
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the OpenAI chat completions API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', choices=LATENCY_DISTRIBUTIONS, default='constant')
+    parser.add_argument('--latency-ms', type=float, default=200.0, help='Mean latency (median for lognormal)')
+    parser.add_argument('--latency-spread', type=float, default=0.0,
+                        help='Distribution width in ms (sigma for lognormal)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--stream-chunk-ms', type=float, default=0.0, help='Delay between streamed chunks')
+    parser.add_argument('--cache-min-tokens', type=int, default=1024, help='Shortest prompt prefix that is cached')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        host=args.host, port=args.port, latency=args.latency, latency_ms=args.latency_ms,
+        latency_spread=args.latency_spread, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after, stream_chunk_ms=args.stream_chunk_ms,
+        cache_min_tokens=args.cache_min_tokens, seed=args.seed
+    )
+    print(f"Fake OpenAI server listening; set OPENAI_BASE_URL={server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+        print(json.dumps(server.get_stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
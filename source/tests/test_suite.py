@@ -3,22 +3,82 @@ Comprehensive test suite for MyCRM application.
 Tests core functionality across all layers.
 """
 
+import asyncio
+import html
+import json
 import os
+import re
+import smtplib
 import sys
+import tempfile
+import threading
+import time
 import unittest
 import logging
-from datetime import datetime
+import openai
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+from email.mime.text import MIMEText
 
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from data.models.customer import Customer
 from data.models.user import User, Role
-from data.models.email_log import EmailLog
-from data.factory import repository_factory
+from data.models.email_log import (
+    EmailLog, GENERATION_PATH_CIRCUIT_OPEN, GENERATION_PATH_DEADLINE, GENERATION_PATH_OPENAI, GENERATION_PATH_OPENAI_BATCH,
+    GENERATION_PATH_REUSED
+)
+from data.models.email_job import EmailJob, EmailJobItem
+from data.factory import RepositoryFactory, repository_factory
+from data.models.email_outbox import EmailOutboxMessage
+from data.repositories.mock_repositories import MockComplianceVerdictRepository, MockEmailOutboxRepository
+from data.repositories.sqlite_repositories import (
+    SqliteComplianceVerdictRepository, SqliteDatabase, SqliteEmailJobRepository, SqliteEmailLogRepository,
+    SqliteEmailOutboxRepository
+)
 from business.services.customer_service import CustomerService
 from business.services.user_service import UserService
 from business.services.email_service import EmailService
+from business.services.compliance_cache import ComplianceVerdictCache
+from business.services.prompts import COMPLIANCE_REVIEWS
+from business.services.template_similarity import TemplateIndex, hamming_distance, simhash
+from business.services.email_job_service import EmailJobService
+from business.services.async_email_service import AsyncEmailService
+from business.services.template_engine import compile_template
+from business.services.openai_client import OpenAIClientPool, openai_client_pool
+from business.services.openai_usage import OpenAIUsageTracker, openai_usage_tracker
+from business.services.circuit_breaker import (
+    CircuitBreaker, CircuitOpenError, is_openai_provider_failure, openai_circuit_breaker
+)
+from business.services.deadlines import Deadline, RequestHedger, deadline_scope, get_current_deadline
+from business.services.model_router import ModelRouter, model_router
+from business.services.openai_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, OpenAIScheduler, priority_scope
+from business.services.token_budget import TokenBudgetExceeded, estimate_tokens, fit_request, truncate_to_tokens
+from business.services.rate_limiter import TokenBucket, OpenAIRateLimiter, parse_retry_after
+from business.services.smtp_pool import SMTPConnectionPool, smtp_pool
+from business.services.single_flight import SingleFlight, idempotency_store
+from business.services.smtp_dispatcher import DomainThrottle, ParallelSMTPDispatcher, get_recipient_domain
+from tests.fake_openai_server import FakeOpenAIServer
+
+
+class OpenAITestCase(unittest.TestCase):
+    """Base class for tests that make OpenAI calls.
+    
+    The OpenAI circuit breaker is shared by the whole process, so each test
+    starts and ends with it closed; otherwise failures in one test, such as
+    calls made with a real OPENAI_API_KEY and no reachable server, would get
+    the next test's calls refused.
+    """
+    
+    def setUp(self):
+        """Start with a closed OpenAI circuit."""
+        openai_circuit_breaker.reset()
+    
+    def tearDown(self):
+        """Leave a closed OpenAI circuit for the next test."""
+        openai_circuit_breaker.reset()
 
 
 class TestDataModels(unittest.TestCase):
@@ -109,6 +169,20 @@ class TestRepositoryFactory(unittest.TestCase):
         self.assertIsNotNone(user_repo)
         self.assertIsNotNone(email_repo)
         self.assertIsNotNone(role_repo)
+    
+    def test_compliance_verdict_store_follows_email_log_backend(self):
+        """Test that verdicts are kept in memory without SQL Server and in SQLite only when configured."""
+        with tempfile.TemporaryDirectory() as directory, \
+                patch('data.factory.db_config.test_connection', return_value=False):
+            path = os.path.join(directory, 'verdicts.db')
+            with patch.dict(os.environ, {'COMPLIANCE_CACHE_STORE': 'auto', 'COMPLIANCE_CACHE_PATH': path}):
+                factory = RepositoryFactory()
+                self.assertIsInstance(factory.get_compliance_verdict_repository(), MockComplianceVerdictRepository)
+                self.assertFalse(os.path.exists(path))
+            with patch.dict(os.environ, {'COMPLIANCE_CACHE_STORE': 'sqlite', 'COMPLIANCE_CACHE_PATH': path}):
+                factory.reset()
+                self.assertIsInstance(factory.get_compliance_verdict_repository(), SqliteComplianceVerdictRepository)
+                self.assertTrue(os.path.exists(path))
 
 
 class TestCustomerService(unittest.TestCase):
@@ -215,11 +289,12 @@ class TestUserService(unittest.TestCase):
         self.assertTrue(updated)
 
 
-class TestEmailService(unittest.TestCase):
+class TestEmailService(OpenAITestCase):
     """Test email service functionality."""
     
     def setUp(self):
         """Set up test environment."""
+        super().setUp()
         self.service = EmailService()
     
     def test_get_all_email_logs(self):
@@ -251,6 +326,62 @@ class TestEmailService(unittest.TestCase):
             # Expected if no OpenAI API key is configured
             self.assertIn("API", str(e).upper())
     
+    def test_generate_campaign_emails(self):
+        """Test campaign generation fills the draft for each customer."""
+        self.service.openai_config['api_key'] = ''
+        customers = [
+            Customer(customer_id=1, first_name="John", last_name="Doe",
+                     company_name="Test Corp", email="john@testcorp.com"),
+            Customer(customer_id=2, first_name="Jane", last_name="Smith",
+                     company_name="Other Inc", email="jane@other.com")
+        ]
+
+        email_logs = self.service.generate_campaign_emails(
+            customers, "News for {company}, {first_name}", user_id=1
+        )
+
+        self.assertEqual(len(email_logs), 2)
+        self.assertIn("News for Test Corp, John", email_logs[0].generated_email)
+        self.assertIn("Dear Jane Smith", email_logs[1].generated_email)
+        self.assertEqual(email_logs[1].subject, "Message from MyCRM - Other Inc")
+
+    def test_campaign_with_other_fields_reviews_each_email(self):
+        """Test that the draft verdict is only copied when the draft uses name, company or title placeholders."""
+        self.service.openai_config['api_key'] = ''
+        customers = [Customer(customer_id=number, first_name="Ann", last_name="Lee", company_name="Acme",
+                              email=f"ann{number}@acme.com", linkedin_url=f"https://example.com/ann{number}")
+                     for number in (1, 2)]
+
+        with patch.object(self.service, '_perform_compliance_checks',
+                          wraps=self.service._perform_compliance_checks) as checks:
+            self.service.generate_campaign_emails(customers, "Hello {first_name}", user_id=1)
+            self.assertEqual(checks.call_count, 1)
+            checks.reset_mock()
+            email_logs = self.service.generate_campaign_emails(customers, "See {linkedin_url}", user_id=1)
+
+        self.assertEqual(checks.call_count, 3)
+        self.assertEqual([call.args[0].generated_email for call in checks.call_args_list[1:]],
+                         [email_log.generated_email for email_log in email_logs])
+        self.assertIn("See https://example.com/ann2", email_logs[1].generated_email)
+
+    def test_stream_personalized_email(self):
+        """Test streamed generation yields the body and returns the saved log."""
+        self.service.openai_config['api_key'] = ''
+        customer = Customer(customer_id=1, first_name="John", last_name="Doe",
+                            company_name="Test Corp", email="john@testcorp.com")
+
+        stream = self.service.stream_personalized_email(customer, "Welcome aboard", user_id=1)
+        chunks = []
+        try:
+            while True:
+                chunks.append(next(stream))
+        except StopIteration as done:
+            email_log = done.value
+
+        self.assertIn("Welcome aboard", ''.join(chunks))
+        self.assertIsNotNone(email_log.email_log_id)
+        self.assertEqual(email_log.generated_email, ''.join(chunks))
+
     def test_compliance_check(self):
         """Test content compliance checking."""
         # Test basic compliance checking functionality
@@ -270,6 +401,1117 @@ class TestEmailService(unittest.TestCase):
             pass
 
 
+class TestAsyncEmailService(OpenAITestCase):
+    """Test the asyncio email pipeline."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        super().setUp()
+        self.service = AsyncEmailService(max_concurrency=2)
+        self.service.openai_config['api_key'] = ''
+    
+    def test_run_campaign(self):
+        """Test that the campaign runner generates an email per customer and reports each result."""
+        customers = repository_factory.get_customer_repository().get_all()[:3]
+        reported = []
+        
+        email_logs = asyncio.run(self.service.run_campaign(
+            customers, "Hello {first_name}", user_id=1,
+            on_result=lambda customer, email_log, error: reported.append(error)
+        ))
+        
+        self.assertEqual(len(email_logs), 3)
+        self.assertEqual(reported, [None, None, None])
+        self.assertIn(customers[0].first_name, email_logs[0].generated_email)
+        self.assertIsNotNone(email_logs[0].email_log_id)
+
+    def test_send_queues_to_outbox_instead_of_smtp(self):
+        """Test that async sending queues outbox messages and leaves delivery to the dispatcher."""
+        email_service = self.service.email_service
+        email_service.outbox_repository = MockEmailOutboxRepository(email_service.email_log_repository)
+        customer = repository_factory.get_customer_repository().get_all()[0]
+        email_logs = [email_service.generate_personalized_email(customer, "Hello", user_id=1) for _ in range(2)]
+
+        with patch.object(self.service, '_send_smtp_email', side_effect=AssertionError("sent directly")), \
+                patch.object(email_service, '_wake_outbox_dispatcher') as wake:
+            self.assertTrue(asyncio.run(self.service.send_email(email_logs[0].email_log_id)))
+            results = asyncio.run(self.service.send_bulk_emails([email_logs[1].email_log_id]))
+
+        self.assertEqual(results, {email_logs[1].email_log_id: True})
+        self.assertEqual(wake.call_count, 2)
+        for email_log in email_logs:
+            message = email_service.outbox_repository.get_by_email_log_id(email_log.email_log_id)
+            self.assertEqual(message.status, 'pending')
+            self.assertFalse(email_service.email_log_repository.get_by_id(email_log.email_log_id).email_sent)
+
+
+    def test_hung_openai_call_stops_at_task_timeout(self):
+        """Test that an async OpenAI call that never answers is abandoned at its task's timeout."""
+        async def hang(**request):
+            await asyncio.sleep(60)
+        
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=hang)))
+        customer = repository_factory.get_customer_repository().get_all()[0]
+        started = time.monotonic()
+        with patch.dict(self.service.openai_config, {'api_key': 'test-key'}), \
+                patch.dict(self.service.security_config, {'enable_hipaa_compliance': False,
+                                                          'enable_ai_compliance': False}), \
+                patch.dict(model_router.get_task('body'), {'timeout': 0.2}), \
+                patch.dict(model_router.get_task('subject'), {'timeout': 0.2}), \
+                patch.object(self.service, '_get_client', return_value=client):
+            email_log = asyncio.run(self.service.generate_personalized_email(customer, "Hello", user_id=1))
+        
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(email_log.generation_path, GENERATION_PATH_DEADLINE)
+
+class TestTemplateEngine(unittest.TestCase):
+    """Test compiled template rendering."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        self.customer = Customer(first_name="Jane", last_name="Doe", company_name="Acme", email="jane@acme.com")
+    
+    def test_render_fields_and_defaults(self):
+        """Test customer fields, aliases, defaults and unknown placeholders."""
+        template = compile_template("Hi {name} ({email}) at {company}, {title|valued customer}. {unknown}")
+        self.assertEqual(
+            template.render_customer(self.customer),
+            "Hi Jane Doe (jane@acme.com) at Acme, valued customer. {unknown}"
+        )
+        self.assertEqual(template.placeholders, {'name', 'email', 'company', 'title', 'unknown'})
+    
+    def test_escaping(self):
+        """Test literal braces and value escaping."""
+        self.customer.company_name = "A&B"
+        template = compile_template("{{literal}} {company}")
+        self.assertEqual(template.render_customer(self.customer), "{literal} A&B")
+        self.assertEqual(template.render_customer(self.customer, escape=html.escape), "{literal} A&amp;B")
+    
+    def test_doubled_braces_render_as_single_braces(self):
+        """Test that {{ and }} in a user template are literal braces, not a placeholder in braces."""
+        email_service = EmailService()
+        email = email_service._generate_fallback_email(self.customer, "Code {{first_name}} for {first_name}: {{}}")
+        # Before compiled templates the text was left as written, so this came out as "Code {Jane} for Jane: {{}}"
+        self.assertIn("Code {first_name} for Jane: {}", email)
+    
+    def test_compiled_templates_are_cached(self):
+        """Test that a template is parsed once and can render many customers."""
+        template = compile_template("Dear {first_name}")
+        self.assertIs(compile_template("Dear {first_name}"), template)
+        other = Customer(first_name="John")
+        self.assertEqual(template.render_many([self.customer, other]), ["Dear Jane", "Dear John"])
+
+
+class TestEmailJobService(OpenAITestCase):
+    """Test background email generation jobs."""
+    
+    def setUp(self):
+        """Set up test environment."""
+        super().setUp()
+        self.service = EmailJobService()
+        self.service.email_service.openai_config['api_key'] = ''
+    
+    def _wait_for(self, job_id):
+        """Wait for a job to finish running."""
+        for _ in range(100):
+            job = self.service.get_job(job_id)
+            if job.is_finished:
+                return job
+            time.sleep(0.05)
+        self.fail(f"Job {job_id} did not finish")
+    
+    def test_generation_job(self):
+        """Test that a job processes every recipient and records the email logs."""
+        customers = repository_factory.get_customer_repository().get_all()[:2]
+        job = self.service.submit_generation_job(customers, "Hello {first_name}", user_id=1, campaign_mode=True)
+        
+        job = self._wait_for(job.job_id)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.progress_percent, 100.0)
+        self.assertEqual(len(job.email_log_ids), 2)
+    
+    def test_cancel_job(self):
+        """Test that cancelling a job skips the remaining recipients."""
+        customers = repository_factory.get_customer_repository().get_all() * 20
+        job = self.service.submit_generation_job(customers, "Hello", user_id=1)
+        self.service.cancel_job(job.job_id)
+        
+        job = self._wait_for(job.job_id)
+        self.assertEqual(job.status, 'cancelled')
+    
+    def test_sqlite_job_leases(self):
+        """Test that leased items are fenced to their worker and reclaimed after expiry."""
+        with tempfile.TemporaryDirectory() as directory:
+            repository = SqliteEmailJobRepository(SqliteDatabase(os.path.join(directory, 'jobs.db')))
+            customer = repository_factory.get_customer_repository().get_all()[0]
+            job = repository.create(EmailJob(user_id=1, template_text="Hello", items=[
+                EmailJobItem(customer_id=customer.customer_id, customer=customer, position=3)
+            ]))
+            
+            claimed = repository.claim_items('worker-a', limit=5, lease_seconds=0, max_attempts=3)
+            self.assertEqual(len(claimed), 1)
+            self.assertEqual(claimed[0].customer.email, customer.email)
+            self.assertEqual(claimed[0].position, 3)
+            self.assertEqual(repository.get_without_items(job.job_id).items, [])
+            
+            # The expired lease lets another worker take the item over
+            reclaimed = repository.claim_items('worker-b', limit=5, lease_seconds=60, max_attempts=3)
+            self.assertEqual(len(reclaimed), 1)
+            
+            claimed[0].status = 'completed'
+            self.assertFalse(repository.complete_item(claimed[0], 'worker-a'))
+            reclaimed[0].status = 'completed'
+            self.assertTrue(repository.complete_item(reclaimed[0], 'worker-b'))
+            self.assertEqual(repository.finish_job(job.job_id).status, 'completed')
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test OpenAI rate limiting and backoff."""
+    
+    def test_token_bucket(self):
+        """Test that a bucket grants its capacity and then asks callers to wait."""
+        bucket = TokenBucket(capacity=2, refill_per_second=1)
+        self.assertEqual(bucket.try_consume(1), 0)
+        self.assertEqual(bucket.try_consume(1), 0)
+        self.assertGreater(bucket.try_consume(1), 0)
+    
+    def test_throttling_reduces_concurrency(self):
+        """Test that sustained throttling halves the concurrency limit."""
+        limiter = OpenAIRateLimiter(requests_per_minute=60, tokens_per_minute=1000, max_concurrency=8)
+        limiter.record_throttle()
+        limiter.record_throttle()
+        state = limiter.get_state()
+        self.assertEqual(state['concurrency_limit'], 4)
+        self.assertEqual(state['total_throttled'], 2)
+    
+    def test_backoff_respects_retry_after(self):
+        """Test that backoff never undercuts the server's retry hint."""
+        limiter = OpenAIRateLimiter(requests_per_minute=60, tokens_per_minute=1000, max_concurrency=1)
+        self.assertGreaterEqual(limiter.get_backoff_delay(0, retry_after=5), 5)
+        self.assertLessEqual(limiter.get_backoff_delay(10), limiter.backoff_max)
+    
+    def test_parse_retry_after(self):
+        """Test retry hints from headers and error messages."""
+        class Response:
+            headers = {'retry-after-ms': '1500'}
+        
+        class HeaderError(Exception):
+            response = Response()
+        
+        self.assertEqual(parse_retry_after(HeaderError()), 1.5)
+        self.assertEqual(parse_retry_after(Exception("Please try again in 250ms.")), 0.25)
+        self.assertIsNone(parse_retry_after(Exception("Bad request")))
+
+
+class TestOpenAIScheduler(unittest.TestCase):
+    """Test priority classes and fair queuing of OpenAI calls."""
+    
+    def _wait_for_queued(self, scheduler, priority, count):
+        """Wait until count calls of priority are queued."""
+        give_up = time.monotonic() + 5
+        while scheduler.get_state()['classes'][priority]['queued'] < count and time.monotonic() < give_up:
+            time.sleep(0.005)
+        self.assertEqual(scheduler.get_state()['classes'][priority]['queued'], count)
+    
+    def test_interactive_calls_go_before_bulk(self):
+        """Test that bulk work leaves the reserved turn free and waits behind interactive calls."""
+        limiter = OpenAIRateLimiter(requests_per_minute=600, tokens_per_minute=100000, max_concurrency=2)
+        scheduler = OpenAIScheduler(limiter, interactive_reserve=1)
+        
+        with priority_scope(PRIORITY_BULK):
+            bulk_turn = scheduler.acquire(100)
+            with self.assertRaises(TimeoutError):
+                scheduler.acquire(100, timeout=0.05)
+        interactive_turn = scheduler.acquire(100, timeout=0.05)
+        
+        granted = []
+        
+        def call(priority):
+            with priority_scope(priority), scheduler.turn(100):
+                granted.append(priority)
+        
+        bulk = threading.Thread(target=call, args=(PRIORITY_BULK,))
+        bulk.start()
+        self._wait_for_queued(scheduler, PRIORITY_BULK, 1)
+        interactive = threading.Thread(target=call, args=(PRIORITY_INTERACTIVE,))
+        interactive.start()
+        self._wait_for_queued(scheduler, PRIORITY_INTERACTIVE, 1)
+        self.assertEqual(scheduler.get_state()['queued'], 2)
+        
+        scheduler.release(bulk_turn)
+        interactive.join(5)
+        scheduler.release(interactive_turn)
+        bulk.join(5)
+        
+        self.assertEqual(granted, [PRIORITY_INTERACTIVE, PRIORITY_BULK])
+        state = scheduler.get_state()['classes']
+        self.assertEqual(state[PRIORITY_BULK]['abandoned'], 1)
+        self.assertEqual(state[PRIORITY_BULK]['peak_queued'], 1)
+        self.assertEqual(state[PRIORITY_INTERACTIVE]['active'] + state[PRIORITY_BULK]['active'], 0)
+    
+    def test_users_share_a_class_fairly(self):
+        """Test that a user's single call is not queued behind another user's backlog."""
+        limiter = OpenAIRateLimiter(requests_per_minute=600, tokens_per_minute=100000, max_concurrency=1)
+        scheduler = OpenAIScheduler(limiter, interactive_reserve=0)
+        granted = []
+        
+        def call(user_id):
+            with openai_usage_tracker.scope(user_id=user_id), priority_scope(PRIORITY_BULK), scheduler.turn(100):
+                granted.append(user_id)
+        
+        with priority_scope(PRIORITY_BULK):
+            held = scheduler.acquire(100)
+        threads = []
+        for count, user_id in enumerate([1, 1, 1, 1, 2], start=1):
+            threads.append(threading.Thread(target=call, args=(user_id,)))
+            threads[-1].start()
+            self._wait_for_queued(scheduler, PRIORITY_BULK, count)
+        self.assertEqual(scheduler.get_state()['classes'][PRIORITY_BULK]['queued_users'], 2)
+        
+        scheduler.release(held)
+        for thread in threads:
+            thread.join(5)
+        
+        self.assertEqual(granted, [1, 2, 1, 1, 1])
+
+
+class TestOpenAIUsage(OpenAITestCase):
+    """Test OpenAI call instrumentation."""
+    
+    def test_scopes_attribute_usage(self):
+        """Test that calls are collected per scope and totalled per user and campaign."""
+        tracker = OpenAIUsageTracker(prompt_cost_per_1k=1.0, completion_cost_per_1k=2.0)
+        usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=500)
+        
+        with tracker.scope(user_id=7, campaign_id='job-1'):
+            with tracker.scope() as email_usage:
+                tracker.record('body', 'gpt-test', usage, latency=0.2, retries=1)
+            tracker.record('hipaa_compliance', 'gpt-test', None, latency=0.1, retries=0, success=False)
+        
+        self.assertEqual(email_usage.get_stage_totals()['body']['cost'], 2.0)
+        self.assertEqual(email_usage.get_stage_totals()['body']['retries'], 1)
+        state = tracker.get_state()
+        self.assertEqual(state['by_user'][7]['calls'], 2)
+        self.assertEqual(state['by_campaign']['job-1']['cost'], 2.0)
+        self.assertEqual(state['stages']['body']['p95_ms'], 200.0)
+        self.assertEqual(state['stages']['hipaa_compliance']['errors'], 1)
+    
+    def test_email_log_records_stage_usage(self):
+        """Test that a generated email carries per-stage token and cost totals."""
+        email_service = EmailService()
+        email_service.openai_config['api_key'] = 'test-key'
+        customer = repository_factory.get_customer_repository().get_all()[0]
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="APPROVED: fine"))],
+            usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20, total_tokens=120)
+        )
+        
+        with patch.object(email_service, '_create_chat_completion', return_value=response):
+            email_log = email_service.generate_personalized_email(customer, "Hello", user_id=1)
+        
+        self.assertEqual(email_log.openai_usage['body']['prompt_tokens'], 100)
+        self.assertEqual(email_log.openai_usage['subject']['calls'], 1)
+        self.assertGreater(email_log.openai_cost, 0)
+        self.assertIn('body', email_service.get_metrics()['openai_usage']['stages'])
+
+
+class TestTokenBudget(unittest.TestCase):
+    """Test local token estimation and request budgeting."""
+    
+    def test_estimate_and_truncate(self):
+        """Test that estimates track text length and truncation respects the budget."""
+        text = "Thank you for your interest in our quarterly planning workshop. " * 20
+        self.assertGreater(estimate_tokens(text), 200)
+        self.assertEqual(estimate_tokens(""), 0)
+        
+        truncated = truncate_to_tokens(text, 50)
+        self.assertTrue(truncated.endswith("[...]"))
+        self.assertLessEqual(estimate_tokens(truncated), 55)
+        self.assertEqual(truncate_to_tokens("Short text", 50), "Short text")
+    
+    def test_fit_request_to_context(self):
+        """Test that max_tokens shrinks to the remaining context and oversized prompts are rejected."""
+        request = {'model': 'gpt-test', 'messages': [{'role': 'user', 'content': "word " * 900}], 'max_tokens': 500}
+        fitted = fit_request(request, context_window=1200, min_output_tokens=64)
+        self.assertLess(fitted['max_tokens'], 500)
+        self.assertEqual(request['max_tokens'], 500)
+        
+        with self.assertRaises(TokenBudgetExceeded):
+            fit_request(request, context_window=920, min_output_tokens=64)
+    
+    def test_body_budget_scales_with_template(self):
+        """Test that short templates get smaller reply budgets than long ones."""
+        email_service = EmailService()
+        short_budget = email_service._get_body_max_tokens("Quick hello")
+        long_budget = email_service._get_body_max_tokens("Please review our new pricing and onboarding plan. " * 10)
+        self.assertLess(short_budget, long_budget)
+        self.assertLessEqual(long_budget, model_router.get_task('body')['max_tokens'])
+
+
+class TestSingleFlight(OpenAITestCase):
+    """Test de-duplication of identical generation requests."""
+    
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that callers arriving while a call is in flight get its result."""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "result"
+        
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("key", work)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        while flight.get_state()['shared'] < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["result"] * 4)
+        self.assertEqual(flight.get_state()['in_flight'], 0)
+    
+    def test_idempotent_generate_returns_existing_email(self):
+        """Test that a repeated generate with the same idempotency key does not generate again."""
+        email_service = EmailService()
+        email_service.openai_config['api_key'] = ''
+        customer = repository_factory.get_customer_repository().get_all()[0]
+        
+        first = email_service.generate_personalized_email(customer, "Hello", user_id=1, idempotency_key="retry-key")
+        with patch.object(email_service, '_generate_personalized_email',
+                          side_effect=AssertionError("generated twice")):
+            repeated = email_service.generate_personalized_email(customer, "Hello", user_id=1,
+                                                                 idempotency_key="retry-key")
+        
+        self.assertEqual(repeated.email_log_id, first.email_log_id)
+        self.assertIsNone(idempotency_store.get("email:2:retry-key"))
+
+    def test_reused_idempotency_key_with_new_template_generates_again(self):
+        """Test that an idempotency key reused for a different template does not return the old email."""
+        email_service = EmailService()
+        email_service.openai_config['api_key'] = ''
+        customer = repository_factory.get_customer_repository().get_all()[0]
+
+        first = email_service.generate_personalized_email(customer, "Hello", user_id=1, idempotency_key="reused-key")
+        changed = email_service.generate_personalized_email(customer, "Goodbye", user_id=1,
+                                                            idempotency_key="reused-key")
+
+        self.assertNotEqual(changed.email_log_id, first.email_log_id)
+        self.assertIn("Goodbye", changed.generated_email)
+
+
+class TestFakeOpenAIServer(OpenAITestCase):
+    """Test the local OpenAI stand-in used for load testing."""
+    
+    def test_generate_email_against_fake_server(self):
+        """Test that EmailService generates and checks an email through the fake server."""
+        email_service = EmailService()
+        customer = repository_factory.get_customer_repository().get_all()[0]
+        
+        with FakeOpenAIServer() as server, \
+                patch.dict(email_service.openai_config, {'api_key': 'fake-key'}), \
+                patch.object(openai_client_pool, 'get_client',
+                             OpenAIClientPool(api_key='fake-key', base_url=server.base_url).get_client):
+            email_log = email_service.generate_personalized_email(customer, "Invite them to a demo", user_id=1)
+            stats = server.get_stats()
+        
+        self.assertIn("MyCRM Team", email_log.generated_email)
+        self.assertTrue(email_log.hipaa_compliance_check.startswith("APPROVED"))
+        self.assertEqual(stats['completions'], stats['requests'])
+        self.assertGreater(email_log.openai_usage['body']['completion_tokens'], 0)
+    
+    def test_injected_errors_and_streaming(self):
+        """Test 429 injection with Retry-After, and streamed replies that match non-streamed ones."""
+        request = {'model': 'gpt-test', 'messages': [{'role': 'user', 'content': "Write a short note"}]}
+        
+        with FakeOpenAIServer(rate_limit_rate=1.0, retry_after=2) as server:
+            client = openai.OpenAI(api_key='fake-key', base_url=server.base_url, max_retries=0)
+            with self.assertRaises(openai.RateLimitError) as raised:
+                client.chat.completions.create(**request)
+            self.assertEqual(raised.exception.response.headers['retry-after'], '2')
+        
+        with FakeOpenAIServer() as server:
+            client = openai.OpenAI(api_key='fake-key', base_url=server.base_url, max_retries=0)
+            reply = client.chat.completions.create(**request)
+            chunks = list(client.chat.completions.create(stream=True, stream_options={'include_usage': True},
+                                                         **request))
+        
+        streamed = ''.join(chunk.choices[0].delta.content for chunk in chunks
+                           if chunk.choices and chunk.choices[0].delta.content)
+        self.assertEqual(streamed, reply.choices[0].message.content)
+        self.assertEqual(chunks[-1].usage.completion_tokens, reply.usage.completion_tokens)
+
+    
+    def test_stalled_stream_is_cut_off_at_deadline(self):
+        """Test that a stream still arriving at its deadline falls back and counts against the circuit."""
+        email_service = EmailService()
+        customer = repository_factory.get_customer_repository().get_all()[0]
+        breaker = CircuitBreaker('Test', is_openai_provider_failure)
+        
+        with FakeOpenAIServer(stream_chunk_ms=100) as server, \
+                patch.dict(email_service.openai_config, {'api_key': 'fake-key'}), \
+                patch.dict(email_service.security_config,
+                           {'enable_hipaa_compliance': False, 'enable_ai_compliance': False}), \
+                patch.dict(model_router.get_task('body'), {'timeout': 0.3}), \
+                patch('business.services.email_service.openai_circuit_breaker', breaker), \
+                patch.object(openai_client_pool, 'get_client',
+                             OpenAIClientPool(api_key='fake-key', base_url=server.base_url).get_client):
+            started = time.monotonic()
+            stream = email_service.stream_personalized_email(customer, "Invite them to a demo", user_id=1)
+            chunks = []
+            try:
+                while True:
+                    chunks.append(next(stream))
+            except StopIteration as done:
+                email_log = done.value
+        
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertGreater(len(chunks), 0)
+        self.assertEqual(email_log.generation_path, GENERATION_PATH_DEADLINE)
+        self.assertEqual(breaker.get_state()['consecutive_failures'], 1)
+    
+    def test_pooled_client_reuses_warm_connections(self):
+        """Test that warm-up opens connections that later calls reuse."""
+        with FakeOpenAIServer() as server:
+            pool = OpenAIClientPool(api_key='fake-key', base_url=server.base_url, warmup_connections=3)
+            self.assertEqual(pool.warm_up(), 3)
+            self.assertIs(pool.get_client(), pool.get_client())
+            for _ in range(5):
+                pool.get_client().chat.completions.create(
+                    model='gpt-test', messages=[{'role': 'user', 'content': "Write a short note"}]
+                )
+            connections = server.get_stats()['connections']
+            pool.close()
+        
+        self.assertLessEqual(connections, 3)
+        self.assertEqual(pool.get_state()['warmed_connections'], 3)
+
+class TestDeadlines(OpenAITestCase):
+    """Test generation deadlines and request hedging."""
+    
+    def test_slow_body_falls_back_at_deadline(self):
+        """Test that a body call slower than the generation deadline is abandoned for the template."""
+        email_service = EmailService()
+        customer = repository_factory.get_customer_repository().get_all()[0]
+        timeouts = []
+        
+        def slow_completion(request):
+            timeouts.append(request['timeout'])
+            time.sleep(min(request['timeout'], 2.0))
+            raise TimeoutError("read timed out")
+        
+        started = time.monotonic()
+        with patch.dict(email_service.openai_config, {'api_key': 'test-key', 'generation_deadline': 0.3}), \
+                patch.dict(email_service.security_config,
+                           {'enable_hipaa_compliance': False, 'enable_ai_compliance': False}), \
+                patch.object(email_service, '_create_chat_completion', side_effect=slow_completion):
+            email_log = email_service.generate_personalized_email(customer, "Hello", user_id=1)
+        
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(email_log.generation_path, GENERATION_PATH_DEADLINE)
+        self.assertIn(customer.full_name, email_log.generated_email)
+        self.assertEqual(len(timeouts), 1)
+        self.assertLessEqual(timeouts[0], 0.3)
+    
+    def test_hedge_wins_and_straggler_is_cancelled(self):
+        """Test that a call slower than its stage's percentile is raced and the loser cancelled."""
+        for _ in range(RequestHedger.MIN_SAMPLES):
+            openai_usage_tracker.record('hedge_test', 'gpt-test', None, 0.01, 0)
+        hedger = RequestHedger(percentile=95, min_delay=0.05)
+        attempts = []
+        straggler_cancelled = threading.Event()
+        
+        def call():
+            attempts.append(1)
+            if len(attempts) > 1:
+                return "hedge"
+            while not get_current_deadline().expired:
+                time.sleep(0.01)
+            straggler_cancelled.set()
+            return "primary"
+        
+        started = time.monotonic()
+        with deadline_scope(5):
+            result, hedged = hedger.call('hedge_test', call)
+        
+        self.assertEqual((result, hedged), ("hedge", True))
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertTrue(straggler_cancelled.wait(1))
+        self.assertEqual(hedger.get_state()['hedge_wins'], 1)
+
+
+class TestCircuitBreaker(OpenAITestCase):
+    """Test the OpenAI provider circuit breaker."""
+    
+    def _fail(self):
+        raise openai.APIConnectionError(request=None)
+    
+    def test_opens_probes_and_closes(self):
+        """Test that consecutive failures open the circuit and one successful probe closes it."""
+        breaker = CircuitBreaker('Test', is_openai_provider_failure, failure_threshold=3, open_seconds=0.1)
+        for _ in range(3):
+            with self.assertRaises(openai.APIConnectionError):
+                breaker.call(self._fail)
+        self.assertEqual(breaker.get_state()['state'], CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(lambda: self.fail("called while open"))
+        
+        time.sleep(0.15)
+        
+        def probe():
+            # Only one probe is let through while half-open
+            with self.assertRaises(CircuitOpenError):
+                breaker.call(lambda: self.fail("second probe"))
+            return "ok"
+        
+        self.assertEqual(breaker.call(probe), "ok")
+        self.assertEqual(breaker.get_state()['state'], CircuitBreaker.CLOSED)
+    
+    def test_cancelled_hedge_attempt_is_not_a_failure(self):
+        """Test that an attempt abandoned because the other hedged attempt won is not held against the provider."""
+        breaker = CircuitBreaker('Test', is_openai_provider_failure, failure_threshold=1)
+        parent = Deadline(10)
+        straggler = Deadline(10, parent)
+        
+        def time_out_after_losing():
+            straggler.cancel()
+            raise openai.APITimeoutError(request=None)
+        
+        with self.assertRaises(openai.APITimeoutError):
+            breaker.call(time_out_after_losing, abandoned=lambda: straggler.cancelled)
+        self.assertEqual(breaker.get_state()['state'], CircuitBreaker.CLOSED)
+        self.assertFalse(parent.cancelled)
+        
+        # The same failure in an attempt nobody gave up on opens the circuit
+        with self.assertRaises(openai.APIConnectionError):
+            breaker.call(self._fail, abandoned=lambda: parent.cancelled)
+        self.assertEqual(breaker.get_state()['state'], CircuitBreaker.OPEN)
+    
+    def test_open_circuit_falls_back_and_leaves_compliance_pending(self):
+        """Test that an open circuit skips OpenAI, and a recheck completes the pending reviews."""
+        email_service = EmailService()
+        customer = repository_factory.get_customer_repository().get_all()[0]
+        open_breaker = CircuitBreaker('Test', is_openai_provider_failure, failure_threshold=1, open_seconds=60)
+        with self.assertRaises(openai.APIConnectionError):
+            open_breaker.call(self._fail)
+        approved = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="APPROVED: fine"))],
+                                   usage=None)
+        
+        with patch.dict(email_service.openai_config, {'api_key': 'test-key'}), \
+                patch.dict(email_service.security_config,
+                           {'enable_hipaa_compliance': True, 'enable_ai_compliance': True}):
+            with patch('business.services.email_service.openai_circuit_breaker', open_breaker), \
+                    patch.object(email_service, '_create_chat_completion', side_effect=AssertionError("called")):
+                email_log = email_service.generate_personalized_email(customer, "Hello", user_id=1)
+            
+            self.assertEqual(email_log.generation_path, GENERATION_PATH_CIRCUIT_OPEN)
+            self.assertTrue(email_log.compliance_pending)
+            self.assertFalse(email_log.compliance_approved)
+            
+            # The provider is back: the recheck runs against a closed circuit of its own
+            with patch('business.services.email_service.openai_circuit_breaker',
+                       CircuitBreaker('Test', is_openai_provider_failure)), \
+                    patch.object(email_service, '_create_chat_completion', return_value=approved):
+                email_log = email_service.recheck_compliance(email_log.email_log_id)
+        
+        self.assertFalse(email_log.compliance_pending)
+        self.assertTrue(email_log.compliance_approved)
+
+
+class TestModelRouting(OpenAITestCase):
+    """Test per-task models and downgrades to a faster model."""
+    
+    def _route(self, model, fallback_model='', max_tokens=100, temperature=0.5, timeout=5.0, latency_budget=0.0):
+        return {'model': model, 'fallback_model': fallback_model, 'max_tokens': max_tokens,
+                'temperature': temperature, 'timeout': timeout, 'latency_budget': latency_budget}
+    
+    def test_each_task_uses_its_own_settings(self):
+        """Test that requests and stage timeouts follow their task's route."""
+        email_service = EmailService()
+        customer = Customer(customer_id=1, first_name="Ann", last_name="Lee", company_name="Co", email="a@example.com")
+        router = ModelRouter({
+            'body': self._route('gpt-large', max_tokens=400, temperature=0.7),
+            'subject': self._route('gpt-small', max_tokens=20, temperature=0.2, timeout=2.0),
+            'hipaa': self._route('gpt-review', max_tokens=80, temperature=0.0, timeout=7.0),
+            'ai_check': self._route('gpt-ethics', max_tokens=90, temperature=0.1)
+        })
+        
+        with patch('business.services.email_service.model_router', router):
+            body = email_service._build_email_request(customer, "Hello")
+            subject = email_service._build_subject_request(customer, "Hello")
+            hipaa = email_service._build_hipaa_request("Dear Ann")
+            ai_batch = email_service._build_compliance_batch_request('ai', ["Dear Ann"])
+        
+        self.assertEqual((body['model'], body['temperature']), ('gpt-large', 0.7))
+        self.assertEqual((subject['model'], subject['max_tokens'], subject['temperature']), ('gpt-small', 20, 0.2))
+        self.assertEqual((hipaa['model'], hipaa['max_tokens'], hipaa['temperature']), ('gpt-review', 80, 0.0))
+        self.assertEqual(ai_batch['model'], 'gpt-ethics')
+        self.assertEqual(router.get_timeout('hipaa_compliance_batch'), 7.0)
+        self.assertIsNone(router.get_timeout('body_batch'))
+    
+    def test_slow_model_is_downgraded_until_it_recovers(self):
+        """Test that a task over its latency budget uses its fallback model for a while, then its own again."""
+        router = ModelRouter({'body': self._route('gpt-large', fallback_model='gpt-fast', latency_budget=1.0)},
+                             latency_percentile=90, downgrade_seconds=60)
+        for _ in range(ModelRouter.MIN_SAMPLES):
+            router.record_latency('body', 'gpt-large', 0.6)
+        self.assertEqual(router.get_route('body')['model'], 'gpt-large')
+        # A call with less time left than the model usually takes goes to the fallback
+        with deadline_scope(0.3):
+            self.assertEqual(router.get_route('body')['model'], 'gpt-fast')
+        
+        for _ in range(ModelRouter.MIN_SAMPLES):
+            router.record_latency('body', 'gpt-large', 2.5)
+            # Batched calls do not count against the budget
+            router.record_latency('body_batch', 'gpt-large', 0.1)
+        self.assertEqual(router.get_route('body')['model'], 'gpt-fast')
+        self.assertEqual(router.get_state()['body']['downgrades'], 1)
+        
+        later = time.monotonic() + 61
+        with patch('business.services.model_router.time.monotonic', return_value=later):
+            self.assertEqual(router.get_route('body')['model'], 'gpt-large')
+
+
+class TestComplianceBatching(OpenAITestCase):
+    """Test compliance reviews that check several emails per AI call."""
+    
+    def _reply(self, content):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+    
+    def test_batched_review_retries_unclear_verdicts_alone(self):
+        """Test that one call reviews a batch and emails without a clear verdict are reviewed alone."""
+        email_service = EmailService()
+        email_logs = [EmailLog(generated_email=f"Hello customer {number}") for number in range(4)]
+        prompts = []
+        
+        def complete(request):
+            prompt = request['messages'][1]['content']
+            prompts.append(prompt)
+            if '<email id=' in prompt:
+                # Email 3 gets an unknown verdict and email 4 none at all
+                return self._reply('Here you go: {"results": [{"id": 1, "verdict": "APPROVED", "reason": "fine"}, '
+                                   '{"id": 2, "verdict": "VIOLATION", "reason": "mentions a diagnosis"}, '
+                                   '{"id": 3, "verdict": "UNSURE"}]}')
+            return self._reply("APPROVED: fine on its own")
+        
+        with patch.dict(email_service.openai_config, {'api_key': 'test-key'}), \
+                patch.dict(email_service.security_config, {'enable_hipaa_compliance': True,
+                                                           'enable_ai_compliance': False,
+                                                           'compliance_batch_size': 10}), \
+                patch.object(email_service, '_create_chat_completion', side_effect=complete):
+            email_service.perform_batched_compliance_checks(email_logs)
+        
+        self.assertEqual(len(prompts), 3)
+        self.assertEqual([email_log.compliance_approved for email_log in email_logs], [True, False, True, True])
+        self.assertEqual(email_logs[1].hipaa_compliance_check, "VIOLATION: mentions a diagnosis")
+        self.assertEqual(email_logs[3].hipaa_compliance_check, "APPROVED: fine on its own")
+        self.assertEqual(email_logs[0].openai_usage['hipaa_compliance_batch']['calls'], 1)
+        self.assertEqual(email_logs[2].openai_usage['hipaa_compliance']['calls'], 1)
+    
+    def test_batches_fit_size_and_token_budget(self):
+        """Test that batches hold at most the batch size and stay within the token budget."""
+        email_service = EmailService()
+        contents = ["Short note."] * 5 + ["word " * 3000] + ["Short note."] * 2
+        
+        with patch.dict(email_service.security_config, {'compliance_batch_size': 3, 'compliance_batch_tokens': 2000}):
+            batches = email_service._plan_compliance_batches('hipaa', contents, list(range(len(contents))))
+        
+        self.assertEqual(batches, [[0, 1, 2], [3, 4], [5], [6, 7]])
+
+
+class TestComplianceVerdictCache(OpenAITestCase):
+    """Test reuse of compliance verdicts for content that was already reviewed."""
+    
+    def test_identical_content_is_not_reviewed_again(self):
+        """Test that cached verdicts skip the AI call until the compliance prompt changes."""
+        email_service = EmailService()
+        cache = ComplianceVerdictCache(MockComplianceVerdictRepository())
+        prompts = []
+        
+        def complete(request):
+            prompts.append(request['messages'][1]['content'])
+            content = 'VIOLATION: mentions a diagnosis' if 'diagnosis' in prompts[-1] else 'APPROVED: fine'
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+        
+        def review(contents):
+            email_logs = [EmailLog(generated_email=content) for content in contents]
+            email_service.perform_batched_compliance_checks(email_logs)
+            return [email_log.hipaa_compliance_check for email_log in email_logs]
+        
+        with patch.dict(email_service.openai_config, {'api_key': 'test-key'}), \
+                patch.dict(email_service.security_config, {'enable_hipaa_compliance': True,
+                                                           'enable_ai_compliance': False,
+                                                           'compliance_batch_size': 1}), \
+                patch.object(email_service, '_create_chat_completion', side_effect=complete), \
+                patch('business.services.email_service.compliance_verdict_cache', cache):
+            first = review(["Hello Ann,\nwelcome.", "Your diagnosis is ready."])
+            # Re-wrapped copies of the same emails hit the cache
+            second = review(["Hello  Ann, welcome.", "Your diagnosis is ready.\n"])
+            self.assertEqual(len(prompts), 2)
+            self.assertEqual(second, first)
+            
+            with patch.dict('business.services.prompts.COMPLIANCE_REVIEWS',
+                            {'hipaa': {**COMPLIANCE_REVIEWS['hipaa'], 'checks': ["No PHI"]}}):
+                review(["Hello Ann, welcome."])
+        
+        self.assertEqual(len(prompts), 3)
+        self.assertEqual(cache.get_state()['hits'], 2)
+    
+    def test_sqlite_cache_keeps_clear_verdicts_and_evicts_least_recently_used(self):
+        """Test that only clear verdicts persist and eviction drops old and least recently used ones."""
+        with tempfile.TemporaryDirectory() as tempdir:
+            repository = SqliteComplianceVerdictRepository(SqliteDatabase(os.path.join(tempdir, 'verdicts.db')))
+            cache = ComplianceVerdictCache(repository, max_entries=2, ttl_days=30)
+            
+            cache.put_many('ai', 'gpt-test', ["one", "two", "three", "four"],
+                           ["APPROVED: ok", "VIOLATION: unfair", "AI compliance check failed: timeout",
+                            "PENDING: AI compliance review will run when the AI provider is available again"])
+            self.assertEqual(repository.count(), 2)
+            self.assertEqual(cache.get_many('ai', 'gpt-test', ["one", "three"]), ["APPROVED: ok", None])
+            self.assertIsNone(cache.get('ai', 'gpt-other', "one"))
+            
+            cache.put('ai', 'gpt-test', "five", "APPROVED: fine")
+            self.assertEqual(cache.evict(), 1)
+            # "two" was used least recently
+            self.assertIsNone(cache.get('ai', 'gpt-test', "two"))
+            self.assertEqual(cache.get('ai', 'gpt-test', "one"), "APPROVED: ok")
+            
+            with patch('business.services.compliance_cache.datetime') as clock:
+                clock.now.return_value = datetime.now() + timedelta(days=31)
+                self.assertEqual(cache.get_many('ai', 'gpt-test', ["one", "five"]), [None, None])
+                self.assertEqual(cache.evict(), 2)
+
+
+class TestBatchedGeneration(OpenAITestCase):
+    """Test bulk generation that personalizes several recipients per AI call."""
+    
+    def _customers(self, count):
+        return [Customer(customer_id=number, first_name=f"Ann{number}", last_name="Lee", company_name=f"Co{number}",
+                         title="CTO", email=f"ann{number}@example.com") for number in range(1, count + 1)]
+    
+    def test_invalid_entries_are_generated_alone(self):
+        """Test that one call personalizes a batch and missing or invalid entries are regenerated alone."""
+        email_service = EmailService()
+        customers = self._customers(4)
+        requests = []
+        
+        def complete(request):
+            prompt = '\n'.join(message['content'] for message in request['messages'])
+            requests.append(prompt)
+            if '"customer_id"' in prompt:
+                # Customer 3 is not named in its body and customer 4 is missing
+                content = json.dumps([
+                    {'customer_id': 1, 'subject': "Hello Ann1", 'body': "Dear Ann1, welcome."},
+                    {'customer_id': 2, 'subject': "Hello Ann2", 'body': "Dear Ann2 at Co2, welcome."},
+                    {'customer_id': 3, 'subject': "Hello", 'body': "Dear customer, welcome."},
+                    {'customer_id': 99, 'subject': "Hello", 'body': "Dear stranger."}
+                ])
+            else:
+                content = "Single reply"
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+        
+        with patch.dict(email_service.openai_config, {'api_key': 'test-key', 'hedge_percentile': 0}), \
+                patch.dict(email_service.campaign_config, {'generation_batch_size': 5}), \
+                patch.object(email_service, '_create_chat_completion', side_effect=complete):
+            email_logs = email_service.compose_personalized_emails(customers, "Welcome {first_name}", user_id=1)
+        
+        # One batch call, then a body and a subject call for each of the two invalid entries
+        self.assertEqual(len(requests), 5)
+        self.assertEqual([email_log.generation_path for email_log in email_logs],
+                         [GENERATION_PATH_OPENAI_BATCH, GENERATION_PATH_OPENAI_BATCH,
+                          GENERATION_PATH_OPENAI, GENERATION_PATH_OPENAI])
+        self.assertEqual(email_logs[1].subject, "Hello Ann2")
+        self.assertEqual(email_logs[3].generated_email, "Single reply")
+        self.assertEqual(email_logs[0].openai_usage['body_batch']['calls'], 1)
+    
+    def test_batch_size_follows_token_estimates(self):
+        """Test that batches shrink to fit the token budget and repeated customers are left out."""
+        email_service = EmailService()
+        customers = self._customers(6) + self._customers(1)
+        
+        with patch.dict(email_service.campaign_config, {'generation_batch_size': 5, 'generation_batch_tokens': 100000}):
+            self.assertEqual(email_service._plan_generation_batches(customers, "Hello", list(range(7))),
+                             [[0, 1, 2, 3, 4], [5]])
+        
+        with patch.dict(email_service.campaign_config, {'generation_batch_size': 5, 'generation_batch_tokens': 1000}):
+            batches = email_service._plan_generation_batches(customers, "Hello " * 200, list(range(7)))
+        self.assertTrue(all(len(batch) < 5 for batch in batches))
+        self.assertEqual(sorted(index for batch in batches for index in batch), [0, 1, 2, 3, 4, 5])
+
+
+class TestTemplateReuse(OpenAITestCase):
+    """Test reuse of earlier emails when a bulk run's template is a near-duplicate."""
+    
+    TEMPLATE = ("Join our spring webinar on Tuesday at 10am to see the new reporting dashboard, "
+                "ask our product team questions and hear how other teams use it.")
+    
+    def test_simhash_index_matches_only_near_duplicates(self):
+        """Test that a small edit matches an earlier template while identical and unrelated ones do not."""
+        index = TemplateIndex(similarity=0.9)
+        index.add(1, self.TEMPLATE)
+        edited = self.TEMPLATE.replace("Tuesday", "Thursday")
+        
+        self.assertLess(hamming_distance(simhash(self.TEMPLATE), simhash(edited)), TemplateIndex.MAX_DISTANCE)
+        self.assertEqual(index.find_similar(1, edited).template_text, self.TEMPLATE)
+        self.assertIsNone(index.find_similar(1, self.TEMPLATE))
+        self.assertIsNone(index.find_similar(2, edited))
+        self.assertIsNone(index.find_similar(1, "Our annual report is attached for your review."))
+    
+    def test_edited_template_patches_earlier_emails(self):
+        """Test that emails containing the edited text are patched and the rest are generated again."""
+        email_service = EmailService()
+        customers = [Customer(customer_id=number, first_name=f"Zoe{number}", last_name="Park",
+                              company_name=f"Firm{number}", email=f"zoe{number}@example.com")
+                     for number in (481, 482)]
+        prompts = []
+        
+        def complete(request):
+            prompt = request['messages'][1]['content']
+            prompts.append(prompt)
+            name = re.search(r'Name: (\w+)', prompt).group(1)
+            template = prompt.split('Email Template:\n')[1].split('\n\n')[0]
+            # Zoe482's email paraphrases the template, so the edit cannot be placed in it
+            body = template if name == "Zoe481" else "We are hosting a webinar soon."
+            content = "Webinar" if 'subject lines' in request['messages'][0]['content'] else f"Dear {name},\n\n{body}"
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+        
+        with patch.dict(email_service.openai_config, {'api_key': 'test-key', 'hedge_percentile': 0}), \
+                patch.dict(email_service.campaign_config, {'generation_batch_size': 1, 'template_reuse_mode': 'patch'}), \
+                patch.dict(email_service.security_config, {'enable_hipaa_compliance': False,
+                                                           'enable_ai_compliance': False}), \
+                patch.object(email_service, '_create_chat_completion', side_effect=complete), \
+                patch('business.services.email_service.template_index', TemplateIndex(similarity=0.9)), \
+                patch.object(email_service.email_log_repository, 'get_by_user_id',
+                             side_effect=AssertionError("loaded every email of the user")):
+            email_service.generate_bulk_personalized_emails(customers, self.TEMPLATE, 48)
+            prompts.clear()
+            email_logs = email_service.generate_bulk_personalized_emails(
+                customers, self.TEMPLATE.replace("Tuesday", "Thursday"), 48
+            )
+        
+        self.assertEqual(email_logs[0].generation_path, GENERATION_PATH_REUSED)
+        self.assertIn("webinar on Thursday at 10am", email_logs[0].generated_email)
+        self.assertTrue(email_logs[0].generated_email.startswith("Dear Zoe481,"))
+        self.assertEqual(email_logs[1].generation_path, GENERATION_PATH_OPENAI)
+        # Only Zoe482's body and subject were generated again
+        self.assertEqual(len(prompts), 2)
+        self.assertTrue(all("Zoe482" in prompt for prompt in prompts))
+
+
+class TestPromptCaching(OpenAITestCase):
+    """Test prompt layout for the provider's prompt cache and cached-token reporting."""
+    
+    def test_customer_data_follows_shared_prefix(self):
+        """Test that requests for different customers differ only after the template."""
+        email_service = EmailService()
+        first, second = [Customer(customer_id=number, first_name=name, last_name="Lee", company_name=f"{name} Ltd",
+                                  title="CTO", email=f"{name}@example.com") for number, name in ((1, "Ann"), (2, "Bob"))]
+        template = "Invite {first_name} to our spring product webinar."
+        
+        for build in (email_service._build_email_request, email_service._build_subject_request):
+            first_messages = build(first, template)['messages']
+            second_messages = build(second, template)['messages']
+            self.assertEqual(first_messages[0], second_messages[0])
+            shared = os.path.commonprefix([first_messages[1]['content'], second_messages[1]['content']])
+            self.assertIn(template, shared)
+            self.assertNotIn("Ann", shared)
+    
+    def test_cached_tokens_are_recorded_and_discounted(self):
+        """Test that cached prompt tokens reported by the server are recorded and billed at the cached rate."""
+        email_service = EmailService()
+        customers = repository_factory.get_customer_repository().get_all()[:2]
+        template = "Invite {first_name} to our spring product webinar. " * 20
+        
+        with FakeOpenAIServer(cache_min_tokens=128, cache_block_tokens=32) as server, \
+                patch.dict(email_service.openai_config, {'api_key': 'fake-key'}), \
+                patch.object(openai_client_pool, 'get_client',
+                             OpenAIClientPool(api_key='fake-key', base_url=server.base_url).get_client):
+            first, second = [email_service.compose_personalized_email(customer, template, user_id=1)
+                             for customer in customers]
+        
+        self.assertEqual(first.openai_usage['body']['cached_tokens'], 0)
+        self.assertGreater(second.openai_usage['body']['cached_tokens'], 128)
+        tracker = OpenAIUsageTracker(prompt_cost_per_1k=1.0, completion_cost_per_1k=0.0, cached_prompt_cost_per_1k=0.5)
+        self.assertEqual(tracker.get_cost(1000, 0, cached_tokens=600), 0.7)
+
+
+class TestEmailOutbox(OpenAITestCase):
+    """Test queued email delivery through the outbox."""
+    
+    def test_send_email_is_queued_once_and_delivered(self):
+        """Test that sending queues one outbox message that the dispatcher delivers."""
+        email_service = EmailService()
+        email_service.openai_config['api_key'] = ''
+        customer = repository_factory.get_customer_repository().get_all()[0]
+        email_log = email_service.generate_personalized_email(customer, "Hello", user_id=1)
+        delivered = []
+        
+        with patch.object(smtp_pool, 'send_message', side_effect=delivered.append):
+            self.assertTrue(email_service.send_email(email_log.email_log_id))
+            self.assertTrue(email_service.send_email(email_log.email_log_id))
+            
+            for _ in range(100):
+                if email_service.email_log_repository.get_by_id(email_log.email_log_id).email_sent:
+                    break
+                time.sleep(0.05)
+        
+        self.assertTrue(email_service.email_log_repository.get_by_id(email_log.email_log_id).email_sent)
+        self.assertEqual(len(delivered), 1)
+        message = email_service.outbox_repository.get_by_email_log_id(email_log.email_log_id)
+        self.assertEqual(message.status, 'sent')
+        # The Message-ID carries a random part so email log IDs reused by another database do not collide
+        self.assertEqual(delivered[0]['Message-ID'].split('@')[0], f"<{message.message_id}")
+        self.assertRegex(message.message_id, rf"^email-log-{email_log.email_log_id}\.[0-9a-f]{{32}}$")
+
+    def test_bulk_send_loads_and_queues_per_chunk(self):
+        """Test that bulk sending reads and queues each chunk of email logs in one call."""
+        email_service = EmailService()
+        email_service.openai_config['api_key'] = ''
+        email_service.email_config['bulk_send_chunk_size'] = 2
+        # A private outbox keeps the embedded dispatcher from delivering these messages
+        email_service.outbox_repository = MockEmailOutboxRepository(email_service.email_log_repository)
+        customer = repository_factory.get_customer_repository().get_all()[0]
+        email_logs = [email_service.generate_personalized_email(customer, "Hello", user_id=1) for _ in range(3)]
+        email_logs[1].compliance_approved = False
+        email_log_ids = [email_log.email_log_id for email_log in email_logs] + [999999]
+        log_repository = email_service.email_log_repository
+
+        with patch.object(log_repository, 'get_by_id', side_effect=AssertionError("loaded one at a time")), \
+                patch.object(log_repository, 'get_by_ids', wraps=log_repository.get_by_ids) as get_by_ids, \
+                patch.object(email_service.outbox_repository, 'enqueue_many',
+                             wraps=email_service.outbox_repository.enqueue_many) as enqueue_many, \
+                patch.object(email_service, '_wake_outbox_dispatcher'):
+            results = email_service.send_bulk_emails(email_log_ids)
+
+        self.assertEqual(results, {email_log_ids[0]: True, email_log_ids[1]: False,
+                                   email_log_ids[2]: True, 999999: False})
+        self.assertEqual(get_by_ids.call_count, 2)
+        self.assertEqual(enqueue_many.call_count, 2)
+        self.assertIsNone(email_service.outbox_repository.get_by_email_log_id(email_log_ids[1]))
+
+    def test_sqlite_batch_enqueue_and_mark_sent(self):
+        """Test that a batch of messages is queued and marked sent together with its email logs."""
+        with tempfile.TemporaryDirectory() as directory:
+            database = SqliteDatabase(os.path.join(directory, 'outbox.db'))
+            log_repository = SqliteEmailLogRepository(database)
+            outbox_repository = SqliteEmailOutboxRepository(database)
+            email_logs = [log_repository.create(EmailLog(customer_id=1, user_id=1, recipient_email=f"user{i}@example.com"))
+                          for i in range(3)]
+
+            messages = outbox_repository.enqueue_many([
+                EmailOutboxMessage(email_log_id=email_log.email_log_id, idempotency_key=f"email-log-{email_log.email_log_id}",
+                                   recipient_email=email_log.recipient_email)
+                for email_log in email_logs
+            ])
+            self.assertEqual([message.email_log_id for message in messages],
+                             [email_log.email_log_id for email_log in email_logs])
+
+            claimed = outbox_repository.claim_batch('worker-a', limit=2, lease_seconds=60)
+            self.assertEqual(outbox_repository.mark_sent_many(messages, 'worker-a'),
+                             [message.outbox_id for message in claimed])
+            sent = [email_log.email_sent for email_log in
+                    log_repository.get_by_ids([email_log.email_log_id for email_log in email_logs])]
+            self.assertEqual(sorted(sent), [False, True, True])
+
+
+class TestSMTPConnectionPool(unittest.TestCase):
+    """Test SMTP connection reuse."""
+    
+    class FakeSMTP:
+        """SMTP session that records what was sent."""
+        
+        def __init__(self):
+            self.sent = []
+            self.resets = 0
+            self.closed = False
+        
+        def send_message(self, msg):
+            self.sent.append(msg)
+        
+        def rset(self):
+            self.resets += 1
+        
+        def quit(self):
+            self.closed = True
+    
+    def _create_pool(self, **kwargs):
+        """Create a pool whose connections are fake sessions."""
+        pool = SMTPConnectionPool('localhost', 25, **kwargs)
+        pool.sessions = []
+        
+        def create_connection():
+            pool.sessions.append(self.FakeSMTP())
+            return pool.sessions[-1]
+        
+        pool._create_connection = create_connection
+        return pool
+    
+    def test_connections_are_reused(self):
+        """Test that sequential sends share one session and reset it between messages."""
+        pool = self._create_pool(max_messages_per_connection=2)
+        for _ in range(3):
+            pool.send_message(MIMEText("Hello"))
+        
+        self.assertEqual(len(pool.sessions), 2)
+        self.assertEqual(len(pool.sessions[0].sent), 2)
+        self.assertEqual(pool.sessions[0].resets, 1)
+        self.assertTrue(pool.sessions[0].closed)
+        self.assertEqual(pool.get_state()['messages_sent'], 3)
+    
+    def test_dropped_connection_is_replaced(self):
+        """Test that a send on a dropped session is retried on a new one."""
+        pool = self._create_pool()
+        pool.send_message(MIMEText("First"))
+        
+        def disconnect(msg):
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        
+        pool.sessions[0].send_message = disconnect
+        pool.send_message(MIMEText("Second"))
+        
+        self.assertEqual(len(pool.sessions), 2)
+        self.assertEqual(len(pool.sessions[1].sent), 1)
+        self.assertEqual(pool.get_state()['reconnects'], 1)
+
+
+class TestSMTPDispatcher(unittest.TestCase):
+    """Test parallel SMTP dispatch."""
+    
+    def test_dispatch_throttles_per_domain(self):
+        """Test that sends run in parallel but never exceed the per-domain limit."""
+        dispatcher = ParallelSMTPDispatcher(max_workers=4, throttle=DomainThrottle(1, 1000))
+        recipients = {1: 'a@big.com', 2: 'b@big.com', 3: 'c@big.com', 4: 'd@other.com', 5: 'e@other.com'}
+        active = {}
+        peak = {}
+        lock = threading.Lock()
+        
+        def send(recipient):
+            domain = get_recipient_domain(recipient)
+            with lock:
+                active[domain] = active.get(domain, 0) + 1
+                peak[domain] = max(peak.get(domain, 0), active[domain])
+            time.sleep(0.02)
+            with lock:
+                active[domain] -= 1
+            return recipient != 'c@big.com'
+        
+        results = dispatcher.dispatch(recipients, get_recipient=lambda recipient: recipient, send=send)
+        
+        self.assertEqual(results, {1: True, 2: True, 3: False, 4: True, 5: True})
+        self.assertEqual(peak, {'big.com': 1, 'other.com': 1})
+        self.assertEqual(dispatcher.get_state()['last_dispatch']['sent'], 4)
+
+
 class TestConfiguration(unittest.TestCase):
     """Test configuration and environment setup."""
     
@@ -297,6 +1539,15 @@ class TestConfiguration(unittest.TestCase):
             self.assertIsNotNone(config)
         except Exception as e:
             self.fail(f"Configuration failed: {e}")
+    
+    def test_malformed_user_weights_are_skipped(self):
+        """Test that bad OPENAI_USER_WEIGHTS entries are logged and skipped instead of failing startup."""
+        from config.settings import get_openai_config
+        with patch.dict(os.environ, {'OPENAI_USER_WEIGHTS': '1:2.5, bob:3,4:x,5,6:-1, 7:0.5'}), \
+                self.assertLogs('config.settings', level='WARNING') as logs:
+            weights = get_openai_config()['user_weights']
+        self.assertEqual(weights, {1: 2.5, 7: 0.5})
+        self.assertEqual(len(logs.output), 4)
 
 
 def run_tests():
@@ -314,6 +1565,26 @@ def run_tests():
         TestCustomerService,
         TestUserService,
         TestEmailService,
+        TestAsyncEmailService,
+        TestTemplateEngine,
+        TestEmailJobService,
+        TestRateLimiter,
+        TestOpenAIUsage,
+        TestTokenBudget,
+        TestSingleFlight,
+        TestFakeOpenAIServer,
+        TestDeadlines,
+        TestCircuitBreaker,
+        TestModelRouting,
+        TestOpenAIScheduler,
+        TestComplianceBatching,
+        TestComplianceVerdictCache,
+        TestBatchedGeneration,
+        TestTemplateReuse,
+        TestPromptCaching,
+        TestEmailOutbox,
+        TestSMTPConnectionPool,
+        TestSMTPDispatcher,
         TestConfiguration
     ]
     
@@ -3,8 +3,12 @@ Email controller for AI email generation and management.
 """
 
 import cherrypy
+import html
+import json
 import logging
+import uuid
 from business.services.email_service import EmailService
+from business.services.email_job_service import EmailJobService
 from business.services.customer_service import CustomerService
 from web.controllers.auth_controller import AuthController
 
@@ -15,6 +19,7 @@ class EmailController:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.email_service = EmailService()
+        self.job_service = EmailJobService(self.email_service)
         self.customer_service = CustomerService()
         self.auth = AuthController()
     
@@ -107,19 +112,18 @@ class EmailController:
                 if len(customers) == 1:
                     # Single customer - existing behavior
                     email_log = self.email_service.generate_personalized_email(
-                        customers[0], template_text, user_id
+                        customers[0], template_text, user_id, idempotency_key=kwargs.get('idempotency_key')
                     )
                     
                     raise cherrypy.HTTPRedirect(f'/email/preview/{email_log.email_log_id}')
                 else:
-                    # Multiple customers - bulk generation
-                    email_logs = self.email_service.generate_bulk_personalized_emails(
-                        customers, template_text, user_id
+                    # Multiple customers - bulk generation runs as a background job
+                    job = self.job_service.submit_generation_job(
+                        customers, template_text, user_id, campaign_mode=bool(kwargs.get('campaign_mode')),
+                        idempotency_key=kwargs.get('idempotency_key')
                     )
                     
-                    # Redirect to bulk preview page
-                    log_ids = ','.join(str(log.email_log_id) for log in email_logs)
-                    raise cherrypy.HTTPRedirect(f'/email/bulk_preview?log_ids={log_ids}')
+                    raise cherrypy.HTTPRedirect(f'/email/jobs/{job.job_id}')
                 
             except cherrypy.HTTPRedirect:
                 # Re-raise HTTPRedirect - this is not an error, it's the normal flow
@@ -138,6 +142,86 @@ class EmailController:
                 customers = self.customer_service.get_active_customers()
                 return self._render_customer_selection(customers, str(e))
     
+    @cherrypy.expose
+    def generate_stream(self, customer_id=None, template_text=None, **kwargs):
+        """Generate an email for one customer, streaming the body to the browser as it is written."""
+        self.auth.require_admin()
+        
+        if cherrypy.request.method != 'POST':
+            raise cherrypy.HTTPRedirect('/email/generate')
+        
+        try:
+            customer_id = int(customer_id or kwargs.get('customer_ids', '').split(',')[0])
+        except ValueError:
+            return self._render_error_page("Invalid Request", "Invalid customer ID")
+        
+        template_text = template_text or ''
+        if not template_text.strip():
+            return self._render_error_page("Missing Information", "Please provide template text")
+        
+        customer = self.customer_service.get_customer_by_id(customer_id)
+        if not customer:
+            return self._render_error_page("Customer Not Found", f"Customer with ID {customer_id} not found")
+        
+        user_id = cherrypy.session.get('user_id')
+        stream = self.email_service.stream_personalized_email(customer, template_text, user_id)
+        
+        def content():
+            yield self._render_stream_header(customer)
+            try:
+                while True:
+                    try:
+                        chunk = next(stream)
+                    except StopIteration as done:
+                        email_log = done.value
+                        break
+                    yield html.escape(chunk)
+            except Exception as e:
+                self.logger.error(f"Error streaming email generation: {e}")
+                yield self._render_stream_footer(error=str(e))
+                return
+            yield self._render_stream_footer(email_log)
+        
+        return content()
+    generate_stream._cp_config = {'response.stream': True}
+    
+    @cherrypy.expose
+    def jobs(self, job_id=None, action=None, format=None):
+        """Show bulk generation job progress, or cancel a job."""
+        self.auth.require_admin()
+        
+        try:
+            user_id = cherrypy.session.get('user_id')
+            
+            if job_id is None:
+                return self._render_job_list(self.job_service.get_jobs_by_user(user_id))
+            
+            job_id = int(job_id)
+            
+            if action == 'cancel':
+                if cherrypy.request.method != 'POST':
+                    raise cherrypy.HTTPError(405, "Cancellation requires POST")
+                self.job_service.cancel_job(job_id)
+                raise cherrypy.HTTPRedirect(f'/email/jobs/{job_id}')
+            
+            job = self.job_service.get_job(job_id)
+            if not job:
+                return self._render_error_page("Job Not Found", f"Email job with ID {job_id} not found")
+            
+            if format == 'json':
+                cherrypy.response.headers['Content-Type'] = 'application/json'
+                return json.dumps(job.to_dict()).encode('utf-8')
+            
+            return self._render_job_progress(job)
+            
+        except (cherrypy.HTTPRedirect, cherrypy.HTTPError):
+            raise
+        except ValueError:
+            return self._render_error_page("Invalid Request", "Invalid job ID")
+        except Exception as e:
+            self.logger.error(f"Error loading email job: {e}")
+            return self._render_error_page("Error", str(e))
+    
     @cherrypy.expose
     def preview(self, email_log_id):
         """Preview generated email before sending."""
@@ -159,6 +243,27 @@ class EmailController:
             self.logger.error(f"Error previewing email: {e}")
             return self._render_error_page("Error", str(e))
     
+    @cherrypy.expose
+    def recheck(self, email_log_id):
+        """Run an email's compliance checks again, e.g. after pending reviews."""
+        self.auth.require_admin()
+        
+        if cherrypy.request.method != 'POST':
+            raise cherrypy.HTTPRedirect(f'/email/preview/{email_log_id}')
+        
+        try:
+            email_log_id = int(email_log_id)
+            self.email_service.recheck_compliance(email_log_id)
+            raise cherrypy.HTTPRedirect(f'/email/preview/{email_log_id}')
+            
+        except cherrypy.HTTPRedirect:
+            raise
+        except ValueError as e:
+            return self._render_error_page("Invalid Request", str(e))
+        except Exception as e:
+            self.logger.error(f"Error rechecking compliance: {e}")
+            return self._render_error_page("Error", str(e))
+    
     @cherrypy.expose
     def send(self, email_log_id):
         """Send the generated email."""
@@ -169,9 +274,9 @@ class EmailController:
             success = self.email_service.send_email(email_log_id)
             
             if success:
-                raise cherrypy.HTTPRedirect('/email/logs?message=Email sent successfully')
+                raise cherrypy.HTTPRedirect('/email/logs?message=Email queued for sending')
             else:
-                raise cherrypy.HTTPRedirect(f'/email/preview/{email_log_id}?error=Failed to send email')
+                raise cherrypy.HTTPRedirect(f'/email/preview/{email_log_id}?error=Failed to queue email')
                 
         except ValueError:
             return self._render_error_page("Invalid Request", "Invalid email log ID")
@@ -266,9 +371,9 @@ class EmailController:
             total_count = len(results)
             
             if success_count == total_count:
-                message = f"All {total_count} emails sent successfully!"
+                message = f"All {total_count} emails queued for sending!"
             else:
-                message = f"{success_count} of {total_count} emails sent successfully. Check logs for failures."
+                message = f"{success_count} of {total_count} emails queued for sending. Check logs for failures."
             
             raise cherrypy.HTTPRedirect(f'/email/logs?message={message}')
             
@@ -278,6 +383,13 @@ class EmailController:
             self.logger.error(f"Error sending bulk emails: {e}")
             return self._render_error_page("Error", str(e))
     
+    @cherrypy.expose
+    @cherrypy.tools.json_out()
+    def metrics(self):
+        """Report email pipeline metrics as JSON."""
+        self.auth.require_admin()
+        return self.email_service.get_metrics()
+    
     def _render_customer_selection(self, customers, error=None):
         """Render customer selection page for email generation."""
         customer_options = ""
@@ -490,6 +602,7 @@ class EmailController:
                 
                 <form method="post" action="/email/generate">
                     <input type="hidden" name="customer_ids" value="{','.join(customer_ids)}">
+                    <input type="hidden" name="idempotency_key" value="{html.escape(data.get('idempotency_key') or uuid.uuid4().hex)}">
                     
                     <div class="form-group">
                         <label for="template_text">Email Template (max 1000 characters):</label>
@@ -498,7 +611,13 @@ class EmailController:
                         <div class="char-count" id="char-count">0 / 1000 characters</div>
                     </div>
                     
+                    {f'''<div class="form-group">
+                        <label><input type="checkbox" name="campaign_mode" value="1" {'checked' if data.get('campaign_mode') else ''}>
+                        Campaign mode: personalize the template once and fill in each customer's name, company and title</label>
+                    </div>''' if len(customers) > 1 else ''}
+                    
                     <button type="submit" class="btn">Generate Email{'s' if len(customers) > 1 else ''}</button>
+                    {'<button type="submit" class="btn" formaction="/email/generate_stream">Generate with Live Preview</button>' if len(customers) == 1 else ''}
                     <a href="/email/generate" class="btn btn-secondary">Cancel</a>
                 </form>
             </div>
@@ -506,6 +625,179 @@ class EmailController:
         </html>
         """
 
+    def _render_stream_header(self, customer):
+        """Render the opening of the streamed generation page, up to the email body."""
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>MyCRM - Generating Email</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f5f5f5; }}
+                .container {{ max-width: 800px; margin: 0 auto; background: white; padding: 30px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
+                .email-preview {{ background-color: #f8f9fa; padding: 20px; border-radius: 4px; margin-bottom: 20px; border: 1px solid #dee2e6; white-space: pre-line; }}
+                .status {{ color: #666; }}
+                .error {{ color: red; padding: 10px; background-color: #f8d7da; border: 1px solid #f5c6cb; border-radius: 4px; }}
+                .back-link {{ color: #007bff; text-decoration: none; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <h1>Generating Email</h1>
+                <h3>Recipient: {customer.full_name} ({customer.email})</h3>
+                <div class="email-preview">"""
+    
+    def _render_stream_footer(self, email_log=None, error=None):
+        """Render the end of the streamed generation page and move on to the preview."""
+        if error:
+            status = f'<div class="error">{html.escape(error)}</div><p><a href="/email/generate" class="back-link">← Back to Email Generation</a></p>'
+        else:
+            preview_url = f'/email/preview/{email_log.email_log_id}'
+            status = f"""<p class="status">Compliance checks complete. <a href="{preview_url}" class="back-link">Continue to preview</a></p>
+                <script>window.location.href = '{preview_url}';</script>"""
+        
+        return f"""</div>
+                {status}
+            </div>
+        </body>
+        </html>
+        """
+
+    def _render_job_progress(self, job):
+        """Render progress of a bulk generation job."""
+        status_icons = {
+            'pending': '⏳', 'running': '🔄', 'completed': '✅', 'failed': '❌', 'cancelled': '⛔'
+        }
+        item_rows = ""
+        for item in job.items:
+            item_rows += f"""
+            <tr>
+                <td>{html.escape(item.customer.full_name) if item.customer else f'Customer {item.customer_id}'}</td>
+                <td>{status_icons.get(item.status, '')} {item.status.title()}</td>
+                <td>{f'<a href="/email/preview/{item.email_log_id}">View</a>' if item.email_log_id else html.escape(item.error_message)}</td>
+            </tr>
+            """
+        
+        eta = f"{job.eta_seconds:.0f} seconds" if job.eta_seconds is not None else "Calculating..."
+        log_ids = ','.join(str(log_id) for log_id in job.email_log_ids)
+        
+        if not job.is_finished:
+            actions = f"""
+                <form method="post" action="/email/jobs/{job.job_id}/cancel" style="display: inline;">
+                    <button type="submit" class="btn btn-danger" {'disabled' if job.cancel_requested else ''}
+                            onclick="return confirm('Cancel this job?')">{'Cancelling...' if job.cancel_requested else 'Cancel Job'}</button>
+                </form>
+            """
+        elif log_ids:
+            actions = f'<a href="/email/bulk_preview?log_ids={log_ids}" class="btn btn-success">Preview Generated Emails</a>'
+        else:
+            actions = ''
+        
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>MyCRM - Email Generation Job</title>
+            {'<meta http-equiv="refresh" content="2">' if not job.is_finished else ''}
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f5f5f5; }}
+                .container {{ max-width: 900px; margin: 0 auto; background: white; padding: 30px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
+                .progress {{ background-color: #e9ecef; border-radius: 4px; height: 24px; margin: 15px 0; }}
+                .progress-bar {{ background-color: #007bff; height: 100%; border-radius: 4px; color: white; text-align: center; line-height: 24px; }}
+                table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
+                th, td {{ padding: 10px; text-align: left; border-bottom: 1px solid #ddd; }}
+                th {{ background-color: #f8f9fa; }}
+                .btn {{ padding: 10px 20px; background-color: #007bff; color: white; border: none; border-radius: 4px; cursor: pointer; text-decoration: none; display: inline-block; margin-right: 10px; }}
+                .btn-success {{ background-color: #28a745; }}
+                .btn-danger {{ background-color: #dc3545; }}
+                .btn:disabled {{ opacity: 0.5; cursor: not-allowed; }}
+                .error {{ color: red; padding: 10px; background-color: #f8d7da; border: 1px solid #f5c6cb; border-radius: 4px; }}
+                .back-link {{ color: #007bff; text-decoration: none; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <a href="/email/jobs" class="back-link">← All Jobs</a>
+                <h1>Email Generation Job #{job.job_id}</h1>
+                
+                <p><strong>Status:</strong> {job.status.title()}{' (cancellation requested)' if job.cancel_requested and not job.is_finished else ''}</p>
+                <p><strong>Mode:</strong> {'Campaign draft' if job.campaign_mode else 'Per-customer AI generation'}</p>
+                <p><strong>Progress:</strong> {job.processed_count} of {job.total_count} processed</p>
+                {f'<p><strong>Estimated time remaining:</strong> {eta}</p>' if not job.is_finished else ''}
+                {f'<div class="error">{html.escape(job.error_message)}</div>' if job.error_message else ''}
+                
+                <div class="progress">
+                    <div class="progress-bar" style="width: {job.progress_percent}%;">{job.progress_percent:.0f}%</div>
+                </div>
+                
+                {actions}
+                
+                <table>
+                    <thead>
+                        <tr>
+                            <th>Customer</th>
+                            <th>Status</th>
+                            <th>Result</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                        {item_rows}
+                    </tbody>
+                </table>
+            </div>
+        </body>
+        </html>
+        """
+    
+    def _render_job_list(self, jobs):
+        """Render the list of a user's bulk generation jobs."""
+        job_rows = ""
+        for job in jobs:
+            job_rows += f"""
+            <tr>
+                <td><a href="/email/jobs/{job.job_id}">#{job.job_id}</a></td>
+                <td>{job.status.title()}</td>
+                <td>{job.processed_count} / {job.total_count}</td>
+                <td>{job.created_date.strftime('%Y-%m-%d %H:%M') if job.created_date else ''}</td>
+            </tr>
+            """
+        
+        return f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>MyCRM - Email Generation Jobs</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f5f5f5; }}
+                .container {{ max-width: 900px; margin: 0 auto; background: white; padding: 30px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
+                table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
+                th, td {{ padding: 10px; text-align: left; border-bottom: 1px solid #ddd; }}
+                th {{ background-color: #f8f9fa; }}
+                .back-link {{ color: #007bff; text-decoration: none; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <a href="/email/generate" class="back-link">← Back to Email Generation</a>
+                <h1>Email Generation Jobs</h1>
+                <table>
+                    <thead>
+                        <tr>
+                            <th>Job</th>
+                            <th>Status</th>
+                            <th>Processed</th>
+                            <th>Created</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                        {job_rows if job_rows else '<tr><td colspan="4">No email jobs found</td></tr>'}
+                    </tbody>
+                </table>
+            </div>
+        </body>
+        </html>
+        """
+
     def _render_bulk_email_preview(self, email_previews):
         """Render bulk email preview page."""
         preview_items = ""
@@ -613,6 +905,9 @@ class EmailController:
         """Render email preview page."""
         compliance_status = "✅ Approved" if email_log.compliance_approved else "❌ Rejected"
         compliance_color = "#28a745" if email_log.compliance_approved else "#dc3545"
+        if email_log.compliance_pending:
+            compliance_status = "⏳ Pending - AI provider unavailable"
+            compliance_color = "#ffc107"
         
         return f"""
         <!DOCTYPE html>
@@ -664,10 +959,13 @@ class EmailController:
                     </div>
                     
                     <p><strong>Overall Status:</strong> <span class="status">{compliance_status}</span></p>
+                    {f'<p><strong>Generated By:</strong> {email_log.generation_path}</p>' if email_log.generation_path else ''}
+                    {f'<p><strong>AI Usage:</strong> {sum(stage["prompt_tokens"] + stage["completion_tokens"] for stage in email_log.openai_usage.values())} tokens ({sum(stage.get("cached_tokens", 0) for stage in email_log.openai_usage.values())} prompt tokens cached), ${email_log.openai_cost:.4f}, {sum(stage["latency_ms"] for stage in email_log.openai_usage.values()):.0f} ms</p>' if email_log.openai_usage else ''}
                 </div>
                 
                 <div>
-                    {f'<a href="/email/send/{email_log.email_log_id}" class="btn btn-success" onclick="return confirm(\'Send this email to {customer.email}?\')">Send Email</a>' if email_log.compliance_approved else '<button class="btn" disabled>Send Email (Compliance Failed)</button>'}
+                    {f'<a href="/email/send/{email_log.email_log_id}" class="btn btn-success" onclick="return confirm(\'Send this email to {customer.email}?\')">Send Email</a>' if email_log.compliance_approved else f'<button class="btn" disabled>Send Email (Compliance {"Pending" if email_log.compliance_pending else "Failed"})</button>'}
+                    {f'<form method="post" action="/email/recheck/{email_log.email_log_id}" style="display: inline;"><button type="submit" class="btn">Re-run Compliance Checks</button></form>' if email_log.compliance_pending else ''}
                     <a href="/email/generate/{customer.customer_id}" class="btn btn-secondary">Edit Template</a>
                     <a href="/email/logs" class="btn">View Email History</a>
                 </div>
@@ -151,6 +151,7 @@ class MainController:
                     <p><strong>Environment:</strong> Development Mode</p>
                     <p><strong>Data Source:</strong> Mock Data (SQL Server fallback active)</p>
                     <p><strong>AI Service:</strong> {"Enabled" if self._check_openai_status() else "Disabled"}</p>
+                    <p><strong>AI Provider Circuit:</strong> {self._get_openai_circuit_status()}</p>
                     <p><strong>Version:</strong> MyCRM v1.0.0</p>
                 </div>
             </div>
@@ -158,6 +159,16 @@ class MainController:
         </html>
         """
     
+    def _get_openai_circuit_status(self):
+        """Describe the OpenAI circuit breaker state."""
+        from business.services.circuit_breaker import openai_circuit_breaker
+        state = openai_circuit_breaker.get_state()
+        if state['state'] == 'open':
+            return f"Open - using template fallback, retrying in {state['retry_in_seconds']:.0f}s"
+        if state['state'] == 'half_open':
+            return "Half-open - probing the provider"
+        return f"Closed ({state['recent_error_rate']:.0%} recent errors)"
+    
     def _check_openai_status(self):
         """Check if OpenAI is configured."""
         from config.settings import get_openai_config
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+MyCRM Email Job Worker
+Processes queued bulk email generation jobs and delivers queued emails
+outside the web server.
+
+Run with EMAIL_JOB_MODE=worker in both the web server and the workers. Any
+number of workers may run against the same job repository.
+"""
+
+import os
+import sys
+import argparse
+import logging
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Add project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from business.services.email_job_service import EmailJobService, EmailJobWorker
+from business.services.openai_client import openai_client_pool
+from business.services.outbox_dispatcher import EmailOutboxDispatcher
+
+
+def setup_logging():
+    """Configure worker logging."""
+    os.makedirs('logs', exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('logs/worker.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+
+def main():
+    """Parse arguments and run the worker loop."""
+    parser = argparse.ArgumentParser(description='Process queued MyCRM email generation jobs and outgoing emails.')
+    parser.add_argument('--worker-id', help='Unique worker name (defaults to host, PID and a random suffix)')
+    parser.add_argument('--batch-size', type=int, help='Items to lease per claim')
+    parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+    args = parser.parse_args()
+
+    setup_logging()
+    logger = logging.getLogger(__name__)
+
+    job_service = EmailJobService()
+    worker = EmailJobWorker(job_service, worker_id=args.worker_id, batch_size=args.batch_size)
+    dispatcher = EmailOutboxDispatcher(job_service.email_service, worker_id=worker.worker_id)
+    openai_client_pool.warm_up()
+    try:
+        if args.once:
+            worker.run(once=True)
+            dispatcher.run(once=True)
+        else:
+            dispatcher.start()
+            worker.run()
+    except KeyboardInterrupt:
+        logger.info("Shutting down email job worker...")
+        worker.stop()
+        dispatcher.stop()
+
+
+if __name__ == '__main__':
+    main()